@@ -10,6 +10,8 @@ from app.core.config import settings
 from app.models.user import Base
 from app.models.audit_log import AuditLog  # noqa: F401 - needed for alembic autogenerate
 from app.models.permissions import Permission, Role, role_permissions, user_roles  # noqa: F401
+from app.models.scan_history import ScanRecord  # noqa: F401
+from app.models.ip_reservation import IPReservation  # noqa: F401
 
 config = context.config
 
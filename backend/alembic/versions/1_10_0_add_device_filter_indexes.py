@@ -0,0 +1,47 @@
+"""add devices indexes for list filters, sorts and search
+
+Revision ID: 1_10_0
+Revises: 1_9_0
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers
+revision = '1_10_0'
+down_revision = '1_9_0'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+  ('ix_devices_subnet_ip', ['subnet_id', 'ip_packed']),
+  ('ix_devices_location_sector', ['location_id', 'sector_id', 'instalacion_id']),
+  ('ix_devices_sector_instalacion', ['sector_id', 'instalacion_id']),
+  ('ix_devices_instalacion', ['instalacion_id']),
+  ('ix_devices_asset_type_level', ['asset_type', 'network_level']),
+  ('ix_devices_network_level', ['network_level']),
+  ('ix_devices_brand_model', ['brand', 'model']),
+  ('ix_devices_updated_at_id', ['updated_at', 'id']),
+)
+# Columns of the list's search parameter, an ILIKE '%...%' that only trigram
+# indexes serve (PostgreSQL pg_trgm; SQLite scans the table)
+SEARCH_COLUMNS = ('name', 'hostname', 'ip_address', 'mac_address')
+
+
+def upgrade() -> None:
+  for name, columns in INDEXES:
+    op.create_index(name, 'devices', columns)
+  if op.get_bind().dialect.name == 'postgresql':
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in SEARCH_COLUMNS:
+      op.create_index(f'ix_devices_{column}_trgm', 'devices', [column],
+                      postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+  if op.get_bind().dialect.name == 'postgresql':
+    # pg_trgm stays installed: other schemas may use it
+    for column in reversed(SEARCH_COLUMNS):
+      op.drop_index(f'ix_devices_{column}_trgm', table_name='devices')
+  for name, _columns in reversed(INDEXES):
+    op.drop_index(name, table_name='devices')
@@ -0,0 +1,46 @@
+"""add unique index on subnets.subnet
+
+Revision ID: 1_11_0
+Revises: 1_10_0
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+import ipaddress
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '1_11_0'
+down_revision = '1_10_0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+  # Store every CIDR in canonical form first, as the API now does, so spellings of one block collide
+  connection = op.get_bind()
+  rows = connection.execute(sa.text("SELECT id, subnet FROM subnets")).fetchall()
+  seen = {}
+  params = []
+  for row_id, cidr in rows:
+    try:
+      canonical = str(ipaddress.ip_network(cidr.strip(), strict=False))
+    except (ValueError, AttributeError):
+      continue
+    if canonical in seen:
+      raise RuntimeError(
+        f"Subnets {seen[canonical]} and {row_id} are both {canonical}; "
+        "merge or delete the duplicate (GET /api/subnets/overlaps lists them) and rerun the migration"
+      )
+    seen[canonical] = row_id
+    if canonical != cidr:
+      params.append({"id": row_id, "subnet": canonical})
+  if params:
+    connection.execute(sa.text("UPDATE subnets SET subnet = :subnet WHERE id = :id"), params)
+
+  op.create_index('uq_subnets_subnet', 'subnets', ['subnet'], unique=True)
+
+
+def downgrade() -> None:
+  op.drop_index('uq_subnets_subnet', table_name='subnets')
@@ -0,0 +1,36 @@
+"""add scan_results table
+
+Revision ID: 1_5_0
+Revises: 1_4_0
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '1_5_0'
+down_revision = '1_4_0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+  op.create_table(
+    'scan_results',
+    sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+    sa.Column('subnet_id', sa.Integer(), sa.ForeignKey('subnets.id', ondelete='CASCADE'), nullable=False),
+    sa.Column('ip_address', sa.String(45), nullable=False),
+    sa.Column('scanned_at', sa.DateTime(), nullable=False),
+    sa.Column('online', sa.Boolean(), nullable=False),
+    sa.Column('latency_ms', sa.Float(), nullable=True),
+    sa.Column('changed', sa.Boolean(), nullable=False, server_default=sa.false()),
+  )
+  op.create_index('ix_scan_results_subnet_ip_time', 'scan_results', ['subnet_id', 'ip_address', 'scanned_at'])
+  op.create_index('ix_scan_results_scanned_at', 'scan_results', ['scanned_at'])
+
+
+def downgrade() -> None:
+  op.drop_index('ix_scan_results_scanned_at', table_name='scan_results')
+  op.drop_index('ix_scan_results_subnet_ip_time', table_name='scan_results')
+  op.drop_table('scan_results')
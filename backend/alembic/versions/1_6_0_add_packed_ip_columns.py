@@ -0,0 +1,54 @@
+"""add packed ip columns
+
+Revision ID: 1_6_0
+Revises: 1_5_0
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+import ipaddress
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '1_6_0'
+down_revision = '1_5_0'
+branch_labels = None
+depends_on = None
+
+TABLES = ('devices', 'switches')
+
+
+def _pack_ip(ip):
+  # Frozen copy of app.utils.ipnum.pack_ip: IPv4 is stored IPv4-mapped
+  if not ip:
+    return None
+  try:
+    addr = ipaddress.ip_address(ip.strip())
+  except ValueError:
+    return None
+  value = int(addr) | (0xFFFF << 32) if addr.version == 4 else int(addr)
+  return value.to_bytes(16, 'big')
+
+
+def upgrade() -> None:
+  for table in TABLES:
+    with op.batch_alter_table(table) as batch_op:
+      batch_op.add_column(sa.Column('ip_packed', sa.LargeBinary(16), nullable=True))
+    op.create_index(f'ix_{table}_ip_packed', table, ['ip_packed'])
+
+  # Backfill from the existing string addresses
+  connection = op.get_bind()
+  for table in TABLES:
+    rows = connection.execute(sa.text(f"SELECT id, ip_address FROM {table} WHERE ip_address IS NOT NULL")).fetchall()
+    params = [{"id": row_id, "packed": _pack_ip(ip)} for row_id, ip in rows]
+    params = [p for p in params if p["packed"] is not None]
+    if params:
+      connection.execute(sa.text(f"UPDATE {table} SET ip_packed = :packed WHERE id = :id"), params)
+
+
+def downgrade() -> None:
+  for table in TABLES:
+    op.drop_index(f'ix_{table}_ip_packed', table_name=table)
+    with op.batch_alter_table(table) as batch_op:
+      batch_op.drop_column('ip_packed')
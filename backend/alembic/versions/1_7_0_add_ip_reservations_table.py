@@ -0,0 +1,35 @@
+"""add ip_reservations table
+
+Revision ID: 1_7_0
+Revises: 1_6_0
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '1_7_0'
+down_revision = '1_6_0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+  op.create_table(
+    'ip_reservations',
+    sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+    sa.Column('subnet_id', sa.Integer(), sa.ForeignKey('subnets.id', ondelete='CASCADE'), nullable=False),
+    sa.Column('ip_address', sa.String(45), nullable=False),
+    sa.Column('reserved_by', sa.Integer(), sa.ForeignKey('users.id', ondelete='SET NULL'), nullable=True),
+    sa.Column('note', sa.String(200), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.UniqueConstraint('subnet_id', 'ip_address', name='uq_ip_reservations_subnet_ip'),
+  )
+  op.create_index('ix_ip_reservations_expires_at', 'ip_reservations', ['expires_at'])
+
+
+def downgrade() -> None:
+  op.drop_index('ix_ip_reservations_expires_at', table_name='ip_reservations')
+  op.drop_table('ip_reservations')
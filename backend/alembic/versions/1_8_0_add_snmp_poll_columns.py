@@ -0,0 +1,43 @@
+"""add snmp poll columns to switches and switch_ports
+
+Revision ID: 1_8_0
+Revises: 1_7_0
+Create Date: 2026-10-16 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '1_8_0'
+down_revision = '1_7_0'
+branch_labels = None
+depends_on = None
+
+PORT_COLUMNS = ('if_index', 'oper_status', 'speed_mbps', 'learned_macs', 'polled_at')
+
+
+def upgrade() -> None:
+  with op.batch_alter_table('switches') as batch_op:
+    batch_op.add_column(sa.Column('sys_description', sa.String(500), nullable=True))
+    batch_op.add_column(sa.Column('last_polled_at', sa.DateTime(), nullable=True))
+
+  with op.batch_alter_table('switch_ports') as batch_op:
+    batch_op.add_column(sa.Column('if_index', sa.Integer(), nullable=True))
+    batch_op.add_column(sa.Column('oper_status', sa.String(20), nullable=True))
+    batch_op.add_column(sa.Column('speed_mbps', sa.Integer(), nullable=True))
+    batch_op.add_column(sa.Column('learned_macs', sa.Integer(), nullable=True))
+    batch_op.add_column(sa.Column('polled_at', sa.DateTime(), nullable=True))
+  # Polls reconcile ports by (switch, port name)
+  op.create_index('ix_switch_ports_switch_port', 'switch_ports', ['switch_id', 'port_number'])
+
+
+def downgrade() -> None:
+  op.drop_index('ix_switch_ports_switch_port', table_name='switch_ports')
+  with op.batch_alter_table('switch_ports') as batch_op:
+    for column in PORT_COLUMNS:
+      batch_op.drop_column(column)
+
+  with op.batch_alter_table('switches') as batch_op:
+    batch_op.drop_column('last_polled_at')
+    batch_op.drop_column('sys_description')
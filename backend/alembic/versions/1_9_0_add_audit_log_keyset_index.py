@@ -0,0 +1,22 @@
+"""add audit_logs (created_at, id) index for keyset pagination
+
+Revision ID: 1_9_0
+Revises: 1_8_0
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers
+revision = '1_9_0'
+down_revision = '1_8_0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+  op.create_index('ix_audit_logs_created_at_id', 'audit_logs', ['created_at', 'id'])
+
+
+def downgrade() -> None:
+  op.drop_index('ix_audit_logs_created_at_id', table_name='audit_logs')
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime
 
@@ -8,13 +8,19 @@ from ..core.database import get_db
 from ..core.deps import get_current_admin_user
 from ..models.audit_log import AuditLog
 from ..schemas.schemas import AuditLogResponse, AuditLogFilter
+from ..utils.pagination import paginate, set_next_cursor
 
 router = APIRouter()
 
+# Newest first; id breaks ties between entries written in the same second
+AUDIT_LOG_KEYS = ((AuditLog.created_at, True), (AuditLog.id, True))
+
 @router.get("", response_model=List[AuditLogResponse])
 def get_audit_logs(
+  response: Response,
   skip: int = Query(0, ge=0),
   limit: int = Query(50, ge=1, le=500),
+  cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces skip"),
   user_id: Optional[int] = None,
   username: Optional[str] = None,
   action: Optional[str] = None,
@@ -40,7 +46,11 @@ def get_audit_logs(
   if date_to:
     query = query.filter(AuditLog.created_at <= date_to)
 
-  logs = query.order_by(desc(AuditLog.created_at)).offset(skip).limit(limit).all()
+  try:
+    logs = paginate(query, AUDIT_LOG_KEYS, skip, limit, cursor)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  set_next_cursor(response, logs, AUDIT_LOG_KEYS, limit)
   return logs
 
 @router.get("/count")
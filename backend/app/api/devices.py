@@ -1,28 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from ..core.database import get_db
 from ..schemas.schemas import (
   DeviceCreate, DeviceUpdate, DeviceResponse,
   CredentialCreate, CredentialUpdate, CredentialResponse,
-  DevicePingResult, PingMultipleRequest
+  DevicePingResult, PingMultipleRequest,
+  SubnetResolveRequest, SubnetResolveResponse, SubnetResolveChange
 )
-from ..crud.crud import get_devices, get_device, create_device, update_device, delete_device
+from ..crud.crud import get_device, create_device, update_device, delete_device
 from ..crud import crud
-from ..core.deps import get_current_active_user
+from ..core.config import ProbeSpec
+from ..core.deps import get_current_active_user, get_current_admin_user, probe_profile_option
 from ..core.security import encrypt_sensitive_data, decrypt_sensitive_data
-from ..models.user import Credential
-from ..utils.network import ping_host, ping_multiple_hosts
+from ..models.user import Credential, Device
+from ..utils.network import ping_host, ping_multiple_hosts, parse_ip_prefix
+from ..utils.ipnum import packed_range
+from ..utils.occupancy import occupancy
+from ..utils.allocation import ReservationHeld
+from ..utils.subnet_trie import subnet_resolver
+from ..utils.rdns import reverse_dns
+from ..utils.pagination import set_next_cursor
 
 router = APIRouter()
 
-def enrich_device(device, db: Session) -> dict:
-  """Add related names to device response"""
-  # Get credentials for this device
-  credentials = db.query(Credential).filter(Credential.device_id == device.id).all()
-
-  device_dict = {
+def enrich_device(device) -> dict:
+  """Add related names to device response; load devices with crud.device_detail_options() to avoid per-device queries"""
+  return {
     "id": device.id,
     "name": device.name,
     "hostname": device.hostname,
@@ -43,56 +49,112 @@ def enrich_device(device, db: Session) -> dict:
     "created_at": device.created_at,
     "is_public": device.is_public,
     "access_level": device.access_level,
-    "credentials": credentials,
-    "asset_type_name": None,
-    "network_level_name": None,
-    "subnet_name": None,
-    "location_name": None,
-    "sector_name": None,
-    "instalacion_name": None,
+    "credentials": device.credentials,
+    "asset_type_name": _related_name(device.asset_type_rel),
+    "network_level_name": _related_name(device.network_level_rel),
+    "subnet_name": _related_name(device.subnet_rel),
+    "location_name": _related_name(device.location_rel),
+    "sector_name": _related_name(device.sector_rel),
+    "instalacion_name": _related_name(device.instalacion_rel),
   }
 
-  if device.asset_type:
-    asset_type = crud.get_asset_type(db, device.asset_type)
-    if asset_type:
-      device_dict["asset_type_name"] = asset_type.name
-
-  if device.network_level:
-    network_level = crud.get_network_level(db, device.network_level)
-    if network_level:
-      device_dict["network_level_name"] = network_level.name
-
-  if device.subnet_id:
-    subnet = crud.get_subnet(db, device.subnet_id)
-    if subnet:
-      device_dict["subnet_name"] = subnet.name
-
-  if device.location_id:
-    location = crud.get_location(db, device.location_id)
-    if location:
-      device_dict["location_name"] = location.name
-
-  if device.sector_id:
-    sector = crud.get_sector(db, device.sector_id)
-    if sector:
-      device_dict["sector_name"] = sector.name
-
-  if device.instalacion_id:
-    instalacion = crud.get_instalacion(db, device.instalacion_id)
-    if instalacion:
-      device_dict["instalacion_name"] = instalacion.name
-
-  return device_dict
+def _related_name(row) -> Optional[str]:
+  return row.name if row is not None else None
 
 @router.get("", response_model=List[DeviceResponse])
 def get_device_list(
+  response: Response,
   skip: int = 0,
   limit: int = 100,
+  cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces skip"),
+  ip_prefix: Optional[str] = None,
+  subnet_id: Optional[int] = None,
+  location_id: Optional[int] = None,
+  sector_id: Optional[int] = None,
+  instalacion_id: Optional[int] = None,
+  asset_type: Optional[int] = None,
+  network_level: Optional[int] = None,
+  brand: Optional[str] = Query(None, description="Exact, case-sensitive brand"),
+  model: Optional[str] = Query(None, description="Exact, case-sensitive model"),
+  updated_since: Optional[datetime] = None,
+  search: Optional[str] = Query(None, description="Substring of name, hostname, IP or MAC"),
+  sort: Optional[str] = Query(None, description="Comma-separated columns, - for descending, e.g. brand,-updated_at"),
+  resolve_names: bool = Query(False, description="Add the PTR name of each device IP as resolved_hostname"),
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
-  devices = get_devices(db, skip=skip, limit=limit)
-  return [enrich_device(device, db) for device in devices]
+  """Devices matching every filter; brand and model match exactly (served by an index), search ignores case"""
+  try:
+    ip_range = None
+    if ip_prefix:
+      # CIDR, single IP or partial IPv4 prefix ("10.1."), answered by a range scan on ip_packed
+      ip_range = packed_range(parse_ip_prefix(ip_prefix))
+    if sort:
+      keys = crud.device_sort_keys(sort)
+    else:
+      keys = crud.DEVICE_RANGE_KEYS if ip_range else crud.DEVICE_KEYS
+    devices = crud.search_devices(
+      db, keys, skip=skip, limit=limit, cursor=cursor, ip_range=ip_range,
+      updated_since=updated_since, search=search, subnet_id=subnet_id, location_id=location_id,
+      sector_id=sector_id, instalacion_id=instalacion_id, asset_type=asset_type,
+      network_level=network_level, brand=brand, model=model,
+    )
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  set_next_cursor(response, devices, keys, limit)
+  enriched = [enrich_device(device) for device in devices]
+  if resolve_names:
+    names = reverse_dns.resolve_many_sync(d["ip_address"] for d in enriched if d["ip_address"])
+    for d in enriched:
+      d["resolved_hostname"] = names.get(d["ip_address"])
+  return enriched
+
+@router.post("/resolve-subnets", response_model=SubnetResolveResponse)
+def resolve_device_subnets(
+  body: SubnetResolveRequest,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_admin_user)
+):
+  """Re-assign devices to the most specific subnet containing their IP, in one pass (admin only)"""
+  query = db.query(Device.id, Device.ip_address, Device.subnet_id, Device.netmask, Device.default_gateway)
+  if body.device_ids is not None:
+    query = query.filter(Device.id.in_(body.device_ids))
+  if body.only_unassigned:
+    query = query.filter(Device.subnet_id.is_(None))
+  rows = query.filter(Device.ip_address.isnot(None)).all()
+
+  matches = subnet_resolver.resolve_many(db, [r.ip_address for r in rows])
+  changes, mappings = [], []
+  unresolved = 0
+  for row, match in zip(rows, matches):
+    if match is None:
+      unresolved += 1
+      continue
+    if match.subnet_id == row.subnet_id:
+      continue
+    changes.append(SubnetResolveChange(
+      device_id=row.id, ip_address=row.ip_address,
+      old_subnet_id=row.subnet_id, new_subnet_id=match.subnet_id
+    ))
+    mappings.append({
+      "id": row.id,
+      "subnet_id": match.subnet_id,
+      "netmask": row.netmask or match.netmask,
+      "default_gateway": row.default_gateway or match.default_gateway,
+    })
+
+  if mappings and not body.dry_run:
+    db.bulk_update_mappings(Device, mappings)
+    db.commit()
+    occupancy.invalidate()
+
+  return SubnetResolveResponse(
+    checked=len(rows),
+    updated=0 if body.dry_run else len(mappings),
+    unresolved=unresolved,
+    dry_run=body.dry_run,
+    changes=changes
+  )
 
 @router.get("/{device_id}", response_model=DeviceResponse)
 def read_device(
@@ -100,10 +162,10 @@ def read_device(
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
-  db_device = get_device(db, device_id=device_id)
+  db_device = crud.get_device_detail(db, device_id=device_id)
   if db_device is None:
     raise HTTPException(status_code=404, detail="Device not found")
-  return enrich_device(db_device, db)
+  return enrich_device(db_device)
 
 @router.post("", response_model=DeviceResponse, status_code=status.HTTP_201_CREATED)
 def create_new_device(
@@ -111,8 +173,11 @@ def create_new_device(
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
-  db_device = create_device(db=db, device=device, user_id=current_user.id)
-  return enrich_device(db_device, db)
+  try:
+    db_device = create_device(db=db, device=device, user_id=current_user.id)
+  except ReservationHeld as e:
+    raise HTTPException(status_code=409, detail=str(e))
+  return enrich_device(db_device)
 
 @router.put("/{device_id}", response_model=DeviceResponse)
 def update_existing_device(
@@ -121,10 +186,13 @@ def update_existing_device(
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
-  db_device = update_device(db, device_id=device_id, device=device)
+  try:
+    db_device = update_device(db, device_id=device_id, device=device, user_id=current_user.id)
+  except ReservationHeld as e:
+    raise HTTPException(status_code=409, detail=str(e))
   if db_device is None:
     raise HTTPException(status_code=404, detail="Device not found")
-  return enrich_device(db_device, db)
+  return enrich_device(db_device)
 
 @router.delete("/{device_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_existing_device(
@@ -214,6 +282,7 @@ def delete_credential(
 @router.get("/{device_id}/ping", response_model=DevicePingResult)
 def ping_device(
   device_id: int,
+  probes: Optional[List[ProbeSpec]] = Depends(probe_profile_option),
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
@@ -225,7 +294,7 @@ def ping_device(
   if not db_device.ip_address:
     raise HTTPException(status_code=400, detail="Device has no IP address")
 
-  result = ping_host(db_device.ip_address, timeout=2)
+  result = ping_host(db_device.ip_address, timeout=2, probes=probes)
 
   return DevicePingResult(
     device_id=db_device.id,
@@ -233,12 +302,14 @@ def ping_device(
     ip_address=db_device.ip_address,
     online=result["online"],
     latency_ms=result["latency_ms"],
-    error=result["error"]
+    error=result["error"],
+    probe=result["probe"]
   )
 
 @router.post("/ping-multiple", response_model=List[DevicePingResult])
 def ping_multiple_devices(
   body: PingMultipleRequest,
+  probes: Optional[List[ProbeSpec]] = Depends(probe_profile_option),
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
@@ -253,7 +324,7 @@ def ping_multiple_devices(
     return []
 
   ips = [d.ip_address for d in devices_to_ping]
-  ping_results = ping_multiple_hosts(ips, max_workers=20, timeout=2)
+  ping_results = ping_multiple_hosts(ips, max_workers=20, timeout=2, probes=probes)
 
   # Map ping results back to devices
   ip_to_result = {r["ip"]: r for r in ping_results}
@@ -266,7 +337,8 @@ def ping_multiple_devices(
       ip_address=device.ip_address,
       online=pr.get("online", False),
       latency_ms=pr.get("latency_ms"),
-      error=pr.get("error")
+      error=pr.get("error"),
+      probe=pr.get("probe")
     ))
 
   return results
\ No newline at end of file
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import List, Optional, Dict, Any
 import csv
+import ipaddress
 import json
 import io
 import os
@@ -12,6 +13,9 @@ from ..core.database import get_db
 from ..core.deps import get_current_admin_user
 from ..schemas.schemas import ImportRequest, ImportResponse, ImportPreview, ImportPreviewItem, ExportRequest, ExportResponse
 from ..crud.crud import get_device, get_subnet, get_user
+from ..utils.occupancy import occupancy
+from ..utils.subnet_trie import subnet_resolver, assign_subnet
+from ..utils.subnet_overlap import SubnetIntervalIndex, subnet_range, overlap_kind
 import pandas as pd
 
 router = APIRouter()
@@ -38,7 +42,7 @@ SUPPORTED_ENTITIES = {
     }
 }
 
-def validate_entity_data(entity_type: str, data: dict, db: Session) -> ImportPreviewItem:
+def validate_entity_data(entity_type: str, data: dict, db: Session, overlap_index: Optional[SubnetIntervalIndex] = None) -> ImportPreviewItem:
     """Validar una fila de datos para importación"""
     entity_config = SUPPORTED_ENTITIES.get(entity_type)
     if not entity_config:
@@ -97,6 +101,21 @@ def validate_entity_data(entity_type: str, data: dict, db: Session) -> ImportPre
                 status="error",
                 message=f"Formato de subnet inválido: {subnet}"
             )
+        
+        # Detectar solapamientos con subredes existentes y con filas anteriores del archivo
+        if overlap_index is not None:
+            new_range = subnet_range(subnet)
+            for other in overlap_index.conflicts(new_range):
+                origin = f"id {other.subnet_id}" if other.subnet_id is not None else "otra fila del archivo"
+                if overlap_kind(new_range, other) == "duplicate":
+                    return ImportPreviewItem(
+                        row_number=data.get("_row_number", 0),
+                        data=data,
+                        status="error",
+                        message=f"Subnet {new_range.cidr} duplicada ({origin})"
+                    )
+                warnings.append(f"Subnet {new_range.cidr} se solapa con {other.cidr} ({origin})")
+            overlap_index.add(new_range)
     
     elif entity_type == "users":
         # Validar formato de email
@@ -122,16 +141,11 @@ def validate_entity_data(entity_type: str, data: dict, db: Session) -> ImportPre
     )
 
 def is_valid_ip(ip: str) -> bool:
-    """Validar formato de dirección IP"""
+    """Validar formato de dirección IP (IPv4 o IPv6)"""
     try:
-        parts = ip.split('.')
-        if len(parts) != 4:
-            return False
-        for part in parts:
-            if not part.isdigit() or not 0 <= int(part) <= 255:
-                return False
+        ipaddress.ip_address(ip.strip())
         return True
-    except:
+    except (ValueError, AttributeError):
         return False
 
 def is_valid_mac(mac: str) -> bool:
@@ -141,14 +155,13 @@ def is_valid_mac(mac: str) -> bool:
     return bool(re.match(pattern, mac))
 
 def is_valid_subnet(subnet: str) -> bool:
-    """Validar formato de subnet CIDR"""
+    """Validar formato de subnet CIDR (IPv4 o IPv6)"""
+    if '/' not in str(subnet):
+        return False
     try:
-        parts = subnet.split('/')
-        if len(parts) != 2:
-            return False
-        ip, mask = parts
-        return is_valid_ip(ip) and mask.isdigit() and 0 <= int(mask) <= 32
-    except:
+        ipaddress.ip_network(subnet.strip(), strict=False)
+        return True
+    except (ValueError, AttributeError):
         return False
 
 def is_valid_email(email: str) -> bool:
@@ -162,6 +175,14 @@ def get_device_by_ip(db: Session, ip: str):
     from ..models.user import Device
     return db.query(Device).filter(Device.ip_address == ip).first()
 
+def build_subnet_overlap_index(db: Session, include_existing: bool = True) -> SubnetIntervalIndex:
+    """Índice de rangos para detectar solapamientos de subredes durante la importación"""
+    from ..models.user import Subnet
+    existing = db.query(Subnet.id, Subnet.subnet).all() if include_existing else []
+    return SubnetIntervalIndex(
+        r for r in (subnet_range(s.subnet, s.id) for s in existing) if r is not None
+    )
+
 def get_user_by_username(db: Session, username: str):
     """Obtener usuario por username"""
     from ..models.user import User
@@ -213,9 +234,10 @@ async def preview_import(
     
     # Validar cada fila
     preview_items = []
+    overlap_index = build_subnet_overlap_index(db) if entity_type == "subnets" else None
     for i, row in enumerate(data_rows, 1):
         row["_row_number"] = i
-        item = validate_entity_data(entity_type, row, db)
+        item = validate_entity_data(entity_type, row, db, overlap_index)
         preview_items.append(item)
     
     # Calcular estadísticas
@@ -265,9 +287,11 @@ async def import_data(
     # Validar y preparar datos
     preview_items = []
     valid_data = []
+    # En modo replace las subredes existentes se eliminan, solo cuentan las del archivo
+    overlap_index = build_subnet_overlap_index(db, include_existing=merge_mode) if entity_type == "subnets" else None
     for i, row in enumerate(data_rows, 1):
         row["_row_number"] = i
-        item = validate_entity_data(entity_type, row, db)
+        item = validate_entity_data(entity_type, row, db, overlap_index)
         preview_items.append(item)
         
         if item.status in ["valid", "warning"]:
@@ -310,12 +334,14 @@ async def import_data(
             for device_data in valid_data:
                 try:
                     device = Device(**device_data)
+                    assign_subnet(db, device)
                     db.add(device)
                     imported_count += 1
                 except Exception as e:
                     errors.append(f"Error en fila {device_data.get('_row_number', '?')}: {str(e)}")
             
             db.commit()
+            occupancy.invalidate()
         
         elif entity_type == "subnets":
             from ..models.user import Subnet
@@ -325,6 +351,8 @@ async def import_data(
             
             for subnet_data in valid_data:
                 try:
+                    # Forma canónica, igual que en la API, para el índice único de subnets.subnet
+                    subnet_data["subnet"] = str(ipaddress.ip_network(subnet_data["subnet"].strip(), strict=False))
                     subnet = Subnet(**subnet_data)
                     db.add(subnet)
                     imported_count += 1
@@ -332,6 +360,8 @@ async def import_data(
                     errors.append(f"Error en fila {subnet_data.get('_row_number', '?')}: {str(e)}")
             
             db.commit()
+            occupancy.invalidate()
+            subnet_resolver.invalidate()
         
         elif entity_type == "users":
             from ..models.user import User
@@ -415,7 +445,8 @@ async def export_data(
     
     # Convertir a lista de diccionarios
     columns = result.keys()
-    data = [dict(zip(columns, row)) for row in rows]
+    # ip_packed es derivado de ip_address y se recalcula al importar
+    data = [{k: v for k, v in zip(columns, row) if k != "ip_packed"} for row in rows]
     
     # Generar archivo
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
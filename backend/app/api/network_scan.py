@@ -1,24 +1,123 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import desc
+from typing import List, Optional, Union
+from datetime import datetime, timedelta
+import asyncio
+import ipaddress
+import json
+import time
 
+from ..core.config import ProbeSpec, settings
 from ..core.database import get_db
-from ..core.deps import get_current_admin_user, get_current_active_user
+from ..core.deps import get_current_admin_user, get_current_active_user, probe_profile_option
 from ..crud.crud import get_subnet, get_device
 from ..schemas.schemas import (
-  NetworkScanResult, NetworkScanResponse, QuickAddDeviceRequest, DeviceResponse
+  NetworkScanResult, NetworkScanResponse, NetworkScanProgress, QuickAddDeviceRequest, DeviceResponse,
+  ScanJobResponse, ScanJobResultsResponse, NetworkScanChange, NetworkScanDeltaResponse, ScanRecordResponse,
+  ScanTargets, MacUpdateRequest, MacUpdateChange, MacUpdateResponse,
+  ModbusDiscoveryRequest, DeviceIdentification, DiscoveryResponse,
+  EnipDiscoveryRequest, EnipIdentity, EnipScanResult, EnipDiscoveryResponse,
+  PcapDeviceProposal, PcapMacUpdate, PcapTalker, PcapImportResponse
 )
 from ..utils.network import (
-  get_all_ips_in_subnet, get_used_ips_in_subnet,
-  ping_multiple_hosts
+  get_used_ips_in_subnet,
+  ping_multiple_hosts, ip_sort_key
+)
+from ..utils.icmp import iter_ping_hosts, iter_with_ticks
+from ..utils.occupancy import occupancy
+from ..utils.subnet_trie import subnet_resolver
+from ..utils.allocation import ReservationHeld, release_reservation
+from ..utils.neighbors import NeighborTable, normalize_mac
+from ..utils.rdns import reverse_dns
+from ..utils.discovery import run_sweep, suggest_device_fields
+from ..utils.modbus import identify_modbus, modbus_suggestions
+from ..utils.enip import list_identity, enip_suggestions
+from ..utils.pcap import CaptureError
+from ..utils.passive import PassiveInventory, ingest_capture, diff_inventory, top_talkers
+from ..utils.scan import (
+  devices_by_ip, build_scan_result, empty_scan_counts, tally_scan_result, scan_jobs, build_rate_controller,
+  latest_scan_states, select_delta_targets, is_state_change, record_scan_results, record_scan_rows,
+  save_scan_rows, scan_row, resolve_scan_targets, resolve_hostnames
 )
 from ..models.user import Device
+from ..models.scan_history import ScanRecord
 
 router = APIRouter()
 
-@router.post("/{subnet_id}/scan", response_model=NetworkScanResponse)
+def scan_rate_options(
+  min_concurrency: Optional[int] = Query(None, ge=1, description="Starting/floor probe window"),
+  max_concurrency: Optional[int] = Query(None, ge=1, description="Ceiling of the adaptive probe window"),
+  max_pps: Optional[int] = Query(None, ge=1, description="Packets per second cap")
+) -> dict:
+  """Per-scan probe-rate settings, clamped later to the subnet's configured limits"""
+  return {"min_concurrency": min_concurrency, "max_concurrency": max_concurrency, "max_pps": max_pps}
+
+# ========== SCAN JOBS ==========
+# NOTE: Job routes must be defined BEFORE /{subnet_id} routes to avoid route conflicts
+
+@router.get("/scan-jobs", response_model=List[ScanJobResponse])
+def list_scan_jobs(
+  subnet_id: Optional[int] = None,
+  current_user = Depends(get_current_admin_user)
+):
+  """List background scan jobs, newest first (admin only)"""
+  return [job.progress() for job in scan_jobs.list_jobs(subnet_id=subnet_id)]
+
+@router.get("/scan-jobs/{job_id}", response_model=ScanJobResponse)
+def get_scan_job(
+  job_id: str,
+  current_user = Depends(get_current_admin_user)
+):
+  """Get the progress of a background scan job (admin only)"""
+  job = scan_jobs.get(job_id)
+  if job is None:
+    raise HTTPException(status_code=404, detail="Scan job not found")
+  return job.progress()
+
+@router.get("/scan-jobs/{job_id}/results", response_model=ScanJobResultsResponse)
+def get_scan_job_results(
+  job_id: str,
+  offset: int = Query(0, ge=0),
+  limit: int = Query(1000, ge=1, le=10000),
+  current_user = Depends(get_current_admin_user)
+):
+  """Get the results a scan job has collected so far, in completion order (admin only)"""
+  job = scan_jobs.get(job_id)
+  if job is None:
+    raise HTTPException(status_code=404, detail="Scan job not found")
+  available = len(job.results)
+  return ScanJobResultsResponse(
+    job_id=job.id,
+    status=job.status,
+    offset=offset,
+    available=available,
+    results=job.results[offset:min(offset + limit, available)]
+  )
+
+@router.post("/scan-jobs/{job_id}/cancel", response_model=ScanJobResponse)
+def cancel_scan_job(
+  job_id: str,
+  current_user = Depends(get_current_admin_user)
+):
+  """Cancel a queued or running scan job; collected results are kept (admin only)"""
+  job = scan_jobs.cancel(job_id)
+  if job is None:
+    raise HTTPException(status_code=404, detail="Scan job not found")
+  return job.progress()
+
+# ========== SUBNET SCAN ==========
+
+@router.post("/{subnet_id}/scan", response_model=Union[NetworkScanResponse, ScanJobResponse])
 def scan_subnet(
   subnet_id: int,
+  response: Response,
+  run_async: bool = Query(False, alias="async", description="Run as a background job and return its ID"),
+  rate_options: dict = Depends(scan_rate_options),
+  resolve_names: bool = Query(False, description="Look up PTR names of online hosts"),
+  probes: Optional[List[ProbeSpec]] = Depends(probe_profile_option),
+  targets: Optional[ScanTargets] = None,
   db: Session = Depends(get_db),
   current_user = Depends(get_current_admin_user)
 ):
@@ -27,57 +126,392 @@ def scan_subnet(
   if db_subnet is None:
     raise HTTPException(status_code=404, detail="Subnet not found")
 
-  all_ips = get_all_ips_in_subnet(db_subnet.subnet)
-  used_ips = get_used_ips_in_subnet(db, subnet_id)
+  all_ips = _scan_targets(db, subnet_id, db_subnet.subnet, targets)
+  ip_to_device = devices_by_ip(db, subnet_id)
+  controller = build_rate_controller(db_subnet.subnet, **rate_options)
 
-  # Get all devices in this subnet for name lookup
-  devices = db.query(Device).filter(Device.subnet_id == subnet_id).all()
-  ip_to_device = {d.ip_address: d for d in devices if d.ip_address}
+  if run_async:
+    job, attached = scan_jobs.submit(
+      subnet_id, db_subnet.subnet, all_ips, ip_to_device,
+      max_jobs=settings.scan.limits_for(db_subnet.subnet).max_jobs,
+      controller=controller, created_by=current_user.id, resolve_names=resolve_names, probes=probes
+    )
+    response.status_code = status.HTTP_202_ACCEPTED
+    return ScanJobResponse(**job.progress(), attached=attached)
 
   # Ping all IPs
-  ping_results = ping_multiple_hosts(all_ips, max_workers=20, timeout=2)
+  scanned_at = datetime.utcnow()
+  ping_results = ping_multiple_hosts(all_ips, max_workers=20, timeout=2, controller=controller, probes=probes)
 
+  # Read after probing, when the neighbor cache holds the responders
+  neighbors = NeighborTable()
   results = []
-  online_count = 0
-  offline_count = 0
-  registered_count = 0
-  new_count = 0
-
+  counts = empty_scan_counts()
   for pr in ping_results:
-    is_registered = pr["ip"] in ip_to_device
-    device = ip_to_device.get(pr["ip"])
-
-    result = NetworkScanResult(
-      ip=pr["ip"],
-      online=pr["online"],
-      latency_ms=pr["latency_ms"],
-      is_registered=is_registered,
-      device_id=device.id if device else None,
-      device_name=device.name if device else None
-    )
+    result = build_scan_result(pr, ip_to_device, neighbors)
+    tally_scan_result(counts, result)
     results.append(result)
-
-    if pr["online"]:
-      online_count += 1
-      if not is_registered:
-        new_count += 1
-    else:
-      offline_count += 1
-
-    if is_registered:
-      registered_count += 1
+  record_scan_results(db, subnet_id, results, scanned_at)
+  if resolve_names:
+    resolve_hostnames(results)
 
   return NetworkScanResponse(
     subnet_id=subnet_id,
     subnet_cidr=db_subnet.subnet,
     scanned_ips=len(all_ips),
-    online_count=online_count,
-    offline_count=offline_count,
-    registered_count=registered_count,
-    new_count=new_count,
+    results=results,
+    rate=controller.stats(),
+    **counts
+  )
+
+@router.post("/{subnet_id}/scan/stream")
+def scan_subnet_stream(
+  subnet_id: int,
+  format: str = Query("ndjson", pattern=r"^(ndjson|sse)$"),
+  progress_interval: float = Query(1.0, ge=0.1, le=60),
+  rate_options: dict = Depends(scan_rate_options),
+  resolve_names: bool = Query(False, description="Look up PTR names of online hosts"),
+  probes: Optional[List[ProbeSpec]] = Depends(probe_profile_option),
+  targets: Optional[ScanTargets] = None,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_admin_user)
+):
+  """Scan all IPs in a subnet, streaming each result as its probe finishes (admin only).
+
+  Emits `result` frames, periodic `progress` frames with the running
+  counters, a `hostnames` frame mapping online IPs to PTR names when
+  `resolve_names` is set, and a final `summary` frame, either as NDJSON
+  (one JSON object per line) or as Server-Sent Events.
+  """
+  db_subnet = get_subnet(db, subnet_id=subnet_id)
+  if db_subnet is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+
+  subnet_cidr = db_subnet.subnet
+  all_ips = _scan_targets(db, subnet_id, subnet_cidr, targets)
+  # Resolved up front: the DB session is closed before the body is streamed
+  ip_to_device = devices_by_ip(db, subnet_id)
+  controller = build_rate_controller(subnet_cidr, **rate_options)
+
+  def progress(counts: dict, scanned: int, rate: Optional[dict] = None) -> NetworkScanProgress:
+    return NetworkScanProgress(
+      subnet_id=subnet_id,
+      subnet_cidr=subnet_cidr,
+      total_ips=len(all_ips),
+      scanned_ips=scanned,
+      rate=rate,
+      **counts
+    )
+
+  async def frames():
+    counts = empty_scan_counts()
+    scanned = 0
+    scanned_at = datetime.utcnow()
+    # Only the compact (ip, online, latency_ms) history rows are kept, not the response models
+    history = []
+    neighbors = NeighborTable()
+    results = iter_ping_hosts(all_ips, timeout=2, controller=controller, probes=probes)
+    # Progress follows a timer, so it keeps coming while every outstanding probe is still waiting
+    async for pr in iter_with_ticks(results, progress_interval):
+      if pr is None:
+        yield _encode_frame(format, "progress", progress(counts, scanned).model_dump())
+        continue
+      result = build_scan_result(pr, ip_to_device, neighbors)
+      tally_scan_result(counts, result)
+      history.append(scan_row(result))
+      scanned += 1
+      yield _encode_frame(format, "result", result.model_dump())
+    await asyncio.to_thread(save_scan_rows, subnet_id, history, scanned_at)
+    if resolve_names:
+      names = await reverse_dns.resolve_many(ip for ip, online, _latency in history if online)
+      yield _encode_frame(format, "hostnames", {"hostnames": names})
+    yield _encode_frame(format, "summary", progress(counts, scanned, controller.stats()).model_dump())
+
+  media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+  return StreamingResponse(frames(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@router.post("/{subnet_id}/scan/delta", response_model=NetworkScanDeltaResponse)
+def scan_subnet_delta(
+  subnet_id: int,
+  rate_options: dict = Depends(scan_rate_options),
+  resolve_names: bool = Query(False, description="Look up PTR names of online hosts"),
+  probes: Optional[List[ProbeSpec]] = Depends(probe_profile_option),
+  targets: Optional[ScanTargets] = None,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_admin_user)
+):
+  """Reprobe only stale or recently changed hosts and report what changed (admin only).
+
+  Hosts never probed before, hosts whose last stored result is older than
+  `scan.stale_after_minutes` and hosts whose last result was a state change
+  are probed; everyone else keeps its stored state.
+  """
+  db_subnet = get_subnet(db, subnet_id=subnet_id)
+  if db_subnet is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+
+  all_ips = _scan_targets(db, subnet_id, db_subnet.subnet, targets)
+  previous = latest_scan_states(db, subnet_id)
+  scanned_at = datetime.utcnow()
+  probe_ips = select_delta_targets(
+    all_ips, previous, scanned_at, timedelta(minutes=settings.scan.stale_after_minutes)
+  )
+  ip_to_device = devices_by_ip(db, subnet_id)
+  controller = build_rate_controller(db_subnet.subnet, **rate_options)
+
+  ping_results = ping_multiple_hosts(
+    probe_ips, max_workers=20, timeout=2, controller=controller, probes=probes
+  ) if probe_ips else []
+  neighbors = NeighborTable()
+  # Only the changes are kept as response models; everything else becomes a compact history row
+  history = []
+  changes = []
+  for pr in ping_results:
+    result = build_scan_result(pr, ip_to_device, neighbors)
+    history.append(scan_row(result))
+    record = previous.get(result.ip)
+    if is_state_change(result.online, record):
+      changes.append(NetworkScanChange(
+        **result.model_dump(),
+        previous_online=record.online if record else None,
+        previous_scanned_at=record.scanned_at if record else None
+      ))
+  if resolve_names:
+    resolve_hostnames(changes)
+  record_scan_rows(db, subnet_id, history, scanned_at, previous)
+
+  return NetworkScanDeltaResponse(
+    subnet_id=subnet_id,
+    subnet_cidr=db_subnet.subnet,
+    total_ips=len(all_ips),
+    probed_ips=len(probe_ips),
+    skipped_ips=len(all_ips) - len(probe_ips),
+    changed_count=len(changes),
+    results=changes,
+    rate=controller.stats() if probe_ips else None
+  )
+
+@router.get("/{subnet_id}/scan-history", response_model=List[ScanRecordResponse])
+def get_scan_history(
+  subnet_id: int,
+  ip_address: Optional[str] = None,
+  changes_only: bool = False,
+  skip: int = Query(0, ge=0),
+  limit: int = Query(500, ge=1, le=5000),
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_admin_user)
+):
+  """Get stored scan results of a subnet, newest first (admin only)"""
+  if get_subnet(db, subnet_id=subnet_id) is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+
+  query = db.query(ScanRecord).filter(ScanRecord.subnet_id == subnet_id)
+  if ip_address:
+    query = query.filter(ScanRecord.ip_address == ip_address)
+  if changes_only:
+    query = query.filter(ScanRecord.changed.is_(True))
+  return query.order_by(desc(ScanRecord.scanned_at), ScanRecord.ip_address).offset(skip).limit(limit).all()
+
+@router.post("/{subnet_id}/update-macs", response_model=MacUpdateResponse)
+def update_device_macs(
+  subnet_id: int,
+  body: MacUpdateRequest,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_admin_user)
+):
+  """Fill registered devices' MAC addresses from the scanner's neighbor cache in one batched update (admin only).
+
+  Only L2-adjacent hosts that were contacted recently (e.g. by a scan) are in
+  the cache. Existing MACs are kept unless `overwrite` is set.
+  """
+  if get_subnet(db, subnet_id=subnet_id) is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+
+  query = db.query(Device.id, Device.ip_address, Device.mac_address).filter(
+    Device.subnet_id == subnet_id, Device.ip_address.isnot(None)
+  )
+  if body.device_ids is not None:
+    query = query.filter(Device.id.in_(body.device_ids))
+  rows = query.all()
+
+  neighbors = NeighborTable().entries()
+  changes, mappings = [], []
+  not_found = 0
+  for row in rows:
+    mac = neighbors.get(_canonical_ip(row.ip_address))
+    if mac is None:
+      not_found += 1
+      continue
+    if row.mac_address and (not body.overwrite or normalize_mac(row.mac_address) == mac):
+      continue
+    changes.append(MacUpdateChange(device_id=row.id, ip_address=row.ip_address, old_mac=row.mac_address, new_mac=mac))
+    mappings.append({"id": row.id, "mac_address": mac})
+
+  if mappings and not body.dry_run:
+    db.bulk_update_mappings(Device, mappings)
+    db.commit()
+
+  return MacUpdateResponse(
+    checked=len(rows),
+    updated=0 if body.dry_run else len(mappings),
+    not_found=not_found,
+    dry_run=body.dry_run,
+    changes=changes
+  )
+
+# ========== DEVICE IDENTIFICATION ==========
+
+@router.post("/{subnet_id}/identify/modbus", response_model=DiscoveryResponse)
+def identify_modbus_devices(
+  subnet_id: int,
+  body: ModbusDiscoveryRequest,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_admin_user)
+):
+  """Read Modbus device identification (function 43/14) from online hosts and suggest brand/model (admin only).
+
+  Hosts default to those online in the subnet's latest stored scan. At most
+  `discovery.max_concurrency` sessions are open at once and new ones start
+  no faster than `discovery.rate` per second. With `apply`, suggestions are
+  written to the matching registered devices in one batched update.
+  """
+  db_subnet = get_subnet(db, subnet_id=subnet_id)
+  if db_subnet is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+
+  ips = _discovery_targets(db, subnet_id, db_subnet.subnet, body.ips)
+  options = settings.discovery
+  unit_id = body.unit_id if body.unit_id is not None else options.modbus_unit_id
+  answers = run_sweep(
+    ips, lambda ip: identify_modbus(ip, body.port, unit_id, options.timeout_seconds),
+    options.max_concurrency, options.rate
+  )
+
+  ip_to_device = devices_by_ip(db, subnet_id)
+  results = []
+  for ip in ips:
+    answer = answers[ip]
+    brand, model = modbus_suggestions(answer["objects"])
+    results.append(_identification(ip, "modbus", answer["objects"], answer["error"], brand, model, ip_to_device))
+  return _discovery_response(db, subnet_id, db_subnet.subnet, results, body.apply, body.overwrite)
+
+@router.post("/{subnet_id}/identify/enip", response_model=EnipDiscoveryResponse)
+def identify_enip_devices(
+  subnet_id: int,
+  body: EnipDiscoveryRequest,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_admin_user)
+):
+  """Discover EtherNet/IP (CIP) devices with one ListIdentity broadcast plus unicasts (admin only).
+
+  The broadcast reaches devices on a directly attached IPv4 segment; unicast
+  requests go to the given hosts (default: online in the latest scan) for
+  routed segments. Replies are collected until the deadline, flagged as
+  registered or new like scan results and stored in the scan history.
+  """
+  db_subnet = get_subnet(db, subnet_id=subnet_id)
+  if db_subnet is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+
+  network = ipaddress.ip_network(db_subnet.subnet, strict=False)
+  unicast = [ip for ip in _discovery_targets(db, subnet_id, db_subnet.subnet, body.ips) if ":" not in ip]
+  broadcast = None
+  if body.broadcast and network.version == 4 and network.prefixlen < 31:
+    broadcast = str(network.broadcast_address)
+  options = settings.discovery
+
+  scanned_at = datetime.utcnow()
+  replies = asyncio.run(list_identity(
+    unicast, broadcast, body.port,
+    wait=body.wait_seconds or options.enip_wait_seconds, rate=options.rate
+  ))
+
+  ip_to_device = devices_by_ip(db, subnet_id)
+  results = []
+  counts = empty_scan_counts()
+  for ip in sorted(replies, key=ip_sort_key):
+    if ipaddress.ip_address(ip) not in network:
+      continue
+    identity, latency_ms = replies[ip]
+    scan_result = build_scan_result(
+      {"ip": ip, "online": True, "latency_ms": latency_ms, "probe": f"enip/{body.port}"}, ip_to_device
+    )
+    brand, model = enip_suggestions(identity, options.enip_vendors)
+    suggested = suggest_device_fields(brand, model)
+    result = EnipScanResult(
+      **scan_result.model_dump(),
+      identity=EnipIdentity(**identity),
+      suggested_brand=suggested.get("brand"),
+      suggested_model=suggested.get("model")
+    )
+    tally_scan_result(counts, result)
+    results.append(result)
+  record_scan_results(db, subnet_id, results, scanned_at)
+  updated = _apply_identifications(db, results, body.overwrite) if body.apply else 0
+
+  return EnipDiscoveryResponse(
+    subnet_id=subnet_id,
+    subnet_cidr=db_subnet.subnet,
+    probed=len(unicast),
+    online_count=counts["online_count"],
+    registered_count=counts["registered_count"],
+    new_count=counts["new_count"],
+    updated=updated,
     results=results
   )
 
+# ========== PASSIVE DISCOVERY ==========
+
+@router.post("/pcap-import", response_model=PcapImportResponse)
+def import_pcap(
+  file: UploadFile = File(...),
+  apply: bool = Form(False),
+  overwrite: bool = Form(False),
+  talkers: int = Form(100, ge=0, le=10000),
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_admin_user)
+):
+  """Inventory hosts, MACs, OT protocols and talkers of a pcap/pcapng capture and diff them against devices.
+
+  The capture is read in one pass, one packet at a time. Nothing is sent on
+  the network. New devices are only proposed; with `apply`, observed MACs
+  are written to devices that have none (or to all of them with `overwrite`).
+  """
+  inventory = PassiveInventory(
+    max_hosts=settings.discovery.pcap_max_hosts,
+    max_talkers=settings.discovery.pcap_max_talkers,
+    router_mac_ips=settings.discovery.pcap_router_mac_ips
+  )
+  try:
+    ingest_capture(file.file, inventory)
+  except CaptureError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+
+  new_devices, mac_updates = diff_inventory(db, inventory, subnet_resolver.resolve_many)
+  mac_updates = [PcapMacUpdate(**update) for update in mac_updates]
+  if apply:
+    mappings = []
+    for update in mac_updates:
+      if update.current_mac and not overwrite:
+        continue
+      mappings.append({"id": update.device_id, "mac_address": update.observed_mac})
+      update.applied = True
+    if mappings:
+      db.bulk_update_mappings(Device, mappings)
+      db.commit()
+
+  return PcapImportResponse(
+    filename=file.filename,
+    packets=inventory.packets,
+    undecoded_packets=inventory.undecoded,
+    hosts_seen=len(inventory.hosts),
+    dropped_hosts=inventory.dropped_hosts,
+    dropped_talkers=inventory.dropped_talkers,
+    new_devices=[PcapDeviceProposal(**proposal) for proposal in new_devices],
+    mac_updates=mac_updates,
+    talkers=[PcapTalker(**talker) for talker in top_talkers(inventory, talkers)]
+  )
+
 @router.post("/quick-add", status_code=status.HTTP_201_CREATED)
 def quick_add_device(
   body: QuickAddDeviceRequest,
@@ -85,8 +519,15 @@ def quick_add_device(
   current_user = Depends(get_current_admin_user)
 ):
   """Quickly add a discovered device from scan (admin only)"""
+  subnet_id = body.subnet_id
+  if subnet_id is None:
+    match = subnet_resolver.resolve(db, body.ip_address)
+    if match is None:
+      raise HTTPException(status_code=400, detail=f"No subnet contains IP {body.ip_address}")
+    subnet_id = match.subnet_id
+
   # Verify subnet exists
-  db_subnet = get_subnet(db, subnet_id=body.subnet_id)
+  db_subnet = get_subnet(db, subnet_id=subnet_id)
   if db_subnet is None:
     raise HTTPException(status_code=404, detail="Subnet not found")
 
@@ -99,16 +540,23 @@ def quick_add_device(
     name=body.name,
     ip_address=body.ip_address,
     hostname=body.hostname,
-    subnet_id=body.subnet_id,
+    brand=body.brand,
+    model=body.model,
+    subnet_id=subnet_id,
     asset_type=body.asset_type,
     network_level=body.network_level,
     default_gateway=db_subnet.default_gateway,
     netmask=db_subnet.netmask,
     created_by=current_user.id
   )
+  try:
+    release_reservation(db, db_device.subnet_id, db_device.ip_address, current_user.id)
+  except ReservationHeld as e:
+    raise HTTPException(status_code=409, detail=str(e))
   db.add(db_device)
   db.commit()
   db.refresh(db_device)
+  occupancy.device_added(db_device.subnet_id, db_device.ip_address)
 
   return {
     "id": db_device.id,
@@ -116,3 +564,91 @@ def quick_add_device(
     "ip_address": db_device.ip_address,
     "message": f"Dispositivo '{db_device.name}' creado exitosamente"
   }
+
+# ========== HELPERS ==========
+
+def _canonical_ip(ip: str) -> str:
+  # Neighbor cache keys are in canonical form (lower-case, compressed IPv6)
+  try:
+    return str(ipaddress.ip_address(ip.strip()))
+  except ValueError:
+    return ip
+
+def _scan_targets(db: Session, subnet_id: int, cidr: str, targets: Optional[ScanTargets]) -> List[str]:
+  targets = targets or ScanTargets()
+  try:
+    return resolve_scan_targets(db, subnet_id, cidr, targets.mode, targets.ips)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+
+def _encode_frame(format: str, frame_type: str, data: dict) -> str:
+  if format == "sse":
+    return f"event: {frame_type}\ndata: {json.dumps(data)}\n\n"
+  return json.dumps({"type": frame_type, **data}) + "\n"
+
+def _discovery_targets(db: Session, subnet_id: int, cidr: str, ips: Optional[List[str]]) -> List[str]:
+  """Requested addresses (which must lie in the subnet), or the hosts online in the latest scan"""
+  if ips is None:
+    online = [ip for ip, record in latest_scan_states(db, subnet_id).items() if record.online]
+    return sorted(online, key=ip_sort_key)
+  network = ipaddress.ip_network(cidr, strict=False)
+  targets = []
+  for ip in ips:
+    try:
+      addr = ipaddress.ip_address(ip.strip())
+    except ValueError:
+      raise HTTPException(status_code=400, detail=f"Invalid IP address: {ip}")
+    if addr not in network:
+      raise HTTPException(status_code=400, detail=f"{ip} is not an address of {network}")
+    targets.append(str(addr))
+  return list(dict.fromkeys(targets))
+
+def _identification(ip: str, protocol: str, objects: dict, error: Optional[str], brand: Optional[str],
+                    model: Optional[str], ip_to_device: dict) -> DeviceIdentification:
+  device = ip_to_device.get(ip)
+  suggested = suggest_device_fields(brand, model)
+  return DeviceIdentification(
+    ip=ip,
+    protocol=protocol,
+    identified=bool(objects),
+    objects=objects,
+    device_id=device[0] if device else None,
+    device_name=device[1] if device else None,
+    suggested_brand=suggested.get("brand"),
+    suggested_model=suggested.get("model"),
+    error=error
+  )
+
+def _discovery_response(db: Session, subnet_id: int, cidr: str, results: List[DeviceIdentification],
+                        apply: bool, overwrite: bool) -> DiscoveryResponse:
+  updated = _apply_identifications(db, results, overwrite) if apply else 0
+  return DiscoveryResponse(
+    subnet_id=subnet_id,
+    subnet_cidr=cidr,
+    probed=len(results),
+    identified=sum(1 for r in results if r.identified),
+    updated=updated,
+    results=results
+  )
+
+def _apply_identifications(db: Session, results: List[Union[DeviceIdentification, EnipScanResult]],
+                           overwrite: bool) -> int:
+  """Write suggested brand/model to registered devices in one batched update"""
+  by_device = {r.device_id: r for r in results if r.device_id and (r.suggested_brand or r.suggested_model)}
+  if not by_device:
+    return 0
+  current = db.query(Device.id, Device.brand, Device.model).filter(Device.id.in_(list(by_device))).all()
+  mappings = []
+  for row in current:
+    result = by_device[row.id]
+    mapping = {"id": row.id}
+    for field, value, existing in (("brand", result.suggested_brand, row.brand), ("model", result.suggested_model, row.model)):
+      if value and value != existing and (overwrite or not existing):
+        mapping[field] = value
+    if len(mapping) > 1:
+      mappings.append(mapping)
+      result.applied = True
+  if mappings:
+    db.bulk_update_mappings(Device, mappings)
+    db.commit()
+  return len(mappings)
@@ -1,20 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional
+from itertools import islice
+import ipaddress
+from datetime import timedelta
 from ..core.database import get_db
 from ..schemas.schemas import (
   SubnetCreate, SubnetUpdate, SubnetResponse,
-  SubnetIPInfo, FreeIPResponse, IPValidationRequest, IPValidationResponse
+  SubnetIPInfo, FreeIPResponse, FreeIPRange, IPValidationRequest, IPValidationResponse,
+  OrphanDevice, SubnetOverlap, FreeSubnetBlock, SubnetBlockReserve,
+  IPAllocationRequest, IPAllocationResponse, IPReservationResponse,
+  BatchIPValidationRequest, BatchIPValidationResult
 )
 from ..crud.crud import (
   get_subnets, get_subnet, create_subnet, update_subnet, delete_subnet,
-  get_subnets_by_location, get_location, get_network_level
+  get_subnets_by_location, get_location, get_network_level, SUBNET_KEYS
 )
 from ..core.deps import get_current_active_user
-from ..utils.network import get_all_ips_in_subnet, get_used_ips_in_subnet, get_free_ips_in_subnet, is_ip_in_subnet
+from ..utils.network import (
+  get_used_ips_in_subnet, get_free_ips_in_subnet, is_ip_in_subnet,
+  count_hosts, count_used_hosts, iter_free_ranges, find_orphan_devices, host_bounds
+)
+from ..utils.occupancy import occupancy
+from ..utils.subnet_trie import subnet_resolver, subnet_conflicts
+from ..utils.subnet_overlap import find_overlapping_pairs, overlap_kind, subnet_range, iter_free_blocks
+from ..utils.allocation import allocate_ips, reserved_ips, purge_expired_reservations, AllocationError
+from ..utils.pagination import set_next_cursor
+from ..models.user import Subnet, Device
+from ..models.ip_reservation import IPReservation
 
 router = APIRouter()
 
+# Attempts before giving up when concurrent requests keep taking the chosen block
+MAX_BLOCK_RESERVATION_ATTEMPTS = 8
+# max_devices of a reserved block defaults to its host count, capped to fit the integer column (IPv6 blocks)
+MAX_DEFAULT_DEVICES = 2 ** 31 - 1
+
 def enrich_subnet(subnet, db: Session) -> dict:
   """Add related names to subnet response"""
   subnet_dict = {
@@ -52,14 +74,194 @@ def get_subnets_by_location_endpoint(
   subnets = get_subnets_by_location(db, location_id=location_id)
   return [enrich_subnet(s, db) for s in subnets]
 
+@router.get("/orphans", response_model=List[OrphanDevice])
+def get_orphan_devices(
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """Devices whose IP does not match their subnet, or that lack one (route must be defined BEFORE /{subnet_id})"""
+  return find_orphan_devices(db)
+
+@router.get("/overlaps", response_model=List[SubnetOverlap])
+def get_subnet_overlaps(
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """Every pair of subnets whose address ranges overlap (route must be defined BEFORE /{subnet_id})"""
+  ranges = [subnet_range(s.subnet, s.id) for s in db.query(Subnet.id, Subnet.subnet).all()]
+  return [
+    SubnetOverlap(
+      subnet_id=a.subnet_id, subnet_cidr=a.cidr,
+      other_subnet_id=b.subnet_id, other_subnet_cidr=b.cidr, kind=kind
+    )
+    for a, b, kind in find_overlapping_pairs(r for r in ranges if r is not None)
+  ]
+
+@router.get("/free-blocks", response_model=List[FreeSubnetBlock])
+def get_free_subnet_blocks(
+  parent: str,
+  prefix_length: int = Query(..., ge=1, le=128),
+  count: int = Query(1, ge=1, le=1024),
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """First free aligned blocks of a prefix length inside a supernet (route must be defined BEFORE /{subnet_id})"""
+  parent_network = _parse_parent(parent)
+  try:
+    blocks = list(islice(iter_free_blocks(parent_network, prefix_length, _existing_networks(db)), count))
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  return [_free_block(b) for b in blocks]
+
+@router.post("/reserve-block", response_model=SubnetResponse, status_code=status.HTTP_201_CREATED)
+def reserve_subnet_block(
+  body: SubnetBlockReserve,
+  allow_nested: bool = False,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """Create a subnet on the first free aligned block of a supernet (route must be defined BEFORE /{subnet_id}).
+
+  A block inside an existing subnet is refused unless `allow_nested` is set, as on create.
+  """
+  parent_network = _parse_parent(body.parent)
+  for _attempt in range(MAX_BLOCK_RESERVATION_ATTEMPTS):
+    # Recomputed from the database on every attempt: the block another worker just took is skipped
+    try:
+      block = next(iter_free_blocks(parent_network, body.prefix_length, _existing_networks(db)), None)
+    except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+    if block is None:
+      raise HTTPException(status_code=409, detail=f"No free /{body.prefix_length} block left in {parent_network}")
+
+    free_block = _free_block(block)
+    block_range = subnet_range(free_block.cidr)
+    if any(overlap_kind(block_range, other) != "contained" for other in subnet_conflicts(db, free_block.cidr)):
+      continue  # Created by another worker since the free blocks were listed
+    # Only an enclosing subnet is left to conflict with
+    _check_overlaps(db, free_block.cidr, allow_nested)
+    try:
+      subnet = SubnetCreate(
+        name=body.name,
+        location=body.location,
+        location_id=body.location_id,
+        network_level_id=body.network_level_id,
+        subnet=free_block.cidr,
+        default_gateway=body.default_gateway or free_block.first_host,
+        netmask=free_block.netmask,
+        max_devices=body.max_devices or max(1, min(free_block.size, MAX_DEFAULT_DEVICES))
+      )
+    except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+    try:
+      db_subnet = create_subnet(db=db, subnet=subnet)
+    except IntegrityError:
+      # uq_subnets_subnet: a concurrent request created this block first
+      db.rollback()
+      continue
+    return enrich_subnet(db_subnet, db)
+  raise HTTPException(
+    status_code=409,
+    detail=f"Could not reserve a /{body.prefix_length} block in {parent_network} after {MAX_BLOCK_RESERVATION_ATTEMPTS} attempts"
+  )
+
+@router.post("/validate-ips", response_model=List[BatchIPValidationResult])
+def validate_ips_batch(
+  body: BatchIPValidationRequest,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """Validate many IPs, possibly across subnets, loading each subnet's occupancy once (route must be defined BEFORE /{subnet_id})"""
+  subnets = {}
+  bitmaps = {}
+  used_sets = {}
+  reserved_sets = {}
+  seen = set()
+  results = []
+  conflicts = []
+  for item in body.items:
+    ip = item.ip_address.strip()
+    subnet_id = item.subnet_id or body.subnet_id
+    if subnet_id is None:
+      match = subnet_resolver.resolve(db, ip)
+      subnet_id = match.subnet_id if match else None
+    if subnet_id is not None and subnet_id not in subnets:
+      subnets[subnet_id] = get_subnet(db, subnet_id=subnet_id)
+    db_subnet = subnets.get(subnet_id)
+
+    duplicate = (subnet_id, ip) in seen
+    seen.add((subnet_id, ip))
+    result = BatchIPValidationResult(
+      ip_address=ip, subnet_id=subnet_id, valid=False, in_subnet=False, available=False,
+      duplicate_in_batch=duplicate, message=""
+    )
+    results.append(result)
+
+    try:
+      ipaddress.ip_address(ip)
+    except ValueError:
+      result.message = f"La IP {ip} no es válida"
+      continue
+    result.valid = True
+    if db_subnet is None:
+      result.message = f"La subred {subnet_id} no existe" if subnet_id is not None else f"Ninguna subred contiene la IP {ip}"
+      continue
+    if not is_ip_in_subnet(ip, db_subnet.subnet):
+      result.message = f"La IP {ip} no pertenece a la subred {db_subnet.subnet}"
+      continue
+    result.in_subnet = True
+
+    if subnet_id not in bitmaps:
+      bitmaps[subnet_id] = occupancy.get(db, subnet_id, db_subnet.subnet)
+      reserved_sets[subnet_id] = reserved_ips(db, subnet_id)
+    bitmap = bitmaps[subnet_id]
+    if bitmap is not None and bitmap.offset_of(ip) is not None:
+      used = bitmap.contains(ip)
+    else:
+      if subnet_id not in used_sets:
+        used_sets[subnet_id] = get_used_ips_in_subnet(db, subnet_id)
+      used = ip in used_sets[subnet_id]
+    result.reserved = ip in reserved_sets[subnet_id]
+    result.available = not used and not result.reserved and not duplicate
+
+    if used:
+      result.message = f"La IP {ip} ya está en uso"
+      conflicts.append(result)
+    elif result.reserved:
+      result.message = f"La IP {ip} está reservada"
+    elif duplicate:
+      result.message = f"La IP {ip} está repetida en el lote"
+    else:
+      result.message = f"La IP {ip} está disponible"
+
+  # Names of the devices holding the used addresses, in one query
+  if conflicts:
+    rows = db.query(Device.id, Device.name, Device.ip_address, Device.subnet_id).filter(
+      Device.ip_address.in_(list({r.ip_address for r in conflicts})),
+      Device.subnet_id.in_(list({r.subnet_id for r in conflicts}))
+    ).all()
+    holders = {(d.subnet_id, d.ip_address): d for d in rows}
+    for r in conflicts:
+      device = holders.get((r.subnet_id, r.ip_address))
+      if device is not None:
+        r.conflict_device_id = device.id
+        r.conflict_device_name = device.name
+  return results
+
 @router.get("", response_model=List[SubnetResponse])
 def get_subnet_list(
+  response: Response,
   skip: int = 0,
   limit: int = 100,
+  cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces skip"),
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
-  subnets = get_subnets(db, skip=skip, limit=limit)
+  try:
+    subnets = get_subnets(db, skip=skip, limit=limit, cursor=cursor)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  set_next_cursor(response, subnets, SUBNET_KEYS, limit)
   return [enrich_subnet(s, db) for s in subnets]
 
 @router.get("/{subnet_id}", response_model=SubnetResponse)
@@ -76,20 +278,33 @@ def read_subnet(
 @router.post("", response_model=SubnetResponse, status_code=status.HTTP_201_CREATED)
 def create_new_subnet(
   subnet: SubnetCreate,
+  allow_nested: bool = False,
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
-  db_subnet = create_subnet(db=db, subnet=subnet)
+  _check_overlaps(db, subnet.subnet, allow_nested)
+  try:
+    db_subnet = create_subnet(db=db, subnet=subnet)
+  except IntegrityError:
+    db.rollback()
+    raise HTTPException(status_code=400, detail=f"Subnet {subnet.subnet} already exists")
   return enrich_subnet(db_subnet, db)
 
 @router.put("/{subnet_id}", response_model=SubnetResponse)
 def update_existing_subnet(
   subnet_id: int,
   subnet: SubnetUpdate,
+  allow_nested: bool = False,
   db: Session = Depends(get_db),
   current_user = Depends(get_current_active_user)
 ):
-  db_subnet = update_subnet(db, subnet_id=subnet_id, subnet=subnet)
+  if subnet.subnet is not None:
+    _check_overlaps(db, subnet.subnet, allow_nested, exclude_id=subnet_id)
+  try:
+    db_subnet = update_subnet(db, subnet_id=subnet_id, subnet=subnet)
+  except IntegrityError:
+    db.rollback()
+    raise HTTPException(status_code=400, detail=f"Subnet {subnet.subnet} already exists")
   if db_subnet is None:
     raise HTTPException(status_code=404, detail="Subnet not found")
   return enrich_subnet(db_subnet, db)
@@ -116,10 +331,12 @@ def get_subnet_ip_info(
   if db_subnet is None:
     raise HTTPException(status_code=404, detail="Subnet not found")
 
-  all_ips = get_all_ips_in_subnet(db_subnet.subnet)
-  used_ips = get_used_ips_in_subnet(db, subnet_id)
-  total = len(all_ips)
-  used = len(used_ips)
+  bitmap = occupancy.get(db, subnet_id, db_subnet.subnet)
+  if bitmap is not None:
+    total, used = bitmap.size, bitmap.used
+  else:
+    total = count_hosts(db_subnet.subnet)
+    used = count_used_hosts(db_subnet.subnet, get_used_ips_in_subnet(db, subnet_id))
   free = total - used
   usage_pct = round((used / total * 100), 2) if total > 0 else 0
 
@@ -144,9 +361,104 @@ def get_subnet_free_ips(
   if db_subnet is None:
     raise HTTPException(status_code=404, detail="Subnet not found")
 
-  free_ips = get_free_ips_in_subnet(db, subnet_id, db_subnet.subnet, limit=limit)
+  # Addresses held by pending allocations are not offered
+  reserved = reserved_ips(db, subnet_id)
+  bitmap = occupancy.get(db, subnet_id, db_subnet.subnet)
+  if bitmap is not None:
+    free_ips = list(islice((ip for ip in bitmap.iter_free_ips() if ip not in reserved), limit))
+  else:
+    free_ips = get_free_ips_in_subnet(db, subnet_id, db_subnet.subnet, limit=limit + len(reserved))
+    free_ips = [ip for ip in free_ips if ip not in reserved][:limit]
   return [FreeIPResponse(ip=ip, available=True) for ip in free_ips]
 
+@router.get("/{subnet_id}/free-ranges", response_model=List[FreeIPRange])
+def get_subnet_free_ranges(
+  subnet_id: int,
+  limit: int = Query(50, ge=1, le=1000),
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """Get contiguous ranges of free IPs in a subnet"""
+  db_subnet = get_subnet(db, subnet_id=subnet_id)
+  if db_subnet is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+
+  try:
+    address_class = type(ipaddress.ip_network(db_subnet.subnet, strict=False).network_address)
+  except ValueError:
+    return []
+  bitmap = occupancy.get(db, subnet_id, db_subnet.subnet)
+  if bitmap is not None:
+    ranges = bitmap.iter_free_ranges()
+  else:
+    ranges = iter_free_ranges(db_subnet.subnet, get_used_ips_in_subnet(db, subnet_id))
+  return [
+    FreeIPRange(start=str(address_class(start)), end=str(address_class(end)), size=end - start + 1)
+    for start, end in islice(ranges, limit)
+  ]
+
+@router.post("/{subnet_id}/allocate", response_model=IPAllocationResponse, status_code=status.HTTP_201_CREATED)
+def allocate_subnet_ips(
+  subnet_id: int,
+  body: IPAllocationRequest,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """Reserve the next free IP, or a block of contiguous IPs, until a device takes it or the TTL runs out"""
+  db_subnet = get_subnet(db, subnet_id=subnet_id)
+  if db_subnet is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+
+  try:
+    reservations = allocate_ips(
+      db, subnet_id, db_subnet.subnet,
+      count=body.count,
+      contiguous=body.contiguous,
+      ttl=timedelta(seconds=body.ttl_seconds),
+      user_id=current_user.id,
+      note=body.note
+    )
+  except AllocationError as e:
+    raise HTTPException(status_code=409, detail=str(e))
+
+  return IPAllocationResponse(
+    subnet_id=subnet_id,
+    addresses=[r.ip_address for r in reservations],
+    expires_at=reservations[0].expires_at,
+    reservations=reservations
+  )
+
+@router.get("/{subnet_id}/reservations", response_model=List[IPReservationResponse])
+def get_subnet_reservations(
+  subnet_id: int,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """Get unexpired IP reservations of a subnet"""
+  if get_subnet(db, subnet_id=subnet_id) is None:
+    raise HTTPException(status_code=404, detail="Subnet not found")
+  purge_expired_reservations(db, subnet_id)
+  db.commit()
+  return db.query(IPReservation).filter(IPReservation.subnet_id == subnet_id).order_by(IPReservation.expires_at).all()
+
+@router.delete("/{subnet_id}/reservations/{reservation_id}", status_code=status.HTTP_204_NO_CONTENT)
+def release_subnet_reservation(
+  subnet_id: int,
+  reservation_id: int,
+  db: Session = Depends(get_db),
+  current_user = Depends(get_current_active_user)
+):
+  """Release an IP reservation before its TTL runs out"""
+  reservation = db.query(IPReservation).filter(
+    IPReservation.id == reservation_id,
+    IPReservation.subnet_id == subnet_id
+  ).first()
+  if reservation is None:
+    raise HTTPException(status_code=404, detail="Reservation not found")
+  db.delete(reservation)
+  db.commit()
+  return None
+
 @router.post("/{subnet_id}/validate-ip", response_model=IPValidationResponse)
 def validate_ip_in_subnet(
   subnet_id: int,
@@ -168,16 +480,67 @@ def validate_ip_in_subnet(
       message=f"La IP {ip} no pertenece a la subred {db_subnet.subnet}"
     )
 
-  used_ips = get_used_ips_in_subnet(db, subnet_id)
-  available = ip not in used_ips
+  bitmap = occupancy.get(db, subnet_id, db_subnet.subnet)
+  if bitmap is not None and bitmap.offset_of(ip) is not None:
+    available = not bitmap.contains(ip)
+  else:
+    available = ip not in get_used_ips_in_subnet(db, subnet_id)
 
   if not available:
     return IPValidationResponse(
       ip_address=ip, valid=True, in_subnet=True, available=False,
       message=f"La IP {ip} ya está en uso"
     )
+  # Held by a pending allocation, as in /validate-ips and /free-ips
+  if ip in reserved_ips(db, subnet_id):
+    return IPValidationResponse(
+      ip_address=ip, valid=True, in_subnet=True, available=False,
+      message=f"La IP {ip} está reservada"
+    )
 
   return IPValidationResponse(
     ip_address=ip, valid=True, in_subnet=True, available=True,
     message=f"La IP {ip} está disponible"
-  )
\ No newline at end of file
+  )
+
+def _check_overlaps(db: Session, cidr: str, allow_nested: bool, exclude_id: Optional[int] = None):
+  """Reject a CIDR that duplicates an existing subnet, or nests with one unless allowed"""
+  new_range = subnet_range(cidr)
+  if new_range is None:
+    raise HTTPException(status_code=400, detail=f"Invalid subnet: {cidr}")
+  for other in subnet_conflicts(db, cidr, exclude_id=exclude_id):
+    kind = overlap_kind(new_range, other)
+    if kind == "duplicate":
+      raise HTTPException(status_code=400, detail=f"Subnet {new_range.cidr} already exists (id {other.subnet_id})")
+    if not allow_nested:
+      relation = "contains" if kind == "contains" else "is inside"
+      raise HTTPException(
+        status_code=400,
+        detail=f"Subnet {new_range.cidr} {relation} subnet {other.cidr} (id {other.subnet_id}); pass allow_nested=true if intended"
+      )
+
+def _parse_parent(cidr: str):
+  try:
+    return ipaddress.ip_network(cidr.strip(), strict=False)
+  except ValueError:
+    raise HTTPException(status_code=400, detail=f"Invalid subnet: {cidr}")
+
+def _existing_networks(db: Session) -> list:
+  networks = []
+  for s in db.query(Subnet.subnet).all():
+    try:
+      networks.append(ipaddress.ip_network(s.subnet, strict=False))
+    except ValueError:
+      continue
+  return networks
+
+def _free_block(network) -> FreeSubnetBlock:
+  first_host, last_host = host_bounds(network)
+  address_class = type(network.network_address)
+  return FreeSubnetBlock(
+    cidr=str(network),
+    netmask=str(network.netmask),
+    first_host=str(address_class(first_host)),
+    last_host=str(address_class(last_host)),
+    size=max(0, last_host - first_host + 1)
+  )
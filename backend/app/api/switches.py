@@ -1,14 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
+from ..core.config import settings
 from ..core.database import get_db
 from ..core.deps import get_current_active_user, get_current_admin_user
 from ..crud import crud
 from ..schemas.schemas import (
   SwitchCreate, SwitchUpdate, SwitchResponse,
-  SwitchPortCreate, SwitchPortUpdate, SwitchPortResponse
+  SwitchPortCreate, SwitchPortUpdate, SwitchPortResponse,
+  SwitchPollRequest, SwitchPollResult, SwitchPollResponse
 )
-from ..models.user import User
+from ..models.user import User, Switch
+from ..utils.network import parse_ip_prefix
+from ..utils.ipnum import packed_range
+from ..utils.pagination import set_next_cursor
+from ..utils.snmp import SNMPCredentials, check_credentials
+from ..utils.switch_poller import poll_switches, reconcile_switch_ports, device_ids_by_mac, vlan_ids_by_number
 
 router = APIRouter()
 
@@ -40,16 +48,46 @@ def delete_switch_port(
     raise HTTPException(status_code=404, detail="Switch port not found")
   return None
 
+# ========== SNMP POLLING ==========
+
+@router.post("/poll", response_model=SwitchPollResponse)
+def poll_all_switches(
+  body: SwitchPollRequest = SwitchPollRequest(),
+  db: Session = Depends(get_db),
+  current_user: User = Depends(get_current_admin_user)
+):
+  """Poll switches over SNMP (sysDescr, interfaces, forwarding table, VLANs) and update their ports"""
+  query = db.query(Switch).filter(Switch.ip_address.isnot(None), Switch.ip_address != "")
+  if body.switch_ids is not None:
+    query = query.filter(Switch.id.in_(body.switch_ids))
+  switches = query.order_by(Switch.id).all()
+  return _poll(db, switches, body)
+
 # ========== SWITCHES ==========
 
 @router.get("", response_model=List[SwitchResponse])
 def get_all_switches(
+  response: Response,
   skip: int = 0,
   limit: int = 100,
+  cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces skip"),
+  ip_prefix: Optional[str] = None,
   db: Session = Depends(get_db)
 ):
-  """Get all switches"""
-  switches = crud.get_switches(db, skip=skip, limit=limit)
+  """Get all switches, optionally only those inside an IP prefix"""
+  if ip_prefix:
+    try:
+      first, last = packed_range(parse_ip_prefix(ip_prefix))
+      switches = crud.get_switches_in_range(db, first, last, skip=skip, limit=limit, cursor=cursor)
+    except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, switches, crud.SWITCH_RANGE_KEYS, limit)
+  else:
+    try:
+      switches = crud.get_switches(db, skip=skip, limit=limit, cursor=cursor)
+    except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+    set_next_cursor(response, switches, crud.SWITCH_KEYS, limit)
   result = []
   for sw in switches:
     result.append(_build_switch_response(db, sw))
@@ -110,13 +148,23 @@ def delete_switch(
 # ========== SWITCH PORTS (nested under switch) ==========
 
 @router.get("/{switch_id}/ports", response_model=List[SwitchPortResponse])
-def get_switch_ports(switch_id: int, db: Session = Depends(get_db)):
+def get_switch_ports(
+  switch_id: int,
+  response: Response,
+  limit: Optional[int] = Query(None, ge=1, description="Page size; all ports when omitted"),
+  cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+  db: Session = Depends(get_db)
+):
   """Get all ports for a switch"""
   sw = crud.get_switch(db, switch_id=switch_id)
   if not sw:
     raise HTTPException(status_code=404, detail="Switch not found")
 
-  ports = crud.get_switch_ports_by_switch(db, switch_id=switch_id)
+  try:
+    ports = crud.get_switch_ports_by_switch(db, switch_id=switch_id, limit=limit, cursor=cursor)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  set_next_cursor(response, ports, crud.SWITCH_PORT_KEYS, limit)
   result = []
   for port in ports:
     result.append(_build_port_response(db, port))
@@ -147,8 +195,58 @@ def create_switch_port(
   db_port = crud.create_switch_port(db, port=port, switch_id=switch_id)
   return _build_port_response(db, db_port)
 
+@router.post("/{switch_id}/poll", response_model=SwitchPollResponse)
+def poll_switch(
+  switch_id: int,
+  body: SwitchPollRequest = SwitchPollRequest(),
+  db: Session = Depends(get_db),
+  current_user: User = Depends(get_current_admin_user)
+):
+  """Poll one switch over SNMP and update its ports"""
+  sw = crud.get_switch(db, switch_id=switch_id)
+  if not sw:
+    raise HTTPException(status_code=404, detail="Switch not found")
+  if not sw.ip_address:
+    raise HTTPException(status_code=400, detail="Switch has no IP address")
+  return _poll(db, [sw], body)
+
 # ========== HELPERS ==========
 
+def _snmp_credentials(body: SwitchPollRequest) -> SNMPCredentials:
+  """snmp section of config.yaml with the request's overrides"""
+  fields = {name: getattr(settings.snmp, name) for name in SNMPCredentials._fields}
+  fields.update(body.model_dump(include=set(SNMPCredentials._fields), exclude_none=True))
+  credentials = SNMPCredentials(**fields)
+  try:
+    check_credentials(credentials)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  return credentials
+
+def _poll(db: Session, switches: list, body: SwitchPollRequest) -> SwitchPollResponse:
+  """Poll switches concurrently, then reconcile every port table in one transaction"""
+  credentials = _snmp_credentials(body)
+  snapshots = poll_switches([sw.ip_address.strip() for sw in switches], credentials)
+
+  devices = device_ids_by_mac(db)
+  vlans = vlan_ids_by_number(db)
+  polled_at = datetime.utcnow()
+  results = []
+  for sw in switches:
+    snapshot = snapshots[sw.ip_address.strip()]
+    result = SwitchPollResult(switch_id=sw.id, switch_name=sw.name, ip_address=sw.ip_address,
+                              error=snapshot["error"], sys_description=snapshot["sys_description"])
+    if not snapshot["error"]:
+      counts = reconcile_switch_ports(db, sw, snapshot, devices, vlans, polled_at, dry_run=body.dry_run)
+      result = result.model_copy(update=counts)
+    results.append(result)
+  if not body.dry_run:
+    db.commit()
+
+  failed = sum(1 for r in results if r.error)
+  return SwitchPollResponse(polled=len(results) - failed, failed=failed, dry_run=body.dry_run, results=results)
+
+
 def _build_switch_response(db: Session, sw):
   location_name = None
   if sw.location_id:
@@ -165,6 +263,8 @@ def _build_switch_response(db: Session, sw):
     "model": sw.model,
     "location_id": sw.location_id,
     "description": sw.description,
+    "sys_description": sw.sys_description,
+    "last_polled_at": sw.last_polled_at,
     "created_at": sw.created_at,
     "location_name": location_name,
     "ports_count": ports_count,
@@ -196,6 +296,11 @@ def _build_port_response(db: Session, port):
     "vlan_id": port.vlan_id,
     "device_id": port.device_id,
     "description": port.description,
+    "if_index": port.if_index,
+    "oper_status": port.oper_status,
+    "speed_mbps": port.speed_mbps,
+    "learned_macs": port.learned_macs,
+    "polled_at": port.polled_at,
     "created_at": port.created_at,
     "switch_name": switch_name,
     "vlan_name": vlan_name,
@@ -1,22 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..core.database import get_db
 from ..core.deps import get_current_active_user, get_current_admin_user
 from ..crud import crud
 from ..schemas.schemas import VlanCreate, VlanUpdate, VlanResponse
 from ..models.user import User
+from ..utils.pagination import set_next_cursor
 
 router = APIRouter()
 
 @router.get("", response_model=List[VlanResponse])
 def get_all_vlans(
+  response: Response,
   skip: int = 0,
   limit: int = 100,
+  cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces skip"),
   db: Session = Depends(get_db)
 ):
   """Get all VLANs"""
-  vlans = crud.get_vlans(db, skip=skip, limit=limit)
+  try:
+    vlans = crud.get_vlans(db, skip=skip, limit=limit, cursor=cursor)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  set_next_cursor(response, vlans, crud.VLAN_KEYS, limit)
   result = []
   for vlan in vlans:
     result.append(_build_vlan_response(db, vlan))
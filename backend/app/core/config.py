@@ -1,7 +1,8 @@
+from pydantic import Field, field_validator, model_validator
 from pydantic_settings import BaseSettings
 import yaml
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 class DatabaseSettings(BaseSettings):
   type: str
@@ -40,11 +41,132 @@ class ServerSettings(BaseSettings):
 class RateLimitSettings(BaseSettings):
   requests_per_minute: int
 
+class SubnetScanLimits(BaseSettings):
+  max_jobs: Optional[int] = None
+  max_in_flight: Optional[int] = None
+  min_concurrency: Optional[int] = None
+  max_pps: Optional[int] = None
+
+class ProbeSpec(BaseSettings):
+  kind: str = "icmp"  # icmp, tcp (connect handshake) or udp (request/response)
+  port: Optional[int] = None  # Required for tcp and udp
+  timeout: Optional[float] = None  # Seconds; defaults to the scan's probe timeout
+  payload: Optional[str] = None  # Hex-encoded datagram sent by udp probes
+
+  @model_validator(mode="after")
+  def check_probe(self):
+    if self.kind not in ("icmp", "tcp", "udp"):
+      raise ValueError(f"Unknown probe kind: {self.kind}")
+    if self.kind != "icmp" and not (self.port and 0 < self.port < 65536):
+      raise ValueError(f"{self.kind} probes need a port between 1 and 65535")
+    if self.payload is not None:
+      bytes.fromhex(self.payload)
+    return self
+
+  @property
+  def label(self) -> str:
+    """How results name the probe that answered, e.g. tcp/502"""
+    return self.kind if self.kind == "icmp" else f"{self.kind}/{self.port}"
+
+# EtherNet/IP ListIdentity encapsulation request (command 0x63, empty body)
+ENIP_LIST_IDENTITY = "63" + "00" * 23
+
+DEFAULT_PROBE_PROFILES = {
+  "icmp": [ProbeSpec(kind="icmp")],
+  "tcp": [ProbeSpec(kind="tcp", port=port, timeout=1.0) for port in (502, 102, 44818, 80, 443)],
+  "udp": [ProbeSpec(kind="udp", port=44818, timeout=1.0, payload=ENIP_LIST_IDENTITY)],
+  "ot": [ProbeSpec(kind="icmp")]
+        + [ProbeSpec(kind="tcp", port=port, timeout=1.0) for port in (502, 102, 44818, 80, 443)]
+        + [ProbeSpec(kind="udp", port=44818, timeout=1.0, payload=ENIP_LIST_IDENTITY)],
+}
+
+class ScanSettings(BaseSettings):
+  max_concurrent_jobs: int = 2  # Scan jobs running at once across all subnets
+  max_jobs_per_subnet: int = 1  # Further requests attach to the running job
+  max_in_flight: int = 1024  # Ceiling of the adaptive probe window per scan
+  min_concurrency: int = 64  # Starting/floor probe window per scan
+  max_pps: int = 0  # Packets per second cap per scan, 0 = unlimited
+  job_retention_minutes: int = 60
+  stale_after_minutes: int = 1440  # Delta scans reprobe hosts last probed longer ago than this
+  history_retention_days: int = 30
+  max_sweep_hosts: int = 65536  # Larger subnets are scanned from candidate lists, never enumerated
+  prober: str = "auto"  # auto (icmp, then fping, then subprocess), icmp, fping or subprocess
+  multi_ping_helper: str = "fping"  # fping-compatible binary probing many targets per process
+  multi_ping_batch: int = 1024  # Most targets handed to one helper process
+  max_connections: int = 256  # TCP/UDP probe sockets open at once per scan
+  probe_profiles: Dict[str, List[ProbeSpec]] = Field(default_factory=lambda: dict(DEFAULT_PROBE_PROFILES))
+  subnet_limits: Dict[str, SubnetScanLimits] = {}  # Overrides keyed by subnet CIDR
+
+  @field_validator("probe_profiles")
+  @classmethod
+  def merge_default_profiles(cls, v: Dict[str, List[ProbeSpec]]) -> Dict[str, List[ProbeSpec]]:
+    return {**DEFAULT_PROBE_PROFILES, **v}
+
+  def probe_profile(self, name: str) -> List[ProbeSpec]:
+    """Probes of a named profile; raises ValueError for an unknown name"""
+    if name not in self.probe_profiles:
+      raise ValueError(f"Unknown probe profile: {name}. Available: {', '.join(sorted(self.probe_profiles))}")
+    return self.probe_profiles[name]
+
+  def limits_for(self, cidr: str) -> SubnetScanLimits:
+    """Effective job and probe-rate limits for a subnet"""
+    override = self.subnet_limits.get(cidr, SubnetScanLimits())
+    return SubnetScanLimits(
+      max_jobs=override.max_jobs or self.max_jobs_per_subnet,
+      max_in_flight=override.max_in_flight or self.max_in_flight,
+      min_concurrency=override.min_concurrency or self.min_concurrency,
+      max_pps=override.max_pps or self.max_pps,
+    )
+
+class DiscoverySettings(BaseSettings):
+  max_concurrency: int = 16  # Identification sessions open at once
+  rate: float = 20  # New sessions per second; OT devices often have tiny connection tables
+  timeout_seconds: float = 2.0
+  modbus_unit_id: int = 255  # 255 addresses the Modbus/TCP device itself
+  enip_wait_seconds: float = 3.0  # How long ListIdentity replies are collected
+  enip_vendors: Dict[int, str] = {}  # Extra CIP vendor id -> brand names
+  pcap_max_hosts: int = 65536  # Hosts tracked per capture import; later ones are counted as dropped
+  pcap_max_talkers: int = 100000  # (source, destination, protocol) pairs tracked per capture import
+  pcap_router_mac_ips: int = 8  # A MAC seen with more addresses is a router: not paired with them
+
+class SNMPSettings(BaseSettings):
+  version: str = "2c"  # 2c or 3
+  community: str = "public"
+  username: str = ""  # SNMPv3 user
+  auth_protocol: Optional[str] = None  # md5 or sha
+  auth_key: Optional[str] = None
+  priv_protocol: Optional[str] = None  # aes (AES-128) or des, for switches without AES
+  priv_key: Optional[str] = None
+  port: int = 161
+  timeout_seconds: float = 2.0
+  retries: int = 1
+  max_repetitions: int = 25  # Rows per GetBulk request
+  max_concurrency: int = 16  # Switches polled at once
+  access_port_max_macs: int = 4  # Ports learning more MACs are treated as uplinks: no device is linked
+
+  @field_validator("version")
+  @classmethod
+  def _check_version(cls, value: str) -> str:
+    if value not in ("2c", "3"):
+      raise ValueError("snmp.version must be 2c or 3")
+    return value
+
+class DNSSettings(BaseSettings):
+  ttl_seconds: int = 3600  # How long resolved PTR names are cached
+  negative_ttl_seconds: int = 300  # How long "no PTR record" answers are cached
+  cache_size: int = 65536  # Cached addresses, least recently used evicted first
+  max_concurrency: int = 64  # Reverse lookups in flight at once
+  timeout_seconds: float = 2.0  # Per lookup; timed out lookups are not cached
+
 class Settings(BaseSettings):
   database: DatabaseSettings
   security: SecuritySettings
   server: ServerSettings
   rate_limit: RateLimitSettings
+  scan: ScanSettings = Field(default_factory=ScanSettings)
+  dns: DNSSettings = Field(default_factory=DNSSettings)
+  discovery: DiscoverySettings = Field(default_factory=DiscoverySettings)
+  snmp: SNMPSettings = Field(default_factory=SNMPSettings)
 
 def load_config() -> Settings:
   config_path = Path(__file__).parent.parent.parent / "config.yaml"
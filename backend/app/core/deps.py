@@ -1,7 +1,8 @@
-from typing import List
-from fastapi import Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from ..core.config import ProbeSpec, settings
 from ..core.database import get_db
 from ..core.security import decode_token
 from ..crud.crud import get_user
@@ -82,3 +83,14 @@ def require_permission(permission_name: str):
       )
     return current_user
   return permission_checker
+
+def probe_profile_option(
+  profile: Optional[str] = Query(None, description="Probe profile from scan.probe_profiles, e.g. tcp or ot; ICMP echo when omitted")
+) -> Optional[List[ProbeSpec]]:
+  """Probes of the requested profile, for segments that filter ICMP"""
+  if profile is None:
+    return None
+  try:
+    return settings.scan.probe_profile(profile)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
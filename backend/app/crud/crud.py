@@ -1,6 +1,12 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from sqlalchemy.orm import Session, joinedload, selectinload
+from datetime import datetime
+from typing import Optional, List, Tuple
+from sqlalchemy import or_
 from ..models.user import User, Device, Credential, AssetType, NetworkLevel, Subnet, Location, Sector, Instalacion, Switch, Vlan, SwitchPort
+from ..utils.occupancy import occupancy
+from ..utils.subnet_trie import subnet_resolver, assign_subnet
+from ..utils.allocation import ReservationHeld, release_reservation
+from ..utils.pagination import SortKeys, paginate
 
 def get_user(db: Session, user_id: int) -> Optional[User]:
   return db.query(User).filter(User.id == user_id).first()
@@ -34,34 +40,139 @@ def delete_user(db: Session, user_id: int) -> bool:
     return True
   return False
 
-def get_devices(db: Session, skip: int = 0, limit: int = 100) -> List[Device]:
-  return db.query(Device).offset(skip).limit(limit).all()
+def device_detail_options() -> tuple:
+  """Loader options for everything enrich_device reads: referenced rows joined in, credentials in one extra query"""
+  return (
+    joinedload(Device.asset_type_rel),
+    joinedload(Device.network_level_rel),
+    joinedload(Device.subnet_rel),
+    joinedload(Device.location_rel),
+    joinedload(Device.sector_rel),
+    joinedload(Device.instalacion_rel),
+    selectinload(Device.credentials),
+  )
+
+# Sort keys of paginated lists: (column, descending), ending with the primary key (see utils.pagination)
+DEVICE_KEYS = ((Device.id, False),)
+DEVICE_RANGE_KEYS = ((Device.ip_packed, False), (Device.id, False))
+
+# Columns of the device list's sort parameter
+DEVICE_SORT_COLUMNS = {
+  "id": Device.id,
+  "name": Device.name,
+  "hostname": Device.hostname,
+  "ip": Device.ip_packed,
+  "mac": Device.mac_address,
+  "brand": Device.brand,
+  "model": Device.model,
+  "subnet_id": Device.subnet_id,
+  "location_id": Device.location_id,
+  "sector_id": Device.sector_id,
+  "instalacion_id": Device.instalacion_id,
+  "asset_type": Device.asset_type,
+  "network_level": Device.network_level,
+  "created_at": Device.created_at,
+  "updated_at": Device.updated_at,
+}
+# Columns of the device list's equality filters
+DEVICE_FILTER_COLUMNS = ("subnet_id", "location_id", "sector_id", "instalacion_id",
+                         "asset_type", "network_level", "brand", "model")
+
+def device_sort_keys(sort: str) -> SortKeys:
+  """Sort keys of a "brand,-updated_at" spec (- for descending), ending with the id tie-break"""
+  keys = []
+  for field in sort.split(","):
+    field = field.strip()
+    if not field:
+      continue
+    name = field.lstrip("+-")
+    if name not in DEVICE_SORT_COLUMNS:
+      raise ValueError(f"Cannot sort by '{name}'; use one of {', '.join(DEVICE_SORT_COLUMNS)}")
+    column = DEVICE_SORT_COLUMNS[name]
+    if any(key is column for key, _descending in keys):
+      raise ValueError(f"'{name}' appears twice in sort")
+    keys.append((column, field.startswith("-")))
+    if column is Device.id:
+      return tuple(keys)
+  # The tie-break follows the last key so a composite index serves both directions
+  keys.append((Device.id, keys[-1][1] if keys else False))
+  return tuple(keys)
+
+def get_devices(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[Device]:
+  return paginate(db.query(Device).options(*device_detail_options()), DEVICE_KEYS, skip, limit, cursor)
+
+def search_devices(db: Session, keys: SortKeys = DEVICE_KEYS, skip: int = 0, limit: int = 100,
+                   cursor: Optional[str] = None, ip_range: Optional[Tuple[bytes, bytes]] = None,
+                   updated_since: Optional[datetime] = None, search: Optional[str] = None,
+                   **equal) -> List[Device]:
+  """Devices matching every given filter, paginated on `keys`.
+
+  `equal` maps DEVICE_FILTER_COLUMNS names to exact values; with the packed
+  IP range and updated_since these are sargable and served by the devices
+  indexes. `search` is a case-insensitive substring match on name,
+  hostname, IP and MAC, served on PostgreSQL by the trigram indexes of
+  migration 1_10_0 and a table scan on SQLite.
+  """
+  query = db.query(Device).options(*device_detail_options())
+  for name, value in equal.items():
+    if name not in DEVICE_FILTER_COLUMNS:
+      raise ValueError(f"Cannot filter by '{name}'")
+    if value is not None:
+      query = query.filter(getattr(Device, name) == value)
+  if ip_range:
+    query = query.filter(Device.ip_packed.between(*ip_range))
+  if updated_since:
+    query = query.filter(Device.updated_at >= updated_since)
+  if search:
+    pattern = f"%{search}%"
+    query = query.filter(or_(Device.name.ilike(pattern), Device.hostname.ilike(pattern),
+                             Device.ip_address.ilike(pattern), Device.mac_address.ilike(pattern)))
+  return paginate(query, keys, skip, limit, cursor)
 
 def get_device(db: Session, device_id: int) -> Optional[Device]:
   return db.query(Device).filter(Device.id == device_id).first()
 
+def get_device_detail(db: Session, device_id: int) -> Optional[Device]:
+  """get_device with the rows enrich_device reads loaded in the same round trips"""
+  return db.query(Device).options(*device_detail_options()).filter(Device.id == device_id).first()
+
 def create_device(db: Session, device, user_id: int):
+  """Create a device, taking over its address's reservation; raises ReservationHeld for another user's"""
   db_device = Device(**device.model_dump(), created_by=user_id)
+  assign_subnet(db, db_device)
+  release_reservation(db, db_device.subnet_id, db_device.ip_address, user_id)
   db.add(db_device)
   db.commit()
   db.refresh(db_device)
+  occupancy.device_added(db_device.subnet_id, db_device.ip_address)
   return db_device
 
-def update_device(db: Session, device_id: int, device):
+def update_device(db: Session, device_id: int, device, user_id: Optional[int] = None):
+  """Update a device; a new address's reservation is taken over, or ReservationHeld raised for another user's"""
   db_device = get_device(db, device_id=device_id)
   if db_device:
+    old_address = (db_device.subnet_id, db_device.ip_address)
     update_data = device.model_dump(exclude_unset=True)
     for field, value in update_data.items():
       setattr(db_device, field, value)
+    if (db_device.subnet_id, db_device.ip_address) != old_address:
+      try:
+        release_reservation(db, db_device.subnet_id, db_device.ip_address, user_id)
+      except ReservationHeld:
+        db.rollback()
+        raise
     db.commit()
     db.refresh(db_device)
+    occupancy.device_moved(old_address, (db_device.subnet_id, db_device.ip_address))
   return db_device
 
 def delete_device(db: Session, device_id: int) -> bool:
   db_device = get_device(db, device_id=device_id)
   if db_device:
+    old_address = (db_device.subnet_id, db_device.ip_address)
     db.delete(db_device)
     db.commit()
+    occupancy.device_removed(*old_address)
     return True
   return False
 
@@ -127,8 +238,10 @@ def delete_network_level(db: Session, network_level_id: int) -> bool:
     return True
   return False
 
-def get_subnets(db: Session, skip: int = 0, limit: int = 100) -> List[Subnet]:
-  return db.query(Subnet).offset(skip).limit(limit).all()
+SUBNET_KEYS = ((Subnet.id, False),)
+
+def get_subnets(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[Subnet]:
+  return paginate(db.query(Subnet), SUBNET_KEYS, skip, limit, cursor)
 
 def get_subnet(db: Session, subnet_id: int) -> Optional[Subnet]:
   return db.query(Subnet).filter(Subnet.id == subnet_id).first()
@@ -138,6 +251,7 @@ def create_subnet(db: Session, subnet):
   db.add(db_subnet)
   db.commit()
   db.refresh(db_subnet)
+  subnet_resolver.subnet_saved(db_subnet)
   return db_subnet
 
 def update_subnet(db: Session, subnet_id: int, subnet):
@@ -148,6 +262,8 @@ def update_subnet(db: Session, subnet_id: int, subnet):
       setattr(db_subnet, field, value)
     db.commit()
     db.refresh(db_subnet)
+    occupancy.invalidate(subnet_id)
+    subnet_resolver.subnet_saved(db_subnet)
   return db_subnet
 
 def delete_subnet(db: Session, subnet_id: int) -> bool:
@@ -155,6 +271,8 @@ def delete_subnet(db: Session, subnet_id: int) -> bool:
   if db_subnet:
     db.delete(db_subnet)
     db.commit()
+    occupancy.invalidate(subnet_id)
+    subnet_resolver.subnet_deleted(subnet_id)
     return True
   return False
 
@@ -266,8 +384,16 @@ def get_subnets_by_location(db: Session, location_id: int) -> List[Subnet]:
 
 # ========== SWITCHES ==========
 
-def get_switches(db: Session, skip: int = 0, limit: int = 100) -> List[Switch]:
-  return db.query(Switch).offset(skip).limit(limit).all()
+SWITCH_KEYS = ((Switch.id, False),)
+SWITCH_RANGE_KEYS = ((Switch.ip_packed, False), (Switch.id, False))
+
+def get_switches(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[Switch]:
+  return paginate(db.query(Switch), SWITCH_KEYS, skip, limit, cursor)
+
+def get_switches_in_range(db: Session, first: bytes, last: bytes, skip: int = 0, limit: int = 100,
+                          cursor: Optional[str] = None) -> List[Switch]:
+  query = db.query(Switch).filter(Switch.ip_packed.between(first, last))
+  return paginate(query, SWITCH_RANGE_KEYS, skip, limit, cursor)
 
 def get_switch(db: Session, switch_id: int) -> Optional[Switch]:
   return db.query(Switch).filter(Switch.id == switch_id).first()
@@ -299,8 +425,10 @@ def delete_switch(db: Session, switch_id: int) -> bool:
 
 # ========== VLANS ==========
 
-def get_vlans(db: Session, skip: int = 0, limit: int = 100) -> List[Vlan]:
-  return db.query(Vlan).offset(skip).limit(limit).all()
+VLAN_KEYS = ((Vlan.id, False),)
+
+def get_vlans(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[Vlan]:
+  return paginate(db.query(Vlan), VLAN_KEYS, skip, limit, cursor)
 
 def get_vlan(db: Session, vlan_id: int) -> Optional[Vlan]:
   return db.query(Vlan).filter(Vlan.id == vlan_id).first()
@@ -332,11 +460,15 @@ def delete_vlan(db: Session, vlan_id: int) -> bool:
 
 # ========== SWITCH PORTS ==========
 
-def get_switch_ports(db: Session, skip: int = 0, limit: int = 100) -> List[SwitchPort]:
-  return db.query(SwitchPort).offset(skip).limit(limit).all()
+SWITCH_PORT_KEYS = ((SwitchPort.id, False),)
+
+def get_switch_ports(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> List[SwitchPort]:
+  return paginate(db.query(SwitchPort), SWITCH_PORT_KEYS, skip, limit, cursor)
 
-def get_switch_ports_by_switch(db: Session, switch_id: int) -> List[SwitchPort]:
-  return db.query(SwitchPort).filter(SwitchPort.switch_id == switch_id).all()
+def get_switch_ports_by_switch(db: Session, switch_id: int, limit: Optional[int] = None,
+                               cursor: Optional[str] = None) -> List[SwitchPort]:
+  query = db.query(SwitchPort).filter(SwitchPort.switch_id == switch_id)
+  return paginate(query, SWITCH_PORT_KEYS, 0, limit, cursor)
 
 def get_switch_port(db: Session, port_id: int) -> Optional[SwitchPort]:
   return db.query(SwitchPort).filter(SwitchPort.id == port_id).first()
@@ -7,6 +7,9 @@ from .core.config import settings
 from .core.database import engine
 from .api import auth, devices, asset_types, network_levels, subnets, config, import_export, locations, audit, network_scan, roles, switches, vlans
 from .middleware.audit import AuditMiddleware
+from .utils.scan import scan_jobs
+from .utils.pagination import NEXT_CURSOR_HEADER
+from .utils.rdns import reverse_dns
 
 app = FastAPI(
     title="IP Controller API",
@@ -24,6 +27,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Add Audit middleware
@@ -52,6 +56,11 @@ app.include_router(roles.router, prefix="/api/roles", tags=["roles"])
 app.include_router(switches.router, prefix="/api/switches", tags=["switches"])
 app.include_router(vlans.router, prefix="/api/vlans", tags=["vlans"])
 
+@app.on_event("shutdown")
+def stop_scan_jobs():
+    scan_jobs.shutdown()
+    reverse_dns.shutdown()
+
 @app.get("/")
 def root():
     return {"message": "IP Controller API"}
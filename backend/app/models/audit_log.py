@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, func
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Index, func
 from ..core.database import Base
 
 class AuditLog(Base):
@@ -18,3 +18,8 @@ class AuditLog(Base):
   endpoint = Column(String(500), nullable=True)
   status_code = Column(Integer, nullable=True)
   created_at = Column(DateTime, server_default=func.now())
+
+  __table_args__ = (
+    # Keyset pagination of the log, newest first
+    Index("ix_audit_logs_created_at_id", "created_at", "id"),
+  )
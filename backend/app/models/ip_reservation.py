@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, UniqueConstraint
+from ..core.database import Base
+
+class IPReservation(Base):
+  __tablename__ = "ip_reservations"
+
+  id = Column(Integer, primary_key=True)
+  subnet_id = Column(Integer, ForeignKey("subnets.id", ondelete="CASCADE"), nullable=False)
+  ip_address = Column(String(45), nullable=False)
+  reserved_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
+  note = Column(String(200))
+  created_at = Column(DateTime, nullable=False)
+  expires_at = Column(DateTime, nullable=False)  # Released by the next allocation after this
+
+  __table_args__ = (
+    # One live reservation per address: concurrent allocations collide here instead of in devices
+    UniqueConstraint("subnet_id", "ip_address", name="uq_ip_reservations_subnet_ip"),
+    Index("ix_ip_reservations_expires_at", "expires_at"),
+  )
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, ForeignKey, Index
+from ..core.database import Base
+
+class ScanRecord(Base):
+  __tablename__ = "scan_results"
+
+  id = Column(Integer, primary_key=True)
+  subnet_id = Column(Integer, ForeignKey("subnets.id", ondelete="CASCADE"), nullable=False)
+  ip_address = Column(String(45), nullable=False)
+  scanned_at = Column(DateTime, nullable=False)  # Shared by every host probed in the same scan
+  online = Column(Boolean, nullable=False)
+  latency_ms = Column(Float)
+  changed = Column(Boolean, nullable=False, default=False)  # State differs from the previous record
+
+  __table_args__ = (
+    Index("ix_scan_results_subnet_ip_time", "subnet_id", "ip_address", "scanned_at"),
+    Index("ix_scan_results_scanned_at", "scanned_at"),
+  )
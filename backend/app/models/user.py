@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, LargeBinary, Index, func
+from sqlalchemy.orm import relationship, validates
 from ..core.database import Base
+from ..utils.ipnum import pack_ip, PACKED_IP_LENGTH
 
 class User(Base):
   __tablename__ = "users"
@@ -90,6 +91,11 @@ class Subnet(Base):
   location_rel = relationship("Location", backref="subnets_rel")
   network_level_rel = relationship("NetworkLevel", backref="subnets_rel")
 
+  __table_args__ = (
+    # Concurrent creates and block reservations of the same CIDR collide here, across workers
+    Index("uq_subnets_subnet", "subnet", unique=True),
+  )
+
 class Device(Base):
   __tablename__ = "devices"
 
@@ -112,6 +118,7 @@ class Device(Base):
   subnet_id = Column(Integer, ForeignKey("subnets.id", ondelete="SET NULL"))
   mac_address = Column(String(17), index=True)
   ip_address = Column(String(45), index=True)
+  ip_packed = Column(LargeBinary(PACKED_IP_LENGTH), index=True)  # pack_ip(ip_address), kept in sync
   default_gateway = Column(String(45))
   netmask = Column(String(45))
   created_by = Column(Integer, ForeignKey("users.id"))
@@ -126,6 +133,26 @@ class Device(Base):
   network_level_rel = relationship("NetworkLevel", backref="devices")
   subnet_rel = relationship("Subnet", backref="devices")
   creator = relationship("User", backref="created_devices")
+  # Read-only: credentials are written through their own endpoints and removed by the FK cascade
+  credentials = relationship("Credential", order_by="Credential.id", viewonly=True)
+
+  __table_args__ = (
+    # Filters and sorts of the device list (see crud.search_devices)
+    Index("ix_devices_subnet_ip", "subnet_id", "ip_packed"),
+    Index("ix_devices_location_sector", "location_id", "sector_id", "instalacion_id"),
+    Index("ix_devices_sector_instalacion", "sector_id", "instalacion_id"),
+    Index("ix_devices_instalacion", "instalacion_id"),
+    Index("ix_devices_asset_type_level", "asset_type", "network_level"),
+    Index("ix_devices_network_level", "network_level"),
+    Index("ix_devices_brand_model", "brand", "model"),
+    Index("ix_devices_updated_at_id", "updated_at", "id"),
+    # The search parameter's trigram indexes are PostgreSQL-only, created by migration 1_10_0
+  )
+
+  @validates("ip_address")
+  def _sync_ip_packed(self, key, value):
+    self.ip_packed = pack_ip(value)
+    return value
 
 class Credential(Base):
   __tablename__ = "credentials"
@@ -144,9 +171,12 @@ class Switch(Base):
   id = Column(Integer, primary_key=True, index=True)
   name = Column(String(100), nullable=False)
   ip_address = Column(String(45), index=True)
+  ip_packed = Column(LargeBinary(PACKED_IP_LENGTH), index=True)  # pack_ip(ip_address), kept in sync
   model = Column(String(100))
   location_id = Column(Integer, ForeignKey("locations.id", ondelete="SET NULL"))
   description = Column(String(500))
+  sys_description = Column(String(500))  # sysDescr reported by the last SNMP poll
+  last_polled_at = Column(DateTime)
   created_at = Column(DateTime, server_default=func.now())
   updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -154,6 +184,11 @@ class Switch(Base):
   location_rel = relationship("Location", backref="switches")
   ports = relationship("SwitchPort", back_populates="switch_rel", cascade="all, delete-orphan")
 
+  @validates("ip_address")
+  def _sync_ip_packed(self, key, value):
+    self.ip_packed = pack_ip(value)
+    return value
+
 class Vlan(Base):
   __tablename__ = "vlans"
 
@@ -177,9 +212,20 @@ class SwitchPort(Base):
   vlan_id = Column(Integer, ForeignKey("vlans.id", ondelete="SET NULL"))
   device_id = Column(Integer, ForeignKey("devices.id", ondelete="SET NULL"))
   description = Column(String(500))
+  # Filled by SNMP polls
+  if_index = Column(Integer)
+  oper_status = Column(String(20))
+  speed_mbps = Column(Integer)
+  learned_macs = Column(Integer)
+  polled_at = Column(DateTime)
   created_at = Column(DateTime, server_default=func.now())
   updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
+  __table_args__ = (
+    # Polls reconcile ports by (switch, port name)
+    Index("ix_switch_ports_switch_port", "switch_id", "port_number"),
+  )
+
   # Relationships
   switch_rel = relationship("Switch", back_populates="ports")
   vlan_rel = relationship("Vlan", backref="switch_ports")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
-from typing import Optional, List, TYPE_CHECKING
+from typing import Dict, Optional, List, TYPE_CHECKING
 from datetime import datetime
 
 if TYPE_CHECKING:
@@ -138,16 +138,33 @@ class InstalacionResponse(InstalacionBase):
   class Config:
     from_attributes = True
 
+def _validate_cidr(v: str) -> str:
+  """IPv4 or IPv6 CIDR with an explicit prefix length, normalised to its network address"""
+  import ipaddress
+  if '/' not in v:
+    raise ValueError('Subnet must be in CIDR notation, e.g. 192.168.1.0/24')
+  try:
+    network = ipaddress.ip_network(v.strip(), strict=False)
+  except ValueError as e:
+    raise ValueError(f'Invalid subnet: {e}')
+  # Canonical form, so the unique index on subnets.subnet sees every spelling of a block
+  return str(network)
+
 class SubnetBase(BaseModel):
   name: str = Field(..., min_length=1, max_length=100)
   location: Optional[str] = Field(None, max_length=100)
   location_id: Optional[int] = None
   network_level_id: Optional[int] = None
-  subnet: str = Field(..., pattern=r"^([0-9]{1,3}\.){3}[0-9]{1,3}/[0-9]{1,2}$", description="Subnet in CIDR notation (e.g., 192.168.1.0/24)")
+  subnet: str = Field(..., max_length=45, description="Subnet in CIDR notation (e.g., 192.168.1.0/24 or 2001:db8::/64)")
   default_gateway: str = Field(..., max_length=45)
   netmask: str = Field(..., max_length=45)
   max_devices: int = Field(..., gt=0)
 
+  @field_validator('subnet')
+  @classmethod
+  def validate_subnet(cls, v: str) -> str:
+    return _validate_cidr(v)
+
 class SubnetCreate(SubnetBase):
   pass
 
@@ -156,11 +173,45 @@ class SubnetUpdate(BaseModel):
   location: Optional[str] = None
   location_id: Optional[int] = None
   network_level_id: Optional[int] = None
-  subnet: Optional[str] = Field(None, pattern=r"^([0-9]{1,3}\.){3}[0-9]{1,3}/[0-9]{1,2}$")
+  subnet: Optional[str] = Field(None, max_length=45)
   default_gateway: Optional[str] = None
   netmask: Optional[str] = None
   max_devices: Optional[int] = Field(None, gt=0)
 
+  @field_validator('subnet')
+  @classmethod
+  def validate_subnet(cls, v: Optional[str]) -> Optional[str]:
+    return _validate_cidr(v) if v is not None else v
+
+class FreeSubnetBlock(BaseModel):
+  cidr: str
+  netmask: str
+  first_host: str
+  last_host: str
+  size: int
+
+class SubnetBlockReserve(BaseModel):
+  parent: str = Field(..., description="Supernet in CIDR notation to carve the block from")
+  prefix_length: int = Field(..., ge=1, le=128)
+  name: str = Field(..., min_length=1, max_length=100)
+  location: Optional[str] = Field(None, max_length=100)
+  location_id: Optional[int] = None
+  network_level_id: Optional[int] = None
+  default_gateway: Optional[str] = Field(None, max_length=45)  # First host when omitted
+  max_devices: Optional[int] = Field(None, gt=0)  # Host count when omitted
+
+  @model_validator(mode='after')
+  def validate_prefix_length(self):
+    """The block must fit in the parent's address family: up to /32 for IPv4, /128 for IPv6"""
+    import ipaddress
+    try:
+      parent = ipaddress.ip_network(self.parent.strip(), strict=False)
+    except ValueError as e:
+      raise ValueError(f'Invalid subnet: {e}')
+    if not parent.prefixlen <= self.prefix_length <= parent.max_prefixlen:
+      raise ValueError(f'prefix_length must be between {parent.prefixlen} and {parent.max_prefixlen} inside {parent}')
+    return self
+
 class SubnetResponse(SubnetBase):
   id: int
   current_devices: int
@@ -205,6 +256,24 @@ class DeviceUpdate(DeviceBase):
   name: Optional[str] = None
   ip_address: Optional[str] = None
 
+class SubnetResolveRequest(BaseModel):
+  device_ids: Optional[List[int]] = None  # All devices when omitted
+  only_unassigned: bool = True
+  dry_run: bool = False
+
+class SubnetResolveChange(BaseModel):
+  device_id: int
+  ip_address: Optional[str] = None
+  old_subnet_id: Optional[int] = None
+  new_subnet_id: int
+
+class SubnetResolveResponse(BaseModel):
+  checked: int
+  updated: int
+  unresolved: int
+  dry_run: bool
+  changes: List[SubnetResolveChange]
+
 class CredentialBase(BaseModel):
   username: str = Field(..., min_length=1)
   password: str = Field(..., min_length=1)
@@ -303,6 +372,7 @@ class DeviceResponse(DeviceBase):
   location_name: Optional[str] = None
   sector_name: Optional[str] = None
   instalacion_name: Optional[str] = None
+  resolved_hostname: Optional[str] = None  # PTR name of ip_address, only when requested
 
   class Config:
     from_attributes = True
@@ -401,6 +471,51 @@ class FreeIPResponse(BaseModel):
   ip: str
   available: bool
 
+class FreeIPRange(BaseModel):
+  start: str
+  end: str
+  size: int
+
+class OrphanDevice(BaseModel):
+  device_id: int
+  device_name: str
+  ip_address: str
+  subnet_id: Optional[int] = None
+  reason: str  # outside_subnet, unassigned
+  suggested_subnet_id: Optional[int] = None
+  suggested_subnet_cidr: Optional[str] = None
+
+class SubnetOverlap(BaseModel):
+  subnet_id: int
+  subnet_cidr: str
+  other_subnet_id: int
+  other_subnet_cidr: str
+  kind: str  # duplicate, contains
+
+class IPAllocationRequest(BaseModel):
+  count: int = Field(1, ge=1, le=256)
+  contiguous: bool = True  # Only used when count > 1
+  ttl_seconds: int = Field(300, ge=10, le=86400)
+  note: Optional[str] = Field(None, max_length=200)
+
+class IPReservationResponse(BaseModel):
+  id: int
+  subnet_id: int
+  ip_address: str
+  reserved_by: Optional[int] = None
+  note: Optional[str] = None
+  created_at: datetime
+  expires_at: datetime
+
+  class Config:
+    from_attributes = True
+
+class IPAllocationResponse(BaseModel):
+  subnet_id: int
+  addresses: List[str]
+  expires_at: datetime
+  reservations: List[IPReservationResponse]
+
 class IPValidationRequest(BaseModel):
   ip_address: str
 
@@ -411,6 +526,21 @@ class IPValidationResponse(BaseModel):
   available: bool
   message: str
 
+class BatchIPValidationItem(BaseModel):
+  ip_address: str
+  subnet_id: Optional[int] = None  # Request default, else the most specific matching subnet
+
+class BatchIPValidationRequest(BaseModel):
+  items: List[BatchIPValidationItem] = Field(..., min_length=1, max_length=5000)
+  subnet_id: Optional[int] = None
+
+class BatchIPValidationResult(IPValidationResponse):
+  subnet_id: Optional[int] = None
+  reserved: bool = False
+  duplicate_in_batch: bool = False
+  conflict_device_id: Optional[int] = None
+  conflict_device_name: Optional[str] = None
+
 # Ping Schemas
 class PingResult(BaseModel):
   ip: str
@@ -425,11 +555,26 @@ class DevicePingResult(BaseModel):
   online: bool
   latency_ms: Optional[float] = None
   error: Optional[str] = None
+  probe: Optional[str] = None  # Probe that answered with a probe profile, e.g. tcp/502
 
 class PingMultipleRequest(BaseModel):
   device_ids: List[int]
 
 # Network Scan Schemas
+class ProbeRateStats(BaseModel):
+  probes_sent: int
+  replies: int
+  timeouts: int
+  duration_s: float
+  effective_pps: float
+  peak_pps: int
+  min_concurrency: int
+  max_concurrency: int
+  max_pps: Optional[float] = None
+  peak_concurrency: int
+  final_concurrency: int
+  decreases: int
+
 class NetworkScanResult(BaseModel):
   ip: str
   online: bool
@@ -437,6 +582,13 @@ class NetworkScanResult(BaseModel):
   is_registered: bool
   device_id: Optional[int] = None
   device_name: Optional[str] = None
+  mac_address: Optional[str] = None  # From the scanner's neighbor cache; only for L2-adjacent hosts
+  hostname: Optional[str] = None  # PTR name, only when the scan resolves names
+  probe: Optional[str] = None  # Probe that answered with a probe profile, e.g. tcp/502
+
+class ScanTargets(BaseModel):
+  mode: str = Field("auto", pattern=r"^(auto|sweep|candidates)$")
+  ips: List[str] = Field(default_factory=list, max_length=65536)  # Extra addresses, e.g. from an imported list
 
 class NetworkScanResponse(BaseModel):
   subnet_id: int
@@ -447,14 +599,195 @@ class NetworkScanResponse(BaseModel):
   registered_count: int
   new_count: int
   results: List[NetworkScanResult]
+  rate: Optional[ProbeRateStats] = None
+
+class NetworkScanChange(NetworkScanResult):
+  previous_online: Optional[bool] = None  # None when the IP had never been probed
+  previous_scanned_at: Optional[datetime] = None
+
+class NetworkScanDeltaResponse(BaseModel):
+  subnet_id: int
+  subnet_cidr: str
+  total_ips: int
+  probed_ips: int
+  skipped_ips: int
+  changed_count: int
+  results: List[NetworkScanChange]
+  rate: Optional[ProbeRateStats] = None
+
+class MacUpdateRequest(BaseModel):
+  device_ids: Optional[List[int]] = None  # Every device of the subnet when omitted
+  overwrite: bool = False  # Replace MACs that differ instead of only filling empty ones
+  dry_run: bool = False
+
+class MacUpdateChange(BaseModel):
+  device_id: int
+  ip_address: str
+  old_mac: Optional[str] = None
+  new_mac: str
+
+class MacUpdateResponse(BaseModel):
+  checked: int
+  updated: int
+  not_found: int  # Devices with no neighbor cache entry
+  dry_run: bool
+  changes: List[MacUpdateChange]
+
+class ScanRecordResponse(BaseModel):
+  subnet_id: int
+  ip_address: str
+  scanned_at: datetime
+  online: bool
+  latency_ms: Optional[float] = None
+  changed: bool
+
+  class Config:
+    from_attributes = True
+
+class NetworkScanProgress(BaseModel):
+  subnet_id: int
+  subnet_cidr: str
+  total_ips: int
+  scanned_ips: int
+  online_count: int
+  offline_count: int
+  registered_count: int
+  new_count: int
+  rate: Optional[ProbeRateStats] = None  # Only on the final summary frame
+
+class ScanJobResponse(BaseModel):
+  job_id: str
+  subnet_id: int
+  subnet_cidr: str
+  status: str  # queued, running, completed, cancelled, failed
+  total_ips: int
+  scanned_ips: int
+  online_count: int
+  offline_count: int
+  registered_count: int
+  new_count: int
+  created_by: Optional[int] = None
+  created_at: datetime
+  started_at: Optional[datetime] = None
+  finished_at: Optional[datetime] = None
+  error: Optional[str] = None
+  rate: Optional[ProbeRateStats] = None
+  attached: bool = False  # True when an already running scan of the subnet was returned
+
+class ScanJobResultsResponse(BaseModel):
+  job_id: str
+  status: str
+  offset: int
+  available: int
+  results: List[NetworkScanResult]
 
 class QuickAddDeviceRequest(BaseModel):
   ip_address: str
   name: str
-  subnet_id: int
+  subnet_id: Optional[int] = None  # Resolved from ip_address when omitted
   hostname: Optional[str] = None
   asset_type: Optional[int] = None
   network_level: Optional[int] = None
+  brand: Optional[str] = Field(None, max_length=100)  # e.g. suggested by device identification
+  model: Optional[str] = Field(None, max_length=100)
+
+class DiscoveryRequest(BaseModel):
+  ips: Optional[List[str]] = Field(None, max_length=65536)  # Online hosts of the latest scan when omitted
+  apply: bool = False  # Write suggested brand/model to registered devices
+  overwrite: bool = False  # Replace a brand/model already set instead of only filling empty ones
+
+class ModbusDiscoveryRequest(DiscoveryRequest):
+  port: int = Field(502, ge=1, le=65535)
+  unit_id: Optional[int] = Field(None, ge=0, le=255)  # discovery.modbus_unit_id when omitted
+
+class EnipDiscoveryRequest(DiscoveryRequest):
+  port: int = Field(44818, ge=1, le=65535)
+  broadcast: bool = True  # Also ask the subnet's broadcast address (IPv4 segments reachable at L2)
+  wait_seconds: Optional[float] = Field(None, gt=0, le=30)  # discovery.enip_wait_seconds when omitted
+
+class EnipIdentity(BaseModel):
+  vendor_id: int
+  device_type: int
+  product_code: int
+  revision: str
+  status: int
+  serial_number: str
+  product_name: str
+  state: Optional[int] = None
+
+class EnipScanResult(NetworkScanResult):
+  identity: EnipIdentity
+  suggested_brand: Optional[str] = None
+  suggested_model: Optional[str] = None
+  applied: bool = False
+
+class EnipDiscoveryResponse(BaseModel):
+  subnet_id: int
+  subnet_cidr: str
+  probed: int  # Unicast requests; the broadcast is not counted
+  online_count: int
+  registered_count: int
+  new_count: int
+  updated: int
+  results: List[EnipScanResult]
+
+class PcapDeviceProposal(BaseModel):
+  ip_address: str
+  mac_address: Optional[str] = None
+  mac_source: Optional[str] = None  # "arp" or "ip" (Ethernet source of the host's packets)
+  subnet_id: Optional[int] = None
+  subnet_cidr: Optional[str] = None
+  protocols: List[str] = []  # e.g. "modbus-server", "s7-client"
+  packets: int
+  first_seen: Optional[datetime] = None
+  last_seen: Optional[datetime] = None
+
+class PcapMacUpdate(BaseModel):
+  device_id: int
+  device_name: str
+  ip_address: str
+  current_mac: Optional[str] = None
+  observed_mac: str
+  mac_source: str
+  applied: bool = False
+
+class PcapTalker(BaseModel):
+  src_ip: str
+  dst_ip: str
+  protocol: str  # OT protocol, or "ip" for anything else
+  packets: int
+  bytes: int
+
+class PcapImportResponse(BaseModel):
+  filename: Optional[str] = None
+  packets: int
+  undecoded_packets: int
+  hosts_seen: int
+  dropped_hosts: int  # Hosts beyond discovery.pcap_max_hosts
+  dropped_talkers: int  # Talker pairs beyond discovery.pcap_max_talkers
+  new_devices: List[PcapDeviceProposal]
+  mac_updates: List[PcapMacUpdate]
+  talkers: List[PcapTalker]
+
+class DeviceIdentification(BaseModel):
+  ip: str
+  protocol: str
+  identified: bool
+  objects: Dict[str, str] = {}  # Raw identification fields as reported by the device
+  device_id: Optional[int] = None
+  device_name: Optional[str] = None
+  suggested_brand: Optional[str] = None
+  suggested_model: Optional[str] = None
+  applied: bool = False
+  error: Optional[str] = None
+
+class DiscoveryResponse(BaseModel):
+  subnet_id: int
+  subnet_cidr: str
+  probed: int
+  identified: int
+  updated: int
+  results: List[DeviceIdentification]
 
 # Switch Schemas
 class SwitchBase(BaseModel):
@@ -477,12 +810,43 @@ class SwitchUpdate(BaseModel):
 class SwitchResponse(SwitchBase):
   id: int
   created_at: datetime
+  sys_description: Optional[str] = None
+  last_polled_at: Optional[datetime] = None
   location_name: Optional[str] = None
   ports_count: int = 0
 
   class Config:
     from_attributes = True
 
+class SwitchPollRequest(BaseModel):
+  switch_ids: Optional[List[int]] = None  # Every switch with an IP address when omitted
+  dry_run: bool = False
+  # Overrides of the snmp section of config.yaml
+  version: Optional[str] = Field(None, pattern="^(2c|3)$")
+  community: Optional[str] = None
+  username: Optional[str] = None
+  auth_protocol: Optional[str] = Field(None, pattern="^(md5|sha)$")
+  auth_key: Optional[str] = None
+  priv_protocol: Optional[str] = Field(None, pattern="^(aes|des)$")
+  priv_key: Optional[str] = None
+
+class SwitchPollResult(BaseModel):
+  switch_id: int
+  switch_name: str
+  ip_address: Optional[str] = None
+  error: Optional[str] = None
+  sys_description: Optional[str] = None
+  ports_seen: int = 0
+  ports_created: int = 0
+  ports_updated: int = 0
+  devices_linked: int = 0
+
+class SwitchPollResponse(BaseModel):
+  polled: int
+  failed: int
+  dry_run: bool
+  results: List[SwitchPollResult]
+
 # VLAN Schemas
 class VlanBase(BaseModel):
   vlan_number: int = Field(..., ge=1, le=4094)
@@ -534,6 +898,11 @@ class SwitchPortResponse(BaseModel):
   vlan_id: Optional[int] = None
   device_id: Optional[int] = None
   description: Optional[str] = None
+  if_index: Optional[int] = None
+  oper_status: Optional[str] = None
+  speed_mbps: Optional[int] = None
+  learned_macs: Optional[int] = None
+  polled_at: Optional[datetime] = None
   created_at: datetime
   switch_name: Optional[str] = None
   vlan_name: Optional[str] = None
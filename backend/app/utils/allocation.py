@@ -0,0 +1,133 @@
+import ipaddress
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Set
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.ip_reservation import IPReservation
+from ..models.user import Device
+from .network import get_used_ips_in_subnet, iter_free_ranges
+from .occupancy import occupancy
+
+# Attempts before giving up when other processes keep taking the chosen addresses
+MAX_ALLOCATION_ATTEMPTS = 8
+
+# Allocations in this process are serialised per subnet; the unique constraint covers other processes
+_subnet_locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+
+
+class AllocationError(Exception):
+  """No free address or block could be reserved"""
+
+
+class ReservationHeld(AllocationError):
+  """The address is held by another user's unexpired reservation"""
+
+
+def purge_expired_reservations(db: Session, subnet_id: Optional[int] = None):
+  query = db.query(IPReservation).filter(IPReservation.expires_at < datetime.utcnow())
+  if subnet_id is not None:
+    query = query.filter(IPReservation.subnet_id == subnet_id)
+  query.delete(synchronize_session=False)
+
+
+def reserved_ips(db: Session, subnet_id: int) -> Set[str]:
+  """Addresses of a subnet held by unexpired reservations"""
+  rows = db.query(IPReservation.ip_address).filter(
+    IPReservation.subnet_id == subnet_id,
+    IPReservation.expires_at >= datetime.utcnow()
+  ).all()
+  return {r.ip_address for r in rows}
+
+
+def release_reservation(db: Session, subnet_id: Optional[int], ip: Optional[str], user_id: Optional[int] = None):
+  """Drop the reservation of an address once a device takes it (the caller commits).
+
+  Raises ReservationHeld when another user's reservation of the address has not expired.
+  """
+  if subnet_id is None or not ip:
+    return
+  reservation = db.query(IPReservation).filter(
+    IPReservation.subnet_id == subnet_id,
+    IPReservation.ip_address == ip
+  ).first()
+  if reservation is None:
+    return
+  held = reservation.expires_at >= datetime.utcnow() and reservation.reserved_by is not None
+  if held and reservation.reserved_by != user_id:
+    raise ReservationHeld(f"IP {ip} is reserved by another user until {reservation.expires_at:%Y-%m-%d %H:%M:%S} UTC")
+  db.delete(reservation)
+
+
+def _taken_by_devices(db: Session, subnet_id: int, ips: List[str]) -> bool:
+  return db.query(Device.id).filter(Device.subnet_id == subnet_id, Device.ip_address.in_(ips)).first() is not None
+
+
+def _iter_free_values(db: Session, subnet_id: int, cidr: str) -> Iterator[int]:
+  """Integer values of addresses no device uses, in order"""
+  bitmap = occupancy.get(db, subnet_id, cidr)
+  if bitmap is not None:
+    for offset in bitmap.iter_free_offsets():
+      yield bitmap.first + offset
+    return
+  for first, last in iter_free_ranges(cidr, get_used_ips_in_subnet(db, subnet_id)):
+    yield from range(first, last + 1)
+
+
+def _pick(db: Session, subnet_id: int, cidr: str, count: int, contiguous: bool, skip: Set[str]) -> List[str]:
+  address_class = type(ipaddress.ip_network(cidr, strict=False).network_address)
+  picked: List[int] = []
+  for value in _iter_free_values(db, subnet_id, cidr):
+    if str(address_class(value)) in skip:
+      if contiguous:
+        picked = []
+      continue
+    if contiguous and picked and value != picked[-1] + 1:
+      picked = []
+    picked.append(value)
+    if len(picked) == count:
+      return [str(address_class(v)) for v in picked]
+  return []
+
+
+def allocate_ips(db: Session, subnet_id: int, cidr: str, count: int = 1, contiguous: bool = True,
+                 ttl: timedelta = timedelta(minutes=5), user_id: Optional[int] = None,
+                 note: Optional[str] = None) -> List[IPReservation]:
+  """Reserve the next `count` free addresses of a subnet in one transaction.
+
+  Reservations insert under a unique (subnet_id, ip_address) constraint, so
+  when a concurrent allocation wins an address the transaction rolls back and
+  is retried against the now committed reservations instead of handing out a
+  duplicate.
+  """
+  with _subnet_locks[subnet_id]:
+    for _ in range(MAX_ALLOCATION_ATTEMPTS):
+      purge_expired_reservations(db, subnet_id)
+      ips = _pick(db, subnet_id, cidr, count, contiguous, reserved_ips(db, subnet_id))
+      if not ips:
+        db.rollback()
+        kind = f"block of {count} contiguous addresses" if contiguous and count > 1 else f"{count} free address(es)"
+        raise AllocationError(f"No {kind} available in {cidr}")
+      if _taken_by_devices(db, subnet_id, ips):
+        # The cached bitmap missed a device written by another process
+        occupancy.invalidate(subnet_id)
+        continue
+
+      now = datetime.utcnow()
+      reservations = [
+        IPReservation(subnet_id=subnet_id, ip_address=ip, reserved_by=user_id, note=note,
+                      created_at=now, expires_at=now + ttl)
+        for ip in ips
+      ]
+      db.add_all(reservations)
+      try:
+        db.commit()
+      except IntegrityError:
+        db.rollback()
+        continue
+      for r in reservations:
+        db.refresh(r)
+      return reservations
+  raise AllocationError(f"Could not reserve addresses in {cidr} after {MAX_ALLOCATION_ATTEMPTS} attempts")
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class RatePacer:
+  """Spaces operations at least 1/rate seconds apart across all callers; rate 0 = unlimited"""
+
+  def __init__(self, rate: float):
+    self._interval = 1.0 / rate if rate > 0 else 0.0
+    self._next_slot = 0.0
+    self._lock = asyncio.Lock()
+
+  async def wait(self):
+    if not self._interval:
+      return
+    async with self._lock:
+      now = time.monotonic()
+      delay = self._next_slot - now
+      self._next_slot = max(now, self._next_slot) + self._interval
+    if delay > 0:
+      await asyncio.sleep(delay)
+
+
+async def sweep(ips: Iterable[str], query: Callable[[str], Awaitable[T]],
+                max_concurrency: int = 32, rate: float = 0) -> Dict[str, T]:
+  """Run `query` against every address with bounded concurrency and a strict start rate.
+
+  At most `max_concurrency` queries are open at once and new ones start no
+  faster than `rate` per second, so a sweep of a fragile OT segment never
+  bursts. Results are keyed by address; `query` is expected to report its
+  own failures in the value it returns.
+  """
+  slots = asyncio.Semaphore(max(1, max_concurrency))
+  pacer = RatePacer(rate)
+
+  async def run(ip: str):
+    async with slots:
+      await pacer.wait()
+      return ip, await query(ip)
+
+  return dict(await asyncio.gather(*(run(ip) for ip in dict.fromkeys(ips))))
+
+
+def run_sweep(ips: Iterable[str], query: Callable[[str], Awaitable[T]],
+              max_concurrency: int = 32, rate: float = 0) -> Dict[str, T]:
+  """sweep() for sync endpoints (no running event loop)"""
+  return asyncio.run(sweep(ips, query, max_concurrency, rate))
+
+
+def suggest_device_fields(brand: Optional[str], model: Optional[str]) -> Dict[str, str]:
+  """Non-empty brand/model suggestions, trimmed to the device columns"""
+  suggested = {}
+  if brand and brand.strip():
+    suggested["brand"] = brand.strip()[:100]
+  if model and model.strip():
+    suggested["model"] = model.strip()[:100]
+  return suggested
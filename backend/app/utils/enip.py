@@ -0,0 +1,125 @@
+import asyncio
+import socket
+import struct
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from .discovery import RatePacer
+
+ENIP_PORT = 44818
+COMMAND_LIST_IDENTITY = 0x0063
+CPF_ITEM_IDENTITY = 0x000C
+ENCAPSULATION_HEADER = struct.Struct("<HHII8sI")
+IDENTITY_FIXED = struct.Struct("<H2sH4s8sHHHBBHI")
+
+# CIP vendor ids of common vendors; extend through discovery.enip_vendors
+CIP_VENDORS = {
+  1: "Rockwell Automation/Allen-Bradley",
+}
+
+
+class ENIPError(Exception):
+  """A malformed EtherNet/IP encapsulation reply"""
+
+
+def build_list_identity(context: bytes = b"\x00" * 8) -> bytes:
+  """ListIdentity encapsulation request; the command carries no data"""
+  return ENCAPSULATION_HEADER.pack(COMMAND_LIST_IDENTITY, 0, 0, 0, context[:8].ljust(8, b"\x00"), 0)
+
+
+def parse_list_identity(data: bytes) -> Dict:
+  """Identity fields of a ListIdentity reply (the first CIP identity item)"""
+  if len(data) < ENCAPSULATION_HEADER.size + 2:
+    raise ENIPError("Reply too short")
+  command, length, _session, status, _context, _options = ENCAPSULATION_HEADER.unpack_from(data)
+  if command != COMMAND_LIST_IDENTITY:
+    raise ENIPError(f"Unexpected command {command:#06x}")
+  if status != 0:
+    raise ENIPError(f"Encapsulation status {status:#x}")
+  body = data[ENCAPSULATION_HEADER.size:ENCAPSULATION_HEADER.size + length]
+  (count,) = struct.unpack_from("<H", body)
+  offset = 2
+  for _ in range(count):
+    if offset + 4 > len(body):
+      break
+    item_type, item_length = struct.unpack_from("<HH", body, offset)
+    item = body[offset + 4:offset + 4 + item_length]
+    offset += 4 + item_length
+    if item_type != CPF_ITEM_IDENTITY:
+      continue
+    if len(item) < IDENTITY_FIXED.size + 1:
+      raise ENIPError("Truncated identity item")
+    (_version, _family, _port, _address, _zero, vendor_id, device_type, product_code,
+     revision_major, revision_minor, status_word, serial) = IDENTITY_FIXED.unpack_from(item)
+    name_length = item[IDENTITY_FIXED.size]
+    name_start = IDENTITY_FIXED.size + 1
+    product_name = item[name_start:name_start + name_length].decode("latin-1").strip("\x00 ").strip()
+    state = item[name_start + name_length] if len(item) > name_start + name_length else None
+    return {
+      "vendor_id": vendor_id,
+      "device_type": device_type,
+      "product_code": product_code,
+      "revision": f"{revision_major}.{revision_minor:03d}",
+      "status": status_word,
+      "serial_number": f"{serial:08X}",
+      "product_name": product_name,
+      "state": state,
+    }
+  raise ENIPError("No identity item in reply")
+
+
+class _IdentityCollector(asyncio.DatagramProtocol):
+  def __init__(self):
+    self.sent_at: Dict[str, float] = {}
+    self.broadcast_at: Optional[float] = None
+    self.replies: Dict[str, Tuple[Dict, Optional[float]]] = {}
+
+  def datagram_received(self, data: bytes, addr):
+    ip = addr[0]
+    if ip in self.replies:
+      return
+    try:
+      identity = parse_list_identity(data)
+    except (ENIPError, struct.error):
+      return
+    sent_at = self.sent_at.get(ip, self.broadcast_at)
+    latency = round((time.perf_counter() - sent_at) * 1000, 3) if sent_at is not None else None
+    self.replies[ip] = (identity, latency)
+
+  def error_received(self, exc: Exception):
+    # ICMP unreachable for one unicast target; the others are unaffected
+    pass
+
+
+async def list_identity(unicast: Iterable[str] = (), broadcast: Optional[str] = None, port: int = ENIP_PORT,
+                        wait: float = 3.0, rate: float = 0) -> Dict[str, Tuple[Dict, Optional[float]]]:
+  """Send ListIdentity to a broadcast address and/or single hosts and collect replies until the deadline.
+
+  Returns {ip: (identity, latency_ms)} for every device that answered, keyed
+  by the reply's source address. Unicast requests are paced to `rate` per
+  second; the deadline runs from the last request sent.
+  """
+  loop = asyncio.get_running_loop()
+  transport, collector = await loop.create_datagram_endpoint(
+    _IdentityCollector, local_addr=("0.0.0.0", 0), family=socket.AF_INET, allow_broadcast=True
+  )
+  request = build_list_identity(b"OtNetMgr")
+  pacer = RatePacer(rate)
+  try:
+    if broadcast:
+      collector.broadcast_at = time.perf_counter()
+      transport.sendto(request, (broadcast, port))
+    for ip in unicast:
+      await pacer.wait()
+      collector.sent_at[ip] = time.perf_counter()
+      transport.sendto(request, (ip, port))
+    await asyncio.sleep(wait)
+  finally:
+    transport.close()
+  return collector.replies
+
+
+def enip_suggestions(identity: Dict, vendors: Optional[Dict[int, str]] = None) -> Tuple[Optional[str], Optional[str]]:
+  """(brand, model) suggested by a ListIdentity reply; the brand needs a known vendor id"""
+  vendors = {**CIP_VENDORS, **(vendors or {})}
+  return vendors.get(identity.get("vendor_id")), identity.get("product_name") or None
@@ -0,0 +1,727 @@
+import asyncio
+import ipaddress
+import itertools
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import struct
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ..core.config import ProbeSpec, settings
+from .probes import tcp_probe, udp_probe
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+# Payload carried by every echo request (same size as a default Linux ping)
+ECHO_PAYLOAD = b"OtNetManager-probe".ljust(56, b"\x00")
+RECV_BUFFER_SIZE = 1 << 20
+# Initial probe window; the AIMD controller grows it while the network keeps up
+DEFAULT_MIN_CONCURRENCY = 64
+
+
+def _checksum(data: bytes) -> int:
+  """RFC 1071 internet checksum"""
+  if len(data) % 2:
+    data += b"\x00"
+  total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+  total = (total >> 16) + (total & 0xFFFF)
+  total += total >> 16
+  return ~total & 0xFFFF
+
+
+def build_echo_request(ident: int, seq: int, payload: bytes = ECHO_PAYLOAD, version: int = 4) -> bytes:
+  """Build an ICMP (or ICMPv6) echo request packet"""
+  if version == 6:
+    # The kernel computes ICMPv6 checksums, which cover an IPv6 pseudo-header
+    return struct.pack("!BBHHH", ICMPV6_ECHO_REQUEST, 0, 0, ident, seq) + payload
+  header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+  checksum = _checksum(header + payload)
+  return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def parse_echo_reply(data: bytes, version: int = 4) -> Optional[Tuple[int, int]]:
+  """Return (identifier, sequence) of an echo reply, or None for any other packet"""
+  # Raw IPv4 sockets (and datagram sockets on BSD/macOS) deliver the IP header too;
+  # IPv6 sockets never do
+  if version == 4 and len(data) >= 20 and data[0] >> 4 == 4:
+    data = data[(data[0] & 0x0F) * 4:]
+  if len(data) < 8:
+    return None
+  icmp_type, _code, _checksum_value, ident, seq = struct.unpack("!BBHHH", data[:8])
+  if icmp_type != (ICMPV6_ECHO_REPLY if version == 6 else ICMP_ECHO_REPLY):
+    return None
+  return ident, seq
+
+
+def open_icmp_socket(version: int = 4) -> Tuple[socket.socket, bool]:
+  """Open an ICMP (or ICMPv6) socket, preferring the unprivileged datagram flavour.
+
+  Returns the socket and whether the kernel owns the echo identifier
+  (datagram sockets rewrite it to the socket's local port). Raises OSError
+  when neither a datagram nor a raw ICMP socket is permitted.
+  """
+  if version == 6:
+    family, proto = socket.AF_INET6, socket.IPPROTO_ICMPV6
+  else:
+    family, proto = socket.AF_INET, socket.IPPROTO_ICMP
+  try:
+    sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+    sock.bind(("", 0))
+    return sock, True
+  except OSError:
+    pass
+  sock = socket.socket(family, socket.SOCK_RAW, proto)
+  return sock, False
+
+
+def _ip_version(ip: str) -> Optional[int]:
+  try:
+    return ipaddress.ip_address(ip).version
+  except ValueError:
+    return None
+
+
+def _reply_address(addr: str, version: int) -> str:
+  """Canonical text form of a reply's source address (IPv6 drops any %zone)"""
+  if version == 6:
+    return str(ipaddress.IPv6Address(addr.split("%", 1)[0]))
+  return addr
+
+
+def _result(ip: str, online: bool = False, latency_ms: Optional[float] = None, error: Optional[str] = None,
+            probe: Optional[str] = None) -> Dict:
+  return {"ip": ip, "online": online, "latency_ms": latency_ms, "error": error, "probe": probe}
+
+
+class Prober:
+  """A way of sending echo probes; `ping` is awaited once per address"""
+
+  name = "prober"
+
+  async def ping(self, ip: str, timeout: float = 2) -> Dict:
+    raise NotImplementedError
+
+  def close(self):
+    pass
+
+
+class ICMPEngine(Prober):
+  """Sends echo requests over one ICMP socket and matches replies by identifier/sequence"""
+
+  name = "icmp"
+
+  def __init__(self, sock: socket.socket, kernel_ident: bool):
+    self._sock = sock
+    self.version = 6 if sock.family == socket.AF_INET6 else 4
+    self._sock.setblocking(False)
+    try:
+      # Replies to a full burst of requests arrive together; give them room
+      self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+    except OSError:
+      pass
+    self._loop = asyncio.get_running_loop()
+    if kernel_ident:
+      self._ident = sock.getsockname()[1] & 0xFFFF
+    else:
+      self._ident = (os.getpid() ^ random.getrandbits(16)) & 0xFFFF
+    self._seq = itertools.count(random.getrandbits(16))
+    self._waiters: Dict[Tuple[str, int], asyncio.Future] = {}
+    try:
+      self._loop.add_reader(self._sock.fileno(), self._on_readable)
+    except NotImplementedError:
+      # Proactor event loops (Windows) have no readiness callbacks
+      self._sock.close()
+      raise
+
+  def close(self):
+    self._loop.remove_reader(self._sock.fileno())
+    self._sock.close()
+    for fut in self._waiters.values():
+      if not fut.done():
+        fut.cancel()
+    self._waiters.clear()
+
+  def _on_readable(self):
+    while True:
+      try:
+        data, addr = self._sock.recvfrom(2048)
+      except (BlockingIOError, InterruptedError):
+        return
+      except OSError:
+        return
+      reply = parse_echo_reply(data, self.version)
+      if reply is None:
+        continue
+      ident, seq = reply
+      if ident != self._ident:
+        continue
+      fut = self._waiters.pop((_reply_address(addr[0], self.version), seq), None)
+      if fut is not None and not fut.done():
+        fut.set_result(time.perf_counter())
+
+  async def _send(self, packet: bytes, ip: str, deadline: float) -> bool:
+    while True:
+      try:
+        self._sock.sendto(packet, (ip, 0))
+        return True
+      except (BlockingIOError, InterruptedError):
+        if time.perf_counter() >= deadline:
+          return False
+        await asyncio.sleep(0.001)
+
+  async def ping(self, ip: str, timeout: float = 2) -> Dict:
+    """Send one echo request and wait up to `timeout` seconds for its reply"""
+    seq = next(self._seq) & 0xFFFF
+    key = (_reply_address(ip, self.version), seq)
+    fut = self._loop.create_future()
+    self._waiters[key] = fut
+    packet = build_echo_request(self._ident, seq, version=self.version)
+    sent_at = time.perf_counter()
+    try:
+      if not await self._send(packet, ip, sent_at + timeout):
+        return _result(ip, error="Send buffer full")
+      received_at = await asyncio.wait_for(fut, timeout)
+      return _result(ip, True, round((received_at - sent_at) * 1000, 3))
+    except asyncio.TimeoutError:
+      return _result(ip)
+    except OSError as e:
+      return _result(ip, error=e.strerror or str(e))
+    finally:
+      self._waiters.pop(key, None)
+
+
+# ========== SUBPROCESS FALLBACK ==========
+
+def _is_windows() -> bool:
+  return platform.system().lower() == "windows"
+
+
+def ping_command(ip: str, timeout: int = 2) -> List[str]:
+  """Build the system `ping` command line for a single echo request"""
+  if _is_windows():
+    # On Windows, -w is in milliseconds
+    return ["ping", "-n", "1", "-w", str(int(timeout * 1000)), ip]
+  return ["ping", "-c", "1", "-W", str(int(timeout)), ip]
+
+
+def parse_ping_latency(output: str) -> Optional[float]:
+  """Extract the round-trip time from `ping` output"""
+  if _is_windows():
+    match = re.search(r"tiempo[=<](\d+)ms", output)
+    if not match:
+      match = re.search(r"time[=<](\d+)ms", output)
+  else:
+    match = re.search(r"time=(\d+\.?\d*)\s*ms", output)
+  return float(match.group(1)) if match else None
+
+
+async def subprocess_ping(ip: str, timeout: int = 2) -> Dict:
+  """Ping a single host by running the system `ping` binary"""
+  try:
+    proc = await asyncio.create_subprocess_exec(
+      *ping_command(ip, timeout),
+      stdout=asyncio.subprocess.PIPE,
+      stderr=asyncio.subprocess.DEVNULL
+    )
+  except Exception as e:
+    return _result(ip, error=str(e))
+
+  try:
+    stdout, _ = await asyncio.wait_for(proc.communicate(), timeout + 3)
+  except asyncio.TimeoutError:
+    proc.kill()
+    await proc.wait()
+    return _result(ip, error="Timeout")
+
+  online = proc.returncode == 0
+  latency_ms = parse_ping_latency(stdout.decode(errors="replace")) if online else None
+  return _result(ip, online, latency_ms)
+
+
+class SubprocessProber(Prober):
+  """One `ping` process per address, at most `max_workers` at a time"""
+
+  name = "subprocess"
+
+  def __init__(self, max_workers: int = 20):
+    self._slots = asyncio.Semaphore(max(1, max_workers))
+
+  async def ping(self, ip: str, timeout: float = 2) -> Dict:
+    async with self._slots:
+      return await subprocess_ping(ip, timeout)
+
+
+# ========== MULTI-TARGET HELPER ==========
+
+# Extra wait for a helper's verdict beyond the probe timeout (batching, process start)
+HELPER_GRACE_SECONDS = 2.0
+_FPING_LINE = re.compile(r"^(\S+)\s+is\s+(alive|unreachable)(?:\s+\((\d+(?:\.\d+)?)\s*ms\))?")
+
+
+def fping_command(binary: str, timeout: float = 2, interval_ms: int = 1) -> List[str]:
+  """Helper command line for one echo request per target, targets read from stdin"""
+  return [binary, "-e", "-r", "0", "-t", str(max(1, int(timeout * 1000))), "-i", str(max(1, interval_ms))]
+
+
+def parse_fping_line(line: str) -> Optional[Tuple[str, bool, Optional[float]]]:
+  """(ip, online, latency_ms) of an `fping -e` verdict line, or None for anything else"""
+  match = _FPING_LINE.match(line.strip())
+  if not match:
+    return None
+  latency = float(match.group(3)) if match.group(3) else None
+  return match.group(1), match.group(2) == "alive", latency
+
+
+class MultiTargetProber(Prober):
+  """Probes through one fping-compatible helper process per batch of addresses.
+
+  Probes arriving within `batch_window` seconds, up to `max_batch`, share a
+  process. Its stdout is parsed line by line as verdicts are printed, so a
+  probe completes as soon as its own address is reported rather than when
+  the whole batch finishes.
+  """
+
+  name = "fping"
+
+  def __init__(self, binary: str, max_batch: int = 1024, batch_window: float = 0.02, interval_ms: int = 1):
+    self._binary = binary
+    self._max_batch = max(1, max_batch)
+    self._batch_window = batch_window
+    self._interval_ms = interval_ms
+    self._loop = asyncio.get_running_loop()
+    self._pending: Dict[str, List[asyncio.Future]] = {}
+    self._pending_timeout = 0.0
+    self._flush_handle: Optional[asyncio.TimerHandle] = None
+    self._batches = set()
+
+  async def ping(self, ip: str, timeout: float = 2) -> Dict:
+    fut = self._loop.create_future()
+    self._pending.setdefault(ip, []).append(fut)
+    self._pending_timeout = max(self._pending_timeout, timeout)
+    if len(self._pending) >= self._max_batch:
+      self._flush()
+    elif self._flush_handle is None:
+      self._flush_handle = self._loop.call_later(self._batch_window, self._flush)
+    try:
+      return await asyncio.wait_for(fut, timeout + self._batch_window + HELPER_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+      return _result(ip, error="Timeout")
+
+  def _flush(self):
+    if self._flush_handle is not None:
+      self._flush_handle.cancel()
+      self._flush_handle = None
+    if not self._pending:
+      return
+    batch, timeout = self._pending, self._pending_timeout
+    self._pending, self._pending_timeout = {}, 0.0
+    task = self._loop.create_task(self._run_batch(batch, timeout))
+    self._batches.add(task)
+    task.add_done_callback(self._batches.discard)
+
+  @staticmethod
+  def _settle(waiters: List[asyncio.Future], result: Dict):
+    for fut in waiters:
+      if not fut.done():
+        fut.set_result(result)
+
+  async def _run_batch(self, batch: Dict[str, List[asyncio.Future]], timeout: float):
+    proc = None
+    try:
+      proc = await asyncio.create_subprocess_exec(
+        *fping_command(self._binary, timeout, self._interval_ms),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+      )
+      proc.stdin.write("".join(f"{ip}\n" for ip in batch).encode())
+      await proc.stdin.drain()
+      proc.stdin.close()
+      while True:
+        line = await proc.stdout.readline()
+        if not line:
+          break
+        verdict = parse_fping_line(line.decode(errors="replace"))
+        if verdict is None:
+          continue
+        ip, online, latency_ms = verdict
+        waiters = batch.pop(ip, None)
+        if waiters:
+          self._settle(waiters, _result(ip, online, latency_ms))
+      await proc.wait()
+      for ip, waiters in batch.items():
+        # No verdict printed, e.g. an address the helper refused
+        self._settle(waiters, _result(ip, error=f"No reply from {self.name}"))
+    except OSError as e:
+      for ip, waiters in batch.items():
+        self._settle(waiters, _result(ip, error=e.strerror or str(e)))
+    finally:
+      if proc is not None and proc.returncode is None:
+        proc.kill()
+
+  def close(self):
+    if self._flush_handle is not None:
+      self._flush_handle.cancel()
+      self._flush_handle = None
+    for task in list(self._batches):
+      task.cancel()
+    for waiters in self._pending.values():
+      for fut in waiters:
+        if not fut.done():
+          fut.cancel()
+    self._pending.clear()
+
+
+# ========== PROBE PROFILES ==========
+
+class ProfileProber(Prober):
+  """Runs every probe of a profile against an address at once; the first answer wins.
+
+  TCP and UDP probes each hold one of `connection_slots` while their socket
+  is open, which caps the sockets of a whole scan. ICMP probes go through
+  `icmp`, the family's regular prober. Results name the probe that answered
+  (e.g. `tcp/502`) and its handshake or round-trip latency.
+  """
+
+  name = "profile"
+
+  def __init__(self, probes: List[ProbeSpec], icmp: Optional[Prober], connection_slots: asyncio.Semaphore):
+    self._probes = probes
+    self._icmp = icmp
+    self._slots = connection_slots
+
+  async def _answer(self, spec: ProbeSpec, ip: str, timeout: float) -> Optional[Dict]:
+    timeout = spec.timeout or timeout
+    if spec.kind == "icmp":
+      if self._icmp is None:
+        return None
+      result = await self._icmp.ping(ip, timeout)
+      return _result(ip, True, result["latency_ms"], probe=spec.label) if result["online"] else None
+    async with self._slots:
+      if spec.kind == "tcp":
+        latency = await tcp_probe(ip, spec.port, timeout)
+      else:
+        latency = await udp_probe(ip, spec.port, bytes.fromhex(spec.payload or ""), timeout)
+    return _result(ip, True, latency, probe=spec.label) if latency is not None else None
+
+  async def ping(self, ip: str, timeout: float = 2) -> Dict:
+    pending = {asyncio.ensure_future(self._answer(spec, ip, timeout)): i for i, spec in enumerate(self._probes)}
+    try:
+      while pending:
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        # Probes finishing together are ranked by their order in the profile
+        for task in sorted(done, key=pending.get):
+          del pending[task]
+          answer = task.result()
+          if answer is not None:
+            return answer
+      return _result(ip)
+    finally:
+      for task in pending:
+        task.cancel()
+
+  def close(self):
+    if self._icmp is not None:
+      self._icmp.close()
+
+
+# ========== PROBER SELECTION ==========
+
+PROBER_ORDER = ("icmp", "fping", "subprocess")
+
+
+def open_prober(version: Optional[int], fallback: SubprocessProber, preference: str = "auto") -> Prober:
+  """Best available prober for an address family: an ICMP socket, then a
+  multi-target helper, then one `ping` process per host (`fallback`).
+
+  `preference` skips straight to one backend; it still falls back to
+  subprocess probing when that backend is unavailable.
+  """
+  order = PROBER_ORDER if preference == "auto" else (preference,)
+  for name in order:
+    if name == "icmp" and version is not None:
+      try:
+        return ICMPEngine(*open_icmp_socket(version))
+      except (OSError, NotImplementedError):
+        continue
+    if name == "fping":
+      binary = shutil.which(settings.scan.multi_ping_helper)
+      if binary:
+        return MultiTargetProber(binary, max_batch=settings.scan.multi_ping_batch)
+  return fallback
+
+
+# ========== CONCURRENCY CONTROL ==========
+
+class AIMDController:
+  """Additive-increase/multiplicative-decrease window for outstanding probes.
+
+  The window starts at `min_concurrency` and grows by one per completed
+  probe (slow start) until the first back-off, then by one per window of
+  completions. It is halved when the timeout ratio of the last probes
+  spikes above its running baseline or when reply latency inflates well
+  past the fastest reply seen. Sends are additionally paced to `max_pps`
+  packets per second when it is set.
+  """
+
+  SAMPLE_SIZE = 64  # Completions compared against the timeout baseline
+  TIMEOUT_SPIKE = 0.2  # Timeout ratio above baseline that counts as congestion
+  LATENCY_FACTOR = 4.0  # Smoothed RTT over fastest RTT that counts as queueing
+  LATENCY_FLOOR_MS = 10.0  # Ignore inflation smaller than this on fast LANs
+  DECREASE = 0.5
+
+  def __init__(self, min_concurrency: int = DEFAULT_MIN_CONCURRENCY, max_concurrency: int = 1024,
+               max_pps: float = 0, cooldown: float = 2.0):
+    self.min_concurrency = max(1, min_concurrency)
+    self.max_concurrency = max(self.min_concurrency, max_concurrency)
+    self.max_pps = max_pps or 0
+    self.cooldown = cooldown  # Seconds between back-offs (probes sent earlier are still in flight)
+    self.window = float(self.min_concurrency)
+    self.peak_window = self.window
+    self.in_flight = 0
+    self.sent = 0
+    self.replies = 0
+    self.timeouts = 0
+    self.decreases = 0
+    self._slow_start = True
+    self._recent = deque(maxlen=self.SAMPLE_SIZE)
+    self._timeout_baseline: Optional[float] = None
+    self._min_rtt: Optional[float] = None
+    self._srtt: Optional[float] = None
+    self._last_decrease = 0.0
+    self._next_send = 0.0
+    self._second = 0
+    self._sent_this_second = 0
+    self._peak_pps = 0
+    self._slot_freed: Optional[asyncio.Event] = None
+    self._started_at: Optional[float] = None
+    self._finished_at: Optional[float] = None
+
+  def start(self):
+    self._slot_freed = asyncio.Event()
+    self._started_at = time.monotonic()
+    self._finished_at = None
+
+  def finish(self):
+    self._finished_at = time.monotonic()
+
+  async def acquire(self):
+    """Wait for a free slot in the window and for the packet-rate budget"""
+    while self.in_flight >= int(self.window):
+      self._slot_freed.clear()
+      await self._slot_freed.wait()
+    self.in_flight += 1
+
+    now = time.monotonic()
+    if self.max_pps:
+      send_at = max(now, self._next_send)
+      self._next_send = send_at + 1.0 / self.max_pps
+      if send_at > now:
+        await asyncio.sleep(send_at - now)
+        now = send_at
+    self._count_send(now)
+
+  def release(self, result: Dict):
+    """Free a slot and adapt the window to the probe outcome"""
+    self.in_flight -= 1
+    self._observe(result)
+    self._slot_freed.set()
+
+  def _count_send(self, now: float):
+    self.sent += 1
+    second = int(now)
+    if second != self._second:
+      self._second = second
+      self._sent_this_second = 0
+    self._sent_this_second += 1
+    self._peak_pps = max(self._peak_pps, self._sent_this_second)
+
+  def _observe(self, result: Dict):
+    timed_out = not result["online"]
+    self._recent.append(timed_out)
+    if timed_out:
+      self.timeouts += 1
+    else:
+      self.replies += 1
+      rtt = result.get("latency_ms")
+      if rtt is not None:
+        self._min_rtt = rtt if self._min_rtt is None else min(self._min_rtt, rtt)
+        self._srtt = rtt if self._srtt is None else 0.875 * self._srtt + 0.125 * rtt
+
+    if self._congested():
+      now = time.monotonic()
+      if now - self._last_decrease >= self.cooldown:
+        self.window = max(float(self.min_concurrency), self.window * self.DECREASE)
+        self.decreases += 1
+        self._slow_start = False
+        self._last_decrease = now
+        self._recent.clear()
+      return
+
+    if self._slow_start:
+      self.window += 1
+    else:
+      self.window += 1 / self.window
+    self.window = min(float(self.max_concurrency), self.window)
+    self.peak_window = max(self.peak_window, self.window)
+
+  def _congested(self) -> bool:
+    if self._srtt is not None and self._min_rtt is not None:
+      if self._srtt > self._min_rtt * self.LATENCY_FACTOR and self._srtt - self._min_rtt > self.LATENCY_FLOOR_MS:
+        return True
+
+    if len(self._recent) < self.SAMPLE_SIZE:
+      return False
+    ratio = sum(self._recent) / len(self._recent)
+    if self._timeout_baseline is None:
+      self._timeout_baseline = ratio
+      return False
+    spiked = ratio > self._timeout_baseline + self.TIMEOUT_SPIKE
+    # The baseline follows the long-run ratio (most addresses of a sparse subnet never answer)
+    self._timeout_baseline += 0.02 * (ratio - self._timeout_baseline)
+    return spiked
+
+  def stats(self) -> Dict:
+    """Rate actually reached during the run"""
+    end = self._finished_at or time.monotonic()
+    duration = end - self._started_at if self._started_at is not None else 0.0
+    return {
+      "probes_sent": self.sent,
+      "replies": self.replies,
+      "timeouts": self.timeouts,
+      "duration_s": round(duration, 3),
+      "effective_pps": round(self.sent / duration, 1) if duration > 0 else 0.0,
+      "peak_pps": self._peak_pps,
+      "min_concurrency": self.min_concurrency,
+      "max_concurrency": self.max_concurrency,
+      "max_pps": self.max_pps or None,
+      "peak_concurrency": int(self.peak_window),
+      "final_concurrency": int(self.window),
+      "decreases": self.decreases,
+    }
+
+
+# ========== ENTRY POINT ==========
+
+async def iter_ping_hosts(
+  ips: List[str],
+  timeout: int = 2,
+  max_in_flight: int = 1024,
+  fallback_workers: int = 20,
+  controller: Optional[AIMDController] = None,
+  probes: Optional[List[ProbeSpec]] = None
+) -> AsyncIterator[Dict]:
+  """Yield one {ip, online, latency_ms, error, probe} dict per address as each probe finishes.
+
+  Each address family gets the best prober available (see open_prober):
+  a shared ICMP socket, else one fping-compatible helper process per batch,
+  else at most `fallback_workers` `ping` processes. Outstanding probes are
+  governed by `controller`, which defaults to an AIMD window capped at
+  `max_in_flight`. Targets are probed in random order so the timeout ratio
+  the controller watches does not swing with how densely each part of a
+  range is used. With `probes` (a probe profile) each address is tried
+  with all of them through a ProfileProber instead of an echo request.
+  """
+  if controller is None:
+    controller = AIMDController(min(DEFAULT_MIN_CONCURRENCY, max_in_flight), max_in_flight)
+
+  fallback = SubprocessProber(fallback_workers)
+  families = {_ip_version(ip) for ip in ips} - {None}
+  if probes is None:
+    probers: Dict[int, Prober] = {version: open_prober(version, fallback, settings.scan.prober) for version in families}
+  else:
+    slots = asyncio.Semaphore(max(1, settings.scan.max_connections))
+    uses_icmp = any(spec.kind == "icmp" for spec in probes)
+    probers = {
+      version: ProfileProber(probes, open_prober(version, fallback, settings.scan.prober) if uses_icmp else None, slots)
+      for version in families
+    }
+
+  order = list(ips)
+  random.shuffle(order)
+  done: asyncio.Queue = asyncio.Queue()
+  tasks = set()
+
+  async def probe(ip: str):
+    try:
+      result = await probers.get(_ip_version(ip), fallback).ping(ip, timeout)
+    except Exception as e:
+      result = _result(ip, error=str(e))
+    controller.release(result)
+    done.put_nowait(result)
+
+  async def drive():
+    for ip in order:
+      await controller.acquire()
+      task = asyncio.ensure_future(probe(ip))
+      tasks.add(task)
+      task.add_done_callback(tasks.discard)
+
+  controller.start()
+  driver = asyncio.ensure_future(drive())
+  try:
+    for _ in order:
+      yield await done.get()
+  finally:
+    controller.finish()
+    driver.cancel()
+    for task in list(tasks):
+      task.cancel()
+    for prober in probers.values():
+      prober.close()
+
+
+async def iter_with_ticks(results: AsyncIterator[Dict], interval: float) -> AsyncIterator[Optional[Dict]]:
+  """Items of `results`, interleaved with a None every `interval` seconds.
+
+  Ticks keep their period whether or not items arrive, so consumers can
+  report progress or notice a cancellation while every outstanding probe
+  is still waiting. A tick never cancels the wait for the next item;
+  closing this iterator closes `results`.
+  """
+  pending: Optional[asyncio.Future] = None
+  next_tick = time.monotonic() + interval
+  try:
+    while True:
+      if time.monotonic() >= next_tick:
+        next_tick = time.monotonic() + interval
+        yield None
+      if pending is None:
+        pending = asyncio.ensure_future(results.__anext__())
+      done, _ = await asyncio.wait({pending}, timeout=max(0.0, next_tick - time.monotonic()))
+      if not done:
+        continue
+      finished, pending = pending, None
+      try:
+        item = finished.result()
+      except StopAsyncIteration:
+        return
+      yield item
+  finally:
+    if pending is not None:
+      pending.cancel()
+      await asyncio.gather(pending, return_exceptions=True)
+    await results.aclose()
+
+
+async def async_ping_hosts(
+  ips: List[str],
+  timeout: int = 2,
+  max_in_flight: int = 1024,
+  fallback_workers: int = 20,
+  controller: Optional[AIMDController] = None,
+  probes: Optional[List[ProbeSpec]] = None
+) -> List[Dict]:
+  """Ping hosts concurrently and return the results in the same order as `ips`"""
+  by_ip = {}
+  async for result in iter_ping_hosts(ips, timeout, max_in_flight, fallback_workers, controller, probes):
+    by_ip[result["ip"]] = result
+  return [by_ip[ip] for ip in ips]
@@ -0,0 +1,41 @@
+import ipaddress
+from typing import Optional, Tuple
+
+# IPv4 addresses are stored as IPv4-mapped IPv6 (::ffff:a.b.c.d) so both
+# families share one fixed-width, byte-order-sortable 16-byte key
+PACKED_IP_LENGTH = 16
+_IPV4_MAPPED_PREFIX = 0xFFFF << 32
+
+
+def _to_int128(addr) -> int:
+  value = int(addr)
+  return value | _IPV4_MAPPED_PREFIX if addr.version == 4 else value
+
+
+def pack_ip(ip: Optional[str]) -> Optional[bytes]:
+  """Sortable 16-byte key of an IP address, or None when it is empty or invalid"""
+  if not ip:
+    return None
+  try:
+    addr = ipaddress.ip_address(ip.strip())
+  except ValueError:
+    return None
+  return _to_int128(addr).to_bytes(PACKED_IP_LENGTH, "big")
+
+
+def unpack_ip(packed: bytes) -> str:
+  value = int.from_bytes(packed, "big")
+  if value >> 32 == 0xFFFF:
+    return str(ipaddress.IPv4Address(value & 0xFFFFFFFF))
+  return str(ipaddress.IPv6Address(value))
+
+
+def int_range(network) -> Tuple[int, int]:
+  """Inclusive (first, last) of a whole network in the shared 128-bit space"""
+  return _to_int128(network.network_address), _to_int128(network.broadcast_address)
+
+
+def packed_range(network) -> Tuple[bytes, bytes]:
+  """Inclusive (first, last) packed keys covering a whole network, for BETWEEN queries"""
+  first, last = int_range(network)
+  return first.to_bytes(PACKED_IP_LENGTH, "big"), last.to_bytes(PACKED_IP_LENGTH, "big")
@@ -0,0 +1,126 @@
+import asyncio
+import itertools
+import struct
+from typing import Dict, Optional, Tuple
+
+MODBUS_PORT = 502
+FUNCTION_MEI = 0x2B
+MEI_READ_DEVICE_ID = 0x0E
+READ_DEVICE_ID_BASIC = 0x01
+READ_DEVICE_ID_REGULAR = 0x02
+EXCEPTION_FLAG = 0x80
+MBAP_LENGTH = 7
+# Unit identifier 0xFF addresses the TCP device itself rather than a serial slave behind it
+DEFAULT_UNIT_ID = 0xFF
+# Continuation requests followed when a device splits its objects over several responses
+MAX_CONTINUATIONS = 8
+
+# Object ids of the basic and regular device identification categories
+DEVICE_ID_OBJECTS = {
+  0x00: "vendor_name",
+  0x01: "product_code",
+  0x02: "revision",
+  0x03: "vendor_url",
+  0x04: "product_name",
+  0x05: "model_name",
+  0x06: "user_application_name",
+}
+
+_transaction_ids = itertools.count(1)
+
+
+class ModbusError(Exception):
+  """A device answered with a Modbus exception or a malformed response"""
+
+
+def build_read_device_id(transaction_id: int, unit_id: int = DEFAULT_UNIT_ID,
+                         read_code: int = READ_DEVICE_ID_REGULAR, object_id: int = 0) -> bytes:
+  """Modbus/TCP frame of a Read Device Identification (function 43, MEI type 14) request"""
+  pdu = struct.pack("!BBBB", FUNCTION_MEI, MEI_READ_DEVICE_ID, read_code, object_id)
+  return struct.pack("!HHHB", transaction_id & 0xFFFF, 0, len(pdu) + 1, unit_id) + pdu
+
+
+def parse_read_device_id(pdu: bytes) -> Tuple[Dict[int, bytes], bool, int]:
+  """Objects of a Read Device Identification response PDU, whether more follow, and the next object id"""
+  if len(pdu) >= 2 and pdu[0] == FUNCTION_MEI | EXCEPTION_FLAG:
+    raise ModbusError(f"Modbus exception code {pdu[1]}")
+  if len(pdu) < 7 or pdu[0] != FUNCTION_MEI or pdu[1] != MEI_READ_DEVICE_ID:
+    raise ModbusError("Not a Read Device Identification response")
+  _read_code, _conformity, more_follows, next_object_id, count = struct.unpack("!BBBBB", pdu[2:7])
+  objects = {}
+  offset = 7
+  for _ in range(count):
+    if offset + 2 > len(pdu):
+      raise ModbusError("Truncated device identification object")
+    object_id, length = pdu[offset], pdu[offset + 1]
+    value = pdu[offset + 2:offset + 2 + length]
+    if len(value) != length:
+      raise ModbusError("Truncated device identification object")
+    objects[object_id] = value
+    offset += 2 + length
+  return objects, more_follows == 0xFF, next_object_id
+
+
+async def _exchange(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, frame: bytes) -> bytes:
+  writer.write(frame)
+  await writer.drain()
+  header = await reader.readexactly(MBAP_LENGTH)
+  transaction_id, protocol_id, length, _unit = struct.unpack("!HHHB", header)
+  if protocol_id != 0 or length < 2:
+    raise ModbusError("Invalid MBAP header")
+  if transaction_id != struct.unpack("!H", frame[:2])[0]:
+    raise ModbusError("Mismatched transaction id")
+  return await reader.readexactly(length - 1)
+
+
+async def read_device_identification(ip: str, port: int = MODBUS_PORT, unit_id: int = DEFAULT_UNIT_ID,
+                                     timeout: float = 2.0) -> Dict[str, str]:
+  """Identification objects of a Modbus/TCP device keyed by name (vendor_name, product_code, ...).
+
+  Asks for the regular category and falls back to basic for devices that
+  reject it. Raises ModbusError for protocol failures and OSError or
+  asyncio.TimeoutError when the device cannot be reached in time.
+  """
+  reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+  try:
+    objects: Dict[int, bytes] = {}
+    for read_code in (READ_DEVICE_ID_REGULAR, READ_DEVICE_ID_BASIC):
+      object_id = 0
+      try:
+        for _ in range(MAX_CONTINUATIONS):
+          frame = build_read_device_id(next(_transaction_ids), unit_id, read_code, object_id)
+          found, more, object_id = parse_read_device_id(await asyncio.wait_for(_exchange(reader, writer, frame), timeout))
+          objects.update(found)
+          if not more:
+            break
+        break
+      except ModbusError:
+        if read_code == READ_DEVICE_ID_BASIC or objects:
+          raise
+  finally:
+    writer.close()
+  return {
+    DEVICE_ID_OBJECTS.get(object_id, f"object_{object_id:#04x}"): value.decode("latin-1").strip("\x00 ").strip()
+    for object_id, value in objects.items()
+  }
+
+
+async def identify_modbus(ip: str, port: int = MODBUS_PORT, unit_id: int = DEFAULT_UNIT_ID,
+                          timeout: float = 2.0) -> Dict:
+  """{objects, error} for one host, never raising, for use in sweeps"""
+  try:
+    return {"objects": await read_device_identification(ip, port, unit_id, timeout), "error": None}
+  except asyncio.TimeoutError:
+    return {"objects": {}, "error": "Timeout"}
+  except (asyncio.IncompleteReadError, ConnectionResetError):
+    return {"objects": {}, "error": "Connection closed by device"}
+  except ModbusError as e:
+    return {"objects": {}, "error": str(e)}
+  except OSError as e:
+    return {"objects": {}, "error": e.strerror or str(e)}
+
+
+def modbus_suggestions(objects: Dict[str, str]) -> Tuple[Optional[str], Optional[str]]:
+  """(brand, model) suggested by identification objects"""
+  model = objects.get("model_name") or objects.get("product_name") or objects.get("product_code")
+  return objects.get("vendor_name"), model
@@ -0,0 +1,113 @@
+import ipaddress
+import re
+import shutil
+import subprocess
+import time
+from typing import Callable, Dict, Optional
+
+PROC_ARP_PATH = "/proc/net/arp"
+ATF_COMPLETE = 0x2
+_MAC_PATTERN = re.compile(r"^([0-9a-f]{2}[:-]){5}[0-9a-f]{2}$", re.IGNORECASE)
+_IP_NEIGH_PATTERN = re.compile(r"^(\S+)\s.*\blladdr\s+(\S+)")
+
+
+def normalize_mac(mac: str) -> Optional[str]:
+  """Lower-case, colon-separated MAC, or None for incomplete or all-zero entries"""
+  mac = mac.strip().lower().replace("-", ":")
+  if not _MAC_PATTERN.match(mac) or mac == "00:00:00:00:00:00":
+    return None
+  return mac
+
+
+def parse_proc_arp(text: str) -> Dict[str, str]:
+  """IPv4 neighbors from the Linux /proc/net/arp table"""
+  neighbors = {}
+  for line in text.splitlines()[1:]:
+    fields = line.split()
+    if len(fields) < 4:
+      continue
+    ip, _hw_type, flags, mac = fields[:4]
+    try:
+      if not int(flags, 16) & ATF_COMPLETE:
+        continue
+    except ValueError:
+      continue
+    mac = normalize_mac(mac)
+    if mac:
+      neighbors[ip] = mac
+  return neighbors
+
+
+def parse_ip_neigh(text: str) -> Dict[str, str]:
+  """Neighbors from `ip neigh show` output (both families)"""
+  neighbors = {}
+  for line in text.splitlines():
+    match = _IP_NEIGH_PATTERN.match(line.strip())
+    if not match or "FAILED" in line or "INCOMPLETE" in line:
+      continue
+    mac = normalize_mac(match.group(2))
+    if mac:
+      try:
+        neighbors[str(ipaddress.ip_address(match.group(1).split("%", 1)[0]))] = mac
+      except ValueError:
+        continue
+  return neighbors
+
+
+def read_neighbor_table() -> Dict[str, str]:
+  """IP -> MAC of every resolved entry in this host's neighbor cache.
+
+  Uses /proc/net/arp for IPv4 and `ip -6 neigh` for IPv6 when available;
+  returns what it could read (possibly nothing) on other platforms.
+  """
+  neighbors = {}
+  try:
+    with open(PROC_ARP_PATH) as f:
+      neighbors.update(parse_proc_arp(f.read()))
+  except OSError:
+    pass
+
+  ip_binary = shutil.which("ip")
+  if ip_binary:
+    try:
+      output = subprocess.run(
+        [ip_binary, "-6", "neigh", "show"],
+        capture_output=True, text=True, timeout=5
+      ).stdout
+      neighbors.update(parse_ip_neigh(output))
+    except (OSError, subprocess.SubprocessError):
+      pass
+  return neighbors
+
+
+class NeighborTable:
+  """MAC lookups for one scan against a snapshot of the neighbor cache.
+
+  The table is read on the first lookup and re-read on a miss at most every
+  `refresh_interval` seconds, so hosts that answer later in a streamed scan
+  are still found without reading the cache once per result.
+  """
+
+  def __init__(self, refresh_interval: float = 2.0, reader: Callable[[], Dict[str, str]] = read_neighbor_table):
+    self._refresh_interval = refresh_interval
+    self._reader = reader
+    self._entries: Optional[Dict[str, str]] = None
+    self._read_at = 0.0
+
+  def _refresh(self):
+    self._entries = self._reader()
+    self._read_at = time.monotonic()
+
+  def mac_for(self, ip: str) -> Optional[str]:
+    if self._entries is None:
+      self._refresh()
+    mac = self._entries.get(ip)
+    if mac is None and time.monotonic() - self._read_at >= self._refresh_interval:
+      self._refresh()
+      mac = self._entries.get(ip)
+    return mac
+
+  def entries(self) -> Dict[str, str]:
+    if self._entries is None:
+      self._refresh()
+    return dict(self._entries)
@@ -1,21 +1,26 @@
+import asyncio
 import ipaddress
-import subprocess
-import platform
-import re
-from typing import List, Dict, Set, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import List, Dict, Set, Optional, Iterable, Iterator, Tuple
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
-from ..models.user import Device
+from ..models.user import Device, Subnet
+from ..core.config import ProbeSpec
+from .icmp import AIMDController, async_ping_hosts
+from .ipnum import packed_range, pack_ip, PACKED_IP_LENGTH
+from .subnet_trie import subnet_resolver
 
 
-def get_all_ips_in_subnet(cidr: str) -> List[str]:
-  """Get all usable host IPs in a subnet (excludes network and broadcast)"""
-  try:
-    network = ipaddress.ip_network(cidr, strict=False)
-    return [str(ip) for ip in network.hosts()]
-  except ValueError:
-    return []
+def get_all_ips_in_subnet(cidr: str, limit: int = 0) -> List[str]:
+  """Get usable host IPs in a subnet (excludes network and broadcast), at most `limit` when set"""
+  hosts = iter_free_ips(cidr, ())
+  return list(islice(hosts, limit) if limit > 0 else hosts)
+
+
+def ip_sort_key(ip: str) -> bytes:
+  """Numeric sort key (IPv4 as IPv4-mapped IPv6), with invalid addresses last"""
+  return pack_ip(ip) or b"\xff" * (PACKED_IP_LENGTH + 1)
 
 
 def get_used_ips_in_subnet(db: Session, subnet_id: int) -> Set[str]:
@@ -27,14 +32,88 @@ def get_used_ips_in_subnet(db: Session, subnet_id: int) -> Set[str]:
   return {d.ip_address for d in devices if d.ip_address}
 
 
+def host_bounds(network) -> Tuple[int, int]:
+  """First and last usable host of a network as integers"""
+  first = int(network.network_address)
+  last = int(network.broadcast_address)
+  if network.version == 4 and network.prefixlen < 31:
+    return first + 1, last - 1
+  if network.version == 6 and network.prefixlen < 127:
+    # The subnet-router anycast address is not a usable host
+    return first + 1, last
+  return first, last
+
+
+def count_hosts(cidr: str) -> int:
+  """Number of usable host IPs in a subnet, computed from the prefix"""
+  try:
+    first, last = host_bounds(ipaddress.ip_network(cidr, strict=False))
+  except ValueError:
+    return 0
+  return max(0, last - first + 1)
+
+
+def _used_offsets(network, used_ips: Iterable[str]) -> List[int]:
+  """Sorted integer values of the used IPs that fall in the network's host range"""
+  first, last = host_bounds(network)
+  values = set()
+  for ip in used_ips:
+    try:
+      addr = ipaddress.ip_address(ip)
+    except ValueError:
+      continue
+    value = int(addr)
+    if addr.version == network.version and first <= value <= last:
+      values.add(value)
+  return sorted(values)
+
+
+def count_used_hosts(cidr: str, used_ips: Iterable[str]) -> int:
+  """Number of distinct used IPs inside a subnet's host range"""
+  try:
+    network = ipaddress.ip_network(cidr, strict=False)
+  except ValueError:
+    return 0
+  return len(_used_offsets(network, used_ips))
+
+
+def iter_free_ranges(cidr: str, used_ips: Iterable[str]) -> Iterator[Tuple[int, int]]:
+  """Lazily yield inclusive (first, last) integer ranges of free host IPs.
+
+  Walks the sorted used addresses against the host range, so the cost
+  depends on the number of used IPs rather than the size of the subnet.
+  """
+  try:
+    network = ipaddress.ip_network(cidr, strict=False)
+  except ValueError:
+    return
+  first, last = host_bounds(network)
+  cursor = first
+  for value in _used_offsets(network, used_ips):
+    if value > cursor:
+      yield cursor, value - 1
+    cursor = value + 1
+  if cursor <= last:
+    yield cursor, last
+
+
+def iter_free_ips(cidr: str, used_ips: Iterable[str]) -> Iterator[str]:
+  """Lazily yield free host IPs in ascending order"""
+  try:
+    address_class = type(ipaddress.ip_network(cidr, strict=False).network_address)
+  except ValueError:
+    return
+  for start, end in iter_free_ranges(cidr, used_ips):
+    for value in range(start, end + 1):
+      yield str(address_class(value))
+
+
 def get_free_ips_in_subnet(db: Session, subnet_id: int, cidr: str, limit: int = 0) -> List[str]:
   """Get list of free (unassigned) IPs in a subnet"""
-  all_ips = get_all_ips_in_subnet(cidr)
-  used_ips = get_used_ips_in_subnet(db, subnet_id)
-  free_ips = [ip for ip in all_ips if ip not in used_ips]
+  free_ips = iter_free_ips(cidr, get_used_ips_in_subnet(db, subnet_id))
   if limit > 0:
-    return free_ips[:limit]
-  return free_ips
+    return list(islice(free_ips, limit))
+  return list(free_ips)
 
 
 def is_ip_in_subnet(ip: str, cidr: str) -> bool:
@@ -45,6 +124,75 @@ def is_ip_in_subnet(ip: str, cidr: str) -> bool:
     return False
 
 
+def parse_ip_prefix(prefix: str):
+  """Network for a CIDR, a single IP or a partial dotted IPv4 prefix such as '10.1.'"""
+  prefix = prefix.strip()
+  try:
+    return ipaddress.ip_network(prefix, strict=False)
+  except ValueError:
+    pass
+  octets = prefix.rstrip(".").split(".")
+  if not 1 <= len(octets) <= 3 or not all(o.isdigit() and int(o) <= 255 for o in octets):
+    raise ValueError(f"Invalid IP prefix: {prefix}")
+  padded = octets + ["0"] * (4 - len(octets))
+  return ipaddress.ip_network(f"{'.'.join(padded)}/{8 * len(octets)}")
+
+
+def in_network(column, network):
+  """Indexed BETWEEN filter on a packed IP column for every address of a network"""
+  first, last = packed_range(network)
+  return column.between(first, last)
+
+
+def find_orphan_devices(db: Session) -> List[dict]:
+  """Devices whose IP lies outside their assigned subnet, and unassigned devices inside a known one.
+
+  Each entry carries the most specific subnet containing the IP as a suggestion.
+  """
+  subnets = []
+  for s in db.query(Subnet.id, Subnet.subnet).all():
+    try:
+      subnets.append((s.id, ipaddress.ip_network(s.subnet, strict=False)))
+    except ValueError:
+      continue
+  # Longest prefix first, so the first containing subnet is the best suggestion
+  subnets.sort(key=lambda s: s[1].prefixlen, reverse=True)
+  columns = (Device.id, Device.name, Device.ip_address, Device.subnet_id)
+
+  orphans = {}
+  for subnet_id, network in subnets:
+    outside = db.query(*columns).filter(
+      Device.subnet_id == subnet_id,
+      Device.ip_address.isnot(None),
+      or_(Device.ip_packed.is_(None), ~in_network(Device.ip_packed, network))
+    ).all()
+    for d in outside:
+      orphans[d.id] = {"device": d, "reason": "outside_subnet", "suggested": None}
+
+    unassigned = db.query(*columns).filter(
+      Device.subnet_id.is_(None),
+      in_network(Device.ip_packed, network)
+    ).all()
+    for d in unassigned:
+      orphans.setdefault(d.id, {"device": d, "reason": "unassigned", "suggested": (subnet_id, network)})
+
+  for entry in orphans.values():
+    if entry["suggested"] is None:
+      match = subnet_resolver.resolve(db, entry["device"].ip_address)
+      if match is not None:
+        entry["suggested"] = (match.subnet_id, match.cidr)
+
+  return [{
+    "device_id": e["device"].id,
+    "device_name": e["device"].name,
+    "ip_address": e["device"].ip_address,
+    "subnet_id": e["device"].subnet_id,
+    "reason": e["reason"],
+    "suggested_subnet_id": e["suggested"][0] if e["suggested"] else None,
+    "suggested_subnet_cidr": str(e["suggested"][1]) if e["suggested"] else None,
+  } for e in sorted(orphans.values(), key=lambda e: e["device"].id)]
+
+
 def get_subnet_info(cidr: str) -> dict:
   """Get information about a subnet"""
   try:
@@ -54,71 +202,46 @@ def get_subnet_info(cidr: str) -> dict:
       "broadcast_address": str(network.broadcast_address),
       "netmask": str(network.netmask),
       "prefix_length": network.prefixlen,
-      "total_hosts": network.num_addresses - 2 if network.prefixlen < 31 else network.num_addresses,
+      "total_hosts": count_hosts(cidr),
     }
   except ValueError:
     return {}
 
 
-def ping_host(ip: str, timeout: int = 2) -> Dict:
+def ping_host(ip: str, timeout: int = 2, probes: Optional[List[ProbeSpec]] = None) -> Dict:
   """Ping a single host and return result"""
-  param_count = "-n" if platform.system().lower() == "windows" else "-c"
-  param_timeout = "-w" if platform.system().lower() == "windows" else "-W"
-  # On Windows, -w is in milliseconds
-  timeout_value = str(timeout * 1000) if platform.system().lower() == "windows" else str(timeout)
-
+  return ping_multiple_hosts([ip], max_workers=1, timeout=timeout, probes=probes)[0]
+
+
+def ping_multiple_hosts(
+  ips: List[str],
+  max_workers: int = 20,
+  timeout: int = 2,
+  controller: Optional[AIMDController] = None,
+  probes: Optional[List[ProbeSpec]] = None
+) -> List[Dict]:
+  """Ping multiple hosts concurrently with the best available prober backend.
+
+  Backends are tried in order: a shared ICMP socket, an fping-compatible
+  multi-target helper, then one `ping` process per host (`scan.prober`
+  forces one). `max_workers` bounds the number of concurrent `ping`
+  processes of the last resort. Pass an AIMDController to set the
+  concurrency range and packet rate of this call and to read the rate it
+  reached afterwards. Pass `probes` (a probe profile, see
+  `scan.probe_profiles`) to try TCP/UDP probes for hosts that drop ICMP.
+
+  Sync-only: it runs its own event loop, so coroutines must await
+  icmp.async_ping_hosts instead.
+  """
   try:
-    result = subprocess.run(
-      ["ping", param_count, "1", param_timeout, timeout_value, ip],
-      capture_output=True,
-      text=True,
-      timeout=timeout + 3
-    )
-
-    online = result.returncode == 0
-    latency_ms = None
-
-    if online:
-      # Parse latency from ping output
-      if platform.system().lower() == "windows":
-        match = re.search(r"tiempo[=<](\d+)ms", result.stdout)
-        if not match:
-          match = re.search(r"time[=<](\d+)ms", result.stdout)
-      else:
-        match = re.search(r"time=(\d+\.?\d*)\s*ms", result.stdout)
-
-      if match:
-        latency_ms = float(match.group(1))
-
-    return {
-      "ip": ip,
-      "online": online,
-      "latency_ms": latency_ms,
-      "error": None
-    }
-  except subprocess.TimeoutExpired:
-    return {
-      "ip": ip,
-      "online": False,
-      "latency_ms": None,
-      "error": "Timeout"
-    }
-  except Exception as e:
-    return {
-      "ip": ip,
-      "online": False,
-      "latency_ms": None,
-      "error": str(e)
-    }
-
-
-def ping_multiple_hosts(ips: List[str], max_workers: int = 20, timeout: int = 2) -> List[Dict]:
-  """Ping multiple hosts in parallel"""
-  results = []
-  with ThreadPoolExecutor(max_workers=max_workers) as executor:
-    futures = {executor.submit(ping_host, ip, timeout): ip for ip in ips}
-    for future in as_completed(futures):
-      results.append(future.result())
+    asyncio.get_running_loop()
+  except RuntimeError:
+    pass
+  else:
+    raise RuntimeError("ping_multiple_hosts() cannot run inside an event loop; await async_ping_hosts()")
+  results = asyncio.run(async_ping_hosts(
+    ips, timeout=timeout, fallback_workers=max_workers, controller=controller, probes=probes
+  ))
   # Sort by IP for consistent ordering
-  results.sort(key=lambda x: [int(p) for p in x["ip"].split(".")])
+  results.sort(key=lambda x: ip_sort_key(x["ip"]))
   return results
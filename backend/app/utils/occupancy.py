@@ -0,0 +1,201 @@
+import ipaddress
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from ..models.user import Device
+from .network import count_hosts, host_bounds
+
+# Subnets with more hosts than this (e.g. IPv6 /64s) are not bitmapped
+MAX_BITMAP_HOSTS = 1 << 24
+# Rebuild bitmaps this often so changes made by other worker processes show up
+BITMAP_TTL_SECONDS = 30
+
+_WORD_BYTES = 8
+_FULL_WORD = (1 << (_WORD_BYTES * 8)) - 1
+
+
+class SubnetBitmap:
+  """Occupancy of a subnet's host range, one bit per host offset"""
+
+  def __init__(self, cidr: str):
+    self.cidr = cidr
+    self.network = ipaddress.ip_network(cidr, strict=False)
+    self.first, self.last = host_bounds(self.network)
+    self.size = max(0, self.last - self.first + 1)
+    if self.size > MAX_BITMAP_HOSTS:
+      raise ValueError(f"{cidr} has too many hosts to bitmap")
+    # Padded to whole words so scans never need a partial-word tail check
+    words = (self.size + _WORD_BYTES * 8 - 1) // (_WORD_BYTES * 8)
+    self._bits = bytearray(words * _WORD_BYTES)
+    self._extra: Dict[int, int] = {}  # Devices sharing an already used IP
+    self._address_class = type(self.network.network_address)
+    self.used = 0
+    self.built_at = time.monotonic()
+    # Padding bits past the last host are marked used so they are never offered
+    for offset in range(self.size, len(self._bits) * 8):
+      self._bits[offset >> 3] |= 1 << (offset & 7)
+
+  def offset_of(self, ip: str) -> Optional[int]:
+    """Host offset of an IP, or None when it is outside the host range"""
+    try:
+      addr = ipaddress.ip_address(ip)
+    except ValueError:
+      return None
+    value = int(addr)
+    if addr.version != self.network.version or not self.first <= value <= self.last:
+      return None
+    return value - self.first
+
+  def ip_at(self, offset: int) -> str:
+    return str(self._address_class(self.first + offset))
+
+  def _test(self, offset: int) -> bool:
+    return bool(self._bits[offset >> 3] & (1 << (offset & 7)))
+
+  def contains(self, ip: str) -> bool:
+    """Whether an IP in the host range is used"""
+    offset = self.offset_of(ip)
+    return offset is not None and self._test(offset)
+
+  def add(self, ip: str):
+    offset = self.offset_of(ip)
+    if offset is None:
+      return
+    if self._test(offset):
+      self._extra[offset] = self._extra.get(offset, 0) + 1
+    else:
+      self._bits[offset >> 3] |= 1 << (offset & 7)
+      self.used += 1
+
+  def discard(self, ip: str):
+    offset = self.offset_of(ip)
+    if offset is None or not self._test(offset):
+      return
+    if self._extra.get(offset):
+      self._extra[offset] -= 1
+      if not self._extra[offset]:
+        del self._extra[offset]
+    else:
+      self._bits[offset >> 3] &= ~(1 << (offset & 7)) & 0xFF
+      self.used -= 1
+
+  @property
+  def free(self) -> int:
+    return self.size - self.used
+
+  def _word(self, index: int) -> int:
+    start = index * _WORD_BYTES
+    return int.from_bytes(self._bits[start:start + _WORD_BYTES], "little")
+
+  def iter_free_offsets(self, start: int = 0) -> Iterator[int]:
+    """Free host offsets from `start` upwards, skipping full words at once"""
+    word_bits = _WORD_BYTES * 8
+    index = max(0, start) // word_bits
+    words = len(self._bits) // _WORD_BYTES
+    while index < words:
+      word = self._word(index)
+      if word != _FULL_WORD:
+        free_bits = ~word & _FULL_WORD
+        base = index * word_bits
+        while free_bits:
+          low = free_bits & -free_bits
+          offset = base + low.bit_length() - 1
+          if offset >= start:
+            yield offset
+          free_bits ^= low
+      index += 1
+
+  def next_free(self, start: int = 0) -> Optional[int]:
+    return next(self.iter_free_offsets(start), None)
+
+  def iter_free_ips(self) -> Iterator[str]:
+    for offset in self.iter_free_offsets():
+      yield self.ip_at(offset)
+
+  def iter_free_ranges(self) -> Iterator[Tuple[int, int]]:
+    """Inclusive (first, last) integer ranges of free IPs, like network.iter_free_ranges"""
+    run_start = None
+    previous = None
+    for offset in self.iter_free_offsets():
+      if run_start is None:
+        run_start = offset
+      elif offset != previous + 1:
+        yield self.first + run_start, self.first + previous
+        run_start = offset
+      previous = offset
+    if run_start is not None:
+      yield self.first + run_start, self.first + previous
+
+
+class OccupancyIndex:
+  """Lazily built, in-process cache of SubnetBitmap per subnet id"""
+
+  def __init__(self):
+    self._bitmaps: Dict[int, SubnetBitmap] = {}
+    self._lock = threading.Lock()
+
+  def get(self, db: Session, subnet_id: int, cidr: str) -> Optional[SubnetBitmap]:
+    """Bitmap for a subnet, rebuilt when missing, expired or its CIDR changed.
+
+    Returns None for subnets too large to bitmap or with an invalid CIDR;
+    callers fall back to the sorted-walk helpers in network.py.
+    """
+    with self._lock:
+      bitmap = self._bitmaps.get(subnet_id)
+      if bitmap is not None and bitmap.cidr == cidr and time.monotonic() - bitmap.built_at < BITMAP_TTL_SECONDS:
+        return bitmap
+
+    # Checked from the prefix: allocating the bitmap of an IPv6 /64 would exhaust memory
+    if count_hosts(cidr) > MAX_BITMAP_HOSTS:
+      return None
+    try:
+      bitmap = SubnetBitmap(cidr)
+    except ValueError:
+      return None
+
+    rows = db.query(Device.ip_address).filter(
+      Device.subnet_id == subnet_id,
+      Device.ip_address.isnot(None)
+    ).all()
+    for row in rows:
+      bitmap.add(row.ip_address)
+
+    with self._lock:
+      self._bitmaps[subnet_id] = bitmap
+    return bitmap
+
+  def device_added(self, subnet_id: Optional[int], ip: Optional[str]):
+    if subnet_id is None or not ip:
+      return
+    with self._lock:
+      bitmap = self._bitmaps.get(subnet_id)
+      if bitmap is not None:
+        bitmap.add(ip)
+
+  def device_removed(self, subnet_id: Optional[int], ip: Optional[str]):
+    if subnet_id is None or not ip:
+      return
+    with self._lock:
+      bitmap = self._bitmaps.get(subnet_id)
+      if bitmap is not None:
+        bitmap.discard(ip)
+
+  def device_moved(self, old: Tuple[Optional[int], Optional[str]], new: Tuple[Optional[int], Optional[str]]):
+    """Apply a device's (subnet_id, ip_address) change"""
+    if old == new:
+      return
+    self.device_removed(*old)
+    self.device_added(*new)
+
+  def invalidate(self, subnet_id: Optional[int] = None):
+    """Drop one subnet's bitmap, or every bitmap when no id is given"""
+    with self._lock:
+      if subnet_id is None:
+        self._bitmaps.clear()
+      else:
+        self._bitmaps.pop(subnet_id, None)
+
+
+occupancy = OccupancyIndex()
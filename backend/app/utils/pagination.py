@@ -0,0 +1,154 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import Response
+from sqlalchemy import String, and_, false, literal, or_
+
+# Response header carrying the cursor of the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# (column, descending) pairs; the last column must be unique (the primary key).
+# NULLs of nullable columns sort last ascending and first descending, as in a
+# PostgreSQL b-tree, so both directions can walk the same index.
+SortKeys = Sequence[Tuple[Any, bool]]
+
+
+def _encode_value(value):
+  if isinstance(value, bytes):
+    return {"b": value.hex()}
+  if isinstance(value, datetime):
+    return {"t": value.isoformat()}
+  return value
+
+
+def _decode_value(value):
+  if isinstance(value, dict):
+    if "b" in value:
+      return bytes.fromhex(value["b"])
+    if "t" in value:
+      return datetime.fromisoformat(value["t"])
+    raise ValueError("Invalid cursor")
+  return value
+
+
+def _column(key):
+  return getattr(key, "expression", key)
+
+
+def cursor_tag(keys: SortKeys) -> str:
+  """Listing and order a cursor belongs to, e.g. devices:-updated_at,-id"""
+  columns = [_column(column) for column, _descending in keys]
+  return columns[-1].table.name + ":" + ",".join(
+    ("-" if descending else "") + column.name for column, (_key, descending) in zip(columns, keys)
+  )
+
+
+def _check_value(column, value):
+  """Reject values the key's column cannot hold, which the database would fail on"""
+  if value is None:
+    if not _nullable(column):
+      raise ValueError
+    return
+  try:
+    expected = _column(column).type.python_type
+  except NotImplementedError:
+    return
+  if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+    raise ValueError
+
+
+def encode_cursor(keys: SortKeys, values: Sequence) -> str:
+  """Opaque cursor of a row's sort-key values, tagged with the listing and order"""
+  payload = json.dumps({"k": cursor_tag(keys), "v": [_encode_value(v) for v in values]}, separators=(",", ":"))
+  return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: SortKeys) -> List:
+  """Sort-key values of a cursor; ValueError unless it was made for these keys"""
+  try:
+    payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    if not isinstance(payload, dict) or not isinstance(payload.get("v"), list):
+      raise ValueError
+  except (ValueError, TypeError, binascii.Error):
+    raise ValueError("Invalid cursor")
+  if payload.get("k") != cursor_tag(keys) or len(payload["v"]) != len(keys):
+    raise ValueError("Cursor belongs to another listing or sort order; start again without it")
+  try:
+    values = [_decode_value(v) for v in payload["v"]]
+    for (column, _descending), value in zip(keys, values):
+      _check_value(column, value)
+  except (ValueError, TypeError):
+    raise ValueError("Invalid cursor")
+  return values
+
+
+def _nullable(column) -> bool:
+  return getattr(_column(column), "nullable", True)
+
+
+def _order(column, descending: bool):
+  if not _nullable(column):
+    return column.desc() if descending else column
+  return column.desc().nulls_first() if descending else column.asc().nulls_last()
+
+
+def _bind(value, dialect: str):
+  """SQLite keeps func.now() timestamps as "YYYY-MM-DD HH:MM:SS" text, which the driver's
+  ".000000" form never equals; whole-second cursor values are bound in the stored form"""
+  if dialect == "sqlite" and isinstance(value, datetime) and not value.microsecond:
+    return literal(value.strftime("%Y-%m-%d %H:%M:%S"), String)
+  return value
+
+
+def _equal(column, value):
+  return column.is_(None) if value is None else column == value
+
+
+def _after(column, descending: bool, value):
+  """Rows sorting strictly after `value` on one key, NULLs placed as in _order"""
+  if value is None:
+    return column.isnot(None) if descending else false()
+  if descending:
+    return column < value
+  return or_(column > value, column.is_(None)) if _nullable(column) else column > value
+
+
+def paginate(query, keys: SortKeys, skip: int = 0, limit: Optional[int] = 100, cursor: Optional[str] = None):
+  """Order a query by `keys` and page it: after `cursor` when given (keyset), else from `skip` (offset).
+
+  The keyset condition is the expanded row comparison
+  (k1 > v1) OR (k1 = v1 AND k2 > v2) ..., with < for descending keys, so
+  each page is an index range scan however deep it is, and rows inserted
+  before the cursor do not shift later pages. Raises ValueError for a
+  cursor made for other keys or holding values their columns cannot hold.
+  """
+  if cursor:
+    dialect = query.session.get_bind().dialect.name
+    values = [_bind(value, dialect) for value in decode_cursor(cursor, keys)]
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+      equal = [_equal(keys[j][0], values[j]) for j in range(i)]
+      clauses.append(and_(*equal, _after(column, descending, values[i])))
+    query = query.filter(or_(*clauses))
+  query = query.order_by(*(_order(column, descending) for column, descending in keys))
+  if not cursor and skip:
+    query = query.offset(skip)
+  if limit is not None:
+    query = query.limit(limit)
+  return query.all()
+
+
+def next_cursor(rows: Sequence, keys: SortKeys, limit: Optional[int]) -> Optional[str]:
+  """Cursor following the last row of a full page, None when the page came back short"""
+  if not rows or limit is None or len(rows) < limit:
+    return None
+  return encode_cursor(keys, [getattr(rows[-1], column.key) for column, _descending in keys])
+
+
+def set_next_cursor(response: Response, rows: Sequence, keys: SortKeys, limit: Optional[int]):
+  cursor = next_cursor(rows, keys, limit)
+  if cursor:
+    response.headers[NEXT_CURSOR_HEADER] = cursor
@@ -0,0 +1,361 @@
+import ipaddress
+import struct
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..models.user import Device
+from .ipnum import pack_ip
+from .neighbors import normalize_mac
+from .pcap import (
+  LINKTYPE_ETHERNET, LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2,
+  LINKTYPE_NULL, LINKTYPE_RAW, read_packets,
+)
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_ARP = 0x0806
+ETHERTYPE_IPV6 = 0x86DD
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+# ========== PROTOCOLS ==========
+
+# Well-known ports of the OT protocols recognised, by transport; payloads are checked too
+# so that unrelated traffic on the same port is not labelled
+OT_PORTS = {
+  (IPPROTO_TCP, 502): "modbus",
+  (IPPROTO_TCP, 102): "s7",
+  (IPPROTO_TCP, 44818): "cip",
+  (IPPROTO_UDP, 44818): "cip",
+  (IPPROTO_UDP, 2222): "cip",  # Implicit (class 1) I/O
+  (IPPROTO_UDP, 47808): "bacnet",
+}
+ENIP_COMMANDS = (0x0004, 0x0063, 0x0064, 0x0065, 0x0066, 0x006F, 0x0070)
+
+
+def _looks_like(protocol: str, transport: int, port: int, payload: bytes) -> bool:
+  if protocol == "modbus":
+    # MBAP header: protocol id 0 and a length covering the rest of the frame
+    return len(payload) >= 8 and payload[2:4] == b"\x00\x00"
+  if protocol == "s7":
+    # TPKT + COTP data, then the S7comm (0x32) or S7comm-plus (0x72) protocol id
+    return len(payload) >= 8 and payload[0] == 0x03 and payload[1] == 0x00 and payload[7] in (0x32, 0x72)
+  if protocol == "cip":
+    if port == 2222:
+      return len(payload) >= 6
+    return len(payload) >= 24 and struct.unpack_from("<H", payload)[0] in ENIP_COMMANDS
+  if protocol == "bacnet":
+    # BACnet Virtual Link Control, type BACnet/IP
+    return len(payload) >= 4 and payload[0] == 0x81
+  return False
+
+
+def classify(transport: int, src_port: int, dst_port: int, payload: bytes) -> Optional[Tuple[str, bool]]:
+  """(protocol, whether the source is the server side) of a transport payload, or None"""
+  for port, source_is_server in ((dst_port, False), (src_port, True)):
+    protocol = OT_PORTS.get((transport, port))
+    if protocol and _looks_like(protocol, transport, port, payload):
+      return protocol, source_is_server
+  return None
+
+
+# ========== INVENTORY ==========
+
+def _mac(raw: bytes) -> Optional[str]:
+  """Unicast MAC as lower-case colon-separated text; group and all-zero addresses are None"""
+  if len(raw) != 6 or raw[0] & 0x01 or raw == b"\x00" * 6:
+    return None
+  return ":".join(f"{b:02x}" for b in raw)
+
+
+def _host_address(raw: bytes) -> Optional[str]:
+  """Unicast, non link-local address worth inventorying"""
+  try:
+    addr = ipaddress.ip_address(raw)
+  except ValueError:
+    return None
+  if addr.is_multicast or addr.is_unspecified or addr.is_loopback or addr.is_link_local or addr.is_reserved:
+    return None
+  if addr.version == 4 and raw[3] == 255:
+    # Most likely a directed broadcast; real .255 hosts still appear as sources of ARP
+    return None
+  return str(addr)
+
+
+class HostObservation:
+  """What one transmitting address was seen doing; `packets` counts the packets it sent"""
+
+  __slots__ = ("arp_mac", "macs", "protocols", "packets", "first_seen", "last_seen")
+
+  def __init__(self, timestamp: float):
+    self.arp_mac: Optional[str] = None
+    self.macs: Dict[str, int] = {}
+    self.protocols: Set[str] = set()
+    self.packets = 0
+    self.first_seen = timestamp
+    self.last_seen = timestamp
+
+
+class PassiveInventory:
+  """Hosts, IP/MAC pairs, OT protocols and talker pairs accumulated packet by packet.
+
+  Hosts are the senders of ARP and IP packets; addresses only ever seen as
+  destinations are kept in the talker pairs alone. ARP gives authoritative
+  IP/MAC pairs. The Ethernet addresses of IP packets are used as well, except
+  for MACs seen with more than `router_mac_ips` addresses: those belong to
+  routers forwarding other subnets' traffic.
+  Memory grows with the number of hosts and talker pairs, never with the
+  number of packets, and both are capped.
+  """
+
+  def __init__(self, max_hosts: int = 65536, max_talkers: int = 100000, router_mac_ips: int = 8):
+    self.max_hosts = max_hosts
+    self.max_talkers = max_talkers
+    self.router_mac_ips = router_mac_ips
+    self.hosts: Dict[str, HostObservation] = {}
+    self.mac_ips: Dict[str, Set[str]] = {}
+    self.talkers: Dict[Tuple[str, str, str], List[int]] = {}
+    self.packets = 0
+    self.undecoded = 0
+    self.dropped_hosts = 0
+    self.dropped_talkers = 0
+    # Raw address -> text (or None) conversions, reused across packets; bounded like the hosts
+    self._addresses: Dict[bytes, Optional[str]] = {}
+    self._macs: Dict[bytes, Optional[str]] = {}
+
+  def _address(self, raw: bytes) -> Optional[str]:
+    try:
+      return self._addresses[raw]
+    except KeyError:
+      if len(self._addresses) >= 2 * self.max_hosts:
+        self._addresses.clear()
+      text = self._addresses[raw] = _host_address(raw)
+      return text
+
+  def _mac(self, raw: bytes) -> Optional[str]:
+    try:
+      return self._macs[raw]
+    except KeyError:
+      if len(self._macs) >= 2 * self.max_hosts:
+        self._macs.clear()
+      text = self._macs[raw] = _mac(raw)
+      return text
+
+  def _host(self, ip: str, timestamp: float) -> Optional[HostObservation]:
+    host = self.hosts.get(ip)
+    if host is None:
+      if len(self.hosts) >= self.max_hosts:
+        self.dropped_hosts += 1
+        return None
+      host = self.hosts[ip] = HostObservation(timestamp)
+    host.packets += 1
+    if timestamp:
+      host.first_seen = min(host.first_seen, timestamp) if host.first_seen else timestamp
+      host.last_seen = max(host.last_seen, timestamp)
+    return host
+
+  def _pair(self, host: HostObservation, ip: str, mac: Optional[str]):
+    if not mac:
+      return
+    host.macs[mac] = host.macs.get(mac, 0) + 1
+    ips = self.mac_ips.setdefault(mac, set())
+    if len(ips) <= self.router_mac_ips:
+      ips.add(ip)
+
+  def add(self, linktype: int, timestamp: float, data: bytes):
+    self.packets += 1
+    src_mac = dst_mac = None
+    if linktype == LINKTYPE_ETHERNET:
+      if len(data) < 14:
+        self.undecoded += 1
+        return
+      dst_mac, src_mac = self._mac(data[0:6]), self._mac(data[6:12])
+      ethertype = struct.unpack_from("!H", data, 12)[0]
+      offset = 14
+      while ethertype in VLAN_ETHERTYPES and len(data) >= offset + 4:
+        ethertype = struct.unpack_from("!H", data, offset + 2)[0]
+        offset += 4
+    elif linktype == LINKTYPE_LINUX_SLL and len(data) >= 16:
+      address_length = struct.unpack_from("!H", data, 4)[0]
+      src_mac = self._mac(data[6:6 + address_length]) if address_length == 6 else None
+      ethertype, offset = struct.unpack_from("!H", data, 14)[0], 16
+    elif linktype == LINKTYPE_LINUX_SLL2 and len(data) >= 20:
+      ethertype = struct.unpack_from("!H", data, 0)[0]
+      src_mac = self._mac(data[12:18]) if data[11] == 6 else None
+      offset = 20
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6) and data:
+      ethertype, offset = (ETHERTYPE_IPV6 if data[0] >> 4 == 6 else ETHERTYPE_IPV4), 0
+    elif linktype == LINKTYPE_NULL and len(data) >= 4:
+      ethertype, offset = (ETHERTYPE_IPV6 if len(data) > 4 and data[4] >> 4 == 6 else ETHERTYPE_IPV4), 4
+    else:
+      self.undecoded += 1
+      return
+
+    if ethertype == ETHERTYPE_ARP:
+      self._add_arp(timestamp, data, offset)
+    elif ethertype in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+      self._add_ip(timestamp, data, offset, src_mac, dst_mac)
+    else:
+      self.undecoded += 1
+
+  def _add_arp(self, timestamp: float, data: bytes, offset: int):
+    if len(data) < offset + 28:
+      self.undecoded += 1
+      return
+    hardware, protocol, hlen, plen = struct.unpack_from("!HHBB", data, offset)
+    if hardware != 1 or protocol != ETHERTYPE_IPV4 or hlen != 6 or plen != 4:
+      return
+    sender_mac = self._mac(data[offset + 8:offset + 14])
+    sender_ip = self._address(data[offset + 14:offset + 18])
+    if sender_ip and sender_mac:
+      host = self._host(sender_ip, timestamp)
+      if host is not None:
+        host.arp_mac = sender_mac
+        self._pair(host, sender_ip, sender_mac)
+
+  def _add_ip(self, timestamp: float, data: bytes, offset: int, src_mac: Optional[str], dst_mac: Optional[str]):
+    if len(data) < offset + 20:
+      self.undecoded += 1
+      return
+    version = data[offset] >> 4
+    if version == 4:
+      header_length = (data[offset] & 0x0F) * 4
+      total_length = struct.unpack_from("!H", data, offset + 2)[0]
+      fragment = struct.unpack_from("!H", data, offset + 6)[0] & 0x1FFF
+      transport = data[offset + 9]
+      src_raw, dst_raw = data[offset + 12:offset + 16], data[offset + 16:offset + 20]
+      payload_start, payload_end = offset + header_length, offset + total_length
+    elif version == 6 and len(data) >= offset + 40:
+      payload_length = struct.unpack_from("!H", data, offset + 4)[0]
+      fragment = 0
+      transport = data[offset + 6]  # Extension headers are not followed
+      src_raw, dst_raw = data[offset + 8:offset + 24], data[offset + 24:offset + 40]
+      payload_start, payload_end = offset + 40, offset + 40 + payload_length
+    else:
+      self.undecoded += 1
+      return
+    length = payload_end - offset
+
+    src, dst = self._address(src_raw), self._address(dst_raw)
+    src_host = self._host(src, timestamp) if src else None
+    # Only hosts that have transmitted are inventoried: a destination may not exist at all
+    # (scans, stale peers), so it stays a talker until it sends something itself
+    dst_host = self.hosts.get(dst) if dst else None
+    if src_host is not None:
+      self._pair(src_host, src, src_mac)
+    if dst_host is not None:
+      self._pair(dst_host, dst, dst_mac)
+
+    protocol = "ip"
+    if transport in (IPPROTO_TCP, IPPROTO_UDP) and not fragment and len(data) >= payload_start + 8:
+      src_port, dst_port = struct.unpack_from("!HH", data, payload_start)
+      if transport == IPPROTO_TCP:
+        header = (data[payload_start + 12] >> 4) * 4 if len(data) > payload_start + 12 else 20
+      else:
+        header = 8
+      payload = data[payload_start + header:min(payload_end, len(data))]
+      found = classify(transport, src_port, dst_port, payload)
+      if found:
+        protocol, source_is_server = found
+        if src_host is not None:
+          src_host.protocols.add(f"{protocol}-{'server' if source_is_server else 'client'}")
+        if dst_host is not None:
+          dst_host.protocols.add(f"{protocol}-{'client' if source_is_server else 'server'}")
+
+    if src and dst:
+      key = (src, dst, protocol)
+      counters = self.talkers.get(key)
+      if counters is None:
+        if len(self.talkers) >= self.max_talkers:
+          self.dropped_talkers += 1
+          return
+        counters = self.talkers[key] = [0, 0]
+      counters[0] += 1
+      counters[1] += length
+
+  def mac_for(self, ip: str) -> Optional[Tuple[str, str]]:
+    """(mac, source) observed for a host: its ARP announcement, else its most frequent non-router MAC"""
+    host = self.hosts[ip]
+    if host.arp_mac:
+      return host.arp_mac, "arp"
+    candidates = [(count, mac) for mac, count in host.macs.items()
+                  if len(self.mac_ips.get(mac, ())) <= self.router_mac_ips]
+    if not candidates:
+      return None
+    return max(candidates)[1], "ip"
+
+
+def ingest_capture(stream: BinaryIO, inventory: PassiveInventory) -> PassiveInventory:
+  """Feed every packet of a capture into an inventory in one pass"""
+  for packet in read_packets(stream):
+    inventory.add(packet.linktype, packet.timestamp, packet.data)
+  return inventory
+
+
+# ========== DIFF ==========
+
+def _datetime(timestamp: float) -> Optional[datetime]:
+  return datetime.utcfromtimestamp(timestamp) if timestamp else None
+
+
+def devices_by_ip(db: Session, ips: Iterable[str], chunk: int = 500) -> Dict[str, Device]:
+  """Registered devices keyed by observed address, matched on the packed IP column"""
+  packed = {pack_ip(ip): ip for ip in ips}
+  keys = [key for key in packed if key is not None]
+  devices = {}
+  for start in range(0, len(keys), chunk):
+    for device in db.query(Device).filter(Device.ip_packed.in_(keys[start:start + chunk])).order_by(Device.id):
+      devices.setdefault(packed[device.ip_packed], device)
+  return devices
+
+
+def diff_inventory(db: Session, inventory: PassiveInventory, resolve_subnet) -> Tuple[List[Dict], List[Dict]]:
+  """(new device proposals, MAC update proposals) of an inventory against the devices table.
+
+  `resolve_subnet(db, ips)` returns the subnet match of each address, as
+  subnet_resolver.resolve_many does.
+  """
+  ips = sorted(inventory.hosts, key=lambda ip: pack_ip(ip))
+  devices = devices_by_ip(db, ips)
+  subnets = dict(zip(ips, resolve_subnet(db, ips)))
+  new_devices, mac_updates = [], []
+  for ip in ips:
+    host = inventory.hosts[ip]
+    observed = inventory.mac_for(ip)
+    mac, mac_source = observed if observed else (None, None)
+    device = devices.get(ip)
+    if device is None:
+      match = subnets.get(ip)
+      new_devices.append({
+        "ip_address": ip,
+        "mac_address": mac,
+        "mac_source": mac_source,
+        "subnet_id": match.subnet_id if match else None,
+        "subnet_cidr": match.cidr if match else None,
+        "protocols": sorted(host.protocols),
+        "packets": host.packets,
+        "first_seen": _datetime(host.first_seen),
+        "last_seen": _datetime(host.last_seen),
+      })
+      continue
+    current = normalize_mac(device.mac_address) if device.mac_address else None
+    if mac and mac != current:
+      mac_updates.append({
+        "device_id": device.id,
+        "device_name": device.name,
+        "ip_address": ip,
+        "current_mac": device.mac_address,
+        "observed_mac": mac,
+        "mac_source": mac_source,
+      })
+  return new_devices, mac_updates
+
+
+def top_talkers(inventory: PassiveInventory, limit: int) -> List[Dict]:
+  ranked = sorted(inventory.talkers.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+  return [
+    {"src_ip": src, "dst_ip": dst, "protocol": protocol, "packets": packets, "bytes": size}
+    for (src, dst, protocol), (packets, size) in ranked
+  ]
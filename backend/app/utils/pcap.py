@@ -0,0 +1,158 @@
+import gzip
+import struct
+from typing import BinaryIO, Dict, Iterator, NamedTuple
+
+# Link-layer header types (https://www.tcpdump.org/linktypes.html)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002  # Obsolete packet block
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+OPTION_IF_TSRESOL = 9
+GZIP_MAGIC = b"\x1f\x8b"
+# Larger blocks or records are treated as corruption instead of being read into memory
+MAX_RECORD_LENGTH = 256 * 1024
+
+
+class CaptureError(Exception):
+  """The file is not a pcap/pcapng capture or is corrupt"""
+
+
+class Packet(NamedTuple):
+  linktype: int
+  timestamp: float  # Seconds since the epoch
+  data: bytes
+
+
+def _read_exact(stream: BinaryIO, length: int) -> bytes:
+  data = stream.read(length)
+  if len(data) != length:
+    raise EOFError
+  return data
+
+
+def _pcap_endian(header: bytes) -> str:
+  for endian in "<>":
+    if struct.unpack(endian + "I", header[:4])[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+      return endian
+  raise CaptureError("Not a pcap or pcapng file")
+
+
+def _pcap_packets(stream: BinaryIO, header: bytes) -> Iterator[Packet]:
+  endian = _pcap_endian(header)
+  magic = struct.unpack(endian + "I", header[:4])[0]
+  divisor = 1e9 if magic == PCAP_MAGIC_NSEC else 1e6
+  try:
+    rest = _read_exact(stream, 16)
+  except EOFError:
+    return
+  # Upper bits of the link type field carry FCS flags
+  linktype = struct.unpack(endian + "I", rest[12:16])[0] & 0x0FFFFFFF
+  record = struct.Struct(endian + "IIII")
+  while True:
+    head = stream.read(record.size)
+    if len(head) < record.size:
+      return
+    seconds, fraction, captured, _original = record.unpack(head)
+    if captured > MAX_RECORD_LENGTH:
+      raise CaptureError(f"Corrupt record of {captured} bytes")
+    try:
+      data = _read_exact(stream, captured)
+    except EOFError:
+      return  # Capture cut off mid-record
+    yield Packet(linktype, seconds + fraction / divisor, data)
+
+
+def _tsresol(options: bytes, endian: str) -> float:
+  """Seconds per timestamp unit of an interface, from its if_tsresol option"""
+  offset = 0
+  while offset + 4 <= len(options):
+    code, length = struct.unpack_from(endian + "HH", options, offset)
+    if code == 0:
+      break
+    if code == OPTION_IF_TSRESOL and length >= 1:
+      value = options[offset + 4]
+      return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+    offset += 4 + ((length + 3) & ~3)
+  return 1e-6
+
+
+def _pcapng_packets(stream: BinaryIO, header: bytes) -> Iterator[Packet]:
+  endian = "<"
+  interfaces: Dict[int, tuple] = {}
+  block_head = header
+  while True:
+    if len(block_head) < 8:
+      return
+    block_type = struct.unpack("<I", block_head[:4])[0]
+    if block_type == PCAPNG_SHB:
+      # Each section header fixes the byte order and restarts interface numbering
+      try:
+        order = _read_exact(stream, 4)
+      except EOFError:
+        return
+      endian = "<" if struct.unpack("<I", order)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+      if struct.unpack(endian + "I", order)[0] != PCAPNG_BYTE_ORDER_MAGIC:
+        raise CaptureError("Bad pcapng byte-order magic")
+      interfaces = {}
+      length = struct.unpack(endian + "I", block_head[4:8])[0]
+      consumed = 12
+    else:
+      block_type, length = struct.unpack(endian + "II", block_head[:8])
+      consumed = 8
+    if length < consumed + 4 or length % 4 or length > MAX_RECORD_LENGTH + 64:
+      raise CaptureError(f"Corrupt pcapng block of {length} bytes")
+    try:
+      body = _read_exact(stream, length - consumed)[:-4]
+    except EOFError:
+      return
+
+    if block_type == PCAPNG_IDB and len(body) >= 8:
+      linktype, _reserved, snaplen = struct.unpack_from(endian + "HHI", body)
+      interfaces[len(interfaces)] = (linktype, _tsresol(body[8:], endian), snaplen)
+    elif block_type == PCAPNG_EPB and len(body) >= 20:
+      interface_id, high, low, captured, _original = struct.unpack_from(endian + "IIIII", body)
+      if interface_id in interfaces:
+        linktype, resolution, _snaplen = interfaces[interface_id]
+        yield Packet(linktype, ((high << 32) | low) * resolution, body[20:20 + captured])
+    elif block_type == PCAPNG_SPB and len(body) >= 4 and 0 in interfaces:
+      original = struct.unpack_from(endian + "I", body)[0]
+      linktype, _resolution, snaplen = interfaces[0]
+      captured = min(original, snaplen or original, len(body) - 4)
+      yield Packet(linktype, 0.0, body[4:4 + captured])
+    elif block_type == PCAPNG_OPB and len(body) >= 20:
+      interface_id, _drops, high, low, captured, _original = struct.unpack_from(endian + "HHIIII", body)
+      if interface_id in interfaces:
+        linktype, resolution, _snaplen = interfaces[interface_id]
+        yield Packet(linktype, ((high << 32) | low) * resolution, body[20:20 + captured])
+    block_head = stream.read(8)
+
+
+def read_packets(stream: BinaryIO) -> Iterator[Packet]:
+  """Packets of a pcap or pcapng capture (optionally gzip-compressed), read one record at a time.
+
+  Only the current record is held in memory, so captures of any size are
+  processed in constant memory. A capture cut off mid-record ends cleanly.
+  """
+  header = stream.read(8)
+  if header[:2] == GZIP_MAGIC:
+    stream.seek(0)
+    stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    header = stream.read(8)
+  if len(header) < 8:
+    raise CaptureError("File too short for a capture")
+  if struct.unpack("<I", header[:4])[0] == PCAPNG_SHB:
+    return _pcapng_packets(stream, header)
+  _pcap_endian(header)
+  return _pcap_packets(stream, header)
@@ -0,0 +1,56 @@
+import asyncio
+import time
+from typing import Optional
+
+
+async def tcp_probe(ip: str, port: int, timeout: float) -> Optional[float]:
+  """Handshake latency in ms when the host answers a TCP connect, else None.
+
+  A refused connection (RST) also counts as an answer: the port is closed
+  but the host is up.
+  """
+  started = time.perf_counter()
+  try:
+    _reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+  except ConnectionRefusedError:
+    return round((time.perf_counter() - started) * 1000, 3)
+  except (asyncio.TimeoutError, OSError):
+    return None
+  latency = round((time.perf_counter() - started) * 1000, 3)
+  # Reset instead of a graceful close: nothing is sent and no TIME_WAIT is left behind
+  writer.transport.abort()
+  return latency
+
+
+class _ReplyProtocol(asyncio.DatagramProtocol):
+  def __init__(self, reply: asyncio.Future):
+    self._reply = reply
+
+  def datagram_received(self, data: bytes, addr):
+    if not self._reply.done():
+      self._reply.set_result(True)
+
+  def error_received(self, exc: Exception):
+    # ICMP port unreachable surfaces as a refused connection: the host is up
+    if not self._reply.done():
+      self._reply.set_result(isinstance(exc, ConnectionRefusedError))
+
+
+async def udp_probe(ip: str, port: int, payload: bytes, timeout: float) -> Optional[float]:
+  """Round-trip latency in ms when the host replies to a datagram (or rejects it), else None"""
+  loop = asyncio.get_running_loop()
+  reply = loop.create_future()
+  try:
+    transport, _ = await loop.create_datagram_endpoint(lambda: _ReplyProtocol(reply), remote_addr=(ip, port))
+  except OSError:
+    return None
+  started = time.perf_counter()
+  try:
+    transport.sendto(payload)
+    if await asyncio.wait_for(reply, timeout):
+      return round((time.perf_counter() - started) * 1000, 3)
+    return None
+  except (asyncio.TimeoutError, OSError):
+    return None
+  finally:
+    transport.close()
@@ -0,0 +1,138 @@
+import asyncio
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from ..core.config import settings
+
+_MISSING = object()
+
+
+class TTLCache:
+  """Thread-safe LRU cache whose entries also expire after their own TTL"""
+
+  def __init__(self, maxsize: int, clock: Callable[[], float] = time.monotonic):
+    self._maxsize = maxsize
+    self._clock = clock
+    self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def get(self, key: Hashable, default=_MISSING):
+    """Cached value, or `default` when the key is absent or expired"""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return default
+      expires_at, value = entry
+      if expires_at <= self._clock():
+        del self._entries[key]
+        return default
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key: Hashable, value, ttl: float):
+    with self._lock:
+      self._entries[key] = (self._clock() + ttl, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self._maxsize:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+
+def system_ptr_lookup(ip: str) -> Optional[str]:
+  """PTR name of an address through the system resolver; None when it has none.
+
+  Raises OSError for failures worth retrying (timeouts, unreachable servers).
+  """
+  try:
+    return socket.gethostbyaddr(ip)[0]
+  except socket.herror:
+    return None
+
+
+class ReverseResolver:
+  """Concurrent PTR lookups with a TTL-bounded LRU cache of names and misses.
+
+  `lookup` is any blocking callable returning a name or None (no PTR record)
+  and raising OSError on transient failures; it runs on a dedicated thread
+  pool so a stub resolver can be swapped in for tests. Transient failures
+  and timeouts are not cached.
+  """
+
+  def __init__(self, lookup: Callable[[str], Optional[str]] = system_ptr_lookup,
+               cache_size: int = 65536, ttl: float = 3600, negative_ttl: float = 300,
+               max_concurrency: int = 64, timeout: float = 2.0):
+    self.lookup = lookup
+    self.cache = TTLCache(cache_size)
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.max_concurrency = max(1, max_concurrency)
+    self.timeout = timeout
+    self._executor: Optional[ThreadPoolExecutor] = None
+    self._executor_lock = threading.Lock()
+
+  def _get_executor(self) -> ThreadPoolExecutor:
+    with self._executor_lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="rdns")
+      return self._executor
+
+  async def _lookup(self, ip: str, semaphore: asyncio.Semaphore) -> Optional[str]:
+    async with semaphore:
+      loop = asyncio.get_running_loop()
+      try:
+        name = await asyncio.wait_for(loop.run_in_executor(self._get_executor(), self.lookup, ip), self.timeout)
+      except (OSError, asyncio.TimeoutError):
+        return None
+    self.cache.set(ip, name, self.ttl if name else self.negative_ttl)
+    return name
+
+  async def resolve_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+    """PTR name (or None) of each distinct address, looking up only cache misses"""
+    names: Dict[str, Optional[str]] = {}
+    misses = []
+    for ip in ips:
+      if ip in names:
+        continue
+      cached = self.cache.get(ip)
+      if cached is _MISSING:
+        names[ip] = None
+        misses.append(ip)
+      else:
+        names[ip] = cached
+    if misses:
+      semaphore = asyncio.Semaphore(self.max_concurrency)
+      found = await asyncio.gather(*(self._lookup(ip, semaphore) for ip in misses))
+      names.update(zip(misses, found))
+    return names
+
+  async def resolve(self, ip: str) -> Optional[str]:
+    return (await self.resolve_many([ip]))[ip]
+
+  def resolve_many_sync(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+    """resolve_many for sync endpoints and worker threads (no running event loop)"""
+    return asyncio.run(self.resolve_many(ips))
+
+  def shutdown(self):
+    with self._executor_lock:
+      if self._executor is not None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+reverse_dns = ReverseResolver(
+  cache_size=settings.dns.cache_size,
+  ttl=settings.dns.ttl_seconds,
+  negative_ttl=settings.dns.negative_ttl_seconds,
+  max_concurrency=settings.dns.max_concurrency,
+  timeout=settings.dns.timeout_seconds,
+)
@@ -0,0 +1,387 @@
+import asyncio
+import ipaddress
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, insert, and_
+from sqlalchemy.orm import Session
+
+from ..core.config import ProbeSpec, settings
+from ..core.database import SessionLocal
+from ..models.user import Device
+from ..models.scan_history import ScanRecord
+from ..schemas.schemas import NetworkScanResult
+from .icmp import AIMDController, iter_ping_hosts, iter_with_ticks
+from .neighbors import NeighborTable, read_neighbor_table
+from .rdns import reverse_dns
+from .network import count_hosts, get_all_ips_in_subnet, ip_sort_key
+
+
+def devices_by_ip(db: Session, subnet_id: int) -> Dict[str, Tuple[int, str]]:
+  """Map each device IP in a subnet to its (id, name)"""
+  devices = db.query(Device.id, Device.name, Device.ip_address).filter(Device.subnet_id == subnet_id).all()
+  return {d.ip_address: (d.id, d.name) for d in devices if d.ip_address}
+
+
+def build_scan_result(pr: dict, ip_to_device: Dict[str, Tuple[int, str]],
+                      neighbors: Optional[NeighborTable] = None) -> NetworkScanResult:
+  """Turn a ping result into a NetworkScanResult flagged against known devices,
+  with the MAC from the neighbor cache when the host answered"""
+  device = ip_to_device.get(pr["ip"])
+  mac = neighbors.mac_for(pr["ip"]) if neighbors is not None and pr["online"] else None
+  return NetworkScanResult(
+    ip=pr["ip"],
+    online=pr["online"],
+    latency_ms=pr["latency_ms"],
+    is_registered=device is not None,
+    device_id=device[0] if device else None,
+    device_name=device[1] if device else None,
+    mac_address=mac,
+    probe=pr.get("probe")
+  )
+
+
+def attach_hostnames(results: List[NetworkScanResult], names: Dict[str, Optional[str]]):
+  for result in results:
+    if result.online:
+      result.hostname = names.get(result.ip)
+
+
+def resolve_hostnames(results: List[NetworkScanResult]):
+  """Fill the PTR name of every online result, from the reverse-DNS cache where possible"""
+  attach_hostnames(results, reverse_dns.resolve_many_sync(r.ip for r in results if r.online))
+
+
+async def resolve_hostnames_async(results: List[NetworkScanResult]):
+  attach_hostnames(results, await reverse_dns.resolve_many(r.ip for r in results if r.online))
+
+
+def empty_scan_counts() -> dict:
+  return {"online_count": 0, "offline_count": 0, "registered_count": 0, "new_count": 0}
+
+
+def tally_scan_result(counts: dict, result: NetworkScanResult):
+  """Add one result to the online/offline/registered/new counters"""
+  if result.online:
+    counts["online_count"] += 1
+    if not result.is_registered:
+      counts["new_count"] += 1
+  else:
+    counts["offline_count"] += 1
+
+  if result.is_registered:
+    counts["registered_count"] += 1
+
+
+def build_rate_controller(cidr: str, min_concurrency: Optional[int] = None,
+                          max_concurrency: Optional[int] = None,
+                          max_pps: Optional[int] = None) -> AIMDController:
+  """Probe-rate controller for one scan; per-scan values cannot exceed the subnet's configured limits"""
+  limits = settings.scan.limits_for(cidr)
+  ceiling = min(max_concurrency or limits.max_in_flight, limits.max_in_flight)
+  floor = min(min_concurrency or limits.min_concurrency, ceiling)
+  pps = max_pps or limits.max_pps or 0
+  if limits.max_pps:
+    pps = min(pps, limits.max_pps)
+  return AIMDController(floor, ceiling, pps)
+
+
+# ========== SCAN TARGETS ==========
+
+SCAN_MODES = ("auto", "sweep", "candidates")
+
+
+def candidate_ips(db: Session, subnet_id: int, network) -> set:
+  """Addresses worth probing without enumerating the subnet: known devices,
+  previously scanned addresses and this host's neighbor cache"""
+  candidates = {ip for ip in devices_by_ip(db, subnet_id)}
+  history = db.query(ScanRecord.ip_address).filter(ScanRecord.subnet_id == subnet_id).distinct().all()
+  candidates.update(r.ip_address for r in history)
+  candidates.update(read_neighbor_table())
+  return {ip for ip in candidates if _in_network(ip, network)}
+
+
+def resolve_scan_targets(db: Session, subnet_id: int, cidr: str, mode: str = "auto",
+                         extra_ips: Iterable[str] = ()) -> List[str]:
+  """Addresses a scan should probe, in address order.
+
+  `sweep` enumerates every host and is refused above `scan.max_sweep_hosts`;
+  `candidates` probes known devices, previous results, the neighbor cache
+  and `extra_ips`; `auto` sweeps subnets under the cap and falls back to
+  candidates for larger ones (e.g. IPv6 /64s). Raises ValueError for an
+  unknown mode, an invalid CIDR, stray `extra_ips` or a target list over
+  the cap.
+  """
+  if mode not in SCAN_MODES:
+    raise ValueError(f"Unknown scan mode: {mode}")
+  try:
+    network = ipaddress.ip_network(cidr, strict=False)
+  except ValueError:
+    raise ValueError(f"Invalid subnet: {cidr}")
+
+  cap = settings.scan.max_sweep_hosts
+  extra = set()
+  for ip in extra_ips:
+    if not _in_network(ip, network):
+      raise ValueError(f"{ip} is not an address of {network}")
+    extra.add(str(ipaddress.ip_address(ip)))
+
+  total = count_hosts(cidr)
+  if mode == "sweep" and total > cap:
+    raise ValueError(f"{network} has {total} hosts, over the sweep cap of {cap}; use candidates mode")
+  if mode == "sweep" or (mode == "auto" and total <= cap):
+    return get_all_ips_in_subnet(cidr, limit=cap)
+
+  targets = candidate_ips(db, subnet_id, network) | extra
+  if len(targets) > cap:
+    raise ValueError(f"{len(targets)} scan targets exceed the cap of {cap}")
+  return sorted(targets, key=ip_sort_key)
+
+
+def _in_network(ip: str, network) -> bool:
+  try:
+    addr = ipaddress.ip_address(ip)
+  except ValueError:
+    return False
+  return addr.version == network.version and addr in network
+
+
+# ========== SCAN HISTORY ==========
+
+def latest_scan_states(db: Session, subnet_id: int) -> Dict[str, ScanRecord]:
+  """Most recent stored scan record of every IP probed in a subnet"""
+  latest = (
+    db.query(ScanRecord.ip_address, func.max(ScanRecord.scanned_at).label("scanned_at"))
+    .filter(ScanRecord.subnet_id == subnet_id)
+    .group_by(ScanRecord.ip_address)
+    .subquery()
+  )
+  records = (
+    db.query(ScanRecord)
+    .join(latest, and_(
+      ScanRecord.ip_address == latest.c.ip_address,
+      ScanRecord.scanned_at == latest.c.scanned_at
+    ))
+    .filter(ScanRecord.subnet_id == subnet_id)
+    .all()
+  )
+  return {r.ip_address: r for r in records}
+
+
+def select_delta_targets(ips: List[str], previous: Dict[str, ScanRecord],
+                         now: datetime, stale_after: timedelta) -> List[str]:
+  """IPs a delta scan must reprobe: never probed, stale, or last seen changing"""
+  cutoff = now - stale_after
+  targets = []
+  for ip in ips:
+    record = previous.get(ip)
+    if record is None or record.changed or record.scanned_at < cutoff:
+      targets.append(ip)
+  return targets
+
+
+def is_state_change(online: bool, record: Optional[ScanRecord]) -> bool:
+  """Whether a probe outcome differs from the previous record (a first sighting counts when online)"""
+  if record is None:
+    return online
+  return record.online != online
+
+
+# (ip, online, latency_ms): all the scan history keeps of one result
+ScanRow = Tuple[str, bool, Optional[float]]
+
+
+def scan_row(result: NetworkScanResult) -> ScanRow:
+  return (result.ip, result.online, result.latency_ms)
+
+
+def record_scan_rows(db: Session, subnet_id: int, rows: Iterable[ScanRow],
+                     scanned_at: datetime, previous: Optional[Dict[str, ScanRecord]] = None):
+  """Store one scan's rows and prune history past the retention window"""
+  if previous is None:
+    previous = latest_scan_states(db, subnet_id)
+  records = [{
+    "subnet_id": subnet_id,
+    "ip_address": ip,
+    "scanned_at": scanned_at,
+    "online": online,
+    "latency_ms": latency_ms,
+    "changed": is_state_change(online, previous.get(ip)),
+  } for ip, online, latency_ms in rows]
+  if records:
+    db.execute(insert(ScanRecord), records)
+  cutoff = datetime.utcnow() - timedelta(days=settings.scan.history_retention_days)
+  db.query(ScanRecord).filter(
+    ScanRecord.subnet_id == subnet_id,
+    ScanRecord.scanned_at < cutoff
+  ).delete(synchronize_session=False)
+  db.commit()
+
+
+def record_scan_results(db: Session, subnet_id: int, results: List[NetworkScanResult],
+                        scanned_at: datetime, previous: Optional[Dict[str, ScanRecord]] = None):
+  record_scan_rows(db, subnet_id, map(scan_row, results), scanned_at, previous)
+
+
+def save_scan_rows(subnet_id: int, rows: Iterable[ScanRow], scanned_at: datetime):
+  """Store scan rows from outside a request, using a session of its own"""
+  db = SessionLocal()
+  try:
+    record_scan_rows(db, subnet_id, rows, scanned_at)
+  finally:
+    db.close()
+
+
+# ========== BACKGROUND SCAN JOBS ==========
+
+class ScanJob:
+  """State of one background subnet scan"""
+
+  ACTIVE_STATES = ("queued", "running")
+
+  def __init__(self, subnet_id: int, subnet_cidr: str, ips: List[str],
+               ip_to_device: Dict[str, Tuple[int, str]], controller: AIMDController,
+               created_by: Optional[int] = None, resolve_names: bool = False,
+               probes: Optional[List[ProbeSpec]] = None):
+    self.id = uuid.uuid4().hex
+    self.subnet_id = subnet_id
+    self.subnet_cidr = subnet_cidr
+    self.ips = ips
+    self.ip_to_device = ip_to_device
+    self.controller = controller
+    self.created_by = created_by
+    self.resolve_names = resolve_names
+    self.probes = probes
+    self.status = "queued"
+    self.error: Optional[str] = None
+    self.results: List[NetworkScanResult] = []
+    self.counts = empty_scan_counts()
+    self.created_at = datetime.utcnow()
+    self.started_at: Optional[datetime] = None
+    self.finished_at: Optional[datetime] = None
+    self.cancel_event = threading.Event()
+
+  @property
+  def is_active(self) -> bool:
+    return self.status in self.ACTIVE_STATES
+
+  def progress(self) -> dict:
+    return {
+      "job_id": self.id,
+      "subnet_id": self.subnet_id,
+      "subnet_cidr": self.subnet_cidr,
+      "status": self.status,
+      "total_ips": len(self.ips),
+      "scanned_ips": len(self.results),
+      "created_by": self.created_by,
+      "created_at": self.created_at,
+      "started_at": self.started_at,
+      "finished_at": self.finished_at,
+      "error": self.error,
+      "rate": self.controller.stats() if self.started_at else None,
+      **self.counts,
+    }
+
+
+class ScanJobManager:
+  """Runs subnet scans on a bounded worker pool with per-subnet limits"""
+
+  CANCEL_POLL_SECONDS = 0.2
+
+  def __init__(self, max_workers: int, retention_minutes: int = 60):
+    self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="scan-job")
+    self._retention = timedelta(minutes=retention_minutes)
+    self._jobs: Dict[str, ScanJob] = {}
+    self._lock = threading.Lock()
+
+  def submit(self, subnet_id: int, subnet_cidr: str, ips: List[str],
+             ip_to_device: Dict[str, Tuple[int, str]], max_jobs: int,
+             controller: AIMDController, created_by: Optional[int] = None,
+             resolve_names: bool = False, probes: Optional[List[ProbeSpec]] = None) -> Tuple[ScanJob, bool]:
+    """Queue a scan, or return a running scan of the same subnet once `max_jobs` is reached.
+
+    Returns the job and whether it was an already running one.
+    """
+    with self._lock:
+      self._prune()
+      active = [j for j in self._jobs.values() if j.subnet_id == subnet_id and j.is_active]
+      if len(active) >= max_jobs:
+        return max(active, key=lambda j: j.created_at), True
+
+      job = ScanJob(subnet_id, subnet_cidr, ips, ip_to_device, controller, created_by, resolve_names, probes)
+      self._jobs[job.id] = job
+    self._executor.submit(self._run, job)
+    return job, False
+
+  def get(self, job_id: str) -> Optional[ScanJob]:
+    with self._lock:
+      return self._jobs.get(job_id)
+
+  def list_jobs(self, subnet_id: Optional[int] = None) -> List[ScanJob]:
+    with self._lock:
+      jobs = [j for j in self._jobs.values() if subnet_id is None or j.subnet_id == subnet_id]
+    return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+  def cancel(self, job_id: str) -> Optional[ScanJob]:
+    job = self.get(job_id)
+    if job is not None and job.is_active:
+      job.cancel_event.set()
+      with self._lock:
+        if job.status == "queued":
+          job.status = "cancelled"
+          job.finished_at = datetime.utcnow()
+    return job
+
+  def shutdown(self):
+    """Cancel every active job and stop the worker pool"""
+    for job in self.list_jobs():
+      job.cancel_event.set()
+    self._executor.shutdown(wait=False, cancel_futures=True)
+
+  def _prune(self):
+    cutoff = datetime.utcnow() - self._retention
+    for job_id in [j.id for j in self._jobs.values() if not j.is_active and j.finished_at and j.finished_at < cutoff]:
+      del self._jobs[job_id]
+
+  def _run(self, job: ScanJob):
+    with self._lock:
+      if job.status != "queued":
+        return
+      job.status = "running"
+      job.started_at = datetime.utcnow()
+    try:
+      asyncio.run(self._scan(job))
+      save_scan_rows(job.subnet_id, map(scan_row, job.results), job.started_at)
+      final_status = "cancelled" if job.cancel_event.is_set() else "completed"
+    except Exception as e:
+      job.error = str(e)
+      final_status = "failed"
+    with self._lock:
+      job.status = final_status
+      job.finished_at = datetime.utcnow()
+
+  async def _scan(self, job: ScanJob):
+    neighbors = NeighborTable()
+    results = iter_with_ticks(
+      iter_ping_hosts(job.ips, timeout=2, controller=job.controller, probes=job.probes), self.CANCEL_POLL_SECONDS
+    )
+    try:
+      # Ticks let a cancel land while every outstanding probe is still waiting
+      async for pr in results:
+        if job.cancel_event.is_set():
+          break
+        if pr is None:
+          continue
+        result = build_scan_result(pr, job.ip_to_device, neighbors)
+        tally_scan_result(job.counts, result)
+        job.results.append(result)
+    finally:
+      # Closing the scan cancels the probes still in flight
+      await results.aclose()
+    if job.resolve_names and not job.cancel_event.is_set():
+      await resolve_hostnames_async(job.results)
+
+
+scan_jobs = ScanJobManager(settings.scan.max_concurrent_jobs, settings.scan.job_retention_minutes)
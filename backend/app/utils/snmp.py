@@ -0,0 +1,579 @@
+import asyncio
+import hashlib
+import hmac
+import itertools
+import os
+import random
+import struct
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# ========== BER ENCODING ==========
+
+TAG_INTEGER = 0x02
+TAG_OCTET_STRING = 0x04
+TAG_NULL = 0x05
+TAG_OID = 0x06
+TAG_SEQUENCE = 0x30
+TAG_IP_ADDRESS = 0x40
+TAG_COUNTER32 = 0x41
+TAG_GAUGE32 = 0x42
+TAG_TIMETICKS = 0x43
+TAG_OPAQUE = 0x44
+TAG_COUNTER64 = 0x46
+TAG_NO_SUCH_OBJECT = 0x80
+TAG_NO_SUCH_INSTANCE = 0x81
+TAG_END_OF_MIB_VIEW = 0x82
+
+PDU_GET = 0xA0
+PDU_GET_NEXT = 0xA1
+PDU_RESPONSE = 0xA2
+PDU_GET_BULK = 0xA5
+PDU_REPORT = 0xA8
+
+_UNSIGNED_TAGS = (TAG_COUNTER32, TAG_GAUGE32, TAG_TIMETICKS, TAG_COUNTER64)
+# Values marking a varbind with no data; walks stop at end-of-MIB
+EXCEPTION_TAGS = (TAG_NO_SUCH_OBJECT, TAG_NO_SUCH_INSTANCE, TAG_END_OF_MIB_VIEW)
+
+
+class SNMPError(Exception):
+  """A failed SNMP exchange: timeout, error status, authentication or decoding failure"""
+
+
+def _encode_length(length: int) -> bytes:
+  if length < 0x80:
+    return bytes([length])
+  encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+  return bytes([0x80 | len(encoded)]) + encoded
+
+
+def tlv(tag: int, payload: bytes) -> bytes:
+  return bytes([tag]) + _encode_length(len(payload)) + payload
+
+
+def encode_integer(value: int, tag: int = TAG_INTEGER) -> bytes:
+  length = max(1, (value.bit_length() + 8) // 8)
+  return tlv(tag, value.to_bytes(length, "big", signed=True))
+
+
+def encode_octets(value: bytes) -> bytes:
+  return tlv(TAG_OCTET_STRING, value)
+
+
+def encode_null() -> bytes:
+  return tlv(TAG_NULL, b"")
+
+
+def encode_oid(oid: str) -> bytes:
+  arcs = [int(a) for a in oid.strip(".").split(".")]
+  if len(arcs) < 2:
+    raise ValueError(f"Invalid OID: {oid}")
+  body = bytearray()
+  for arc in [arcs[0] * 40 + arcs[1]] + arcs[2:]:
+    chunk = [arc & 0x7F]
+    arc >>= 7
+    while arc:
+      chunk.append(0x80 | (arc & 0x7F))
+      arc >>= 7
+    body.extend(reversed(chunk))
+  return tlv(TAG_OID, bytes(body))
+
+
+def decode_tlv(data: bytes, offset: int = 0) -> Tuple[int, int, int]:
+  """(tag, payload start, payload end) of the element at `offset`"""
+  if offset + 2 > len(data):
+    raise SNMPError("Truncated BER element")
+  tag = data[offset]
+  length = data[offset + 1]
+  start = offset + 2
+  if length & 0x80:
+    count = length & 0x7F
+    if count == 0 or count > 4 or start + count > len(data):
+      raise SNMPError("Unsupported BER length")
+    length = int.from_bytes(data[start:start + count], "big")
+    start += count
+  end = start + length
+  if end > len(data):
+    raise SNMPError("Truncated BER element")
+  return tag, start, end
+
+
+def decode_children(data: bytes, start: int, end: int) -> List[Tuple[int, int, int]]:
+  """(tag, start, end) of every element of a constructed value"""
+  children = []
+  offset = start
+  while offset < end:
+    tag, child_start, child_end = decode_tlv(data, offset)
+    children.append((tag, child_start, child_end))
+    offset = child_end
+  return children
+
+
+def decode_oid(payload: bytes) -> str:
+  arcs = []
+  value = 0
+  for byte in payload:
+    value = (value << 7) | (byte & 0x7F)
+    if not byte & 0x80:
+      arcs.append(value)
+      value = 0
+  if not arcs:
+    raise SNMPError("Empty OID")
+  first = min(arcs[0] // 40, 2)
+  return ".".join(str(a) for a in [first, arcs[0] - first * 40] + arcs[1:])
+
+
+def decode_value(tag: int, payload: bytes):
+  """Python value of a varbind: int, bytes, dotted OID or IP string, or None"""
+  if tag == TAG_INTEGER:
+    return int.from_bytes(payload, "big", signed=True)
+  if tag in _UNSIGNED_TAGS:
+    return int.from_bytes(payload, "big", signed=False)
+  if tag == TAG_OID:
+    return decode_oid(payload)
+  if tag == TAG_IP_ADDRESS and len(payload) == 4:
+    return ".".join(str(b) for b in payload)
+  if tag in (TAG_OCTET_STRING, TAG_OPAQUE, TAG_IP_ADDRESS):
+    return bytes(payload)
+  return None
+
+
+class VarBind(NamedTuple):
+  oid: str
+  tag: int
+  value: object
+
+
+class PDU(NamedTuple):
+  tag: int
+  request_id: int
+  error_status: int
+  error_index: int
+  varbinds: List[VarBind]
+
+
+def encode_pdu(tag: int, request_id: int, oids: List[str], non_repeaters: int = 0, max_repetitions: int = 0) -> bytes:
+  """Request PDU; for GetBulk the two middle fields are non-repeaters and max-repetitions"""
+  varbinds = b"".join(tlv(TAG_SEQUENCE, encode_oid(oid) + encode_null()) for oid in oids)
+  return tlv(tag, encode_integer(request_id) + encode_integer(non_repeaters) + encode_integer(max_repetitions)
+             + tlv(TAG_SEQUENCE, varbinds))
+
+
+def encode_response_pdu(tag: int, request_id: int, varbinds: List[Tuple[str, bytes]],
+                        error_status: int = 0, error_index: int = 0) -> bytes:
+  """Response PDU from (oid, encoded value) pairs, for agents and simulators"""
+  body = b"".join(tlv(TAG_SEQUENCE, encode_oid(oid) + value) for oid, value in varbinds)
+  return tlv(tag, encode_integer(request_id) + encode_integer(error_status) + encode_integer(error_index)
+             + tlv(TAG_SEQUENCE, body))
+
+
+def decode_pdu(data: bytes, offset: int = 0) -> PDU:
+  tag, start, end = decode_tlv(data, offset)
+  fields = decode_children(data, start, end)
+  if len(fields) != 4 or fields[3][0] != TAG_SEQUENCE:
+    raise SNMPError("Malformed PDU")
+  request_id, error_status, error_index = (
+    int.from_bytes(data[s:e], "big", signed=True) for _t, s, e in fields[:3]
+  )
+  varbinds = []
+  for _tag, vb_start, vb_end in decode_children(data, fields[3][1], fields[3][2]):
+    (oid_tag, oid_start, oid_end), (value_tag, value_start, value_end) = decode_children(data, vb_start, vb_end)[:2]
+    if oid_tag != TAG_OID:
+      raise SNMPError("Malformed varbind")
+    varbinds.append(VarBind(decode_oid(data[oid_start:oid_end]), value_tag,
+                            decode_value(value_tag, data[value_start:value_end])))
+  return PDU(tag, request_id, error_status, error_index, varbinds)
+
+
+# ========== SECURITY MODELS ==========
+
+class SNMPCredentials(NamedTuple):
+  version: str = "2c"  # 2c or 3
+  community: str = "public"
+  username: str = ""
+  auth_protocol: Optional[str] = None  # md5 or sha
+  auth_key: Optional[str] = None
+  priv_protocol: Optional[str] = None  # aes or des
+  priv_key: Optional[str] = None
+
+
+class CommunitySecurity:
+  """SNMPv2c: the community string travels in clear"""
+
+  def __init__(self, community: str):
+    self._community = community.encode()
+
+  async def discover(self, send):
+    return
+
+  def wrap(self, pdu: bytes, request_id: int) -> bytes:
+    return tlv(TAG_SEQUENCE, encode_integer(1) + encode_octets(self._community) + pdu)
+
+  def unwrap(self, data: bytes) -> PDU:
+    _tag, start, end = decode_tlv(data)
+    fields = decode_children(data, start, end)
+    if len(fields) < 3:
+      raise SNMPError("Malformed SNMPv2c message")
+    # The PDU starts where the community string ends
+    return decode_pdu(data, fields[1][2])
+
+
+AUTH_HASHES = {"md5": hashlib.md5, "sha": hashlib.sha1}
+AUTH_PARAMS_LENGTH = 12  # HMAC-MD5-96 and HMAC-SHA-96
+USM_SECURITY_MODEL = 3
+FLAG_AUTH, FLAG_PRIV, FLAG_REPORTABLE = 0x01, 0x02, 0x04
+MAX_MESSAGE_SIZE = 65507
+# usmStatsNotInTimeWindows: the agent's clock moved on; resync and retry
+OID_NOT_IN_TIME_WINDOW = "1.3.6.1.6.3.15.1.1.2.0"
+USM_REPORTS = {
+  "1.3.6.1.6.3.15.1.1.1.0": "unsupported security level",
+  OID_NOT_IN_TIME_WINDOW: "not in time window",
+  "1.3.6.1.6.3.15.1.1.3.0": "unknown user name",
+  "1.3.6.1.6.3.15.1.1.4.0": "unknown engine id",
+  "1.3.6.1.6.3.15.1.1.5.0": "wrong digest (check the auth key)",
+  "1.3.6.1.6.3.15.1.1.6.0": "decryption error (check the privacy key)",
+}
+
+
+def password_to_key(password: str, protocol: str) -> bytes:
+  """RFC 3414 A.2 password-to-key: hash of the password repeated to 1 MB"""
+  digest = AUTH_HASHES[protocol]()
+  encoded = password.encode()
+  if not encoded:
+    raise ValueError("SNMPv3 passwords cannot be empty")
+  repeated = (encoded * (1048576 // len(encoded) + 1))[:1048576]
+  digest.update(repeated)
+  return digest.digest()
+
+
+def localize_key(key: bytes, engine_id: bytes, protocol: str) -> bytes:
+  """Key bound to one authoritative engine (RFC 3414 A.2)"""
+  return AUTH_HASHES[protocol](key + engine_id + key).digest()
+
+
+# AES-128 in CFB mode (RFC 3826) and DES in CBC mode (RFC 3414 8.1); both use
+# the first 16 octets of the localized privacy key
+PRIV_PROTOCOLS = ("aes", "des")
+DES_BLOCK = 8
+
+
+def _priv_cipher(protocol: str, key: bytes, boots: int, engine_time: int, salt: bytes):
+  from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+  if protocol == "aes":
+    # The IV is the engine boots and time followed by the 64-bit salt
+    iv = boots.to_bytes(4, "big") + engine_time.to_bytes(4, "big") + salt
+    return Cipher(algorithms.AES(key[:16]), modes.CFB(iv))
+  # DES key and pre-IV are the two halves of the key; the IV is the pre-IV xor the salt.
+  # Triple DES with a single 8-octet key is DES.
+  iv = bytes(a ^ b for a, b in zip(key[DES_BLOCK:2 * DES_BLOCK], salt))
+  return Cipher(algorithms.TripleDES(key[:DES_BLOCK]), modes.CBC(iv))
+
+
+def priv_encrypt(protocol: str, key: bytes, boots: int, engine_time: int, salt: bytes, data: bytes) -> bytes:
+  """Encrypt a scoped PDU; DES pads it to whole blocks, the BER length marks the end"""
+  if protocol == "des" and len(data) % DES_BLOCK:
+    data += b"\x00" * (DES_BLOCK - len(data) % DES_BLOCK)
+  encryptor = _priv_cipher(protocol, key, boots, engine_time, salt).encryptor()
+  return encryptor.update(data) + encryptor.finalize()
+
+
+def priv_decrypt(protocol: str, key: bytes, boots: int, engine_time: int, salt: bytes, data: bytes) -> bytes:
+  if len(salt) != 8 or (protocol == "des" and len(data) % DES_BLOCK):
+    raise SNMPError("SNMPv3 decryption error")
+  decryptor = _priv_cipher(protocol, key, boots, engine_time, salt).decryptor()
+  return decryptor.update(data) + decryptor.finalize()
+
+
+class USMSecurity:
+  """SNMPv3 user-based security: HMAC-MD5/SHA-96 authentication and AES-128 or DES privacy"""
+
+  def __init__(self, credentials: SNMPCredentials):
+    self._user = credentials.username.encode()
+    self._auth_protocol = (credentials.auth_protocol or "").lower() or None
+    self._priv_protocol = (credentials.priv_protocol or "").lower() or None
+    if self._auth_protocol and self._auth_protocol not in AUTH_HASHES:
+      raise ValueError(f"Unsupported SNMPv3 auth protocol: {credentials.auth_protocol}")
+    if self._priv_protocol and self._priv_protocol not in PRIV_PROTOCOLS:
+      raise ValueError(f"Unsupported SNMPv3 privacy protocol: {credentials.priv_protocol}")
+    if self._priv_protocol and not self._auth_protocol:
+      raise ValueError("SNMPv3 privacy requires authentication")
+    self._auth_password = credentials.auth_key
+    self._priv_password = credentials.priv_key
+    self._auth_key = b""
+    self._priv_key = b""
+    self.engine_id = b""
+    self._boots = 0
+    self._time = 0
+    self._synced_at = time.monotonic()
+    self._salt = itertools.count(random.getrandbits(63))
+    self._message_ids = itertools.count(random.getrandbits(30))
+
+  @property
+  def _flags(self) -> int:
+    flags = FLAG_REPORTABLE
+    if self._auth_protocol:
+      flags |= FLAG_AUTH
+    if self._priv_protocol:
+      flags |= FLAG_PRIV
+    return flags
+
+  def _engine_time(self) -> int:
+    return self._time + int(time.monotonic() - self._synced_at)
+
+  def _set_engine(self, engine_id: bytes, boots: int, engine_time: int):
+    if engine_id and engine_id != self.engine_id:
+      self.engine_id = engine_id
+      if self._auth_protocol:
+        self._auth_key = localize_key(password_to_key(self._auth_password or "", self._auth_protocol),
+                                      engine_id, self._auth_protocol)
+      if self._priv_protocol:
+        self._priv_key = localize_key(password_to_key(self._priv_password or "", self._auth_protocol),
+                                      engine_id, self._auth_protocol)[:16]
+    self._boots, self._time, self._synced_at = boots, engine_time, time.monotonic()
+
+  async def discover(self, send):
+    """Learn the agent's engine id, boots and time from the report to an empty request"""
+    request_id = random.getrandbits(30)
+    message = self._encode(encode_pdu(PDU_GET, request_id, []), FLAG_REPORTABLE, b"", 0, 0, b"")
+    await send(message, request_id)
+    if not self.engine_id:
+      raise SNMPError("Agent did not report its SNMP engine id")
+
+  def _next_salt(self, boots: int) -> bytes:
+    salt = next(self._salt)
+    if self._priv_protocol == "des":
+      # RFC 3414 8.1.1.1: engine boots followed by a local counter
+      return boots.to_bytes(4, "big") + (salt & 0xFFFFFFFF).to_bytes(4, "big")
+    return (salt & 0xFFFFFFFFFFFFFFFF).to_bytes(8, "big")
+
+  def _encode(self, pdu: bytes, flags: int, engine_id: bytes, boots: int, engine_time: int, user: bytes) -> bytes:
+    scoped = tlv(TAG_SEQUENCE, encode_octets(engine_id) + encode_octets(b"") + pdu)
+    priv_params = b""
+    if flags & FLAG_PRIV:
+      priv_params = self._next_salt(boots)
+      msg_data = encode_octets(priv_encrypt(self._priv_protocol, self._priv_key, boots, engine_time,
+                                            priv_params, scoped))
+    else:
+      msg_data = scoped
+
+    auth_placeholder = b"\x00" * AUTH_PARAMS_LENGTH if flags & FLAG_AUTH else b""
+    usm_head = (encode_octets(engine_id) + encode_integer(boots) + encode_integer(engine_time)
+                + encode_octets(user))
+    usm_tail = encode_octets(auth_placeholder) + encode_octets(priv_params)
+    usm = tlv(TAG_SEQUENCE, usm_head + usm_tail)
+    global_data = tlv(TAG_SEQUENCE, encode_integer(next(self._message_ids) & 0x7FFFFFFF)
+                      + encode_integer(MAX_MESSAGE_SIZE) + encode_octets(bytes([flags]))
+                      + encode_integer(USM_SECURITY_MODEL))
+    security = encode_octets(usm)
+    message = tlv(TAG_SEQUENCE, encode_integer(3) + global_data + security + msg_data)
+    if not flags & FLAG_AUTH:
+      return message
+
+    # Offset of the auth parameters: message header, version, global data, security
+    # octet string header, USM sequence header, the fields before them and their own header
+    offset = (len(message) - len(encode_integer(3) + global_data + security + msg_data)
+              + len(encode_integer(3) + global_data)
+              + (len(security) - len(usm))
+              + (len(usm) - len(usm_head + usm_tail))
+              + len(usm_head) + 2)
+    mac = hmac.new(self._auth_key, message, AUTH_HASHES[self._auth_protocol]).digest()[:AUTH_PARAMS_LENGTH]
+    return message[:offset] + mac + message[offset + AUTH_PARAMS_LENGTH:]
+
+  def wrap(self, pdu: bytes, request_id: int) -> bytes:
+    return self._encode(pdu, self._flags, self.engine_id, self._boots, self._engine_time(), self._user)
+
+  def unwrap(self, data: bytes) -> PDU:
+    _tag, start, end = decode_tlv(data)
+    fields = decode_children(data, start, end)
+    if len(fields) != 4:
+      raise SNMPError("Malformed SNMPv3 message")
+    flags_field = decode_children(data, fields[1][1], fields[1][2])[2]
+    flags = data[flags_field[1]] if flags_field[2] > flags_field[1] else 0
+    _usm_tag, usm_start, usm_end = decode_tlv(data, fields[2][1])
+    usm = decode_children(data, usm_start, usm_end)
+    if len(usm) != 6:
+      raise SNMPError("Malformed USM parameters")
+    engine_id = data[usm[0][1]:usm[0][2]]
+    boots = int.from_bytes(data[usm[1][1]:usm[1][2]], "big")
+    engine_time = int.from_bytes(data[usm[2][1]:usm[2][2]], "big")
+    auth_start, auth_end = usm[4][1], usm[4][2]
+    priv_params = data[usm[5][1]:usm[5][2]]
+
+    if flags & FLAG_AUTH:
+      if not self._auth_key or auth_end - auth_start != AUTH_PARAMS_LENGTH:
+        raise SNMPError("Unexpected authenticated message")
+      zeroed = data[:auth_start] + b"\x00" * AUTH_PARAMS_LENGTH + data[auth_end:]
+      expected = hmac.new(self._auth_key, zeroed, AUTH_HASHES[self._auth_protocol]).digest()[:AUTH_PARAMS_LENGTH]
+      if not hmac.compare_digest(expected, data[auth_start:auth_end]):
+        raise SNMPError("SNMPv3 authentication failure")
+
+    msg_tag, msg_start, msg_end = fields[3]
+    if flags & FLAG_PRIV:
+      if msg_tag != TAG_OCTET_STRING or not self._priv_key:
+        raise SNMPError("Unexpected encrypted message")
+      scoped = priv_decrypt(self._priv_protocol, self._priv_key, boots, engine_time, priv_params,
+                            data[msg_start:msg_end])
+      scoped_offset = 0
+    else:
+      scoped, scoped_offset = data, fields[2][2]
+
+    _scoped_tag, scoped_start, scoped_end = decode_tlv(scoped, scoped_offset)
+    scoped_fields = decode_children(scoped, scoped_start, scoped_end)
+    if len(scoped_fields) != 3:
+      raise SNMPError("Malformed scoped PDU")
+    pdu = decode_pdu(scoped, scoped_fields[1][2])
+    if self._auth_key and not flags & FLAG_AUTH and pdu.tag != PDU_REPORT:
+      raise SNMPError("Unauthenticated response to an authenticated request")
+    if pdu.tag == PDU_REPORT or not self.engine_id:
+      # Reports carry the agent's engine id and clock, during discovery and after drift
+      self._set_engine(engine_id, boots, engine_time)
+    return pdu
+
+
+def check_credentials(credentials: SNMPCredentials):
+  """Raise ValueError for an unsupported version or protocol before any packet is sent"""
+  if credentials.version == "3":
+    USMSecurity(credentials)
+    if not credentials.username:
+      raise ValueError("SNMPv3 requires a username")
+    for protocol, key in ((credentials.auth_protocol, credentials.auth_key), (credentials.priv_protocol, credentials.priv_key)):
+      if protocol and not key:
+        raise ValueError(f"SNMPv3 {protocol} requires a key")
+  elif credentials.version not in ("2c", "2"):
+    raise ValueError(f"Unsupported SNMP version: {credentials.version}")
+
+
+# ========== CLIENT ==========
+
+class _ReportReceived(SNMPError):
+  def __init__(self, pdu: PDU):
+    oid = pdu.varbinds[0].oid if pdu.varbinds else ""
+    super().__init__(f"SNMP report: {USM_REPORTS.get(oid, oid)}")
+    self.pdu = pdu
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+  def __init__(self, security):
+    self.security = security
+    self.waiters: Dict[int, asyncio.Future] = {}
+
+  def datagram_received(self, data: bytes, addr):
+    try:
+      pdu = self.security.unwrap(data)
+    except (SNMPError, ValueError, IndexError):
+      return
+    waiter = self.waiters.get(pdu.request_id)
+    if waiter is None and pdu.tag == PDU_REPORT and len(self.waiters) == 1:
+      # Reports may not echo the request id of an unreadable request
+      waiter = next(iter(self.waiters.values()))
+    if waiter is None or waiter.done():
+      return
+    if pdu.tag == PDU_REPORT:
+      waiter.set_exception(_ReportReceived(pdu))
+    else:
+      waiter.set_result(pdu)
+
+  def error_received(self, exc: Exception):
+    for waiter in self.waiters.values():
+      if not waiter.done():
+        waiter.set_exception(SNMPError(str(exc)))
+
+
+class SNMPClient:
+  """Async SNMP v2c/v3 client for one agent; concurrent requests share one UDP socket"""
+
+  def __init__(self, host: str, credentials: SNMPCredentials, port: int = 161,
+               timeout: float = 2.0, retries: int = 1, max_repetitions: int = 25):
+    self.host = host
+    self.port = port
+    self.timeout = timeout
+    self.retries = retries
+    self.max_repetitions = max_repetitions
+    if credentials.version == "3":
+      self._security = USMSecurity(credentials)
+    elif credentials.version in ("2c", "2"):
+      self._security = CommunitySecurity(credentials.community)
+    else:
+      raise ValueError(f"Unsupported SNMP version: {credentials.version}")
+    self._transport = None
+    self._protocol: Optional[_ClientProtocol] = None
+    self._request_ids = itertools.count(random.getrandbits(30))
+
+  async def __aenter__(self):
+    loop = asyncio.get_running_loop()
+    self._transport, self._protocol = await loop.create_datagram_endpoint(
+      lambda: _ClientProtocol(self._security), remote_addr=(self.host, self.port)
+    )
+    await self._security.discover(self._send_raw)
+    return self
+
+  async def __aexit__(self, *exc):
+    self.close()
+
+  def close(self):
+    if self._transport is not None:
+      self._transport.close()
+      self._transport = None
+
+  async def _send_raw(self, message: bytes, request_id: int) -> Optional[PDU]:
+    """Send a prepared message, retrying on timeout; a report ends the exchange quietly"""
+    try:
+      return await self._exchange(lambda: message, request_id)
+    except _ReportReceived:
+      return None
+
+  async def _exchange(self, build, request_id: int) -> PDU:
+    loop = asyncio.get_running_loop()
+    for _attempt in range(self.retries + 1):
+      waiter = loop.create_future()
+      self._protocol.waiters[request_id] = waiter
+      try:
+        self._transport.sendto(build())
+        return await asyncio.wait_for(waiter, self.timeout)
+      except asyncio.TimeoutError:
+        continue
+      finally:
+        self._protocol.waiters.pop(request_id, None)
+    raise SNMPError(f"No response from {self.host}")
+
+  async def request(self, tag: int, oids: List[str], non_repeaters: int = 0, max_repetitions: int = 0) -> PDU:
+    request_id = next(self._request_ids) & 0x7FFFFFFF
+    pdu = encode_pdu(tag, request_id, oids, non_repeaters, max_repetitions)
+    try:
+      response = await self._exchange(lambda: self._security.wrap(pdu, request_id), request_id)
+    except _ReportReceived as report:
+      if not any(vb.oid == OID_NOT_IN_TIME_WINDOW for vb in report.pdu.varbinds):
+        raise SNMPError(f"Agent rejected the request ({report})")
+      # The report resynchronised the engine clock; retry once
+      response = await self._exchange(lambda: self._security.wrap(pdu, request_id), request_id)
+    if response.error_status:
+      raise SNMPError(f"SNMP error status {response.error_status} at index {response.error_index}")
+    return response
+
+  async def get(self, oids: List[str]) -> Dict[str, object]:
+    response = await self.request(PDU_GET, oids)
+    return {vb.oid: vb.value for vb in response.varbinds if vb.tag not in EXCEPTION_TAGS}
+
+  async def walk(self, root: str) -> Dict[str, object]:
+    """Every instance under `root`, keyed by the OID suffix after it, using GetBulk"""
+    root = root.strip(".")
+    prefix = root + "."
+    results: Dict[str, object] = {}
+    current = root
+    while True:
+      response = await self.request(PDU_GET_BULK, [current], 0, self.max_repetitions)
+      if not response.varbinds:
+        return results
+      for vb in response.varbinds:
+        if vb.tag == TAG_END_OF_MIB_VIEW or not vb.oid.startswith(prefix):
+          return results
+        if vb.tag not in EXCEPTION_TAGS:
+          results[vb.oid[len(prefix):]] = vb.value
+      last = response.varbinds[-1].oid
+      if _oid_key(last) <= _oid_key(current):
+        raise SNMPError(f"Agent returned OIDs out of order under {root}")
+      current = last
+
+
+def _oid_key(oid: str) -> Tuple[int, ...]:
+  return tuple(int(a) for a in oid.split("."))
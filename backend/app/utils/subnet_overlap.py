@@ -0,0 +1,140 @@
+import ipaddress
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .ipnum import int_range
+
+
+class SubnetRange(NamedTuple):
+  start: int
+  end: int
+  subnet_id: Optional[int]
+  cidr: str
+
+
+def subnet_range(cidr: str, subnet_id: Optional[int] = None) -> Optional[SubnetRange]:
+  """Address range of a CIDR in the shared 128-bit space, or None when it is invalid"""
+  try:
+    network = ipaddress.ip_network(cidr.strip(), strict=False)
+  except (ValueError, AttributeError):
+    return None
+  start, end = int_range(network)
+  return SubnetRange(start, end, subnet_id, str(network))
+
+
+def overlap_kind(a: SubnetRange, b: SubnetRange) -> str:
+  """'duplicate' for the same range, 'contains' when a holds b, 'contained' when b holds a"""
+  if a.start == b.start and a.end == b.end:
+    return "duplicate"
+  if a.start <= b.start and b.end <= a.end:
+    return "contains"
+  if b.start <= a.start and a.end <= b.end:
+    return "contained"
+  return "overlap"
+
+
+def _sort_key(r: SubnetRange) -> tuple:
+  # Containers sort before what they contain
+  return r.start, -r.end, r.subnet_id or 0
+
+
+class SubnetIntervalIndex:
+  """Subnet ranges sorted by start, with a running maximum of ends for O(log n) overlap tests"""
+
+  def __init__(self, ranges: Iterable[SubnetRange] = ()):
+    self._ranges: List[SubnetRange] = sorted(ranges, key=_sort_key)
+    self._keys = [_sort_key(r) for r in self._ranges]
+    self._max_end: List[int] = []
+    self._rebuild_max_end(0)
+
+  def __len__(self) -> int:
+    return len(self._ranges)
+
+  def _rebuild_max_end(self, position: int):
+    del self._max_end[position:]
+    running = self._max_end[-1] if self._max_end else -1
+    for r in self._ranges[position:]:
+      running = max(running, r.end)
+      self._max_end.append(running)
+
+  def add(self, r: SubnetRange):
+    key = _sort_key(r)
+    position = bisect_left(self._keys, key)
+    self._keys.insert(position, key)
+    self._ranges.insert(position, r)
+    self._rebuild_max_end(position)
+
+  def remove(self, subnet_id: int):
+    positions = [i for i, r in enumerate(self._ranges) if r.subnet_id == subnet_id]
+    for position in reversed(positions):
+      del self._keys[position]
+      del self._ranges[position]
+    if positions:
+      self._rebuild_max_end(positions[0])
+
+  def overlaps(self, r: SubnetRange) -> bool:
+    """Whether any indexed range shares an address with r"""
+    # Ranges starting at or before r.end overlap r iff the furthest of their ends reaches r.start
+    count = bisect_right(self._keys, (r.end, float("inf")))
+    return count > 0 and self._max_end[count - 1] >= r.start
+
+  def conflicts(self, r: SubnetRange, exclude_id: Optional[int] = None) -> List[SubnetRange]:
+    """Indexed ranges overlapping r, skipping the subnet being updated"""
+    if not self.overlaps(r):
+      return []
+    count = bisect_right(self._keys, (r.end, float("inf")))
+    return [
+      other for other in self._ranges[:count]
+      if other.end >= r.start and (exclude_id is None or other.subnet_id != exclude_id)
+    ]
+
+
+def find_overlapping_pairs(ranges: Iterable[SubnetRange]) -> List[Tuple[SubnetRange, SubnetRange, str]]:
+  """Every overlapping pair in one sweep over the ranges sorted by start.
+
+  CIDR blocks either nest or are disjoint, so the ranges still open at any
+  point form a chain of containers that a stack tracks exactly.
+  """
+  pairs = []
+  open_ranges: List[SubnetRange] = []
+  for r in sorted(ranges, key=_sort_key):
+    while open_ranges and open_ranges[-1].end < r.start:
+      open_ranges.pop()
+    for container in open_ranges:
+      pairs.append((container, r, overlap_kind(container, r)))
+    open_ranges.append(r)
+  return pairs
+
+
+def iter_free_blocks(parent, prefixlen: int, used: Iterable) -> Iterator:
+  """Aligned free /prefixlen networks inside parent, in address order.
+
+  Walks the gaps between the used networks, buddy-allocator style, so the
+  cost depends on the number of subnets and blocks returned, never on the
+  size of the parent. Networks containing the parent are ignored unless
+  they are exactly the block that would be returned.
+  """
+  if not parent.prefixlen <= prefixlen <= parent.max_prefixlen:
+    raise ValueError(f"Prefix length must be between {parent.prefixlen} and {parent.max_prefixlen}")
+  size = 1 << (parent.max_prefixlen - prefixlen)
+  first, last = int(parent.network_address), int(parent.broadcast_address)
+  taken = []
+  for n in used:
+    if n.version != parent.version:
+      continue
+    start, end = int(n.network_address), int(n.broadcast_address)
+    if end < first or start > last:
+      continue
+    if start <= first and last <= end and n.prefixlen < prefixlen:
+      continue  # A supernet the new block may nest in
+    taken.append((max(start, first), min(end, last)))
+  taken.sort()
+
+  network_class = type(parent)
+  cursor = first
+  for start, end in taken + [(last + 1, last + 1)]:
+    block = -(-cursor // size) * size  # Align up
+    while block + size - 1 < start:
+      yield network_class((block, prefixlen))
+      block += size
+    cursor = max(cursor, end + 1)
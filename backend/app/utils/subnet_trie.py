@@ -0,0 +1,227 @@
+import ipaddress
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy.orm import Session
+
+from ..models.user import Subnet
+from .subnet_overlap import SubnetIntervalIndex, SubnetRange, subnet_range
+
+ADDRESS_BITS = 128
+# Rebuild from the database this often so subnet edits made by other worker processes show up
+TRIE_TTL_SECONDS = 30
+
+_IPV4_MAPPED_PREFIX = 0xFFFF << 32
+
+
+class SubnetMatch(NamedTuple):
+  subnet_id: int
+  cidr: str
+  netmask: Optional[str]
+  default_gateway: Optional[str]
+
+
+def _prefix_key(network) -> tuple:
+  """(value, length) of a network in the shared 128-bit space (IPv4 is IPv4-mapped)"""
+  if network.version == 4:
+    return int(network.network_address) | _IPV4_MAPPED_PREFIX, network.prefixlen + 96
+  return int(network.network_address), network.prefixlen
+
+
+def _address_key(ip: str) -> Optional[tuple]:
+  """(version, value) of an address in the shared 128-bit space"""
+  try:
+    addr = ipaddress.ip_address(ip.strip())
+  except (ValueError, AttributeError):
+    return None
+  return addr.version, int(addr) | _IPV4_MAPPED_PREFIX if addr.version == 4 else int(addr)
+
+
+def _common_length(a: int, b: int, limit: int) -> int:
+  """Number of leading bits a and b share, capped at limit"""
+  return min(ADDRESS_BITS - (a ^ b).bit_length(), limit)
+
+
+def _bit(value: int, index: int) -> int:
+  return (value >> (ADDRESS_BITS - 1 - index)) & 1
+
+
+class _Node:
+  __slots__ = ("prefix", "length", "entries", "children")
+
+  def __init__(self, prefix: int, length: int):
+    self.prefix = prefix
+    self.length = length
+    self.entries: Dict[int, SubnetMatch] = {}  # Several subnets may share one CIDR
+    self.children: List[Optional["_Node"]] = [None, None]
+
+  def best_entry(self) -> Optional[SubnetMatch]:
+    return self.entries[min(self.entries)] if self.entries else None
+
+
+class SubnetTrie:
+  """Path-compressed binary radix trie answering longest-prefix-match queries"""
+
+  def __init__(self):
+    # One root per family: ::/0 or ::ffff:0:0/96 must not match IPv4 addresses
+    self._roots = {4: _Node(_IPV4_MAPPED_PREFIX, 96), 6: _Node(0, 0)}
+    self._keys: Dict[int, tuple] = {}  # subnet_id -> (version, prefix, length), for removal
+
+  def __len__(self) -> int:
+    return len(self._keys)
+
+  def insert(self, match: SubnetMatch) -> bool:
+    """Add or replace a subnet; returns False when its CIDR is invalid"""
+    self.remove(match.subnet_id)
+    try:
+      network = ipaddress.ip_network(match.cidr.strip(), strict=False)
+    except (ValueError, AttributeError):
+      return False
+    prefix, length = _prefix_key(network)
+    self._keys[match.subnet_id] = (network.version, prefix, length)
+
+    node = self._roots[network.version]
+    while node.length != length:
+      bit = _bit(prefix, node.length)
+      child = node.children[bit]
+      if child is None:
+        child = node.children[bit] = _Node(prefix, length)
+        node = child
+        break
+      common = _common_length(child.prefix, prefix, min(child.length, length))
+      if common == child.length:
+        node = child
+        continue
+      # Split the edge at the first differing bit (or at the new prefix when it is an ancestor)
+      split = _Node(prefix if common == length else prefix >> (ADDRESS_BITS - common) << (ADDRESS_BITS - common), common)
+      split.children[_bit(child.prefix, common)] = child
+      node.children[bit] = split
+      node = split
+    node.entries[match.subnet_id] = match
+    return True
+
+  def remove(self, subnet_id: int):
+    key = self._keys.pop(subnet_id, None)
+    if key is None:
+      return
+    version, prefix, length = key
+    node = self._roots[version]
+    path = [node]
+    while node is not None and node.length < length:
+      node = node.children[_bit(prefix, node.length)]
+      if node is not None:
+        path.append(node)
+    if node is None or node.length != length:
+      return
+    node.entries.pop(subnet_id, None)
+
+    # Collapse nodes left without entries and with fewer than two children
+    while len(path) > 1:
+      node = path.pop()
+      if node.entries:
+        break
+      children = [c for c in node.children if c is not None]
+      if len(children) == 2:
+        break
+      parent = path[-1]
+      parent.children[_bit(node.prefix, parent.length)] = children[0] if children else None
+
+  def lookup(self, ip: str) -> Optional[SubnetMatch]:
+    """Most specific subnet containing an IP, or None"""
+    key = _address_key(ip)
+    if key is None:
+      return None
+    version, value = key
+    best = None
+    node = self._roots[version]
+    while node is not None:
+      if _common_length(node.prefix, value, node.length) < node.length:
+        break
+      if node.entries:
+        best = node.best_entry()
+      if node.length == ADDRESS_BITS:
+        break
+      node = node.children[_bit(value, node.length)]
+    return best
+
+
+class SubnetResolver:
+  """Process-wide SubnetTrie, loaded lazily and kept current by subnet CRUD.
+
+  Other workers' changes show up within TRIE_TTL_SECONDS, so the trie only
+  answers read-only lookups; write-time checks use subnet_conflicts().
+  """
+
+  def __init__(self):
+    self._trie: Optional[SubnetTrie] = None
+    self._loaded_at = 0.0
+    self._lock = threading.Lock()
+
+  def _ensure_loaded(self, db: Session) -> SubnetTrie:
+    with self._lock:
+      if self._trie is not None and time.monotonic() - self._loaded_at < TRIE_TTL_SECONDS:
+        return self._trie
+    trie = SubnetTrie()
+    for s in db.query(Subnet.id, Subnet.subnet, Subnet.netmask, Subnet.default_gateway).all():
+      trie.insert(SubnetMatch(s.id, s.subnet, s.netmask, s.default_gateway))
+    with self._lock:
+      self._trie = trie
+      self._loaded_at = time.monotonic()
+    return trie
+
+  def resolve(self, db: Session, ip: Optional[str]) -> Optional[SubnetMatch]:
+    if not ip:
+      return None
+    trie = self._ensure_loaded(db)
+    with self._lock:
+      return trie.lookup(ip)
+
+  def resolve_many(self, db: Session, ips: List[Optional[str]]) -> List[Optional[SubnetMatch]]:
+    trie = self._ensure_loaded(db)
+    with self._lock:
+      return [trie.lookup(ip) if ip else None for ip in ips]
+
+  def subnet_saved(self, subnet):
+    with self._lock:
+      if self._trie is not None:
+        self._trie.insert(SubnetMatch(subnet.id, subnet.subnet, subnet.netmask, subnet.default_gateway))
+
+  def subnet_deleted(self, subnet_id: int):
+    with self._lock:
+      if self._trie is not None:
+        self._trie.remove(subnet_id)
+
+  def invalidate(self):
+    with self._lock:
+      self._trie = None
+
+
+subnet_resolver = SubnetResolver()
+
+
+def subnet_conflicts(db: Session, cidr: str, exclude_id: Optional[int] = None) -> List[SubnetRange]:
+  """Existing subnets whose address range overlaps a CIDR, read from the database.
+
+  Used on writes instead of the cached resolver, so a subnet another worker
+  created moments ago still counts as a conflict.
+  """
+  r = subnet_range(cidr)
+  if r is None:
+    return []
+  existing = (subnet_range(s.subnet, s.id) for s in db.query(Subnet.id, Subnet.subnet).all())
+  return SubnetIntervalIndex(e for e in existing if e is not None).conflicts(r, exclude_id)
+
+
+def assign_subnet(db: Session, device) -> Optional[SubnetMatch]:
+  """Fill a device's missing subnet_id, netmask and default_gateway from its IP's most specific subnet"""
+  if device.subnet_id:
+    return None
+  match = subnet_resolver.resolve(db, device.ip_address)
+  if match is None:
+    return None
+  device.subnet_id = match.subnet_id
+  if not device.netmask:
+    device.netmask = match.netmask
+  if not device.default_gateway:
+    device.default_gateway = match.default_gateway
+  return match
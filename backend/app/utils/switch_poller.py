@@ -0,0 +1,227 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.user import Device, Switch, SwitchPort, Vlan
+from .discovery import sweep
+from .neighbors import normalize_mac
+from .snmp import SNMPClient, SNMPCredentials, SNMPError
+
+# ========== OIDS ==========
+
+SYS_DESCR = "1.3.6.1.2.1.1.1.0"
+IF_DESCR = "1.3.6.1.2.1.2.2.1.2"
+IF_TYPE = "1.3.6.1.2.1.2.2.1.3"
+IF_OPER_STATUS = "1.3.6.1.2.1.2.2.1.8"
+IF_NAME = "1.3.6.1.2.1.31.1.1.1.1"
+IF_HIGH_SPEED = "1.3.6.1.2.1.31.1.1.1.15"  # Mb/s
+IF_ALIAS = "1.3.6.1.2.1.31.1.1.1.18"
+DOT1D_BASE_PORT_IFINDEX = "1.3.6.1.2.1.17.1.4.1.2"
+DOT1D_TP_FDB_PORT = "1.3.6.1.2.1.17.4.3.1.2"  # Indexed by MAC
+DOT1Q_TP_FDB_PORT = "1.3.6.1.2.1.17.7.1.2.2.1.2"  # Indexed by FDB id and MAC
+DOT1Q_PVID = "1.3.6.1.2.1.17.7.1.4.5.1.1"  # Indexed by bridge port
+DOT1Q_VLAN_STATIC_UNTAGGED = "1.3.6.1.2.1.17.7.1.4.3.1.4"  # Indexed by VLAN, bridge port bitmap
+
+TABLES = {
+  "if_descr": IF_DESCR,
+  "if_type": IF_TYPE,
+  "if_oper_status": IF_OPER_STATUS,
+  "if_name": IF_NAME,
+  "if_high_speed": IF_HIGH_SPEED,
+  "if_alias": IF_ALIAS,
+  "base_port_ifindex": DOT1D_BASE_PORT_IFINDEX,
+  "q_fdb": DOT1Q_TP_FDB_PORT,
+  "pvid": DOT1Q_PVID,
+}
+# Walked only when the Q-BRIDGE table above is empty
+FALLBACK_TABLES = {
+  "q_fdb": ("fdb", DOT1D_TP_FDB_PORT),
+  "pvid": ("untagged", DOT1Q_VLAN_STATIC_UNTAGGED),
+}
+
+OPER_STATUS = {1: "up", 2: "down", 3: "testing", 4: "unknown", 5: "dormant", 6: "notPresent", 7: "lowerLayerDown"}
+# ethernetCsmacd, fastEther, fastEtherFX, gigabitEthernet: ports of switches without a bridge MIB
+ETHERNET_IF_TYPES = (6, 62, 69, 117)
+
+
+def _text(value) -> Optional[str]:
+  if isinstance(value, bytes):
+    value = value.decode("utf-8", "replace")
+  if value is None:
+    return None
+  value = str(value).strip("\x00 ").strip()
+  return value or None
+
+
+def _mac_from_index(suffix: str) -> Optional[str]:
+  arcs = suffix.split(".")[-6:]
+  if len(arcs) != 6:
+    return None
+  try:
+    return normalize_mac(":".join(f"{int(a):02x}" for a in arcs))
+  except ValueError:
+    return None
+
+
+def _bitmap_ports(bitmap: bytes) -> List[int]:
+  """Bridge port numbers set in a PortList (first octet, high bit = port 1)"""
+  return [i * 8 + bit + 1 for i, byte in enumerate(bitmap) for bit in range(8) if byte & (0x80 >> bit)]
+
+
+# ========== POLLING ==========
+
+def build_port_table(tables: Dict[str, Dict[str, object]]) -> List[Dict]:
+  """Ports of one switch from its walked tables (suffix -> value), with VLAN and learned MACs.
+
+  Bridge ports are mapped to interfaces through dot1dBasePortIfIndex; switches
+  without a bridge MIB report their Ethernet interfaces without VLAN or MACs.
+  """
+  base_to_if = {int(bp): int(ifindex) for bp, ifindex in tables.get("base_port_ifindex", {}).items()}
+  if_to_base = {ifindex: bp for bp, ifindex in base_to_if.items()}
+
+  macs_by_port: Dict[int, List[str]] = {}
+  fdb = tables.get("q_fdb") or tables.get("fdb") or {}
+  for suffix, bridge_port in fdb.items():
+    mac = _mac_from_index(suffix)
+    if mac and bridge_port:
+      macs_by_port.setdefault(int(bridge_port), []).append(mac)
+
+  vlan_by_port = {int(bp): int(vlan) for bp, vlan in tables.get("pvid", {}).items() if vlan}
+  if not vlan_by_port:
+    for vlan, bitmap in sorted(tables.get("untagged", {}).items(), key=lambda item: int(item[0])):
+      if isinstance(bitmap, bytes):
+        for bp in _bitmap_ports(bitmap):
+          vlan_by_port.setdefault(bp, int(vlan))
+
+  if base_to_if:
+    if_indexes = sorted(base_to_if.values())
+  else:
+    if_indexes = sorted(int(i) for i, if_type in tables.get("if_type", {}).items() if if_type in ETHERNET_IF_TYPES)
+
+  ports = []
+  for ifindex in if_indexes:
+    key = str(ifindex)
+    bridge_port = if_to_base.get(ifindex)
+    name = _text(tables.get("if_name", {}).get(key)) or _text(tables.get("if_descr", {}).get(key)) or key
+    speed = tables.get("if_high_speed", {}).get(key)
+    ports.append({
+      "if_index": ifindex,
+      "port_number": name[:50],
+      "description": (_text(tables.get("if_alias", {}).get(key)) or "")[:500] or None,
+      "oper_status": OPER_STATUS.get(tables.get("if_oper_status", {}).get(key)),
+      "speed_mbps": speed or None,
+      "vlan_number": vlan_by_port.get(bridge_port),
+      "macs": sorted(set(macs_by_port.get(bridge_port, []))),
+    })
+  return ports
+
+
+async def collect_switch(client: SNMPClient) -> Dict:
+  """sysDescr and the port table of one switch; tables are walked concurrently"""
+  sys_info = await client.get([SYS_DESCR])
+  names = list(TABLES)
+  walked = await asyncio.gather(*(client.walk(TABLES[name]) for name in names))
+  tables = dict(zip(names, walked))
+  for name, (fallback, oid) in FALLBACK_TABLES.items():
+    if not tables[name]:
+      tables[fallback] = await client.walk(oid)
+  return {
+    "sys_description": (_text(sys_info.get(SYS_DESCR)) or "")[:500] or None,
+    "ports": build_port_table(tables),
+  }
+
+
+async def poll_switch(ip: str, credentials: SNMPCredentials) -> Dict:
+  """{sys_description, ports, error} for one switch, never raising, for use in sweeps"""
+  try:
+    client = SNMPClient(ip, credentials, port=settings.snmp.port, timeout=settings.snmp.timeout_seconds,
+                        retries=settings.snmp.retries, max_repetitions=settings.snmp.max_repetitions)
+    async with client:
+      return {**await collect_switch(client), "error": None}
+  except SNMPError as e:
+    return {"sys_description": None, "ports": [], "error": str(e)}
+  except OSError as e:
+    return {"sys_description": None, "ports": [], "error": e.strerror or str(e)}
+
+
+def poll_switches(ips: Iterable[str], credentials: SNMPCredentials) -> Dict[str, Dict]:
+  """poll_switch() for many switches at once (snmp.max_concurrency), keyed by IP"""
+  return asyncio.run(sweep(ips, lambda ip: poll_switch(ip, credentials), settings.snmp.max_concurrency))
+
+
+# ========== RECONCILIATION ==========
+
+def device_ids_by_mac(db: Session) -> Dict[str, int]:
+  """Registered devices keyed by normalized MAC address"""
+  devices = {}
+  for device_id, mac in db.query(Device.id, Device.mac_address).filter(Device.mac_address.isnot(None)).order_by(Device.id):
+    mac = normalize_mac(mac)
+    if mac:
+      devices.setdefault(mac, device_id)
+  return devices
+
+
+def vlan_ids_by_number(db: Session) -> Dict[int, int]:
+  vlans = {}
+  for vlan_id, number in db.query(Vlan.id, Vlan.vlan_number).order_by(Vlan.id):
+    vlans.setdefault(number, vlan_id)
+  return vlans
+
+
+def reconcile_switch_ports(db: Session, switch: Switch, snapshot: Dict, devices: Dict[str, int],
+                           vlans: Dict[int, int], polled_at: datetime, dry_run: bool = False) -> Dict[str, int]:
+  """Upsert the polled ports of one switch into switch_ports by port name; the caller commits.
+
+  VLANs are linked when the number is registered. A port is linked to a
+  device when exactly one registered MAC was learned on it and the port
+  learned no more than snmp.access_port_max_macs addresses (uplinks learn
+  many). Manual links and descriptions are never cleared; ports that
+  disappeared from the switch are left in place.
+  """
+  existing: Dict[str, SwitchPort] = {}
+  for port in db.query(SwitchPort).filter(SwitchPort.switch_id == switch.id).order_by(SwitchPort.id):
+    existing.setdefault(port.port_number, port)
+
+  inserts, updates = [], []
+  linked = 0
+  for polled in snapshot["ports"]:
+    mapping = {
+      "if_index": polled["if_index"],
+      "oper_status": polled["oper_status"],
+      "speed_mbps": polled["speed_mbps"],
+      "learned_macs": len(polled["macs"]),
+      "polled_at": polled_at,
+    }
+    if polled["vlan_number"] in vlans:
+      mapping["vlan_id"] = vlans[polled["vlan_number"]]
+    learned = {devices[mac] for mac in polled["macs"] if mac in devices}
+    if len(learned) == 1 and len(polled["macs"]) <= settings.snmp.access_port_max_macs:
+      mapping["device_id"] = learned.pop()
+      linked += 1
+
+    port = existing.get(polled["port_number"])
+    if port is None:
+      inserts.append({**mapping, "switch_id": switch.id, "port_number": polled["port_number"],
+                      "description": polled["description"]})
+    else:
+      if polled["description"] and not port.description:
+        mapping["description"] = polled["description"]
+      updates.append({**mapping, "id": port.id})
+
+  if not dry_run:
+    if inserts:
+      db.bulk_insert_mappings(SwitchPort, inserts)
+    if updates:
+      db.bulk_update_mappings(SwitchPort, updates)
+    db.bulk_update_mappings(Switch, [{
+      "id": switch.id, "sys_description": snapshot["sys_description"], "last_polled_at": polled_at,
+    }])
+  return {
+    "ports_seen": len(snapshot["ports"]),
+    "ports_created": len(inserts),
+    "ports_updated": len(updates),
+    "devices_linked": linked,
+  }
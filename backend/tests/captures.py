@@ -0,0 +1,130 @@
+"""Frames and pcap/pcapng captures built in memory, for the passive discovery tests"""
+import gzip
+import io
+import ipaddress
+import struct
+
+from app.utils.pcap import (
+  LINKTYPE_ETHERNET, OPTION_IF_TSRESOL, PCAP_MAGIC_NSEC, PCAP_MAGIC_USEC, PCAPNG_BYTE_ORDER_MAGIC, PCAPNG_EPB,
+  PCAPNG_IDB, PCAPNG_OPB, PCAPNG_SHB, PCAPNG_SPB,
+)
+
+BROADCAST = "ff:ff:ff:ff:ff:ff"
+
+
+def mac(text):
+  return bytes.fromhex(text.replace(":", ""))
+
+
+def ipv4(src, dst, transport, payload):
+  header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), 0, 0, 64, transport, 0,
+                       ipaddress.ip_address(src).packed, ipaddress.ip_address(dst).packed)
+  return header + payload
+
+
+def ipv6(src, dst, transport, payload):
+  header = struct.pack("!IHBB16s16s", 6 << 28, len(payload), transport, 64,
+                       ipaddress.ip_address(src).packed, ipaddress.ip_address(dst).packed)
+  return header + payload
+
+
+def tcp(src_port, dst_port, payload=b""):
+  return struct.pack("!HHIIBBHHH", src_port, dst_port, 0, 0, 5 << 4, 0x18, 65535, 0, 0) + payload
+
+
+def udp(src_port, dst_port, payload=b""):
+  return struct.pack("!HHHH", src_port, dst_port, 8 + len(payload), 0) + payload
+
+
+def ethernet(src_mac, dst_mac, packet, ethertype=None, vlans=()):
+  if ethertype is None:
+    ethertype = 0x86DD if packet[0] >> 4 == 6 else 0x0800
+  tags = b"".join(struct.pack("!HH", 0x8100, vlan) for vlan in vlans)
+  return mac(dst_mac) + mac(src_mac) + tags + struct.pack("!H", ethertype) + packet
+
+
+def arp(sender_mac, sender_ip, target_ip, reply=False):
+  body = struct.pack("!HHBBH6s4s6s4s", 1, 0x0800, 6, 4, 2 if reply else 1, mac(sender_mac),
+                     ipaddress.ip_address(sender_ip).packed, bytes(6), ipaddress.ip_address(target_ip).packed)
+  return ethernet(sender_mac, BROADCAST, body, ethertype=0x0806)
+
+
+def linux_sll(src_mac, packet, ethertype=0x0800):
+  return struct.pack("!HHH8sH", 0, 1, 6, mac(src_mac) + bytes(2), ethertype) + packet
+
+
+def linux_sll2(src_mac, packet, ethertype=0x0800):
+  return struct.pack("!HHIHBB8s", ethertype, 0, 2, 1, 0, 6, mac(src_mac) + bytes(2)) + packet
+
+
+# ========== OT PAYLOADS ==========
+
+def modbus_request():
+  # Read holding registers 0-9 of unit 1
+  return struct.pack("!HHHBBHH", 1, 0, 6, 1, 3, 0, 10)
+
+
+def s7_setup():
+  return bytes([0x03, 0x00, 0x00, 0x19, 0x02, 0xF0, 0x80, 0x32]) + bytes(17)
+
+
+def enip_list_identity():
+  return struct.pack("<HHII8sI", 0x0063, 0, 0, 0, bytes(8), 0)
+
+
+def bacnet_who_is():
+  return bytes([0x81, 0x0B, 0x00, 0x0C, 0x01, 0x20, 0xFF, 0xFF, 0x00, 0xFF, 0x10, 0x08])
+
+
+# ========== CAPTURES ==========
+
+def pcap(packets, linktype=LINKTYPE_ETHERNET, endian="<", nanoseconds=False):
+  """Classic pcap of (timestamp, frame) pairs"""
+  magic = PCAP_MAGIC_NSEC if nanoseconds else PCAP_MAGIC_USEC
+  divisor = 10 ** 9 if nanoseconds else 10 ** 6
+  out = struct.pack(endian + "IHHiIII", magic, 2, 4, 0, 0, 65535, linktype)
+  for timestamp, frame in packets:
+    seconds = int(timestamp)
+    fraction = round((timestamp - seconds) * divisor)
+    out += struct.pack(endian + "IIII", seconds, fraction, len(frame), len(frame)) + frame
+  return out
+
+
+def _pad(data):
+  return data + bytes(-len(data) % 4)
+
+
+def _block(endian, block_type, body):
+  body = _pad(body)
+  length = 12 + len(body)
+  return struct.pack(endian + "II", block_type, length) + body + struct.pack(endian + "I", length)
+
+
+def section_header(endian="<"):
+  return _block(endian, PCAPNG_SHB, struct.pack(endian + "IHHq", PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1))
+
+
+def interface(endian="<", linktype=LINKTYPE_ETHERNET, snaplen=65535, tsresol=None):
+  options = b""
+  if tsresol is not None:
+    options = struct.pack(endian + "HH", OPTION_IF_TSRESOL, 1) + _pad(bytes([tsresol]))
+    options += struct.pack(endian + "HH", 0, 0)
+  return _block(endian, PCAPNG_IDB, struct.pack(endian + "HHI", linktype, 0, snaplen) + options)
+
+
+def enhanced_packet(frame, ticks=0, interface_id=0, endian="<"):
+  body = struct.pack(endian + "IIIII", interface_id, ticks >> 32, ticks & 0xFFFFFFFF, len(frame), len(frame))
+  return _block(endian, PCAPNG_EPB, body + frame)
+
+
+def simple_packet(frame, endian="<"):
+  return _block(endian, PCAPNG_SPB, struct.pack(endian + "I", len(frame)) + frame)
+
+
+def obsolete_packet(frame, ticks=0, interface_id=0, endian="<"):
+  body = struct.pack(endian + "HHIIII", interface_id, 0, ticks >> 32, ticks & 0xFFFFFFFF, len(frame), len(frame))
+  return _block(endian, PCAPNG_OPB, body + frame)
+
+
+def stream(data, compress=False):
+  return io.BytesIO(gzip.compress(data) if compress else data)
@@ -0,0 +1,64 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.main import app
+from app.core.database import Base, get_db
+from app.core.security import create_access_token
+from app.middleware import audit
+from app.models import audit_log, ip_reservation, permissions, scan_history  # noqa: F401  (register the tables)
+from app.models.user import User
+from app.utils import scan
+from app.utils.occupancy import occupancy
+from app.utils.subnet_trie import subnet_resolver
+
+
+@pytest.fixture
+def engine():
+  """In-memory SQLite database with every table, one per test"""
+  engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+  Base.metadata.create_all(engine)
+  yield engine
+  engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine, monkeypatch):
+  factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+  # Code that opens sessions outside a request
+  monkeypatch.setattr(audit, "SessionLocal", factory)
+  monkeypatch.setattr(scan, "SessionLocal", factory)
+  # Process-wide caches would leak rows between the per-test databases
+  occupancy.invalidate()
+  subnet_resolver.invalidate()
+  return factory
+
+
+@pytest.fixture
+def db(session_factory):
+  session = session_factory()
+  yield session
+  session.close()
+
+
+@pytest.fixture
+def client(session_factory, db):
+  """API client authenticated as an admin"""
+  def override_get_db():
+    session = session_factory()
+    try:
+      yield session
+    finally:
+      session.close()
+
+  app.dependency_overrides[get_db] = override_get_db
+  admin = User(username="admin", email="admin@example.com", hashed_password="x", is_admin=True, is_active=True)
+  db.add(admin)
+  db.commit()
+  # Not used as a context manager: the shutdown hook would stop the shared scan job pool
+  client = TestClient(app)
+  client.headers["Authorization"] = f"Bearer {create_access_token({'sub': str(admin.id)})}"
+  yield client
+  app.dependency_overrides.clear()
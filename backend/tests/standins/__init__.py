@@ -0,0 +1,40 @@
+"""Local stand-ins for the OT devices and network services the discovery code talks to"""
+import asyncio
+import threading
+
+
+class StandIn:
+  """Server on an event loop of its own thread, reachable from sync endpoints and asyncio.run() alike.
+
+  Used as a context manager; subclasses open their sockets in start() and
+  set self.port.
+  """
+
+  host = "127.0.0.1"
+
+  def __enter__(self):
+    self.loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+    self._thread.start()
+    if not ready.wait(5):
+      raise RuntimeError(f"{type(self).__name__} did not start")
+    return self
+
+  def __exit__(self, *exc_info):
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self._thread.join(5)
+
+  def _run(self, ready: threading.Event):
+    asyncio.set_event_loop(self.loop)
+    self.loop.run_until_complete(self.start())
+    ready.set()
+    self.loop.run_forever()
+    self.loop.run_until_complete(self.stop())
+    self.loop.close()
+
+  async def start(self):
+    raise NotImplementedError
+
+  async def stop(self):
+    pass
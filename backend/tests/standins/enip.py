@@ -0,0 +1,67 @@
+import asyncio
+import socket
+import struct
+from typing import Dict, List, Optional
+
+from app.utils.enip import COMMAND_LIST_IDENTITY, CPF_ITEM_IDENTITY, ENCAPSULATION_HEADER
+
+from . import StandIn
+
+
+def identity_reply(context: bytes, vendor_id: int, device_type: int, product_code: int, revision: tuple,
+                   serial: int, product_name: bytes, ip: str = "0.0.0.0", port: int = 44818,
+                   status: int = 0x0030, state: int = 0x03) -> bytes:
+  """ListIdentity reply as a device sends it: one CIP identity item after the encapsulation header"""
+  item = struct.pack("<H", 1)  # Encapsulation protocol version
+  item += struct.pack(">HH4s8s", socket.AF_INET, port, socket.inet_aton(ip), b"\x00" * 8)  # sockaddr, big-endian
+  item += struct.pack("<HHHBBHI", vendor_id, device_type, product_code, revision[0], revision[1], status, serial)
+  item += bytes([len(product_name)]) + product_name + bytes([state])
+  body = struct.pack("<HHH", 1, CPF_ITEM_IDENTITY, len(item)) + item
+  return ENCAPSULATION_HEADER.pack(COMMAND_LIST_IDENTITY, len(body), 0, 0, context, 0) + body
+
+
+class _Responder(asyncio.DatagramProtocol):
+  def __init__(self, standin: "EnipStandIn", ip: str):
+    self.standin = standin
+    self.ip = ip
+
+  def connection_made(self, transport):
+    self.transport = transport
+
+  def datagram_received(self, data: bytes, addr):
+    self.standin.requests.append(self.ip)
+    reply = self.standin.replies.get(self.ip)
+    if reply is None or struct.unpack_from("<H", data)[0] != COMMAND_LIST_IDENTITY:
+      return  # Silent, as a host without an EtherNet/IP stack
+    # The reply echoes the request's sender context
+    reply = reply[:12] + data[12:20] + reply[20:]
+    self.transport.sendto(reply[:self.standin.truncate.get(self.ip)], addr)
+
+
+class EnipStandIn(StandIn):
+  """UDP ListIdentity responders, one per loopback address, all on the same port.
+
+  `replies` maps each address to its reply (see identity_reply); addresses
+  mapped to None stay silent. `truncate` cuts an address's reply to that
+  many bytes.
+  """
+
+  def __init__(self, replies: Dict[str, Optional[bytes]], truncate: Optional[Dict[str, int]] = None):
+    self.replies = replies
+    self.truncate = truncate or {}
+    self.requests: List[str] = []  # Addresses that received a request
+
+  async def start(self):
+    loop = asyncio.get_running_loop()
+    self._transports = []
+    self.port = 0
+    for ip in self.replies:
+      transport, _protocol = await loop.create_datagram_endpoint(
+        lambda ip=ip: _Responder(self, ip), local_addr=(ip, self.port), family=socket.AF_INET
+      )
+      self.port = transport.get_extra_info("sockname")[1]
+      self._transports.append(transport)
+
+  async def stop(self):
+    for transport in self._transports:
+      transport.close()
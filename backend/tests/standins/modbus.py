@@ -0,0 +1,72 @@
+import asyncio
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.modbus import EXCEPTION_FLAG, FUNCTION_MEI, MEI_READ_DEVICE_ID, READ_DEVICE_ID_REGULAR
+
+from . import StandIn
+
+# Highest object id of the basic category (vendor name, product code, revision)
+BASIC_LAST_OBJECT = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+
+
+class ModbusStandIn(StandIn):
+  """Modbus/TCP device answering Read Device Identification (43/14) from a table of objects.
+
+  `per_response` splits the objects over several responses with the
+  more-follows flag set; `basic_only` rejects the regular category as
+  simple devices do; `exception_code` answers every request from object
+  `exception_from` on with that Modbus exception; `close` drops the
+  connection on the first request.
+  """
+
+  def __init__(self, objects: Dict[int, bytes], per_response: Optional[int] = None, basic_only: bool = False,
+               exception_code: Optional[int] = None, exception_from: int = 0, close: bool = False):
+    self.objects = dict(sorted(objects.items()))
+    self.per_response = per_response or max(1, len(objects))
+    self.basic_only = basic_only
+    self.exception_code = exception_code
+    self.exception_from = exception_from
+    self.close = close
+    self.requests: List[Tuple[int, int]] = []  # (read code, first object id) of every request
+
+  async def start(self):
+    self._server = await asyncio.start_server(self._handle, self.host, 0)
+    self.port = self._server.sockets[0].getsockname()[1]
+
+  async def stop(self):
+    self._server.close()
+    await self._server.wait_closed()
+
+  async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+      while True:
+        transaction_id, _protocol, length, unit_id = struct.unpack("!HHHB", await reader.readexactly(7))
+        pdu = await reader.readexactly(length - 1)
+        read_code, object_id = pdu[2], pdu[3]
+        self.requests.append((read_code, object_id))
+        if self.close:
+          break
+        answer = self._answer(read_code, object_id)
+        writer.write(struct.pack("!HHHB", transaction_id, 0, len(answer) + 1, unit_id) + answer)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+      pass
+    finally:
+      writer.close()
+
+  def _answer(self, read_code: int, object_id: int) -> bytes:
+    if self.exception_code is not None and object_id >= self.exception_from:
+      return bytes([FUNCTION_MEI | EXCEPTION_FLAG, self.exception_code])
+    if self.basic_only and read_code == READ_DEVICE_ID_REGULAR:
+      return bytes([FUNCTION_MEI | EXCEPTION_FLAG, ILLEGAL_DATA_VALUE])
+    wanted = [
+      (k, v) for k, v in self.objects.items()
+      if k >= object_id and (read_code == READ_DEVICE_ID_REGULAR or k <= BASIC_LAST_OBJECT)
+    ]
+    chunk, rest = wanted[:self.per_response], wanted[self.per_response:]
+    more_follows, next_object_id = (0xFF, rest[0][0]) if rest else (0x00, 0x00)
+    conformity = 0x82 if read_code == READ_DEVICE_ID_REGULAR else 0x81
+    body = b"".join(bytes([k, len(v)]) + v for k, v in chunk)
+    return bytes([FUNCTION_MEI, MEI_READ_DEVICE_ID, read_code, conformity, more_follows, next_object_id, len(chunk)]) + body
@@ -0,0 +1,121 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.utils.snmp import (
+  FLAG_AUTH, FLAG_PRIV, PDU, PDU_GET, PDU_GET_BULK, PDU_GET_NEXT, PDU_REPORT, PDU_RESPONSE, TAG_COUNTER32,
+  TAG_END_OF_MIB_VIEW, TAG_NO_SUCH_OBJECT, TAG_SEQUENCE, SNMPCredentials, SNMPError, USMSecurity, decode_children,
+  decode_pdu, decode_tlv, encode_integer, encode_octets, encode_response_pdu, tlv,
+)
+
+from . import StandIn
+
+# usmStatsUnknownEngineIDs, the report answering discovery
+UNKNOWN_ENGINE_ID = "1.3.6.1.6.3.15.1.1.4.0"
+ENGINE_ID = b"\x80\x00\x1f\x88\x04standin"
+
+# An object value: bytes for OCTET STRING, int for INTEGER, (tag, int) for the unsigned types
+Value = Union[bytes, int, Tuple[int, int]]
+
+
+def _oid_key(oid: str) -> Tuple[int, ...]:
+  return tuple(int(part) for part in oid.split("."))
+
+
+def _encode_value(value: Value) -> bytes:
+  if isinstance(value, bytes):
+    return encode_octets(value)
+  if isinstance(value, tuple):
+    return encode_integer(value[1], value[0])
+  return encode_integer(value)
+
+
+class SNMPStandIn(StandIn):
+  """SNMP agent answering Get, GetNext and GetBulk from a table of objects.
+
+  Speaks v2c with `community`, and v3 when `credentials` are given: it
+  answers discovery with its engine id and then checks the digest and
+  decrypts as a real agent would. Messages it cannot verify are dropped.
+  """
+
+  def __init__(self, objects: Dict[str, Value], community: str = "public",
+               credentials: Optional[SNMPCredentials] = None, boots: int = 5, engine_time: int = 1000):
+    self.objects = sorted((_oid_key(oid), oid, value) for oid, value in objects.items())
+    self.community = community.encode()
+    self.security = None
+    if credentials is not None:
+      self.security = USMSecurity(credentials)
+      self.security._set_engine(ENGINE_ID, boots, engine_time)
+    self.requests: List[int] = []  # PDU tag of every request answered
+    self.dropped = 0
+
+  async def start(self):
+    self._transport, _protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+      lambda: _AgentProtocol(self), local_addr=(self.host, 0)
+    )
+    self.port = self._transport.get_extra_info("sockname")[1]
+
+  async def stop(self):
+    self._transport.close()
+
+  def answer(self, pdu: PDU) -> bytes:
+    varbinds = []
+    if pdu.tag == PDU_GET:
+      values = {oid: value for _key, oid, value in self.objects}
+      for varbind in pdu.varbinds:
+        value = values.get(varbind.oid)
+        varbinds.append((varbind.oid, tlv(TAG_NO_SUCH_OBJECT, b"") if value is None else _encode_value(value)))
+    elif pdu.tag in (PDU_GET_NEXT, PDU_GET_BULK):
+      # GetBulk carries max-repetitions in the error-index field
+      repetitions = pdu.error_index if pdu.tag == PDU_GET_BULK else 1
+      for varbind in pdu.varbinds:
+        key = _oid_key(varbind.oid)
+        following = [row for row in self.objects if row[0] > key][:repetitions]
+        varbinds.extend((oid, _encode_value(value)) for _key, oid, value in following)
+        if len(following) < repetitions:
+          varbinds.append((varbind.oid, tlv(TAG_END_OF_MIB_VIEW, b"")))
+    self.requests.append(pdu.tag)
+    return encode_response_pdu(PDU_RESPONSE, pdu.request_id, varbinds)
+
+  def handle(self, data: bytes) -> Optional[bytes]:
+    _tag, start, end = decode_tlv(data)
+    fields = decode_children(data, start, end)
+    version = int.from_bytes(data[fields[0][1]:fields[0][2]], "big")
+    if version == 1:
+      if self.security is not None or data[fields[1][1]:fields[1][2]] != self.community:
+        return None
+      response = self.answer(decode_pdu(data, fields[1][2]))
+      return tlv(TAG_SEQUENCE, encode_integer(1) + encode_octets(self.community) + response)
+    if version != 3 or self.security is None:
+      return None
+
+    security = self.security
+    flags_field = decode_children(data, fields[1][1], fields[1][2])[2]
+    flags = data[flags_field[1]]
+    if not flags & FLAG_AUTH:
+      # Discovery: report the engine id, boots and time in an unauthenticated message
+      _scoped_tag, scoped_start, scoped_end = fields[3]
+      request = decode_pdu(data, decode_children(data, scoped_start, scoped_end)[1][2])
+      report = encode_response_pdu(PDU_REPORT, request.request_id,
+                                   [(UNKNOWN_ENGINE_ID, encode_integer(1, TAG_COUNTER32))])
+      return security._encode(report, 0, security.engine_id, security._boots, security._engine_time(), b"")
+    response = self.answer(security.unwrap(data))
+    return security._encode(response, flags & (FLAG_AUTH | FLAG_PRIV), security.engine_id, security._boots,
+                            security._engine_time(), security._user)
+
+
+class _AgentProtocol(asyncio.DatagramProtocol):
+  def __init__(self, agent: SNMPStandIn):
+    self.agent = agent
+
+  def connection_made(self, transport):
+    self.transport = transport
+
+  def datagram_received(self, data: bytes, addr):
+    try:
+      reply = self.agent.handle(data)
+    except (SNMPError, ValueError, IndexError):
+      reply = None
+    if reply is None:
+      self.agent.dropped += 1
+    else:
+      self.transport.sendto(reply, addr)
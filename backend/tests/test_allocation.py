@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.ip_reservation import IPReservation
+from app.models.user import Device, Subnet, User
+from app.utils import allocation
+from app.utils.allocation import AllocationError, allocate_ips
+
+CIDR = "10.0.0.0/28"
+
+
+@pytest.fixture
+def subnet(db):
+  subnet = Subnet(name="Cell", subnet=CIDR, default_gateway="10.0.0.1", netmask="255.255.255.240", max_devices=14)
+  db.add(subnet)
+  db.commit()
+  return subnet
+
+
+@pytest.fixture
+def operator(db):
+  user = User(username="operator", email="operator@example.com", hashed_password="x", is_active=True)
+  db.add(user)
+  db.commit()
+  return user
+
+
+def _use(db, subnet, *ips):
+  db.add_all([Device(name=f"dev-{ip}", ip_address=ip, subnet_id=subnet.id) for ip in ips])
+  db.commit()
+
+
+def _reserve(db, subnet, ip, user=None, expires_in=timedelta(minutes=5)):
+  now = datetime.utcnow()
+  db.add(IPReservation(subnet_id=subnet.id, ip_address=ip, reserved_by=user.id if user else None, created_at=now,
+                       expires_at=now + expires_in))
+  db.commit()
+
+
+def _addresses(reservations):
+  return [r.ip_address for r in reservations]
+
+
+# ========== ALLOCATION ==========
+
+def test_single_addresses_skip_used_and_reserved_ones(db, subnet):
+  _use(db, subnet, "10.0.0.1", "10.0.0.3")
+  _reserve(db, subnet, "10.0.0.2")
+  assert _addresses(allocate_ips(db, subnet.id, CIDR, count=2, contiguous=False)) == ["10.0.0.4", "10.0.0.5"]
+
+
+def test_contiguous_block_starts_after_the_last_gap(db, subnet):
+  _use(db, subnet, "10.0.0.3", "10.0.0.7")
+  _reserve(db, subnet, "10.0.0.10")
+  # 1-2 and 4-6 are too short, 8-9 is cut by the reservation
+  assert _addresses(allocate_ips(db, subnet.id, CIDR, count=4)) == ["10.0.0.11", "10.0.0.12", "10.0.0.13",
+                                                                    "10.0.0.14"]
+
+
+def test_allocations_in_a_row_do_not_overlap(db, subnet, operator):
+  first = allocate_ips(db, subnet.id, CIDR, count=3, user_id=operator.id, note="line 3")
+  second = allocate_ips(db, subnet.id, CIDR, count=3)
+  assert _addresses(first) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+  assert _addresses(second) == ["10.0.0.4", "10.0.0.5", "10.0.0.6"]
+  assert first[0].reserved_by == operator.id and first[0].note == "line 3"
+  assert db.query(IPReservation).count() == 6
+
+
+def test_a_full_subnet_raises(db, subnet):
+  allocate_ips(db, subnet.id, CIDR, count=14, contiguous=False)
+  with pytest.raises(AllocationError, match="No 1 free address"):
+    allocate_ips(db, subnet.id, CIDR)
+  with pytest.raises(AllocationError, match="contiguous"):
+    allocate_ips(db, subnet.id, "10.0.0.0/28", count=2)
+
+
+def test_expired_reservations_are_purged_and_handed_out_again(db, subnet):
+  _reserve(db, subnet, "10.0.0.1", expires_in=timedelta(seconds=-1))
+  _reserve(db, subnet, "10.0.0.2")
+  reservations = allocate_ips(db, subnet.id, CIDR, ttl=timedelta(seconds=30))
+  assert _addresses(reservations) == ["10.0.0.1"]
+  assert reservations[0].expires_at > datetime.utcnow()
+  rows = db.query(IPReservation).order_by(IPReservation.ip_address).all()
+  assert [(r.ip_address, r.expires_at > datetime.utcnow()) for r in rows] == [("10.0.0.1", True), ("10.0.0.2", True)]
+
+
+def test_address_taken_by_another_process_is_retried(db, subnet, monkeypatch):
+  # Another worker committed 10.0.0.1 after this allocation read the reservations
+  _reserve(db, subnet, "10.0.0.1")
+  calls = []
+
+  def stale_then_fresh(session, subnet_id):
+    calls.append(subnet_id)
+    return set() if len(calls) == 1 else {"10.0.0.1"}
+
+  monkeypatch.setattr(allocation, "reserved_ips", stale_then_fresh)
+  assert _addresses(allocate_ips(db, subnet.id, CIDR)) == ["10.0.0.2"]
+  assert len(calls) == 2
+  assert db.query(IPReservation).count() == 2
+
+
+def test_device_missed_by_the_cached_bitmap_is_retried(db, subnet):
+  allocate_ips(db, subnet.id, CIDR)
+  # Written by another process: this process's bitmap does not know it
+  _use(db, subnet, "10.0.0.2")
+  assert _addresses(allocate_ips(db, subnet.id, CIDR)) == ["10.0.0.3"]
+
+
+# ========== RESERVATION HOLDERS ==========
+
+def _device(ip, subnet):
+  return {"name": f"plc-{ip}", "ip_address": ip, "subnet_id": subnet.id}
+
+
+def test_device_on_another_users_reservation_is_rejected(client, db, subnet, operator):
+  _reserve(db, subnet, "10.0.0.5", operator)
+  response = client.post("/api/devices", json=_device("10.0.0.5", subnet))
+  assert response.status_code == 409
+  assert "reserved by another user" in response.json()["detail"]
+  quick = client.post("/api/network/quick-add", json={"name": "plc", "ip_address": "10.0.0.5"})
+  assert quick.status_code == 409
+  assert db.query(Device).count() == 0 and db.query(IPReservation).count() == 1
+
+
+def test_device_takes_over_its_own_expired_or_unowned_reservation(client, db, subnet, operator):
+  admin = db.query(User).filter(User.username == "admin").one()
+  _reserve(db, subnet, "10.0.0.5", admin)
+  _reserve(db, subnet, "10.0.0.6", operator, expires_in=timedelta(seconds=-1))
+  _reserve(db, subnet, "10.0.0.7")
+  for ip in ("10.0.0.5", "10.0.0.6", "10.0.0.7"):
+    assert client.post("/api/devices", json=_device(ip, subnet)).status_code == 201
+  assert db.query(IPReservation).count() == 0
+
+
+def test_moving_a_device_onto_another_users_reservation_is_rejected(client, db, subnet, operator):
+  device_id = client.post("/api/devices", json=_device("10.0.0.4", subnet)).json()["id"]
+  _reserve(db, subnet, "10.0.0.5", operator)
+  response = client.put(f"/api/devices/{device_id}", json={"ip_address": "10.0.0.5"})
+  assert response.status_code == 409
+  db.expire_all()
+  assert db.get(Device, device_id).ip_address == "10.0.0.4"
+  assert client.put(f"/api/devices/{device_id}", json={"ip_address": "10.0.0.6"}).status_code == 200
+
+
+def test_validate_ip_reports_reserved_addresses(client, db, subnet, operator):
+  _reserve(db, subnet, "10.0.0.5", operator)
+  _reserve(db, subnet, "10.0.0.6", operator, expires_in=timedelta(seconds=-1))
+  reserved = client.post(f"/api/subnets/{subnet.id}/validate-ip", json={"ip_address": "10.0.0.5"}).json()
+  assert not reserved["available"] and reserved["message"] == "La IP 10.0.0.5 está reservada"
+  assert client.post(f"/api/subnets/{subnet.id}/validate-ip", json={"ip_address": "10.0.0.6"}).json()["available"]
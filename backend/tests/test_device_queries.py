@@ -0,0 +1,90 @@
+import contextlib
+
+from sqlalchemy import event
+
+from app.models.user import AssetType, Credential, Device, Instalacion, Location, NetworkLevel, Sector, Subnet
+
+
+@contextlib.contextmanager
+def count_statements(engine):
+  """List filled with every SQL statement run on the engine inside the block"""
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+  event.listen(engine, "before_cursor_execute", before_cursor_execute)
+  try:
+    yield statements
+  finally:
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def add_devices(db, count):
+  """Devices referencing their own location, sector, instalacion, asset type, level and subnet, two credentials each"""
+  start = db.query(Device).count()
+  for i in range(start, start + count):
+    location = Location(name=f"Plant {i}")
+    sector = Sector(name=f"Sector {i}", location=location)
+    instalacion = Instalacion(name=f"Line {i}", locacion=sector)
+    asset_type = AssetType(name=f"PLC {i}")
+    level = NetworkLevel(name=f"Level {i}")
+    subnet = Subnet(name=f"Cell {i}", subnet=f"10.{i}.0.0/24", default_gateway=f"10.{i}.0.1",
+                    netmask="255.255.255.0", max_devices=254)
+    db.add_all([location, sector, instalacion, asset_type, level, subnet])
+    db.flush()
+    device = Device(name=f"plc-{i}", location_id=location.id, sector_id=sector.id, instalacion_id=instalacion.id,
+                    asset_type=asset_type.id, network_level=level.id, subnet_id=subnet.id,
+                    ip_address=f"10.{i}.0.10", mac_address=f"aa:00:00:00:00:{i:02x}")
+    db.add(device)
+    db.flush()
+    db.add_all([Credential(device_id=device.id, username="admin", password="secret"),
+                Credential(device_id=device.id, username="operator", password="secret")])
+  db.commit()
+
+
+def test_device_list_runs_a_constant_number_of_statements(client, db, engine):
+  add_devices(db, 2)
+  with count_statements(engine) as few:
+    response = client.get("/api/devices")
+  assert response.status_code == 200 and len(response.json()) == 2
+  assert response.json()[0]["sector_name"] == "Sector 0" and len(response.json()[0]["credentials"]) == 2
+
+  add_devices(db, 18)
+  with count_statements(engine) as many:
+    response = client.get("/api/devices")
+  assert response.status_code == 200 and len(response.json()) == 20
+  assert len(many) == len(few), many
+
+
+def test_device_detail_runs_a_constant_number_of_statements(client, db, engine):
+  add_devices(db, 1)
+  with count_statements(engine) as few:
+    response = client.get("/api/devices/1")
+  assert response.status_code == 200
+  assert response.json()["subnet_name"] == "Cell 0" and response.json()["instalacion_name"] == "Line 0"
+
+  add_devices(db, 19)
+  with count_statements(engine) as many:
+    response = client.get("/api/devices/20")
+  assert response.status_code == 200 and len(response.json()["credentials"]) == 2
+  assert len(many) == len(few), many
+  # Lazy loads would add a statement per relation: the detail reads no more than the whole list
+  with count_statements(engine) as listing:
+    client.get("/api/devices")
+  assert len(many) == len(listing), many
+
+
+def test_search_ignores_case_while_brand_and_model_match_exactly(client, db):
+  db.add_all([Device(name="PLC-Line3", brand="Siemens", model="S7-1500", ip_address="10.0.3.10",
+                     mac_address="AA:BB:CC:00:00:01"),
+              Device(name="hmi-line3", brand="siemens", model="TP700", ip_address="10.0.3.20")])
+  db.commit()
+
+  def names(**params):
+    return sorted(device["name"] for device in client.get("/api/devices", params=params).json())
+
+  assert names(search="LINE3") == ["PLC-Line3", "hmi-line3"]
+  assert names(search="aa:bb:cc") == ["PLC-Line3"]
+  assert names(brand="Siemens") == ["PLC-Line3"]
+  assert names(brand="Siemens", model="s7-1500") == []
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from app.utils.enip import ENIPError, build_list_identity, enip_suggestions, list_identity, parse_list_identity
+from standins.enip import EnipStandIn, identity_reply
+
+# ListIdentity reply in the layout a 1756-EN2T sends: 24-byte encapsulation header,
+# item count, then a CIP identity item (sockaddr big-endian, everything else little-endian)
+EN2T_REPLY = bytes.fromhex(
+  "6300 3c00 00000000 00000000 4f744e65744d6772 00000000"
+  "0100 0c00 3600"
+  "0100 0002 af12 c0a80164 0000000000000000"
+  "0100 0c00 a600 05 1c 3000 efbeadde"
+  "0b 313735362d454e32542f44 03"
+)
+
+
+def _identify(standin, ips, wait=0.3):
+  return asyncio.run(list_identity(ips, port=standin.port, wait=wait))
+
+
+def test_request_is_an_empty_list_identity():
+  assert build_list_identity(b"OtNetMgr") == bytes.fromhex("6300 0000 00000000 00000000 4f744e65744d6772 00000000")
+
+
+def test_real_reply_is_parsed():
+  assert parse_list_identity(EN2T_REPLY) == {
+    "vendor_id": 1,
+    "device_type": 12,
+    "product_code": 166,
+    "revision": "5.028",
+    "status": 0x0030,
+    "serial_number": "DEADBEEF",
+    "product_name": "1756-EN2T/D",
+    "state": 3,
+  }
+  assert enip_suggestions(parse_list_identity(EN2T_REPLY)) == ("Rockwell Automation/Allen-Bradley", "1756-EN2T/D")
+
+
+@pytest.mark.parametrize("length", [10, 30, 60])
+def test_truncated_reply_is_rejected(length):
+  with pytest.raises(ENIPError):
+    parse_list_identity(EN2T_REPLY[:length])
+
+
+def test_stand_in_reply_is_collected():
+  reply = identity_reply(b"\x00" * 8, 47, 14, 1, (1, 40), 0xABCD, b"NX1P2")
+  with EnipStandIn({"127.0.0.2": reply}) as standin:
+    replies = _identify(standin, ["127.0.0.2"])
+  identity, latency_ms = replies["127.0.0.2"]
+  assert (identity["vendor_id"], identity["product_name"], identity["revision"]) == (47, "NX1P2", "1.040")
+  assert latency_ms is not None and latency_ms >= 0
+
+
+def test_truncated_reply_from_a_device_is_ignored():
+  reply = identity_reply(b"\x00" * 8, 1, 14, 55, (20, 11), 0xC0FFEE01, b"1756-L83E/B")
+  with EnipStandIn({"127.0.0.2": reply, "127.0.0.3": reply}, truncate={"127.0.0.3": 50}) as standin:
+    replies = _identify(standin, ["127.0.0.2", "127.0.0.3"])
+  assert list(replies) == ["127.0.0.2"]
+
+
+def test_silent_hosts_time_out_without_a_result():
+  with EnipStandIn({"127.0.0.2": None}) as standin:
+    replies = _identify(standin, ["127.0.0.2"], wait=0.2)
+  assert replies == {}
+  assert standin.requests == ["127.0.0.2"]
+
+
+def test_identify_endpoint_reports_responders(client):
+  subnet = {"name": "lo", "subnet": "127.0.0.0/29", "default_gateway": "127.0.0.6",
+            "netmask": "255.255.255.248", "max_devices": 6}
+  subnet_id = client.post("/api/subnets", json=subnet).json()["id"]
+  device_id = client.post("/api/devices", json={"name": "plc", "ip_address": "127.0.0.2"}).json()["id"]
+  reply = identity_reply(b"\x00" * 8, 1, 14, 55, (20, 11), 0xC0FFEE01, b"1756-L83E/B")
+  with EnipStandIn({"127.0.0.2": reply, "127.0.0.3": None}) as standin:
+    response = client.post(f"/api/network/{subnet_id}/identify/enip", json={
+      "ips": ["127.0.0.2", "127.0.0.3"], "port": standin.port, "broadcast": False,
+      "wait_seconds": 0.3, "apply": True,
+    })
+  assert response.status_code == 200
+  body = response.json()
+  assert (body["probed"], body["online_count"], body["updated"]) == (2, 1, 1)
+  assert body["results"][0]["device_id"] == device_id
+  assert body["results"][0]["identity"]["serial_number"] == "C0FFEE01"
+  stored = client.get(f"/api/devices/{device_id}").json()
+  assert (stored["brand"], stored["model"]) == ("Rockwell Automation/Allen-Bradley", "1756-L83E/B")
@@ -0,0 +1,293 @@
+import asyncio
+import json
+import struct
+
+import pytest
+
+from app.utils import icmp
+from app.utils.icmp import (
+  ICMP_ECHO_REPLY, AIMDController, ICMPEngine, MultiTargetProber, Prober, SubprocessProber, _checksum,
+  async_ping_hosts, build_echo_request, iter_with_ticks, open_icmp_socket, open_prober, parse_echo_reply,
+)
+from app.models.user import Subnet
+from app.utils.network import ping_multiple_hosts
+
+
+def _reply(online=True, latency_ms=1.0):
+  return {"ip": "10.0.0.1", "online": online, "latency_ms": latency_ms if online else None, "error": None,
+          "probe": None}
+
+
+class FakeProber(Prober):
+  """Answers from a function of the address and the number of probes sent so far, counting concurrency"""
+
+  name = "fake"
+
+  def __init__(self, answer, delay=0.001):
+    self.answer = answer
+    self.delay = delay
+    self.sent = 0
+    self.in_flight = 0
+    self.peak_in_flight = 0
+    self.closed = False
+
+  async def ping(self, ip, timeout=2):
+    self.sent += 1
+    self.in_flight += 1
+    self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+    try:
+      online, latency_ms = self.answer(ip, self.sent)
+      await asyncio.sleep(self.delay)
+      return icmp._result(ip, online, latency_ms if online else None)
+    finally:
+      self.in_flight -= 1
+
+  def close(self):
+    self.closed = True
+
+
+def _use(prober, monkeypatch):
+  monkeypatch.setattr(icmp, "open_prober", lambda version, fallback, preference="auto": prober)
+
+
+def _run_with(prober, monkeypatch, ips, controller):
+  _use(prober, monkeypatch)
+  return asyncio.run(async_ping_hosts(ips, timeout=1, controller=controller))
+
+
+# ========== PACKETS ==========
+
+def test_echo_request_checksum_verifies():
+  packet = build_echo_request(0x1234, 7)
+  assert packet[0] == 8 and struct.unpack("!HH", packet[4:8]) == (0x1234, 7)
+  assert _checksum(packet) == 0
+
+
+def test_echo_reply_is_parsed_with_or_without_ip_header():
+  reply = struct.pack("!BBHHH", ICMP_ECHO_REPLY, 0, 0, 0x1234, 7) + b"x" * 8
+  ip_header = bytes([0x45]) + bytes(19)
+  assert parse_echo_reply(reply) == (0x1234, 7)
+  assert parse_echo_reply(ip_header + reply) == (0x1234, 7)
+  assert parse_echo_reply(build_echo_request(0x1234, 7)) is None
+  assert parse_echo_reply(reply[:6]) is None
+
+
+def test_icmp_engine_pings_loopback():
+  async def ping():
+    try:
+      engine = ICMPEngine(*open_icmp_socket(4))
+    except OSError:
+      pytest.skip("ICMP sockets are not permitted here")
+    try:
+      return await engine.ping("127.0.0.1", timeout=1)
+    finally:
+      engine.close()
+
+  result = asyncio.run(ping())
+  assert result["online"] and result["latency_ms"] is not None
+
+
+# ========== PROBER SELECTION ==========
+
+@pytest.fixture
+def no_icmp(monkeypatch):
+  def refuse(version=4):
+    raise PermissionError(1, "Operation not permitted")
+  monkeypatch.setattr(icmp, "open_icmp_socket", refuse)
+
+
+def _which(monkeypatch, path):
+  monkeypatch.setattr(icmp.shutil, "which", lambda name: path)
+
+
+def test_icmp_socket_is_preferred(monkeypatch):
+  opened = []
+
+  class Engine(FakeProber):
+    def __init__(self, sock, kernel_ident):
+      opened.append((sock, kernel_ident))
+
+  monkeypatch.setattr(icmp, "open_icmp_socket", lambda version=4: ("socket", True))
+  monkeypatch.setattr(icmp, "ICMPEngine", Engine)
+  _which(monkeypatch, "/usr/bin/fping")
+  assert isinstance(open_prober(4, SubprocessProber()), Engine)
+  assert opened == [("socket", True)]
+
+
+def test_multi_target_helper_when_icmp_is_refused(no_icmp, monkeypatch):
+  _which(monkeypatch, "/usr/bin/fping")
+
+  async def select():
+    prober = open_prober(4, SubprocessProber())
+    prober.close()
+    return prober
+
+  assert isinstance(asyncio.run(select()), MultiTargetProber)
+
+
+def test_subprocess_fallback_when_nothing_else_is_available(no_icmp, monkeypatch):
+  _which(monkeypatch, None)
+  fallback = SubprocessProber()
+  assert open_prober(4, fallback) is fallback
+
+
+@pytest.mark.parametrize("preference", ["icmp", "fping", "subprocess"])
+def test_forced_backend_falls_back_to_subprocess(no_icmp, monkeypatch, preference):
+  _which(monkeypatch, None)
+  fallback = SubprocessProber()
+  assert open_prober(4, fallback, preference) is fallback
+
+
+def test_unknown_family_skips_the_icmp_socket(monkeypatch):
+  monkeypatch.setattr(icmp, "open_icmp_socket", lambda version=4: pytest.fail("ICMP socket opened"))
+  _which(monkeypatch, None)
+  fallback = SubprocessProber()
+  assert open_prober(None, fallback) is fallback
+
+
+# ========== AIMD ==========
+
+def test_window_grows_by_one_per_reply_in_slow_start():
+  controller = AIMDController(min_concurrency=4, max_concurrency=10)
+  controller.start()
+  for _ in range(3):
+    controller.release(_reply())
+  assert controller.window == 7
+  for _ in range(10):
+    controller.release(_reply())
+  assert controller.window == 10 and controller.peak_window == 10
+
+
+def test_latency_inflation_halves_the_window_once_per_cooldown():
+  controller = AIMDController(min_concurrency=4, max_concurrency=64, cooldown=60)
+  controller.start()
+  for _ in range(28):
+    controller.release(_reply(latency_ms=1.0))
+  assert controller.window == 32
+  for _ in range(20):
+    controller.release(_reply(latency_ms=200.0))
+  # Halved once; the cooldown keeps the in-flight probes of the old window from halving it again
+  assert controller.decreases == 1 and controller.window == 16
+
+
+def test_window_grows_additively_after_a_back_off():
+  controller = AIMDController(min_concurrency=4, max_concurrency=64, cooldown=0)
+  controller.start()
+  controller._min_rtt, controller._srtt = 1.0, 100.0
+  controller.release(_reply(online=False))
+  assert controller.window == 4 and not controller._slow_start
+  controller._srtt = None
+  for _ in range(4):
+    controller.release(_reply(online=False))
+  # One per window of completions, not one per completion
+  assert 4.9 < controller.window < 5.1
+
+
+def test_timeout_spike_above_the_baseline_backs_off():
+  controller = AIMDController(min_concurrency=8, max_concurrency=1024, cooldown=0)
+  controller.start()
+  # A sparse subnet: half the addresses never answer, which becomes the baseline
+  for i in range(AIMDController.SAMPLE_SIZE):
+    controller.release(_reply(online=i % 2 == 0))
+  assert controller.decreases == 0
+  for _ in range(AIMDController.SAMPLE_SIZE):
+    controller.release(_reply(online=False))
+  assert controller.decreases >= 1
+  assert controller.window >= controller.min_concurrency
+
+
+def test_scan_stays_within_the_window_and_backs_off_under_queueing(monkeypatch):
+  # Replies slow down past the 200th probe, as when a link queue fills
+  prober = FakeProber(lambda ip, sent: (True, 1.0 if sent <= 200 else 150.0))
+  controller = AIMDController(min_concurrency=8, max_concurrency=128, cooldown=0)
+  ips = [f"10.0.{i // 256}.{i % 256}" for i in range(600)]
+  results = _run_with(prober, monkeypatch, ips, controller)
+  assert [r["ip"] for r in results] == ips and all(r["online"] for r in results)
+  stats = controller.stats()
+  assert stats["probes_sent"] == 600 and stats["replies"] == 600
+  assert stats["peak_concurrency"] > 8 and stats["decreases"] >= 1
+  assert stats["final_concurrency"] < stats["peak_concurrency"]
+  assert prober.peak_in_flight <= stats["peak_concurrency"]
+  assert prober.closed
+
+
+def test_packet_rate_is_paced(monkeypatch):
+  prober = FakeProber(lambda ip, sent: (False, None))
+  controller = AIMDController(min_concurrency=64, max_concurrency=64, max_pps=200)
+  _run_with(prober, monkeypatch, [f"10.0.0.{i}" for i in range(1, 41)], controller)
+  # 40 sends at 200 per second take at least 0.195 s
+  assert controller.stats()["duration_s"] >= 0.19
+
+
+# ========== SYNC ENTRY POINT ==========
+
+def test_ping_multiple_hosts_refuses_to_run_inside_an_event_loop():
+  async def call():
+    ping_multiple_hosts(["127.0.0.1"])
+
+  with pytest.raises(RuntimeError, match="async_ping_hosts"):
+    asyncio.run(call())
+
+
+def test_ping_multiple_hosts_sorts_results(monkeypatch):
+  prober = FakeProber(lambda ip, sent: (ip.endswith(".2"), 1.0))
+  _use(prober, monkeypatch)
+  results = ping_multiple_hosts(["10.0.0.10", "10.0.0.2", "10.0.0.9"])
+  assert [(r["ip"], r["online"]) for r in results] == [("10.0.0.2", True), ("10.0.0.9", False),
+                                                       ("10.0.0.10", False)]
+
+
+# ========== TICKS ==========
+
+def test_ticks_keep_coming_while_results_are_stalled():
+  closed = []
+
+  async def slow():
+    try:
+      await asyncio.sleep(0.35)
+      yield {"ip": "10.0.0.1"}
+      await asyncio.sleep(3600)
+      yield {"ip": "10.0.0.2"}
+    finally:
+      closed.append(True)
+
+  async def consume():
+    seen = []
+    ticks = iter_with_ticks(slow(), 0.1)
+    async for item in ticks:
+      seen.append(item)
+      if item is not None:
+        break
+    await ticks.aclose()
+    return seen
+
+  seen = asyncio.run(consume())
+  # The pending wait survives every tick: the one result is not lost
+  assert seen[-1] == {"ip": "10.0.0.1"} and seen[:-1].count(None) >= 2
+  assert closed == [True]
+
+
+def test_ticks_keep_their_period_under_a_steady_flow():
+  async def steady():
+    for i in range(30):
+      await asyncio.sleep(0.02)
+      yield {"ip": f"10.0.0.{i}"}
+
+  async def consume():
+    return [item async for item in iter_with_ticks(steady(), 0.1)]
+
+  seen = asyncio.run(consume())
+  assert len([item for item in seen if item is not None]) == 30
+  # About 0.6 s of results: a tick every 0.1 s even though no wait ever timed out
+  assert 3 <= seen.count(None) <= 7
+
+
+def test_stream_sends_progress_while_probes_are_outstanding(client, db, monkeypatch):
+  db.add(Subnet(name="Cell", subnet="10.9.0.0/30", max_devices=2))
+  db.commit()
+  _use(FakeProber(lambda ip, sent: (True, 1.0), delay=0.35), monkeypatch)
+  response = client.post("/api/network/1/scan/stream", params={"progress_interval": 0.1})
+  assert response.status_code == 200
+  kinds = [json.loads(line)["type"] for line in response.text.splitlines()]
+  assert kinds.index("result") >= 2 and set(kinds[:kinds.index("result")]) == {"progress"}
+  assert kinds.count("result") == 2 and kinds[-1] == "summary"
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from app.utils.modbus import (
+  READ_DEVICE_ID_BASIC, READ_DEVICE_ID_REGULAR, ModbusError, build_read_device_id, identify_modbus,
+  parse_read_device_id, read_device_identification,
+)
+from standins.modbus import ModbusStandIn
+
+M340 = {0x00: b"Schneider Electric", 0x01: b"BMXP342020", 0x02: b"v3.10", 0x04: b"Modicon", 0x05: b"M340"}
+
+
+def _identify(port):
+  return asyncio.run(identify_modbus("127.0.0.1", port, timeout=1.0))
+
+
+def test_request_frame_layout():
+  frame = build_read_device_id(0x1234, unit_id=1, read_code=READ_DEVICE_ID_BASIC, object_id=2)
+  assert frame == bytes.fromhex("1234 0000 0005 01 2b0e0102")
+
+
+def test_truncated_object_is_rejected():
+  with pytest.raises(ModbusError):
+    parse_read_device_id(bytes([0x2B, 0x0E, 0x02, 0x82, 0x00, 0x00, 0x01, 0x00, 0x09]) + b"Schn")
+
+
+def test_objects_split_over_several_responses_are_joined():
+  with ModbusStandIn(M340, per_response=2) as device:
+    objects = asyncio.run(read_device_identification("127.0.0.1", device.port, timeout=1.0))
+  assert objects == {
+    "vendor_name": "Schneider Electric", "product_code": "BMXP342020", "revision": "v3.10",
+    "product_name": "Modicon", "model_name": "M340",
+  }
+  assert device.requests == [(READ_DEVICE_ID_REGULAR, 0x00), (READ_DEVICE_ID_REGULAR, 0x02),
+                             (READ_DEVICE_ID_REGULAR, 0x05)]
+
+
+def test_basic_category_is_read_when_regular_is_rejected():
+  with ModbusStandIn(M340, basic_only=True) as device:
+    answer = _identify(device.port)
+  assert answer == {"objects": {"vendor_name": "Schneider Electric", "product_code": "BMXP342020",
+                                "revision": "v3.10"}, "error": None}
+  assert device.requests == [(READ_DEVICE_ID_REGULAR, 0x00), (READ_DEVICE_ID_BASIC, 0x00)]
+
+
+def test_exception_reply_is_reported():
+  with ModbusStandIn(M340, exception_code=0x01) as device:
+    assert _identify(device.port) == {"objects": {}, "error": "Modbus exception code 1"}
+
+
+def test_exception_on_a_continuation_is_reported():
+  with ModbusStandIn(M340, per_response=2, exception_code=0x04, exception_from=0x02) as device:
+    assert _identify(device.port) == {"objects": {}, "error": "Modbus exception code 4"}
+  assert len(device.requests) == 2
+
+
+def test_dropped_connection_is_reported():
+  with ModbusStandIn(M340, close=True) as device:
+    assert _identify(device.port) == {"objects": {}, "error": "Connection closed by device"}
+
+
+def test_identify_endpoint_applies_suggestions(client):
+  subnet = {"name": "lo", "subnet": "127.0.0.0/29", "default_gateway": "127.0.0.6",
+            "netmask": "255.255.255.248", "max_devices": 6}
+  subnet_id = client.post("/api/subnets", json=subnet).json()["id"]
+  device_id = client.post("/api/devices", json={"name": "plc", "ip_address": "127.0.0.1"}).json()["id"]
+  with ModbusStandIn(M340, per_response=2) as device:
+    response = client.post(f"/api/network/{subnet_id}/identify/modbus",
+                           json={"ips": ["127.0.0.1"], "port": device.port, "apply": True})
+  assert response.status_code == 200
+  result = response.json()["results"][0]
+  assert (result["identified"], result["device_id"], result["applied"]) == (True, device_id, True)
+  stored = client.get(f"/api/devices/{device_id}").json()
+  assert (stored["brand"], stored["model"]) == ("Schneider Electric", "M340")
@@ -0,0 +1,62 @@
+import pytest
+
+from app.utils.occupancy import MAX_BITMAP_HOSTS, SubnetBitmap, occupancy
+
+V6_SUBNET = {
+  "name": "plant-v6",
+  "subnet": "2001:db8::/64",
+  "default_gateway": "2001:db8::1",
+  "netmask": "ffff:ffff:ffff:ffff::",
+  "max_devices": 1000,
+}
+
+
+def test_bitmap_tracks_used_and_free_hosts():
+  bitmap = SubnetBitmap("10.0.0.0/29")
+  bitmap.add("10.0.0.1")
+  bitmap.add("10.0.0.3")
+  bitmap.add("10.0.0.3")
+  assert (bitmap.size, bitmap.used) == (6, 2)
+  assert list(bitmap.iter_free_ips())[:2] == ["10.0.0.2", "10.0.0.4"]
+  bitmap.discard("10.0.0.3")
+  assert bitmap.contains("10.0.0.3")
+  bitmap.discard("10.0.0.3")
+  assert not bitmap.contains("10.0.0.3")
+
+
+def test_large_subnet_is_refused_before_allocating():
+  with pytest.raises(ValueError):
+    SubnetBitmap("2001:db8::/64")
+  assert SubnetBitmap("10.0.0.0/8").size <= MAX_BITMAP_HOSTS
+
+
+def test_index_falls_back_for_ipv6_64(db):
+  assert occupancy.get(db, 1, "2001:db8::/64") is None
+
+
+def test_ip_endpoints_on_ipv6_64(client):
+  subnet_id = client.post("/api/subnets", json=V6_SUBNET).json()["id"]
+  device = {"name": "plc", "ip_address": "2001:db8::1", "subnet_id": subnet_id}
+  assert client.post("/api/devices", json=device).status_code == 201
+
+  info = client.get(f"/api/subnets/{subnet_id}/ip-info").json()
+  assert (info["total_ips"], info["used_ips"]) == (2 ** 64 - 1, 1)
+
+  free = client.get(f"/api/subnets/{subnet_id}/free-ips", params={"limit": 2}).json()
+  assert [f["ip"] for f in free] == ["2001:db8::2", "2001:db8::3"]
+
+  ranges = client.get(f"/api/subnets/{subnet_id}/free-ranges").json()
+  assert ranges[0]["start"] == "2001:db8::2"
+
+  taken = client.post(f"/api/subnets/{subnet_id}/validate-ip", json={"ip_address": "2001:db8::1"}).json()
+  assert not taken["available"]
+
+  allocation = client.post(f"/api/subnets/{subnet_id}/allocate", json={"count": 2})
+  assert allocation.status_code == 201
+  assert allocation.json()["addresses"] == ["2001:db8::2", "2001:db8::3"]
+
+  batch = client.post("/api/subnets/validate-ips", json={"items": [
+    {"ip_address": "2001:db8::1"}, {"ip_address": "2001:db8::2"}, {"ip_address": "2001:db8::ffff"},
+  ]}).json()
+  assert [r["available"] for r in batch] == [False, False, True]
+  assert batch[1]["reserved"]
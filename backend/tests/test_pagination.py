@@ -0,0 +1,109 @@
+import base64
+import json
+
+import pytest
+
+from app.crud import crud
+from app.models.user import Device, Subnet, Switch, Vlan
+from app.utils.ipnum import pack_ip
+from app.utils.pagination import NEXT_CURSOR_HEADER, cursor_tag, decode_cursor, encode_cursor
+
+
+def forged(tag, values):
+  """A cursor as a client could hand-craft it"""
+  payload = json.dumps({"k": tag, "v": values}).encode()
+  return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def walk(client, url, limit=2):
+  """Every row of a listing, page by page through the next-cursor header"""
+  rows, cursor = [], None
+  for _page in range(20):
+    params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+    response = client.get(url, params=params)
+    assert response.status_code == 200, response.text
+    rows += response.json()
+    cursor = response.headers.get(NEXT_CURSOR_HEADER)
+    if cursor is None:
+      return rows
+  pytest.fail(f"{url} never returned its last page")
+
+
+@pytest.fixture
+def devices(db):
+  brands = ["Siemens", None, "ABB", "Siemens", None]
+  rows = [Device(name=f"dev-{i}", brand=brand, ip_address=f"10.0.0.{10 - i}", ip_packed=pack_ip(f"10.0.0.{10 - i}"))
+          for i, brand in enumerate(brands)]
+  db.add_all(rows)
+  db.add_all([Subnet(name="Cell", subnet="10.0.0.0/24", max_devices=254), Vlan(vlan_number=10, name="Process"),
+              Switch(name="sw-1")])
+  db.commit()
+  return rows
+
+
+def test_cursor_tag_names_the_table_and_order():
+  assert cursor_tag(crud.device_sort_keys("brand,-updated_at")) == "devices:brand,-updated_at,-id"
+  assert cursor_tag(crud.SWITCH_RANGE_KEYS) == "switches:ip_packed,id"
+
+
+def test_cursor_round_trip_keeps_types():
+  keys = crud.device_sort_keys("ip,-updated_at")
+  values = [b"\x0a\x00\x00\x01", None, 7]
+  assert decode_cursor(encode_cursor(keys, values), keys) == values
+
+
+@pytest.mark.parametrize("sort", [None, "brand", "-brand,name", "ip", "-updated_at"])
+def test_pages_cover_every_device_once(client, devices, sort):
+  rows = walk(client, "/api/devices" + (f"?sort={sort}" if sort else ""))
+  assert sorted(row["id"] for row in rows) == [device.id for device in devices]
+
+
+def test_pages_of_an_ip_prefix_are_in_address_order(client, devices):
+  rows = walk(client, "/api/devices?ip_prefix=10.0.0.0/24")
+  assert [row["ip_address"] for row in rows] == [f"10.0.0.{i}" for i in range(6, 11)]
+
+
+@pytest.mark.parametrize("url", ["/api/subnets", "/api/vlans", "/api/switches", "/api/devices?sort=brand"])
+def test_cursor_of_another_listing_is_rejected(client, devices, url):
+  cursor = client.get("/api/devices", params={"limit": 1}).headers[NEXT_CURSOR_HEADER]
+  response = client.get(url, params={"cursor": cursor})
+  assert response.status_code == 400
+  assert "another listing" in response.json()["detail"]
+
+
+def test_cursor_of_another_sort_direction_is_rejected(client, devices):
+  cursor = client.get("/api/devices", params={"limit": 1, "sort": "brand"}).headers[NEXT_CURSOR_HEADER]
+  assert client.get("/api/devices", params={"sort": "-brand", "cursor": cursor}).status_code == 400
+  assert client.get("/api/devices", params={"sort": "brand", "cursor": cursor}).status_code == 200
+
+
+@pytest.mark.parametrize("url,tag,values", [
+  ("/api/devices", "devices:id", ["1"]),
+  ("/api/devices", "devices:id", [True]),
+  ("/api/devices", "devices:id", [None]),
+  ("/api/devices", "devices:id", [1.5]),
+  ("/api/devices?sort=brand", "devices:brand,id", [3, 1]),
+  ("/api/devices?sort=-updated_at", "devices:-updated_at,-id", ["2026-01-01", 1]),
+  ("/api/devices?sort=-updated_at", "devices:-updated_at,-id", [{"t": "yesterday"}, 1]),
+  ("/api/devices?sort=ip", "devices:ip_packed,id", [{"b": "zz"}, 1]),
+  ("/api/devices?sort=ip", "devices:ip_packed,id", [{"x": 1}, 1]),
+  ("/api/vlans", "vlans:id", ["1 OR 1=1"]),
+  ("/api/devices", "devices:id", [1, 2]),
+])
+def test_cursor_values_of_the_wrong_type_are_rejected(client, devices, url, tag, values):
+  response = client.get(url, params={"cursor": forged(tag, values)})
+  assert response.status_code == 400, response.text
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", forged("devices:id", 1), base64.b64encode(b"[1]").decode()])
+def test_malformed_cursors_are_rejected(client, devices, cursor):
+  response = client.get("/api/devices", params={"cursor": cursor})
+  assert response.status_code == 400
+  assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_null_keys_of_nullable_columns_are_accepted(client, devices):
+  response = client.get("/api/devices", params={"sort": "brand", "cursor": forged("devices:brand,id", [None, 2])})
+  assert response.status_code == 200
+  # NULL brands sort last ascending: only the one after id 2
+  assert [row["name"] for row in response.json()] == ["dev-4"]
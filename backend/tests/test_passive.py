@@ -0,0 +1,188 @@
+import pytest
+
+from app.models.user import Device, Subnet
+from app.utils.passive import PassiveInventory, classify, diff_inventory, ingest_capture, top_talkers
+from app.utils.pcap import LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2, LINKTYPE_RAW
+from app.utils.subnet_trie import subnet_resolver
+from captures import (
+  arp, bacnet_who_is, enhanced_packet, enip_list_identity, ethernet, interface, ipv4, ipv6, linux_sll, linux_sll2,
+  modbus_request, pcap, s7_setup, section_header, stream, tcp, udp,
+)
+
+PLC_MAC = "00:1b:1b:00:00:01"
+HMI_MAC = "00:1b:1b:00:00:02"
+ROUTER_MAC = "00:1b:1b:00:00:fe"
+
+
+def _inventory(frames, linktype=LINKTYPE_ETHERNET, **kwargs):
+  inventory = PassiveInventory(**kwargs)
+  for timestamp, frame in enumerate(frames, start=1700000000):
+    inventory.add(linktype, float(timestamp), frame)
+  return inventory
+
+
+def _modbus_poll(hmi="10.0.0.20", plc="10.0.0.10"):
+  return [
+    ethernet(HMI_MAC, PLC_MAC, ipv4(hmi, plc, 6, tcp(50000, 502, modbus_request()))),
+    ethernet(PLC_MAC, HMI_MAC, ipv4(plc, hmi, 6, tcp(502, 50000, modbus_request()))),
+  ]
+
+
+# ========== CLASSIFICATION ==========
+
+@pytest.mark.parametrize("transport,src_port,dst_port,payload,expected", [
+  (6, 50000, 502, modbus_request(), ("modbus", False)),
+  (6, 502, 50000, modbus_request(), ("modbus", True)),
+  (6, 50000, 102, s7_setup(), ("s7", False)),
+  (6, 50000, 44818, enip_list_identity(), ("cip", False)),
+  (17, 44818, 50000, enip_list_identity(), ("cip", True)),
+  (17, 2222, 2222, bytes(12), ("cip", False)),
+  (17, 47808, 47808, bacnet_who_is(), ("bacnet", False)),
+  # Unrelated traffic on the well-known ports is not labelled
+  (6, 50000, 502, b"GET / HTTP/1.1\r\n", None),
+  (6, 50000, 102, b"\x16\x03\x01\x02\x00\x01\x00\x01", None),
+  (6, 50000, 44818, b"\xff" * 24, None),
+  (17, 47808, 47808, b"\x00" * 8, None),
+  (17, 50000, 502, modbus_request(), None),
+])
+def test_ot_protocols_are_classified_by_port_and_payload(transport, src_port, dst_port, payload, expected):
+  assert classify(transport, src_port, dst_port, payload) == expected
+
+
+def test_hosts_get_client_and_server_roles():
+  inventory = _inventory(_modbus_poll() + [
+    ethernet(HMI_MAC, PLC_MAC, ipv4("10.0.0.20", "10.0.0.10", 17, udp(47808, 47808, bacnet_who_is()))),
+  ])
+  assert inventory.hosts["10.0.0.10"].protocols == {"modbus-server", "bacnet-server"}
+  assert inventory.hosts["10.0.0.20"].protocols == {"modbus-client", "bacnet-client"}
+  assert ("10.0.0.20", "10.0.0.10", "modbus") in inventory.talkers
+
+
+# ========== HOSTS ==========
+
+def test_destination_only_addresses_are_talkers_not_hosts():
+  # The HMI sweeps addresses nobody answers from
+  frames = [ethernet(HMI_MAC, PLC_MAC, ipv4("10.0.0.20", f"10.0.0.{i}", 6, tcp(50000, 502, modbus_request())))
+            for i in range(30, 35)]
+  inventory = _inventory(frames)
+  assert list(inventory.hosts) == ["10.0.0.20"]
+  assert inventory.hosts["10.0.0.20"].protocols == {"modbus-client"}
+  assert len(inventory.talkers) == 5
+  assert [t["dst_ip"] for t in top_talkers(inventory, 2)] == ["10.0.0.30", "10.0.0.31"]
+  # The destination MAC is not credited to an address that never sent anything
+  assert inventory.mac_ips == {HMI_MAC: {"10.0.0.20"}}
+
+
+def test_destination_mac_is_credited_once_the_host_has_transmitted():
+  inventory = _inventory(list(reversed(_modbus_poll())))
+  assert inventory.hosts["10.0.0.10"].macs == {PLC_MAC: 2}
+  assert inventory.hosts["10.0.0.10"].packets == 1
+  assert inventory.mac_for("10.0.0.10") == (PLC_MAC, "ip")
+
+
+def test_arp_is_authoritative():
+  inventory = _inventory([
+    ethernet(ROUTER_MAC, HMI_MAC, ipv4("10.0.0.10", "10.0.0.20", 6, tcp(502, 50000, modbus_request()))),
+    arp(PLC_MAC, "10.0.0.10", "10.0.0.1", reply=True),
+    ethernet(ROUTER_MAC, HMI_MAC, ipv4("10.0.0.10", "10.0.0.20", 6, tcp(502, 50000, modbus_request()))),
+  ])
+  assert inventory.mac_for("10.0.0.10") == (PLC_MAC, "arp")
+
+
+def test_router_macs_are_not_paired_with_remote_hosts():
+  # Traffic routed in from nine other-subnet hosts carries the router's MAC
+  frames = [ethernet(ROUTER_MAC, HMI_MAC, ipv4(f"10.1.0.{i}", "10.0.0.20", 6, tcp(50000, 502, modbus_request())))
+            for i in range(1, 10)]
+  frames.append(ethernet(HMI_MAC, ROUTER_MAC, ipv4("10.0.0.20", "10.1.0.1", 6, tcp(502, 50000, modbus_request()))))
+  inventory = _inventory(frames, router_mac_ips=8)
+  assert inventory.mac_for("10.1.0.1") is None
+  assert inventory.mac_for("10.0.0.20") == (HMI_MAC, "ip")
+  assert len(inventory.mac_ips[ROUTER_MAC]) == 9
+
+
+@pytest.mark.parametrize("linktype,frame", [
+  (LINKTYPE_ETHERNET, ethernet(PLC_MAC, HMI_MAC, ipv4("10.0.0.10", "10.0.0.20", 6, tcp(502, 50000, modbus_request())),
+                               vlans=(10,))),
+  (LINKTYPE_ETHERNET, ethernet(PLC_MAC, HMI_MAC, ipv4("10.0.0.10", "10.0.0.20", 6, tcp(502, 50000, modbus_request())),
+                               vlans=(100, 10))),
+  (LINKTYPE_LINUX_SLL, linux_sll(PLC_MAC, ipv4("10.0.0.10", "10.0.0.20", 6, tcp(502, 50000, modbus_request())))),
+  (LINKTYPE_LINUX_SLL2, linux_sll2(PLC_MAC, ipv4("10.0.0.10", "10.0.0.20", 6, tcp(502, 50000, modbus_request())))),
+])
+def test_vlan_tags_and_linux_cooked_headers_are_decoded(linktype, frame):
+  inventory = _inventory([frame], linktype=linktype)
+  assert inventory.undecoded == 0
+  assert inventory.mac_for("10.0.0.10") == (PLC_MAC, "ip")
+  assert inventory.hosts["10.0.0.10"].protocols == {"modbus-server"}
+
+
+def test_raw_ipv6_and_ignored_addresses():
+  inventory = _inventory([
+    ipv6("2001:db8::10", "2001:db8::20", 17, udp(47808, 47808, bacnet_who_is())),
+    ipv4("10.0.0.10", "10.0.0.255", 17, udp(47808, 47808, bacnet_who_is())),
+    ipv4("169.254.1.1", "224.0.0.1", 17, udp(5000, 5000)),
+    b"\x45\x00",
+  ], linktype=LINKTYPE_RAW)
+  assert sorted(inventory.hosts) == ["10.0.0.10", "2001:db8::10"]
+  assert inventory.hosts["2001:db8::10"].protocols == {"bacnet-client"}
+  assert inventory.undecoded == 1 and inventory.packets == 4
+
+
+def test_host_and_talker_caps():
+  frames = [ethernet(HMI_MAC, PLC_MAC, ipv4(f"10.0.0.{i}", "10.0.0.200", 17, udp(5000, 5000))) for i in range(1, 6)]
+  inventory = _inventory(frames, max_hosts=3, max_talkers=2)
+  assert len(inventory.hosts) == 3 and inventory.dropped_hosts == 2
+  assert len(inventory.talkers) == 2 and inventory.dropped_talkers == 3
+
+
+# ========== CAPTURE TO DIFF ==========
+
+@pytest.fixture
+def cell(db):
+  subnet = Subnet(name="Cell", subnet="10.0.0.0/24", max_devices=254)
+  db.add(subnet)
+  db.add_all([Device(name="plc-1", ip_address="10.0.0.10", mac_address="00:1B:1B:00:00:99"),
+              Device(name="hmi-1", ip_address="10.0.0.20", mac_address=HMI_MAC.upper())])
+  db.commit()
+  return subnet
+
+
+def _frames():
+  return _modbus_poll() + [
+    arp("00:1b:1b:00:00:30", "10.0.0.30", "10.0.0.1"),
+    ethernet("00:1b:1b:00:00:40", HMI_MAC, ipv4("10.0.0.40", "10.0.0.20", 6, tcp(44818, 50000, enip_list_identity()))),
+    # Only ever a destination: not proposed
+    ethernet(HMI_MAC, "00:1b:1b:00:00:50", ipv4("10.0.0.20", "10.0.0.50", 6, tcp(50000, 502, modbus_request()))),
+  ]
+
+
+@pytest.mark.parametrize("capture", [
+  lambda frames: stream(pcap([(1700000000.0 + i, frame) for i, frame in enumerate(frames)])),
+  lambda frames: stream(section_header(">") + interface(">")
+                        + b"".join(enhanced_packet(f, (1700000000 + i) * 10 ** 6, endian=">")
+                                   for i, f in enumerate(frames)), compress=True),
+], ids=["pcap", "pcapng-gzip"])
+def test_capture_is_diffed_against_devices(db, cell, capture):
+  inventory = ingest_capture(capture(_frames()), PassiveInventory())
+  new_devices, mac_updates = diff_inventory(db, inventory, subnet_resolver.resolve_many)
+
+  assert [(d["ip_address"], d["mac_address"], d["mac_source"], d["subnet_cidr"]) for d in new_devices] == [
+    ("10.0.0.30", "00:1b:1b:00:00:30", "arp", "10.0.0.0/24"),
+    ("10.0.0.40", "00:1b:1b:00:00:40", "ip", "10.0.0.0/24"),
+  ]
+  assert new_devices[1]["protocols"] == ["cip-server"] and new_devices[1]["packets"] == 1
+  assert new_devices[1]["first_seen"].year == 2023
+  # The PLC's registered MAC differs; the HMI's matches once normalized
+  assert [(u["device_name"], u["current_mac"], u["observed_mac"]) for u in mac_updates] == [
+    ("plc-1", "00:1B:1B:00:00:99", PLC_MAC)]
+
+
+def test_pcap_import_endpoint_proposes_only_transmitting_hosts(client, db, cell):
+  data = pcap([(1700000000.0 + i, frame) for i, frame in enumerate(_frames())])
+  response = client.post("/api/network/pcap-import", files={"file": ("cell.pcap", data)}, data={"apply": "true"})
+  assert response.status_code == 200, response.text
+  body = response.json()
+  assert body["hosts_seen"] == 4
+  assert [d["ip_address"] for d in body["new_devices"]] == ["10.0.0.30", "10.0.0.40"]
+  # A registered MAC is only overwritten with `overwrite`
+  assert [u["applied"] for u in body["mac_updates"]] == [False]
+  assert {t["dst_ip"] for t in body["talkers"]} >= {"10.0.0.50"}
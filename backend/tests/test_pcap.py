@@ -0,0 +1,114 @@
+import pytest
+
+from app.utils.pcap import (
+  LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_RAW, MAX_RECORD_LENGTH, CaptureError, read_packets,
+)
+from captures import (
+  enhanced_packet, interface, obsolete_packet, pcap, section_header, simple_packet, stream,
+)
+
+FRAMES = [bytes([i]) * (60 + i) for i in range(3)]
+
+
+def _read(data, compress=False):
+  return list(read_packets(stream(data, compress)))
+
+
+# ========== PCAP ==========
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_pcap_in_either_byte_order(endian):
+  packets = _read(pcap([(1700000000.25, FRAMES[0]), (1700000001.5, FRAMES[1])], endian=endian))
+  assert [(p.linktype, p.timestamp, p.data) for p in packets] == [
+    (LINKTYPE_ETHERNET, 1700000000.25, FRAMES[0]), (LINKTYPE_ETHERNET, 1700000001.5, FRAMES[1])]
+
+
+def test_pcap_nanosecond_timestamps_and_link_type():
+  packets = _read(pcap([(1700000000.000000123, FRAMES[0])], linktype=LINKTYPE_RAW, nanoseconds=True))
+  assert packets[0].linktype == LINKTYPE_RAW
+  assert packets[0].timestamp == pytest.approx(1700000000.000000123, abs=1e-9)
+
+
+def test_truncated_pcap_keeps_the_whole_records():
+  data = pcap([(1.0, frame) for frame in FRAMES])
+  # Cut inside the last record's data, then inside its header
+  assert [p.data for p in _read(data[:-10])] == FRAMES[:2]
+  assert [p.data for p in _read(data[:-len(FRAMES[2]) - 6])] == FRAMES[:2]
+  assert _read(data[:24]) == []
+
+
+def test_oversized_pcap_record_is_corruption():
+  data = bytearray(pcap([(1.0, FRAMES[0])]))
+  data[24 + 8:24 + 12] = (MAX_RECORD_LENGTH + 1).to_bytes(4, "little")
+  with pytest.raises(CaptureError, match="Corrupt record"):
+    _read(bytes(data))
+
+
+def test_gzip_compressed_pcap():
+  assert [p.data for p in _read(pcap([(1.0, frame) for frame in FRAMES]), compress=True)] == FRAMES
+
+
+@pytest.mark.parametrize("data", [b"", b"\xd4\xc3", b"GET / HTTP/1.1\r\n\r\n"])
+def test_other_files_are_rejected(data):
+  with pytest.raises(CaptureError):
+    _read(data)
+
+
+# ========== PCAPNG ==========
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_pcapng_in_either_byte_order(endian):
+  data = (section_header(endian) + interface(endian)
+          + enhanced_packet(FRAMES[0], ticks=1700000000_250000, endian=endian)
+          + obsolete_packet(FRAMES[1], ticks=1700000001_000000, endian=endian)
+          + simple_packet(FRAMES[2], endian=endian))
+  packets = _read(data)
+  assert [(p.linktype, p.data) for p in packets] == [(LINKTYPE_ETHERNET, frame) for frame in FRAMES]
+  assert [p.timestamp for p in packets] == [pytest.approx(1700000000.25), pytest.approx(1700000001.0), 0.0]
+
+
+def test_pcapng_sections_restart_byte_order_and_interfaces():
+  data = (section_header("<") + interface("<", LINKTYPE_ETHERNET) + interface("<", LINKTYPE_RAW)
+          + enhanced_packet(FRAMES[0], interface_id=1)
+          + section_header(">") + interface(">", LINKTYPE_LINUX_SLL)
+          + enhanced_packet(FRAMES[1], interface_id=0, endian=">")
+          # Interface 1 belonged to the first section
+          + enhanced_packet(FRAMES[2], interface_id=1, endian=">"))
+  assert [(p.linktype, p.data) for p in _read(data)] == [(LINKTYPE_RAW, FRAMES[0]), (LINKTYPE_LINUX_SLL, FRAMES[1])]
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+@pytest.mark.parametrize("tsresol,ticks,seconds", [
+  (None, 1_500_000, 1.5),
+  (9, 1_500_000_000, 1.5),  # Nanoseconds
+  (3, 1_500, 1.5),
+  (0x80 | 10, 1536, 1.5),  # Powers of two: 1/1024 s
+])
+def test_pcapng_timestamp_resolution(endian, tsresol, ticks, seconds):
+  data = section_header(endian) + interface(endian, tsresol=tsresol) + enhanced_packet(FRAMES[0], ticks, endian=endian)
+  assert _read(data)[0].timestamp == pytest.approx(seconds)
+
+
+def test_simple_packets_are_cut_to_the_snap_length():
+  data = section_header() + interface(snaplen=16) + simple_packet(FRAMES[0])
+  assert _read(data)[0].data == FRAMES[0][:16]
+
+
+def test_truncated_pcapng_keeps_the_whole_blocks():
+  data = section_header() + interface() + b"".join(enhanced_packet(frame) for frame in FRAMES)
+  assert [p.data for p in _read(data[:-6])] == FRAMES[:2]
+  assert [p.data for p in _read(data[:-len(enhanced_packet(FRAMES[2])) + 4])] == FRAMES[:2]
+
+
+def test_corrupt_pcapng_blocks_are_rejected():
+  bad_order = bytearray(section_header())
+  bad_order[8:12] = b"\x00\x00\x00\x00"
+  with pytest.raises(CaptureError, match="byte-order"):
+    _read(bytes(bad_order))
+  with pytest.raises(CaptureError, match="Corrupt pcapng block"):
+    _read(section_header() + (6).to_bytes(4, "little") + (13).to_bytes(4, "little") + bytes(8))
+
+
+def test_gzip_compressed_pcapng():
+  data = section_header(">") + interface(">") + enhanced_packet(FRAMES[0], endian=">")
+  assert [p.data for p in _read(data, compress=True)] == [FRAMES[0]]
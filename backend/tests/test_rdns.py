@@ -0,0 +1,91 @@
+import threading
+
+from app.utils.rdns import ReverseResolver, TTLCache
+
+
+class StubResolver:
+  """PTR lookup returning canned answers and counting the queries per address"""
+
+  def __init__(self, answers):
+    self.answers = answers
+    self.queries = {}
+
+  def __call__(self, ip):
+    self.queries[ip] = self.queries.get(ip, 0) + 1
+    answer = self.answers.get(ip)
+    if isinstance(answer, Exception):
+      raise answer
+    return answer
+
+
+class Clock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+def _resolver(answers, cache_size=16, ttl=60, negative_ttl=10, timeout=2.0):
+  stub = StubResolver(answers)
+  clock = Clock()
+  resolver = ReverseResolver(stub, cache_size=cache_size, ttl=ttl, negative_ttl=negative_ttl,
+                             max_concurrency=4, timeout=timeout)
+  resolver.cache = TTLCache(cache_size, clock=clock)
+  return resolver, stub, clock
+
+
+def test_names_are_cached_until_their_ttl_expires():
+  resolver, stub, clock = _resolver({"10.0.0.1": "plc1.plant"})
+  assert resolver.resolve_many_sync(["10.0.0.1", "10.0.0.1"]) == {"10.0.0.1": "plc1.plant"}
+  clock.now += 59
+  assert resolver.resolve_many_sync(["10.0.0.1"]) == {"10.0.0.1": "plc1.plant"}
+  assert stub.queries == {"10.0.0.1": 1}
+  clock.now += 1
+  resolver.resolve_many_sync(["10.0.0.1"])
+  assert stub.queries == {"10.0.0.1": 2}
+
+
+def test_missing_ptr_records_are_cached_for_the_negative_ttl():
+  resolver, stub, clock = _resolver({})
+  assert resolver.resolve_many_sync(["10.0.0.2"]) == {"10.0.0.2": None}
+  clock.now += 9
+  resolver.resolve_many_sync(["10.0.0.2"])
+  assert stub.queries == {"10.0.0.2": 1}
+  clock.now += 1
+  resolver.resolve_many_sync(["10.0.0.2"])
+  assert stub.queries == {"10.0.0.2": 2}
+
+
+def test_transient_failures_are_not_cached():
+  resolver, stub, _clock = _resolver({"10.0.0.3": OSError("timed out")})
+  assert resolver.resolve_many_sync(["10.0.0.3"]) == {"10.0.0.3": None}
+  stub.answers["10.0.0.3"] = "hmi.plant"
+  assert resolver.resolve_many_sync(["10.0.0.3"]) == {"10.0.0.3": "hmi.plant"}
+  assert stub.queries == {"10.0.0.3": 2}
+
+
+def test_lookups_over_the_timeout_are_not_cached():
+  release = threading.Event()
+  resolver, _stub, _clock = _resolver({}, timeout=0.05)
+  slow = resolver.lookup
+  resolver.lookup = lambda ip: release.wait(5) and slow(ip)
+  try:
+    assert resolver.resolve_many_sync(["10.0.0.4"]) == {"10.0.0.4": None}
+    assert len(resolver.cache) == 0
+  finally:
+    release.set()
+    resolver.shutdown()
+
+
+def test_least_recently_used_entries_are_evicted():
+  answers = {f"10.0.0.{i}": f"host{i}" for i in range(1, 4)}
+  resolver, stub, _clock = _resolver(answers, cache_size=2)
+  resolver.resolve_many_sync(["10.0.0.1", "10.0.0.2"])
+  resolver.resolve_many_sync(["10.0.0.1"])  # Now the most recently used
+  resolver.resolve_many_sync(["10.0.0.3"])  # Evicts 10.0.0.2
+  assert len(resolver.cache) == 2
+  resolver.resolve_many_sync(["10.0.0.1", "10.0.0.3"])
+  assert stub.queries == {"10.0.0.1": 1, "10.0.0.2": 1, "10.0.0.3": 1}
+  resolver.resolve_many_sync(["10.0.0.2"])
+  assert stub.queries["10.0.0.2"] == 2
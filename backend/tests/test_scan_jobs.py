@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models.scan_history import ScanRecord
+from app.utils import icmp
+from app.utils.icmp import AIMDController, Prober
+from app.utils.scan import ScanJobManager
+
+
+class HangingProber(Prober):
+  """Answers the first `answered` probes at once and never answers the rest, counting cancellations"""
+
+  name = "hanging"
+
+  def __init__(self, answered):
+    self.answered = answered
+    self.sent = 0
+    self.cancelled = 0
+    self.closed = False
+
+  async def ping(self, ip, timeout=2):
+    self.sent += 1
+    if self.sent <= self.answered:
+      return icmp._result(ip, True, 1.0)
+    try:
+      await asyncio.sleep(3600)
+    except asyncio.CancelledError:
+      self.cancelled += 1
+      raise
+
+  def close(self):
+    self.closed = True
+
+
+@pytest.fixture
+def manager(session_factory):
+  manager = ScanJobManager(max_workers=1)
+  yield manager
+  manager.shutdown()
+
+
+def _wait_until(condition, seconds=5):
+  deadline = time.monotonic() + seconds
+  while not condition():
+    if time.monotonic() > deadline:
+      pytest.fail("timed out")
+    time.sleep(0.01)
+
+
+def test_cancel_stops_a_scan_whose_probes_are_all_outstanding(manager, db, monkeypatch):
+  prober = HangingProber(answered=3)
+  monkeypatch.setattr(icmp, "open_prober", lambda version, fallback, preference="auto": prober)
+  ips = [f"10.0.0.{i}" for i in range(1, 21)]
+  job, _attached = manager.submit(1, "10.0.0.0/24", ips, {}, max_jobs=1,
+                                  controller=AIMDController(min_concurrency=20, max_concurrency=20))
+  _wait_until(lambda: len(job.results) == 3 and prober.sent == 20)
+
+  cancelled_at = time.monotonic()
+  manager.cancel(job.id)
+  _wait_until(lambda: not job.is_active)
+  assert time.monotonic() - cancelled_at < 1
+  assert job.status == "cancelled" and len(job.results) == 3
+  # The probes still in flight were cancelled, not left to run out their timeout
+  assert prober.cancelled == 17 and prober.closed
+  assert db.query(ScanRecord).count() == 3
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from app.utils.snmp import (
+  TAG_GAUGE32, SNMPClient, SNMPCredentials, SNMPError, check_credentials, localize_key, password_to_key,
+  priv_decrypt, priv_encrypt,
+)
+from standins.snmp import SNMPStandIn
+
+# RFC 3414 A.3: password "maplesyrup", engine id 00..02
+RFC3414_ENGINE_ID = bytes.fromhex("000000000000000000000002")
+# NIST SP 800-38A F.3.13 (CFB128-AES128) and FIPS 81 (DES-CBC) known answers
+AES_KEY = bytes.fromhex("2b7e151628aed2a6abf7158809cf4f3c")
+AES_PLAINTEXT = bytes.fromhex("6bc1bee22e409f96e93d7e117393172aae2d8a571e03ac9c9eb76fac45af8e51")
+AES_CIPHERTEXT = bytes.fromhex("3b3fd92eb72dad20333449f8e83cfb4ac8a64537a0b3a93fcde3cdad9f1ce58b")
+DES_KEY = bytes.fromhex("0123456789abcdef")
+DES_IV = bytes.fromhex("1234567890abcdef")
+DES_PLAINTEXT = b"Now is the time for all "
+DES_CIPHERTEXT = bytes.fromhex("e5c7cdde872bf27c43e934008c389c0f683788499a7c05f6")
+
+OBJECTS = {
+  "1.3.6.1.2.1.1.1.0": b"Stand-in switch",
+  "1.3.6.1.2.1.2.2.1.8.1": 1,
+  "1.3.6.1.2.1.2.2.1.8.2": 2,
+  "1.3.6.1.2.1.2.2.1.8.3": 1,
+  "1.3.6.1.2.1.31.1.1.1.15.1": (TAG_GAUGE32, 1000),
+}
+
+
+def _v3(auth="sha", priv="aes", auth_key="authpass1", priv_key="privpass1"):
+  return SNMPCredentials(version="3", username="monitor", auth_protocol=auth, auth_key=auth_key,
+                         priv_protocol=priv, priv_key=priv_key)
+
+
+def _query(port, credentials):
+  async def query():
+    async with SNMPClient("127.0.0.1", credentials, port=port, timeout=0.5, retries=0, max_repetitions=2) as client:
+      return await client.get(["1.3.6.1.2.1.1.1.0"]), await client.walk("1.3.6.1.2.1.2.2.1.8")
+  return asyncio.run(query())
+
+
+@pytest.mark.parametrize("protocol,key,localized", [
+  ("md5", "9faf3283884e92834ebc9847d8edd963", "526f5eed9fcce26f8964c2930787d82b"),
+  ("sha", "9fb5cc0381497b3793528939ff788d5d79145211", "6695febc9288e36282235fc7151f128497b38f3f"),
+])
+def test_password_to_key_matches_rfc3414(protocol, key, localized):
+  assert password_to_key("maplesyrup", protocol).hex() == key
+  assert localize_key(bytes.fromhex(key), RFC3414_ENGINE_ID, protocol).hex() == localized
+
+
+def test_aes_iv_is_boots_time_and_salt():
+  # RFC 3826 3.1.2.1: IV 00..0f from boots 00010203, time 04050607 and salt 08..0f
+  salt = bytes.fromhex("08090a0b0c0d0e0f")
+  ciphertext = priv_encrypt("aes", AES_KEY, 0x00010203, 0x04050607, salt, AES_PLAINTEXT)
+  assert ciphertext == AES_CIPHERTEXT
+  assert priv_decrypt("aes", AES_KEY, 0x00010203, 0x04050607, salt, ciphertext) == AES_PLAINTEXT
+
+
+def test_des_iv_is_pre_iv_xor_salt():
+  # RFC 3414 8.1.1.1: the second half of the key is the pre-IV, xored with the salt
+  pre_iv = bytes.fromhex("00000000ffffffff")
+  salt = bytes(a ^ b for a, b in zip(pre_iv, DES_IV))
+  ciphertext = priv_encrypt("des", DES_KEY + pre_iv, 0, 0, salt, DES_PLAINTEXT)
+  assert ciphertext == DES_CIPHERTEXT
+  assert priv_decrypt("des", DES_KEY + pre_iv, 0, 0, salt, ciphertext) == DES_PLAINTEXT
+
+
+def test_des_pads_to_whole_blocks_and_rejects_partial_ones():
+  ciphertext = priv_encrypt("des", DES_KEY + DES_IV, 0, 0, bytes(8), b"0123456789")
+  assert len(ciphertext) == 16
+  with pytest.raises(SNMPError):
+    priv_decrypt("des", DES_KEY + DES_IV, 0, 0, bytes(8), ciphertext[:12])
+
+
+def test_unsupported_protocols_are_rejected_before_sending():
+  with pytest.raises(ValueError):
+    check_credentials(_v3(priv="3des"))
+  with pytest.raises(ValueError):
+    check_credentials(_v3(auth=None, priv="des"))
+  with pytest.raises(ValueError):
+    check_credentials(SNMPCredentials(version="1"))
+
+
+def test_v2c_get_and_bulk_walk():
+  with SNMPStandIn(OBJECTS) as agent:
+    values, walked = _query(agent.port, SNMPCredentials(community="public"))
+  assert values == {"1.3.6.1.2.1.1.1.0": b"Stand-in switch"}
+  assert walked == {"1": 1, "2": 2, "3": 1}
+
+
+def test_v2c_wrong_community_times_out():
+  with SNMPStandIn(OBJECTS, community="secret") as agent:
+    with pytest.raises(SNMPError):
+      _query(agent.port, SNMPCredentials(community="public"))
+    assert agent.dropped == 1
+
+
+@pytest.mark.parametrize("auth,priv", [("md5", None), ("sha", None), ("md5", "des"), ("sha", "des"),
+                                       ("md5", "aes"), ("sha", "aes")])
+def test_v3_discovery_authentication_and_privacy(auth, priv):
+  with SNMPStandIn(OBJECTS, credentials=_v3(auth, priv)) as agent:
+    values, walked = _query(agent.port, _v3(auth, priv))
+  assert values == {"1.3.6.1.2.1.1.1.0": b"Stand-in switch"}
+  assert walked == {"1": 1, "2": 2, "3": 1}
+  assert agent.dropped == 0
+
+
+@pytest.mark.parametrize("credentials", [_v3(auth_key="wrongpass"), _v3(priv_key="wrongpass")])
+def test_v3_wrong_keys_are_not_answered(credentials):
+  with SNMPStandIn(OBJECTS, credentials=_v3()) as agent:
+    with pytest.raises(SNMPError):
+      _query(agent.port, credentials)
+    # Discovery is answered; the authenticated request is dropped
+    assert agent.requests == [] and agent.dropped == 1
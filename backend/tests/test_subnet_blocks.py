@@ -0,0 +1,66 @@
+from app.api import subnets
+from app.models.user import Subnet
+
+
+def _reserve(client, parent, prefix_length, name="block", **params):
+  return client.post("/api/subnets/reserve-block", json={"name": name, "parent": parent, "prefix_length": prefix_length},
+                     params=params)
+
+
+def test_free_blocks_skip_existing_subnets(client):
+  assert _reserve(client, "10.20.0.0/16", 24).json()["subnet"] == "10.20.0.0/24"
+  blocks = client.get("/api/subnets/free-blocks", params={"parent": "10.20.0.0/16", "prefix_length": 24, "count": 2})
+  assert [b["cidr"] for b in blocks.json()] == ["10.20.1.0/24", "10.20.2.0/24"]
+
+
+def test_block_taken_by_another_worker_is_retried(client, db, monkeypatch):
+  # Another worker created the first block after this request listed the existing subnets
+  db.add(Subnet(name="other worker", subnet="10.30.0.0/24", max_devices=254))
+  db.commit()
+  existing_networks = subnets._existing_networks
+  calls = []
+
+  def stale_then_fresh(session):
+    calls.append(1)
+    return [] if len(calls) == 1 else existing_networks(session)
+
+  monkeypatch.setattr(subnets, "_existing_networks", stale_then_fresh)
+  response = _reserve(client, "10.30.0.0/16", 24)
+  assert response.status_code == 201
+  assert response.json()["subnet"] == "10.30.1.0/24"
+  assert len(calls) == 2
+
+
+def test_block_inside_an_existing_subnet_needs_allow_nested(client, db):
+  db.add(Subnet(name="plant", subnet="10.60.0.0/16", max_devices=254))
+  db.commit()
+  refused = _reserve(client, "10.60.0.0/20", 24)
+  assert refused.status_code == 400
+  assert "is inside subnet 10.60.0.0/16" in refused.json()["detail"]
+  assert db.query(Subnet).count() == 1
+  nested = _reserve(client, "10.60.0.0/20", 24, allow_nested=True)
+  assert nested.status_code == 201 and nested.json()["subnet"] == "10.60.0.0/24"
+
+
+def test_cidr_spellings_are_stored_canonically(client):
+  subnet = {"name": "a", "subnet": "10.40.0.7/24", "default_gateway": "10.40.0.1",
+            "netmask": "255.255.255.0", "max_devices": 10}
+  assert client.post("/api/subnets", json=subnet).json()["subnet"] == "10.40.0.0/24"
+  again = client.post("/api/subnets", json={**subnet, "name": "b", "subnet": "10.40.0.0/24"})
+  assert again.status_code == 400
+
+
+def test_ipv6_blocks_can_be_listed_and_reserved(client):
+  blocks = client.get("/api/subnets/free-blocks", params={"parent": "2001:db8::/48", "prefix_length": 64})
+  assert blocks.json()[0]["cidr"] == "2001:db8::/64"
+  response = _reserve(client, "2001:db8::/48", 64)
+  assert response.status_code == 201
+  assert response.json()["subnet"] == "2001:db8::/64"
+  assert response.json()["default_gateway"] == "2001:db8::1"
+  assert _reserve(client, "2001:db8::/48", 64).json()["subnet"] == "2001:db8:0:1::/64"
+
+
+def test_prefix_length_is_checked_against_the_parent_family(client):
+  assert _reserve(client, "10.50.0.0/16", 33).status_code == 422
+  assert _reserve(client, "10.50.0.0/16", 8).status_code == 422
+  assert _reserve(client, "2001:db8::/48", 129).status_code == 422
@@ -0,0 +1,30 @@
+import ipaddress
+
+from app.models.user import Subnet
+
+
+def _subnet(cidr, name=None):
+  network = ipaddress.ip_network(cidr)
+  return {"name": name or cidr, "subnet": cidr, "default_gateway": str(network.network_address + 1),
+          "netmask": str(network.netmask), "max_devices": 10}
+
+
+def test_duplicate_and_nested_subnets_are_rejected(client):
+  assert client.post("/api/subnets", json=_subnet("10.1.0.0/16")).status_code == 201
+  duplicate = client.post("/api/subnets", json=_subnet("10.1.0.0/16", name="again"))
+  assert duplicate.status_code == 400
+  assert client.post("/api/subnets", json=_subnet("10.1.2.0/24")).status_code == 400
+  assert client.post("/api/subnets", json=_subnet("10.1.2.0/24"), params={"allow_nested": True}).status_code == 201
+
+
+def test_subnet_from_another_worker_conflicts_at_once(client, db):
+  # Loads the resolver's cached trie in this process
+  assert client.post("/api/subnets", json=_subnet("10.2.0.0/24")).status_code == 201
+  # Written by another worker: this process's cache does not know it yet
+  db.add(Subnet(name="other worker", subnet="10.3.0.0/24", max_devices=10))
+  db.commit()
+  response = client.post("/api/subnets", json=_subnet("10.3.0.0/24", name="mine"))
+  assert response.status_code == 400
+  assert "already exists" in response.json()["detail"]
+  update = client.put("/api/subnets/1", json={"subnet": "10.3.0.0/25"})
+  assert update.status_code == 400
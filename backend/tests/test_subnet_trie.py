@@ -0,0 +1,118 @@
+import ipaddress
+import random
+
+import pytest
+
+from app.utils.subnet_trie import SubnetMatch, SubnetTrie
+
+
+def _trie(*cidrs):
+  trie = SubnetTrie()
+  for subnet_id, cidr in enumerate(cidrs, start=1):
+    assert trie.insert(SubnetMatch(subnet_id, cidr, None, None))
+  return trie
+
+
+def _id(trie, ip):
+  match = trie.lookup(ip)
+  return match.subnet_id if match else None
+
+
+def test_most_specific_of_nested_subnets_wins():
+  trie = _trie("10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "10.1.2.128/25")
+  assert _id(trie, "10.200.0.1") == 1
+  assert _id(trie, "10.1.200.1") == 2
+  assert _id(trie, "10.1.2.1") == 3
+  assert _id(trie, "10.1.2.200") == 4
+  assert _id(trie, "11.0.0.1") is None
+
+
+def test_ancestor_inserted_after_its_children_splits_the_edge():
+  trie = _trie("10.1.2.0/24", "10.1.3.0/24", "10.1.0.0/16", "10.1.2.7/32")
+  assert _id(trie, "10.1.2.7") == 4
+  assert _id(trie, "10.1.2.8") == 1
+  assert _id(trie, "10.1.3.1") == 2
+  assert _id(trie, "10.1.4.1") == 3
+
+
+def test_duplicate_cidrs_resolve_to_the_lowest_id_until_it_is_removed():
+  trie = _trie("10.0.0.0/24", "10.0.0.0/24", "10.0.0.5/24")
+  assert len(trie) == 3 and _id(trie, "10.0.0.1") == 1
+  trie.remove(1)
+  assert _id(trie, "10.0.0.1") == 2
+  trie.remove(2)
+  trie.remove(3)
+  assert _id(trie, "10.0.0.1") is None and len(trie) == 0
+
+
+def test_insert_replaces_the_cidr_of_an_existing_id():
+  trie = _trie("10.0.0.0/24")
+  trie.insert(SubnetMatch(1, "10.9.0.0/24", None, None))
+  assert _id(trie, "10.0.0.1") is None and _id(trie, "10.9.0.1") == 1 and len(trie) == 1
+
+
+def test_ipv4_and_ipv6_subnets_do_not_match_each_other():
+  trie = _trie("::/0", "::ffff:0:0/96", "2001:db8::/32", "0.0.0.0/0", "10.0.0.0/8")
+  assert _id(trie, "10.1.1.1") == 5
+  assert _id(trie, "192.0.2.1") == 4
+  assert _id(trie, "2001:db8::1") == 3
+  assert _id(trie, "::ffff:10.1.1.1") == 2
+  assert _id(trie, "2001:db9::1") == 1
+  trie.remove(4)
+  trie.remove(5)
+  assert _id(trie, "10.1.1.1") is None
+  assert _id(trie, "::1") == 1
+
+
+def test_remove_then_lookup_falls_back_to_the_parent():
+  trie = _trie("10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "10.1.3.0/24")
+  trie.remove(2)
+  assert _id(trie, "10.1.2.1") == 3 and _id(trie, "10.1.3.1") == 4 and _id(trie, "10.1.9.1") == 1
+  trie.remove(3)
+  trie.remove(4)
+  assert _id(trie, "10.1.2.1") == 1
+  trie.remove(1)
+  assert _id(trie, "10.1.2.1") is None
+  # Removing an unknown id is a no-op, and the emptied trie takes new subnets
+  trie.remove(99)
+  trie.insert(SubnetMatch(5, "10.1.2.0/24", None, None))
+  assert _id(trie, "10.1.2.1") == 5
+
+
+@pytest.mark.parametrize("cidr", ["", "10.0.0.0/33", "not a subnet", None])
+def test_invalid_cidrs_and_addresses_are_ignored(cidr):
+  trie = SubnetTrie()
+  assert not trie.insert(SubnetMatch(1, cidr, None, None))
+  assert len(trie) == 0
+  assert trie.lookup("not an ip") is None and trie.lookup("") is None
+
+
+def _brute_force(subnets, ip):
+  addr = ipaddress.ip_address(ip)
+  containing = [(network.prefixlen, -subnet_id) for subnet_id, network in subnets.items()
+                if network.version == addr.version and addr in network]
+  return -max(containing)[1] if containing else None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_lookups_match_a_linear_scan_through_inserts_and_removes(seed):
+  rng = random.Random(seed)
+  trie, subnets = SubnetTrie(), {}
+  for subnet_id in range(1, 301):
+    if rng.random() < 0.8:
+      network = ipaddress.ip_network(f"10.{rng.randrange(4)}.{rng.randrange(256)}.0/{rng.randrange(8, 29)}", strict=False)
+    else:
+      network = ipaddress.ip_network(f"2001:db8:{rng.randrange(4):x}::/{rng.randrange(32, 65)}", strict=False)
+    trie.insert(SubnetMatch(subnet_id, str(network), None, None))
+    subnets[subnet_id] = network
+    if rng.random() < 0.3:
+      victim = rng.choice(list(subnets))
+      trie.remove(victim)
+      del subnets[victim]
+  assert len(trie) == len(subnets)
+  for _ in range(500):
+    if rng.random() < 0.8:
+      ip = f"10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(256)}"
+    else:
+      ip = f"2001:db8:{rng.randrange(4):x}::{rng.randrange(65536):x}"
+    assert _id(trie, ip) == _brute_force(subnets, ip), ip
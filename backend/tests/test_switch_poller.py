@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.core.config import settings
+from app.models.user import Device, Switch, SwitchPort, Vlan
+from app.utils.snmp import TAG_GAUGE32, SNMPClient, SNMPCredentials
+from app.utils.switch_poller import collect_switch, device_ids_by_mac, reconcile_switch_ports, vlan_ids_by_number
+from standins.snmp import SNMPStandIn
+
+POLLED_AT = datetime(2026, 1, 1, 12, 0)
+IF_X = "1.3.6.1.2.1.31.1.1.1"
+PLC_MAC = "aa:00:00:00:00:01"
+# Five MACs behind bridge port 3: more than snmp.access_port_max_macs (4)
+UPLINK_MACS = [f"aa:00:00:00:00:0{i}" for i in range(3, 8)]
+
+
+def _mac_arcs(mac):
+  return ".".join(str(int(octet, 16)) for octet in mac.split(":"))
+
+
+def switch_objects(qbridge=True):
+  """Three Gigabit ports and an SVI; the PLC on port 1 (VLAN 10), port 3 an uplink"""
+  objects = {"1.3.6.1.2.1.1.1.0": b"Stand-in Switch 24G, firmware 1.0"}
+  for ifindex, name in ((1, "Gi1/0/1"), (2, "Gi1/0/2"), (3, "Gi1/0/3"), (100, "Vlan10")):
+    objects[f"1.3.6.1.2.1.2.2.1.2.{ifindex}"] = f"GigabitEthernet {ifindex}".encode()
+    objects[f"1.3.6.1.2.1.2.2.1.3.{ifindex}"] = 53 if ifindex == 100 else 6
+    objects[f"1.3.6.1.2.1.2.2.1.8.{ifindex}"] = 2 if ifindex == 2 else 1
+    objects[f"{IF_X}.1.{ifindex}"] = name.encode()
+    objects[f"{IF_X}.15.{ifindex}"] = (TAG_GAUGE32, 1000)
+    objects[f"{IF_X}.18.{ifindex}"] = b"PLC cabinet" if ifindex == 1 else b""
+  for bridge_port in (1, 2, 3):
+    objects[f"1.3.6.1.2.1.17.1.4.1.2.{bridge_port}"] = bridge_port
+  for mac, bridge_port in [(PLC_MAC, 1)] + [(mac, 3) for mac in UPLINK_MACS]:
+    if qbridge:
+      objects[f"1.3.6.1.2.1.17.7.1.2.2.1.2.10.{_mac_arcs(mac)}"] = bridge_port
+    else:
+      objects[f"1.3.6.1.2.1.17.4.3.1.2.{_mac_arcs(mac)}"] = bridge_port
+  if qbridge:
+    for bridge_port, vlan in ((1, 10), (2, 20), (3, 1)):
+      objects[f"1.3.6.1.2.1.17.7.1.4.5.1.1.{bridge_port}"] = (TAG_GAUGE32, vlan)
+  else:
+    # Untagged ports of VLAN 10: bridge ports 1 and 2
+    objects["1.3.6.1.2.1.17.7.1.4.3.1.4.10"] = bytes([0b11000000])
+  objects["1.3.6.1.2.1.99.1"] = 5  # Past the bridge MIB: walks must stop at their root
+  return objects
+
+
+def _collect(port, credentials=SNMPCredentials()):
+  async def collect():
+    async with SNMPClient("127.0.0.1", credentials, port=port, timeout=0.5, retries=0) as client:
+      return await collect_switch(client)
+  return asyncio.run(collect())
+
+
+def _polled(port_number, macs=(), description=None, vlan_number=None):
+  return {"if_index": 1, "port_number": port_number, "description": description, "oper_status": "up",
+          "speed_mbps": 1000, "vlan_number": vlan_number, "macs": list(macs)}
+
+
+def _reconcile(db, switch, ports, **kwargs):
+  snapshot = {"sys_description": "Stand-in switch", "ports": ports}
+  counts = reconcile_switch_ports(db, switch, snapshot, device_ids_by_mac(db), vlan_ids_by_number(db), POLLED_AT,
+                                  **kwargs)
+  db.commit()
+  return counts
+
+
+def _ports(db, switch):
+  return {port.port_number: port for port in db.query(SwitchPort).filter(SwitchPort.switch_id == switch.id)}
+
+
+@pytest.fixture
+def switch(db):
+  switch = Switch(name="sw-core", ip_address="127.0.0.1")
+  db.add(switch)
+  db.commit()
+  return switch
+
+
+def test_collect_switch_over_q_bridge():
+  with SNMPStandIn(switch_objects()) as agent:
+    snapshot = _collect(agent.port)
+  assert snapshot["sys_description"] == "Stand-in Switch 24G, firmware 1.0"
+  ports = {port["port_number"]: port for port in snapshot["ports"]}
+  assert list(ports) == ["Gi1/0/1", "Gi1/0/2", "Gi1/0/3"]
+  assert ports["Gi1/0/1"] == {"if_index": 1, "port_number": "Gi1/0/1", "description": "PLC cabinet",
+                              "oper_status": "up", "speed_mbps": 1000, "vlan_number": 10, "macs": [PLC_MAC]}
+  assert ports["Gi1/0/2"]["oper_status"] == "down" and ports["Gi1/0/2"]["vlan_number"] == 20
+  assert ports["Gi1/0/3"]["macs"] == UPLINK_MACS
+
+
+def test_collect_switch_falls_back_to_dot1d_tables():
+  with SNMPStandIn(switch_objects(qbridge=False)) as agent:
+    snapshot = _collect(agent.port)
+  ports = {port["port_number"]: port for port in snapshot["ports"]}
+  assert ports["Gi1/0/1"]["macs"] == [PLC_MAC] and ports["Gi1/0/1"]["vlan_number"] == 10
+  assert ports["Gi1/0/2"]["vlan_number"] == 10
+  assert ports["Gi1/0/3"]["macs"] == UPLINK_MACS and ports["Gi1/0/3"]["vlan_number"] is None
+
+
+def test_uplinks_are_not_linked_to_devices(db, switch):
+  plc = Device(name="plc-1", mac_address=PLC_MAC.upper())
+  drive = Device(name="drive-1", mac_address=UPLINK_MACS[0])
+  db.add_all([plc, drive])
+  db.commit()
+  limit = settings.snmp.access_port_max_macs
+  counts = _reconcile(db, switch, [
+    _polled("Gi1/0/1", [PLC_MAC]),
+    # One registered MAC among exactly access_port_max_macs is still an access port
+    _polled("Gi1/0/2", [UPLINK_MACS[0]] + [f"bb:00:00:00:00:0{i}" for i in range(1, limit)]),
+    _polled("Gi1/0/3", UPLINK_MACS[:limit + 1]),
+  ])
+  ports = _ports(db, switch)
+  assert counts == {"ports_seen": 3, "ports_created": 3, "ports_updated": 0, "devices_linked": 2}
+  assert ports["Gi1/0/1"].device_id == plc.id
+  assert ports["Gi1/0/2"].device_id == drive.id
+  assert ports["Gi1/0/3"].device_id is None and ports["Gi1/0/3"].learned_macs == limit + 1
+
+
+def test_ports_learning_two_registered_devices_are_not_linked(db, switch):
+  db.add_all([Device(name="plc-1", mac_address=PLC_MAC), Device(name="drive-1", mac_address=UPLINK_MACS[0])])
+  db.commit()
+  counts = _reconcile(db, switch, [_polled("Gi1/0/1", [PLC_MAC, UPLINK_MACS[0]])])
+  assert counts["devices_linked"] == 0
+  assert _ports(db, switch)["Gi1/0/1"].device_id is None
+
+
+def test_manual_descriptions_and_links_are_kept(db, switch):
+  plc = Device(name="plc-1", mac_address=PLC_MAC)
+  vlan = Vlan(vlan_number=10, name="Process")
+  db.add_all([plc, vlan])
+  db.flush()
+  db.add_all([
+    SwitchPort(switch_id=switch.id, port_number="Gi1/0/1", description="Manual: line 3 PLC", device_id=plc.id),
+    SwitchPort(switch_id=switch.id, port_number="Gi1/0/2"),
+    SwitchPort(switch_id=switch.id, port_number="Gi1/0/9", description="Removed from the switch"),
+  ])
+  db.commit()
+  counts = _reconcile(db, switch, [
+    _polled("Gi1/0/1", description="PLC cabinet", vlan_number=10),
+    _polled("Gi1/0/2", description="Drive cabinet", vlan_number=99),
+  ])
+  ports = _ports(db, switch)
+  assert counts == {"ports_seen": 2, "ports_created": 0, "ports_updated": 2, "devices_linked": 0}
+  assert ports["Gi1/0/1"].description == "Manual: line 3 PLC"
+  assert ports["Gi1/0/1"].device_id == plc.id and ports["Gi1/0/1"].vlan_id == vlan.id
+  assert ports["Gi1/0/2"].description == "Drive cabinet" and ports["Gi1/0/2"].vlan_id is None
+  assert ports["Gi1/0/9"].description == "Removed from the switch"
+  assert switch.sys_description == "Stand-in switch" and switch.last_polled_at == POLLED_AT
+
+
+def test_dry_run_writes_nothing(db, switch):
+  counts = _reconcile(db, switch, [_polled("Gi1/0/1")], dry_run=True)
+  assert counts["ports_created"] == 1
+  assert _ports(db, switch) == {}
+  assert switch.last_polled_at is None
+
+
+def test_poll_endpoint_over_snmpv3_with_des(client, db, switch, monkeypatch):
+  credentials = SNMPCredentials(version="3", username="monitor", auth_protocol="md5", auth_key="authpass1",
+                                priv_protocol="des", priv_key="privpass1")
+  db.add(Device(name="plc-1", mac_address=PLC_MAC))
+  db.commit()
+  with SNMPStandIn(switch_objects(), credentials=credentials) as agent:
+    monkeypatch.setattr(settings.snmp, "port", agent.port)
+    monkeypatch.setattr(settings.snmp, "timeout_seconds", 0.5)
+    response = client.post("/api/switches/poll", json={"version": "3", **credentials._asdict()})
+  assert response.status_code == 200
+  result = response.json()["results"][0]
+  assert result["error"] is None
+  assert (result["ports_created"], result["devices_linked"]) == (3, 1)
+  assert result["sys_description"] == "Stand-in Switch 24G, firmware 1.0"
+
+
+def test_poll_endpoint_rejects_unknown_privacy_protocols(client, switch):
+  response = client.post("/api/switches/poll", json={"version": "3", "username": "monitor", "auth_protocol": "sha",
+                                                      "auth_key": "authpass1", "priv_protocol": "3des"})
+  assert response.status_code == 422